@@ -1000,8 +1000,11 @@ def connected_cluster(
         treq=treq_with_authentication(
             reactor, cluster_cert, user_cert, user_key),
         reactor=reactor,
+        # Connections left open at the end of a test would make trial
+        # report the reactor as dirty, so don't keep any:
         client=FlockerClient(reactor, control_node, REST_API_PORT,
-                             cluster_cert, user_cert, user_key),
+                             cluster_cert, user_cert, user_key,
+                             max_connections=0),
         certificates_path=certificates_path,
         cluster_uuid=user_credential.cluster_uuid,
         raw_distribution=environ.get('FLOCKER_ACCEPTANCE_DISTRIBUTION'),
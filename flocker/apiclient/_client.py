@@ -4,8 +4,9 @@
 Client for the Flocker REST API.
 """
 
+import re
 from uuid import UUID, uuid4
-from json import dumps
+from json import dumps, JSONDecoder
 from datetime import datetime
 from os import environ
 
@@ -27,6 +28,7 @@ from twisted.web.http import (
 )
 from twisted.internet.utils import getProcessOutput
 from twisted.internet.task import deferLater
+from twisted.web.client import HTTPConnectionPool
 
 from treq import json_content, content
 
@@ -52,6 +54,13 @@ _LOG_CONDITIONAL_CREATE = ActionType(
 
 NoneType = type(None)
 
+# The number of idle connections to the control service ``FlockerClient``
+# keeps open for reuse by later requests:
+DEFAULT_MAX_CONNECTIONS = 10
+
+# Seconds after which ``FlockerClient`` closes an idle connection:
+DEFAULT_IDLE_TIMEOUT = 60
+
 
 class ServerResponseMissingElementError(Exception):
     """
@@ -217,6 +226,49 @@ class ConfigurationChanged(Exception):
     """
 
 
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _iter_json_array(encoded):
+    """
+    Decode the items of a JSON array one at a time.
+
+    Each item is only decoded once the iterator reaches it, so only the
+    encoded array and the current item need be in memory, and nothing after
+    the point where iteration stops is decoded at all.
+
+    :param bytes encoded: The UTF-8 JSON encoding of an array.  It is not
+        decoded to ``unicode`` first, which would copy all of it.
+
+    :raise ValueError: When iteration reaches a part of ``encoded`` that is
+        not valid JSON, or if it is not an array.
+
+    :return: Iterator of the decoded items.
+    """
+    decoder = JSONDecoder()
+
+    def skip(index):
+        return _WHITESPACE.match(encoded, index).end()
+
+    index = skip(0)
+    if encoded[index:index + 1] != b"[":
+        raise ValueError("Expected a JSON array.")
+    index = skip(index + 1)
+    if encoded[index:index + 1] == b"]":
+        return
+    while True:
+        item, index = decoder.raw_decode(encoded, index)
+        yield item
+        index = skip(index)
+        separator = encoded[index:index + 1]
+        if separator == b"]":
+            return
+        if separator != b",":
+            raise ValueError(
+                "Expected ',' or ']' at position {}.".format(index))
+        index = skip(index + 1)
+
+
 class DatasetsConfiguration(PClass):
     """
     Currently configured datasets.
@@ -245,7 +297,8 @@ class IFlockerAPIV1Client(Interface):
     matching ``list_datasets_configuration`` call.
     """
     def create_dataset(primary, maximum_size=None, dataset_id=None,
-                       metadata=pmap(), configuration_tag=None):
+                       metadata=pmap(), configuration_tag=None,
+                       unique_metadata=()):
         """
         Create a new dataset in the configuration.
 
@@ -257,10 +310,15 @@ class IFlockerAPIV1Client(Interface):
             stored as dataset metadata.
         :param configuration_tag: If not ``None``, should be
             ``DatasetsConfiguration.tag``.
+        :param unique_metadata: Keys of ``metadata`` whose values no other
+            configured dataset may share.  The server checks this as part
+            of creating the dataset, so unlike ``conditional_create`` no
+            listing or retries are needed.
 
         :return: ``Deferred`` that fires after the configuration has been
             updated with resulting ``Dataset``, or errbacking with
-            ``DatasetAlreadyExists``.
+            ``DatasetAlreadyExists`` if the dataset ID or a unique metadata
+            value is already in use.
         """
 
     def move_dataset(primary, dataset_id, configuration_tag=None):
@@ -303,6 +361,25 @@ class IFlockerAPIV1Client(Interface):
         :return: ``Deferred`` firing with iterable of ``DatasetState``.
         """
 
+    def iter_datasets_configuration():
+        """
+        Return the configured datasets, excluding any datasets that have
+        been deleted, parsing each one only when it is reached.
+
+        Callers looking for a particular dataset can stop iterating once
+        they find it and avoid parsing the rest of the response.
+
+        :return: ``Deferred`` firing with an iterator of ``Dataset``.
+        """
+
+    def iter_datasets_state():
+        """
+        Return the actual datasets in the cluster, parsing each one only
+        when it is reached.
+
+        :return: ``Deferred`` firing with an iterator of ``DatasetState``.
+        """
+
     def acquire_lease(dataset_id, node_uuid, expires):
         """
         Acquire a lease on a dataset on a given node.
@@ -379,6 +456,14 @@ class IFlockerAPIV1Client(Interface):
         :return: ``Deferred`` firing with ``iterable`` of ``ContainerState``.
         """
 
+    def iter_containers_state():
+        """
+        Return the actual containers in the cluster, parsing each one only
+        when it is reached.
+
+        :return: ``Deferred`` firing with an iterator of ``ContainerState``.
+        """
+
     def delete_container(name):
         """
         :param unicode name: The name of the container to be deleted.
@@ -422,7 +507,8 @@ class FakeFlockerClient(object):
                 raise ConfigurationChanged()
 
     def create_dataset(self, primary, maximum_size=None, dataset_id=None,
-                       metadata=pmap(), configuration_tag=None):
+                       metadata=pmap(), configuration_tag=None,
+                       unique_metadata=()):
         try:
             self._ensure_matching_tag(configuration_tag)
         except:
@@ -434,6 +520,12 @@ class FakeFlockerClient(object):
             dataset_id = uuid4()
         if dataset_id in self._configured_datasets:
             return fail(DatasetAlreadyExists())
+        for key in unique_metadata:
+            if key not in metadata:
+                continue
+            for existing in self._configured_datasets.values():
+                if existing.metadata.get(key) == metadata[key]:
+                    return fail(DatasetAlreadyExists())
         result = Dataset(primary=primary, maximum_size=maximum_size,
                          dataset_id=dataset_id, metadata=metadata)
         self._configured_datasets = self._configured_datasets.set(
@@ -471,6 +563,12 @@ class FakeFlockerClient(object):
     def list_datasets_state(self):
         return succeed(self._state_datasets)
 
+    def iter_datasets_configuration(self):
+        return succeed(self._configured_datasets.itervalues())
+
+    def iter_datasets_state(self):
+        return succeed(iter(self._state_datasets))
+
     def synchronize_state(self):
         """
         Copy configuration into state.
@@ -548,6 +646,9 @@ class FakeFlockerClient(object):
     def list_containers_state(self):
         return succeed(self._state_containers)
 
+    def iter_containers_state(self):
+        return succeed(iter(self._state_containers))
+
     def delete_container(self, name):
         self._configured_containers = self._configured_containers.remove(name)
         return succeed(None)
@@ -576,9 +677,14 @@ class NotFound(Exception):
 class FlockerClient(object):
     """
     A client for the Flocker V1 REST API.
+
+    Connections to the control service are kept open after each request so
+    that later requests don't have to pay for another TLS handshake.
     """
     def __init__(self, reactor, host, port,
-                 ca_cluster_path, cert_path, key_path):
+                 ca_cluster_path, cert_path, key_path,
+                 max_connections=DEFAULT_MAX_CONNECTIONS,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT):
         """
         :param reactor: Reactor to use for connections.
         :param bytes host: Host to connect to.
@@ -586,15 +692,34 @@ class FlockerClient(object):
         :param FilePath ca_cluster_path: Path to cluster's CA certificate.
         :param FilePath cert_path: Path to user certificate.
         :param FilePath key_path: Path to user private key.
+        :param int max_connections: The maximum number of idle connections
+            to keep open.  More connections are made if there are more
+            concurrent requests, but they are closed once finished.  If
+            ``0`` a new connection is made for every request.
+        :param idle_timeout: Seconds after which an idle connection is
+            closed.
         """
         self._reactor = reactor
+        self._pool = HTTPConnectionPool(
+            reactor, persistent=max_connections > 0)
+        self._pool.maxPersistentPerHost = max_connections
+        self._pool.cachedConnectionTimeout = idle_timeout
         self._treq = treq_with_authentication(reactor, ca_cluster_path,
-                                              cert_path, key_path)
+                                              cert_path, key_path,
+                                              pool=self._pool)
         self._base_url = b"https://%s:%d/v1" % (host, port)
 
+    def disconnect(self):
+        """
+        Close the idle connections to the control service.
+
+        :return: ``Deferred`` firing when they are closed.
+        """
+        return self._pool.closeCachedConnections()
+
     def _request_with_headers(
             self, method, path, body, success_codes, error_codes=None,
-            configuration_tag=None):
+            configuration_tag=None, lazy=False):
         """
         Send a HTTP request to the Flocker API, return decoded JSON body and
         headers.
@@ -608,6 +733,8 @@ class FlockerClient(object):
             raised if it is present, or ``None`` to set no errors.
         :param configuration_tag: If not ``None``, include value as
             ``X-If-Configuration-Matches`` header.
+        :param lazy: If true the response must be a JSON array, whose items
+            are decoded by ``_iter_json_array`` as they are iterated over.
 
         :return: ``Deferred`` firing a tuple of (decoded JSON,
             response headers).
@@ -626,7 +753,11 @@ class FlockerClient(object):
         def got_response(response):
             if response.code in success_codes:
                 action.addSuccessFields(response_code=response.code)
-                d = json_content(response)
+                if lazy:
+                    d = content(response)
+                    d.addCallback(_iter_json_array)
+                else:
+                    d = json_content(response)
                 d.addCallback(lambda decoded_body:
                               (decoded_body, response.headers))
                 return d
@@ -653,7 +784,11 @@ class FlockerClient(object):
         request.addCallback(got_response)
 
         def got_body(result):
-            action.addSuccessFields(response_body=result[0])
+            if lazy:
+                # Logging the items would mean decoding all of them:
+                action.addSuccessFields(response_body=None)
+            else:
+                action.addSuccessFields(response_body=result[0])
             return result
         request.addCallback(got_body)
         request.addActionFinish()
@@ -691,13 +826,18 @@ class FlockerClient(object):
         return request
 
     def create_dataset(self, primary, maximum_size=None, dataset_id=None,
-                       metadata=pmap(), configuration_tag=None):
+                       metadata=pmap(), configuration_tag=None,
+                       unique_metadata=()):
         dataset = {u"primary": unicode(primary),
                    u"metadata": dict(metadata)}
         if dataset_id is not None:
             dataset[u"dataset_id"] = unicode(dataset_id)
         if maximum_size is not None:
             dataset[u"maximum_size"] = maximum_size
+        if unique_metadata:
+            # Only sent when needed, so other creations still work with
+            # control services that don't support it:
+            dataset[u"unique_metadata"] = list(unique_metadata)
         request = self._request(b"POST", b"/configuration/datasets",
                                 dataset, {CREATED},
                                 {CONFLICT: DatasetAlreadyExists,
@@ -715,6 +855,17 @@ class FlockerClient(object):
         request.addCallback(self._parse_configuration_dataset)
         return request
 
+    def iter_datasets_configuration(self):
+        request = self._request(
+            b"GET", b"/configuration/datasets", None, {OK}, lazy=True)
+        request.addCallback(
+            lambda results: (
+                self._parse_configuration_dataset(d)
+                for d in results if not d['deleted']
+            )
+        )
+        return request
+
     def list_datasets_configuration(self):
         request = self._request_with_headers(
             b"GET", b"/configuration/datasets", None, {OK})
@@ -732,24 +883,36 @@ class FlockerClient(object):
         )
         return request
 
+    def _parse_dataset_state(self, dataset_dict):
+        """
+        Convert a dictionary decoded from JSON with a dataset's state.
+
+        :param dataset_dict: Dictionary describing a dataset.
+        :return: ``DatasetState`` instance.
+        """
+        primary = dataset_dict.get(u"primary")
+        if primary is not None:
+            primary = UUID(primary)
+        path = dataset_dict.get(u"path")
+        if path is not None:
+            path = FilePath(path)
+        return DatasetState(primary=primary,
+                            maximum_size=dataset_dict.get(
+                                u"maximum_size", None),
+                            dataset_id=UUID(dataset_dict[u"dataset_id"]),
+                            path=path)
+
     def list_datasets_state(self):
         request = self._request(b"GET", b"/state/datasets", None, {OK})
+        request.addCallback(
+            lambda results: [self._parse_dataset_state(d) for d in results])
+        return request
 
-        def parse_dataset_state(dataset_dict):
-            primary = dataset_dict.get(u"primary")
-            if primary is not None:
-                primary = UUID(primary)
-            path = dataset_dict.get(u"path")
-            if path is not None:
-                path = FilePath(path)
-            return DatasetState(primary=primary,
-                                maximum_size=dataset_dict.get(
-                                    u"maximum_size", None),
-                                dataset_id=UUID(dataset_dict[u"dataset_id"]),
-                                path=path)
-
+    def iter_datasets_state(self):
+        request = self._request(
+            b"GET", b"/state/datasets", None, {OK}, lazy=True)
         request.addCallback(
-            lambda results: [parse_dataset_state(d) for d in results])
+            lambda results: (self._parse_dataset_state(d) for d in results))
         return request
 
     def _parse_lease(self, dictionary):
@@ -838,23 +1001,36 @@ class FlockerClient(object):
         )
         return d
 
+    def _parse_container_state(self, container):
+        """
+        Convert a dictionary decoded from JSON with a container's state.
+
+        :param container: Dictionary describing a container.
+        :return: ``ContainerState`` instance.
+        """
+        try:
+            return ContainerState(
+                node_uuid=UUID(container[u'node_uuid']),
+                name=container[u'name'],
+                image=DockerImage.from_string(container[u'image']),
+                running=container[u'running'],
+                volumes=_parse_volumes(container.get(u'volumes'))
+            )
+        except KeyError as e:
+            raise ServerResponseMissingElementError(e.args[0], container)
+
     def list_containers_state(self):
         d = self._request(b"GET", b"/state/containers", None, {OK})
-
-        def parse(container):
-            try:
-                return ContainerState(
-                    node_uuid=UUID(container[u'node_uuid']),
-                    name=container[u'name'],
-                    image=DockerImage.from_string(container[u'image']),
-                    running=container[u'running'],
-                    volumes=_parse_volumes(container.get(u'volumes'))
-                )
-            except KeyError as e:
-                raise ServerResponseMissingElementError(e.args[0], container)
         d.addCallback(
-            lambda containers: [parse(container) for container in containers])
+            lambda containers: [self._parse_container_state(container)
+                                for container in containers])
+        return d
 
+    def iter_containers_state(self):
+        d = self._request(b"GET", b"/state/containers", None, {OK}, lazy=True)
+        d.addCallback(
+            lambda containers: (self._parse_container_state(container)
+                                for container in containers))
         return d
 
     def list_nodes(self):
@@ -908,10 +1084,12 @@ def conditional_create(client, reactor, condition, *args, **kwargs):
     Create a dataset only if a certain condition is true for the
     configuration.
 
-    This is useful for ensuring e.g. uniqueness of metadata across
-    datasets. Conditional creation will be used to ensure that if the
-    configuration changes the create won't happen; in this case the whole
-    check-and-create will be retried, up to 20 times.
+    This is useful for ensuring arbitrary conditions across datasets.
+    Conditional creation will be used to ensure that if the configuration
+    changes the create won't happen; in this case the whole check-and-create
+    will be retried, up to 20 times.  To ensure uniqueness of metadata values
+    prefer the ``unique_metadata`` argument to ``create_dataset``, which
+    needs neither the listing nor the retries.
 
     All parameters are the same as
     ``IFlockerAPIV1Client.create_dataset_configuration`` except the
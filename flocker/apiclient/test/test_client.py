@@ -34,6 +34,7 @@ from .._client import (
     Lease, LeaseAlreadyHeld, Node, Container, ContainerAlreadyExists,
     DatasetsConfiguration, ConfigurationChanged, conditional_create,
     _LOG_CONDITIONAL_CREATE, ContainerState, MountedDataset,
+    _iter_json_array,
 )
 from ...ca import rest_api_context_factory
 from ...ca.testtools import get_credential_sets
@@ -185,6 +186,38 @@ def make_clientv1_tests():
                 dataset.metadata, pmap({u"hello": u"there"})))
             return d
 
+        def test_create_unique_metadata(self):
+            """
+            If ``unique_metadata`` is given, ``create_dataset`` creates a
+            dataset whose values for those keys differ from those of all
+            existing datasets.
+            """
+            d = self.client.create_dataset(
+                primary=self.node_1.uuid, metadata={u"name": u"one"})
+            d.addCallback(lambda _: self.client.create_dataset(
+                primary=self.node_1.uuid, metadata={u"name": u"two"},
+                unique_metadata=[u"name"]))
+            d.addCallback(lambda _: self.client.list_datasets_configuration())
+            d.addCallback(lambda config: self.assertItemsEqual(
+                [u"one", u"two"],
+                [dataset.metadata[u"name"] for dataset in config]))
+            return d
+
+        def test_create_conflicting_unique_metadata(self):
+            """
+            ``create_dataset`` fails with ``DatasetAlreadyExists`` if an
+            existing dataset has the same value for a key in
+            ``unique_metadata``.
+            """
+            d = self.client.create_dataset(
+                primary=self.node_1.uuid,
+                metadata={u"name": u"one", u"other": u"x"})
+            d.addCallback(lambda _: self.client.create_dataset(
+                primary=self.node_2.uuid,
+                metadata={u"name": u"one", u"other": u"y"},
+                unique_metadata=[u"name", u"other"]))
+            return self.assertFailure(d, DatasetAlreadyExists)
+
         def test_create_conflicting_dataset_id(self):
             """
             Creating two datasets with same ``dataset_id`` results in an
@@ -367,6 +400,41 @@ def make_clientv1_tests():
                               states))
             return d
 
+        def test_iter_datasets_configuration(self):
+            """
+            ``iter_datasets_configuration`` returns an iterator of the
+            configured datasets, excluding deleted ones.
+            """
+            creating = gatherResults([
+                self.client.create_dataset(primary=self.node_1.uuid)
+                for _ in range(3)])
+
+            def created(datasets):
+                d = self.client.delete_dataset(datasets[0].dataset_id)
+                d.addCallback(
+                    lambda _: self.client.iter_datasets_configuration())
+                d.addCallback(lambda iterator: self.assertItemsEqual(
+                    datasets[1:], list(iterator)))
+                return d
+            creating.addCallback(created)
+            return creating
+
+        def test_iter_datasets_state(self):
+            """
+            ``iter_datasets_state`` returns an iterator of the same datasets
+            as ``list_datasets_state``.
+            """
+            d = gatherResults([
+                self.client.create_dataset(primary=self.node_1.uuid)
+                for _ in range(3)])
+            d.addCallback(lambda _: self.synchronize_state())
+            d.addCallback(lambda _: gatherResults([
+                self.client.list_datasets_state(),
+                self.client.iter_datasets_state()]))
+            d.addCallback(lambda (listed, iterator): self.assertEqual(
+                list(listed), list(iterator)))
+            return d
+
         def test_acquire_lease_result(self):
             """
             ``acquire_lease`` returns a ``Deferred`` firing with ``Lease``
@@ -523,6 +591,20 @@ def make_clientv1_tests():
 
             return d
 
+        def test_iter_containers_state(self):
+            """
+            ``iter_containers_state`` returns an iterator of the same
+            containers as ``list_containers_state``.
+            """
+            _, d = create_container_for_test(self, self.client)
+            d.addCallback(lambda _ignored: self.synchronize_state())
+            d.addCallback(lambda _ignored: gatherResults([
+                self.client.list_containers_state(),
+                self.client.iter_containers_state()]))
+            d.addCallback(lambda (listed, iterator): self.assertEqual(
+                list(listed), list(iterator)))
+            return d
+
         def test_container_volumes(self):
             """
             Mounted datasets are included in response messages.
@@ -752,10 +834,25 @@ class FlockerClientTests(make_clientv1_tests()):
         self.addCleanup(api_service.stopService)
 
         credential_set.copy_to(credentials_path, user=True)
-        return FlockerClient(reactor, b"127.0.0.1", self.port,
-                             credentials_path.child(b"cluster.crt"),
-                             credentials_path.child(b"user.crt"),
-                             credentials_path.child(b"user.key"))
+        self.credentials_path = credentials_path
+        return self.connect()
+
+    def connect(self, **kwargs):
+        """
+        Create a new ``FlockerClient`` for the control service started by
+        ``create_client``, which is disconnected at the end of the test.
+
+        :param kwargs: Additional arguments for ``FlockerClient``.
+
+        :return: ``FlockerClient`` instance.
+        """
+        client = FlockerClient(reactor, b"127.0.0.1", self.port,
+                               self.credentials_path.child(b"cluster.crt"),
+                               self.credentials_path.child(b"user.crt"),
+                               self.credentials_path.child(b"user.key"),
+                               **kwargs)
+        self.addCleanup(client.disconnect)
+        return client
 
     def synchronize_state(self):
         deployment = self.persistence_service.get()
@@ -877,6 +974,39 @@ class FlockerClientTests(make_clientv1_tests()):
         d.addCallback(self.assertEqual, self.node_1.uuid)
         return d
 
+    def test_connection_reused(self):
+        """
+        Sequential requests are made over a single connection, which is kept
+        open afterwards.
+        """
+        d = self.client.list_datasets_configuration()
+        d.addCallback(lambda _: self.client.list_datasets_state())
+        d.addCallback(lambda _: self.assertEqual(
+            [1], [len(connections) for connections
+                  in self.client._pool._connections.values()]))
+        return d
+
+    def test_no_persistent_connections(self):
+        """
+        If ``max_connections`` is ``0`` no connections are kept open.
+        """
+        client = self.connect(max_connections=0)
+        d = client.list_datasets_configuration()
+        d.addCallback(lambda _: self.assertEqual(
+            [], [connections for connections
+                 in client._pool._connections.values() if connections]))
+        return d
+
+    def test_pool_configuration(self):
+        """
+        ``max_connections`` and ``idle_timeout`` configure the pool of
+        connections used by the client.
+        """
+        self.assertEqual(
+            (3, 5),
+            (self.connect(max_connections=3)._pool.maxPersistentPerHost,
+             self.connect(idle_timeout=5)._pool.cachedConnectionTimeout))
+
     def test_this_node_uuid_no_retry_on_other_responses(self):
         """
         ``this_node_uuid`` doesn't retry on unexpected responses.
@@ -1006,3 +1136,54 @@ class ConditionalCreateTests(TestCase):
                 primary=self.node_id))
             self.advance()
         self.failureResultOf(d, ConfigurationChanged)
+
+
+class IterJSONArrayTests(TestCase):
+    """
+    Tests for ``_iter_json_array``.
+    """
+    def test_items(self):
+        """
+        ``_iter_json_array`` yields the decoded items of the array, however
+        they are nested and spaced.
+        """
+        self.assertEqual(
+            [{u"a": [1, u"],"]}, None, u"x"],
+            list(_iter_json_array(b' [ {"a": [1, "],"]} ,null,\n"x" ] ')))
+
+    def test_utf8(self):
+        """
+        ``_iter_json_array`` decodes strings in the UTF-8 encoded array to
+        ``unicode``.
+        """
+        self.assertEqual(
+            [u"caf\xe9"], list(_iter_json_array(b'["caf\xc3\xa9"]')))
+
+    def test_empty(self):
+        """
+        ``_iter_json_array`` yields nothing for an empty array.
+        """
+        self.assertEqual([], list(_iter_json_array(b"[ ]")))
+
+    def test_lazy(self):
+        """
+        ``_iter_json_array`` only decodes as far as the iterator has got, so
+        invalid JSON after that point isn't noticed.
+        """
+        iterator = _iter_json_array(b'[1, "two", oops]')
+        self.assertEqual((1, u"two"), (next(iterator), next(iterator)))
+        self.assertRaises(ValueError, next, iterator)
+
+    def test_missing_separator(self):
+        """
+        ``_iter_json_array`` raises ``ValueError`` if items aren't separated
+        by commas.
+        """
+        self.assertRaises(ValueError, list, _iter_json_array(b"[1 2]"))
+
+    def test_not_array(self):
+        """
+        ``_iter_json_array`` raises ``ValueError`` if the JSON is not an
+        array.
+        """
+        self.assertRaises(ValueError, list, _iter_json_array(b'{"a": 1}'))
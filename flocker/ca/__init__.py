@@ -13,7 +13,7 @@ from ._ca import (
 
 from ._validation import (
     amp_server_context_factory, rest_api_context_factory, ControlServicePolicy,
-    treq_with_authentication,
+    treq_with_authentication, node_transfer_context_factory,
 )
 
 __all__ = [
@@ -23,4 +23,5 @@ __all__ = [
     "AUTHORITY_CERTIFICATE_FILENAME", "AUTHORITY_KEY_FILENAME",
     "amp_server_context_factory", "rest_api_context_factory",
     "ControlServicePolicy", "treq_with_authentication",
+    "node_transfer_context_factory",
 ]
@@ -332,6 +332,21 @@ class FlockerCredential(PClass):
         finally:
             os.umask(original_umask)
 
+    def _default_options(self, trust_root):
+        """
+        Construct a ``CertificateOptions`` that exposes this credential's
+        certificate and keypair.
+
+        :param trust_root: Trust root to pass to ``CertificateOptions``.
+
+        :return: ``CertificateOptions`` instance with CA validation
+            configured.
+        """
+        key = self.keypair.keypair.original
+        certificate = self.certificate.original
+        return CertificateOptions(
+            privateKey=key, certificate=certificate, trustRoot=trust_root)
+
     def private_certificate(self):
         """
         Combine private key and certificate into a ``PrivateCertificate``.
@@ -617,21 +632,6 @@ class ControlCredential(PClass):
         instance = cls(credential=credential)
         return instance
 
-    def _default_options(self, trust_root):
-        """
-        Construct a ``CertificateOptions`` that exposes this credential's
-        certificate and keypair.
-
-        :param trust_root: Trust root to pass to ``CertificateOptions``.
-
-        :return: ``CertificateOptions`` instance with CA validation
-            configured.
-        """
-        key = self.credential.keypair.keypair.original
-        certificate = self.credential.certificate.original
-        return CertificateOptions(
-            privateKey=key, certificate=certificate, trustRoot=trust_root)
-
 
 class RootCredential(PClass):
     """
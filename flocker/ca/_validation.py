@@ -48,24 +48,29 @@ class ControlServicePolicy(PClass):
 class _ControlServiceContextFactory(object):
     """
     Context factory that validates various kinds of clients that can
-    connect to the control service.
+    connect to the control service, or the peer of a connection between node
+    agents.
     """
-    def __init__(self, ca_certificate, control_credential, prefix):
+    def __init__(self, ca_certificate, credential, prefix, common_name=None):
         """
         :param Certificate ca_certificate: The certificate authority's
             certificate.
 
-        :param ControlCredential control_credential: The control service's
-            credentials.
+        :param FlockerCredential credential: The certificate and key pair
+            presented to the peer.
 
         :param bytes prefix: The required prefix on certificate common names.
+
+        :param bytes common_name: The required common name of the peer's
+            certificate, or ``None`` to accept any with ``prefix``.
         """
         self.prefix = prefix
-        self.control_credential = control_credential
+        self.common_name = common_name
+        self.credential = credential
         self.ca_certificate = ca_certificate
 
     def getContext(self):
-        default_options = self.control_credential._default_options(
+        default_options = self.credential._default_options(
             self.ca_certificate)
 
         def verify(conn, cert, errno, depth, preverify_ok):
@@ -75,7 +80,10 @@ class _ControlServiceContextFactory(object):
             # Now we're actually verifying certificate we care about:
             if not preverify_ok:
                 return preverify_ok
-            return cert.get_subject().commonName.startswith(self.prefix)
+            common_name = cert.get_subject().commonName
+            if self.common_name is not None:
+                return common_name == self.common_name
+            return common_name.startswith(self.prefix)
         context = default_options.getContext()
         context.set_verify(VERIFY_PEER | VERIFY_FAIL_IF_NO_PEER_CERT,
                            verify)
@@ -97,7 +105,7 @@ def amp_server_context_factory(ca_certificate, control_credential):
         AMP server.
     """
     return _ControlServiceContextFactory(
-        ca_certificate, control_credential, b"node-")
+        ca_certificate, control_credential.credential, b"node-")
 
 
 def rest_api_context_factory(ca_certificate, control_credential):
@@ -115,10 +123,40 @@ def rest_api_context_factory(ca_certificate, control_credential):
         REST API server.
     """
     return _ControlServiceContextFactory(
-        ca_certificate, control_credential, b"user-")
+        ca_certificate, control_credential.credential, b"user-")
+
+
+def node_transfer_context_factory(ca_certificate, node_credential,
+                                  peer_uuid=None):
+    """
+    Create a context factory for connections between node agents, e.g. to
+    transfer volume data.
+
+    Both ends of the connection use it: each presents its own node
+    certificate and requires the other to present a node certificate signed
+    by the same certificate authority.
+
+    :param Certificate ca_certificate: The certificate authority's
+        certificate.
+
+    :param NodeCredential node_credential: This node's credentials.
+
+    :param UUID peer_uuid: The node the connection must be to.  Clients
+        should always give it, so that they only send data to the node they
+        meant to.  If ``None``, any node of the cluster is accepted.
+
+    :return: TLS context factory suitable for both the client and the server
+        of a connection between node agents.
+    """
+    common_name = None
+    if peer_uuid is not None:
+        common_name = b"node-" + bytes(peer_uuid)
+    return _ControlServiceContextFactory(
+        ca_certificate, node_credential.credential, b"node-", common_name)
 
 
-def treq_with_authentication(reactor, ca_path, user_cert_path, user_key_path):
+def treq_with_authentication(reactor, ca_path, user_cert_path, user_key_path,
+                             pool=None):
     """
     Create a ``treq``-API object that implements the REST API TLS
     authentication.
@@ -130,6 +168,9 @@ def treq_with_authentication(reactor, ca_path, user_cert_path, user_key_path):
     :param FilePath ca_path: Absolute path to the public cluster certificate.
     :param FilePath user_cert_path: Absolute path to the user certificate.
     :param FilePath user_key_path: Absolute path to the user private key.
+    :param HTTPConnectionPool pool: The pool of connections to make
+        requests over, or ``None`` to make a new connection for each
+        request.
 
     :return: ``treq`` compatible object.
     """
@@ -137,4 +178,4 @@ def treq_with_authentication(reactor, ca_path, user_cert_path, user_key_path):
     user_credential = UserCredential.from_files(user_cert_path, user_key_path)
     policy = ControlServicePolicy(
         ca_certificate=ca, client_credential=user_credential.credential)
-    return HTTPClient(Agent(reactor, contextFactory=policy))
+    return HTTPClient(Agent(reactor, contextFactory=policy, pool=pool))
@@ -14,10 +14,13 @@ from twisted.internet.endpoints import (
 from twisted.internet import reactor
 from twisted.internet.defer import Deferred, gatherResults
 from twisted.internet.protocol import Protocol, ServerFactory
+from twisted.python.filepath import FilePath
 
 from ...testtools import AsyncTestCase, find_free_port
+from .._ca import NodeCredential
 from .._validation import (
     ControlServicePolicy, amp_server_context_factory, rest_api_context_factory,
+    node_transfer_context_factory,
     )
 from ..testtools import get_credential_sets
 
@@ -330,3 +333,40 @@ class RESTAPIContextFactoryValidationTests(
     """
     Tests for the context factory that validates REST API clients.
     """
+
+
+class NodeTransferServerValidationTests(
+        make_validation_tests(
+            lambda port, good_ca: node_transfer_context_factory(
+                ca_certificate=good_ca.root.credential.certificate,
+                node_credential=good_ca.node),
+            # We are testing a node validating the nodes connecting to it:
+            "node", validator_is_client=False)):
+    """
+    Tests for the validation of the nodes connecting to a volume transfer
+    port.
+    """
+
+
+class NodeTransferClientValidationTests(
+        make_validation_tests(
+            lambda port, good_ca: node_transfer_context_factory(
+                ca_certificate=good_ca.root.credential.certificate,
+                node_credential=good_ca.node,
+                peer_uuid=good_ca.node.uuid),
+            # We are testing a node validating the node it connects to:
+            "node", validator_is_client=True)):
+    """
+    Tests for the validation of the node a volume transfer connection is made
+    to.
+    """
+    def test_other_node(self):
+        """
+        If the certificate is for a different node of the same cluster than
+        the expected one the validator will reject it.
+        """
+        path = FilePath(self.mktemp())
+        path.makedirs()
+        return self.assert_does_not_validate(
+            NodeCredential.initialize(path, self.good_ca.root)
+        )
@@ -4,7 +4,10 @@
 Test validation of keys generated by flocker-ca.
 """
 
-from .. import amp_server_context_factory, rest_api_context_factory
+from .. import (
+    amp_server_context_factory, rest_api_context_factory,
+    node_transfer_context_factory,
+)
 from ..testtools import get_credential_sets
 from ...testtools import TestCase
 
@@ -36,3 +39,14 @@ class ClientValidationContextFactoryTests(TestCase):
             ca_set.root.credential.certificate, ca_set.control)
         self.assertIsNot(context_factory.getContext(),
                          context_factory.getContext())
+
+    def test_node_transfer_new_context_each_time(self):
+        """
+        Each call to the node transfer context factory ``getContext`` returns
+        a new instance, to prevent issues with global shared state.
+        """
+        ca_set, _ = get_credential_sets()
+        context_factory = node_transfer_context_factory(
+            ca_set.root.credential.certificate, ca_set.node)
+        self.assertIsNot(context_factory.getContext(),
+                         context_factory.getContext())
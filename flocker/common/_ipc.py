@@ -90,7 +90,7 @@ class ProcessNode(object):
             raise IOError("Bad exit", remote_command, e.returncode, e.output)
 
     @classmethod
-    def using_ssh(cls, host, port, username, private_key):
+    def using_ssh(cls, host, port, username, private_key, compress=False):
         """Create a ``ProcessNode`` that communicate over SSH.
 
         :param bytes host: The hostname or IP.
@@ -98,12 +98,16 @@ class ProcessNode(object):
         :param bytes username: The username to SSH as.
         :param FilePath private_key: Path to private key to use when talking to
             SSH server.
+        :param bool compress: Whether to compress data sent over the SSH
+            connection.
 
         :return: ``ProcessNode`` instance that communicates over SSH.
         """
+        compression = (b"-C",) if compress else ()
         return cls(initial_command_arguments=(
             b"ssh",
             b"-q",  # suppress warnings
+        ) + compression + (
             b"-i", private_key.path,
             b"-l", username,
             # We're ok with unknown hosts; we'll be switching away from
@@ -26,6 +26,8 @@ from ._model import (
 from ._protocol import (
     IConvergenceAgent,
     NodeStateCommand,
+    NodeStateDiffCommand,
+    node_state_diff_arguments,
     AgentAMP,
     SetNodeEraCommand,
     SetBlockDeviceIdForDatasetId,
@@ -62,6 +64,8 @@ __all__ = [
 
     'IConvergenceAgent',
     'NodeStateCommand',
+    'NodeStateDiffCommand',
+    'node_state_diff_arguments',
     'SetNodeEraCommand',
     'SetBlockDeviceIdForDatasetId',
     'AgentAMP',
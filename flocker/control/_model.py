@@ -127,14 +127,21 @@ def pmap_field(
     TheMap.__name__ = (key_type.__name__.capitalize() +
                        value_type.__name__.capitalize() + "PMap")
 
+    def checked_map(argument):
+        # Maps of this type were checked when they were created; rebuilding
+        # one would check every item again each time its owner is evolved.
+        if type(argument) is TheMap:
+            return argument
+        return TheMap(argument)
+
     if optional:
         def mapping_factory(argument):
             if argument is None:
                 return None
             else:
-                return TheMap(argument)
+                return checked_map(argument)
     else:
-        mapping_factory = TheMap
+        mapping_factory = checked_map
 
     if input_factory:
         factory = lambda x: mapping_factory(input_factory(x))
@@ -998,11 +1005,16 @@ class NodeState(PRecord):
         Maps ``dataset_id`` to a ``FilePath``.
     :ivar PMap devices: The OS devices by which datasets are made manifest.
         Maps ``dataset_id`` (as a ``UUID``) to a ``FilePath``.
+    :ivar PMap replicated_at: For datasets which the node periodically
+        pushes to other nodes, when (as a ``float`` POSIX timestamp) the
+        data last pushed to all of them was taken.  Maps ``dataset_id`` to
+        the time; the replication lag is how long ago that was.  ``None`` if
+        the node does not replicate datasets.
     """
     # Attributes that may be set to None to indicate ignorance:
     _POTENTIALLY_IGNORANT_ATTRIBUTES = ["applications",
                                         "manifestations", "paths",
-                                        "devices"]
+                                        "devices", "replicated_at"]
 
     # Dataset attributes that must all be non-None if one is non-None:
     _DATASET_ATTRIBUTES = {"manifestations", "paths", "devices"}
@@ -1045,6 +1057,7 @@ class NodeState(PRecord):
                                 initial=None, invariant=_keys_match_dataset_id)
     paths = pmap_field(unicode, FilePath, optional=True, initial=None)
     devices = pmap_field(UUID, FilePath, optional=True, initial=None)
+    replicated_at = pmap_field(unicode, float, optional=True, initial=None)
 
     def update_cluster_state(self, cluster_state):
         return cluster_state.update_node(self)
@@ -11,6 +11,7 @@ from json import dumps, loads
 from mmh3 import hash_bytes as mmh3_hash_bytes
 from uuid import UUID
 from collections import Set, Mapping, Iterable
+from itertools import chain
 
 from eliot import Logger, write_traceback, MessageType, Field, ActionType
 
@@ -23,7 +24,7 @@ from twisted.application.service import Service, MultiService
 from twisted.internet.defer import succeed
 from twisted.internet.task import LoopingCall
 
-from weakref import WeakKeyDictionary
+from weakref import WeakKeyDictionary, ref
 
 from ._model import (
     SERIALIZABLE_CLASSES, Deployment, Configuration, GenerationHash
@@ -347,7 +348,48 @@ _NULLSET_TOKEN = mmh3_hash_bytes(b'NULLSET')
 _MAPPING_TOKEN = mmh3_hash_bytes(b'MAPPING')
 _STR_TOKEN = mmh3_hash_bytes(b'STRING')
 
-_generation_hash_cache = WeakKeyDictionary()
+
+class _IdentityCache(object):
+    """
+    A cache of values computed from objects, keyed on the identity of the
+    objects rather than their value.
+
+    Looking an object up in a ``WeakKeyDictionary`` calls its ``__hash__``,
+    which for a ``PClass`` walks the whole tree beneath it every time.
+    Looking it up here costs the same however big it is.  Entries are dropped
+    when their object is garbage collected.
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, key, default):
+        entry = self._entries.get(id(key))
+        if entry is not None and entry[0]() is key:
+            return entry[1]
+        return default
+
+    def __setitem__(self, key, value):
+        key_id = id(key)
+        entries = self._entries
+
+        def expired(reference):
+            # The identifier may have been reused by a newer object already:
+            entry = entries.get(key_id)
+            if entry is not None and entry[0] is reference:
+                entries.pop(key_id, None)
+        entries[key_id] = (ref(key, expired), value)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Keyed on identity so that once a diff has been applied to a large state,
+# hashing the result only touches the objects the diff replaced.
+_generation_hash_cache = _IdentityCache()
+
+# Immutable types which are hashed via their JSON encoding, and are common
+# enough as keys and values (node UUIDs, mount paths) to be worth caching too.
+_CACHED_LEAF_TYPES = frozenset([UUID, FilePath])
 
 
 def _xor_bytes(aggregating_bytearray, updating_bytes):
@@ -401,8 +443,10 @@ def generation_hash(input_object):
             object_to_process = dumps(input_object)
         return mmh3_hash_bytes(object_to_process)
 
-    is_pyrsistent = _is_pyrsistent(input_object)
-    if is_pyrsistent:
+    is_cached = (
+        input_type in _CACHED_LEAF_TYPES or _is_pyrsistent(input_object)
+    )
+    if is_cached:
         cached = _generation_hash_cache.get(input_object, _UNCACHED_SENTINEL)
         if cached is not _UNCACHED_SENTINEL:
             return cached
@@ -413,13 +457,20 @@ def generation_hash(input_object):
         object_to_process = object_to_process._to_dict()
 
     if isinstance(object_to_process, Mapping):
-        # Union a mapping token so that empty maps and empty sets have
-        # different hashes.
-        object_to_process = frozenset(object_to_process.iteritems()).union(
-            [_MAPPING_TOKEN]
+        # Hash a mapping as the set of its items unioned with a mapping token,
+        # so that empty maps and empty sets have different hashes.  The items
+        # are unique already, so XOR their hashes directly: building a
+        # ``frozenset`` of them would call ``__hash__`` on every value in the
+        # tree, cached or not.
+        sub_hashes = chain(
+            [generation_hash(_MAPPING_TOKEN)],
+            (mmh3_hash_bytes(generation_hash(key) + generation_hash(value))
+             for key, value in object_to_process.iteritems()),
         )
-
-    if isinstance(object_to_process, Set):
+        result = bytes(
+            reduce(_xor_bytes, sub_hashes, bytearray(_NULLSET_TOKEN))
+        )
+    elif isinstance(object_to_process, Set):
         sub_hashes = (generation_hash(x) for x in object_to_process)
         result = bytes(
             reduce(_xor_bytes, sub_hashes, bytearray(_NULLSET_TOKEN))
@@ -435,7 +486,7 @@ def generation_hash(input_object):
         # interpreters with different PYTHONHASHSEED. See FLOC-4554.
         result = mmh3_hash_bytes(wire_encode(object_to_process))
 
-    if is_pyrsistent:
+    if is_cached:
         _generation_hash_cache[input_object] = result
 
     return result
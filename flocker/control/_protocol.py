@@ -44,7 +44,7 @@ from eliot import (
 )
 from eliot.twisted import DeferredContext
 
-from pyrsistent import PClass, field
+from pyrsistent import PClass, field, pmap
 
 from repoze.lru import LRUCache
 
@@ -69,7 +69,7 @@ from ._model import (
     BlockDeviceOwnership, DatasetAlreadyOwned, GenerationHash,
 )
 from ._diffing import (
-    Diff
+    Diff, create_diff,
 )
 from ._generations import GenerationTracker
 
@@ -314,6 +314,111 @@ class NodeStateCommand(Command):
     response = []
 
 
+class NodeStateGenerationMismatch(Exception):
+    """
+    A ``NodeStateDiffCommand`` was not made against the node state last
+    received by the control service, or did not produce the expected node
+    state when applied.
+    """
+
+
+class NodeStateDiffCommand(Command):
+    """
+    Used by a convergence agent to update the control service about the
+    status of a particular node, but only sends the diff from the state
+    changes last acknowledged on this connection to the latest ones.
+
+    If the control service responds with ``NodeStateGenerationMismatch`` (or
+    does not know this command at all) the agent should send the full state
+    changes using ``NodeStateCommand`` instead.
+    """
+    arguments = [
+        ('state_changes_diff', Big(SerializableArgument(Diff))),
+        ('start_generation', Big(SerializableArgument(GenerationHash))),
+        ('end_generation', Big(SerializableArgument(GenerationHash))),
+        ('eliot_context', _EliotActionArgument()),
+    ]
+    response = []
+    errors = {NodeStateGenerationMismatch: 'GENERATION_MISMATCH'}
+
+
+def _state_changes_to_pmap(state_changes):
+    """
+    Convert a sequence of state changes into something ``create_diff`` can
+    make a fine grained diff of.
+
+    :param state_changes: A sequence of ``IClusterStateChange`` providers, as
+        sent by ``NodeStateCommand``.
+
+    :return PMap: The changes keyed by their position in ``state_changes``.
+    """
+    return pmap({
+        unicode(index): change for (index, change) in enumerate(state_changes)
+    })
+
+
+def _state_changes_from_pmap(state_changes):
+    """
+    Reverse ``_state_changes_to_pmap``.
+
+    :param PMap state_changes: The result of ``_state_changes_to_pmap``.
+
+    :return tuple: The original state changes, in order.
+    """
+    return tuple(
+        state_changes[key] for key in sorted(state_changes, key=int)
+    )
+
+
+def node_state_diff_arguments(start, end):
+    """
+    Compute the arguments for a ``NodeStateDiffCommand``.
+
+    :param start: The state changes last acknowledged by the control service.
+    :param end: The state changes to send now.
+
+    :return dict: ``NodeStateDiffCommand`` arguments, other than
+        ``eliot_context``.
+    """
+    start = _state_changes_to_pmap(start)
+    end = _state_changes_to_pmap(end)
+    return dict(
+        state_changes_diff=create_diff(start, end),
+        start_generation=make_generation_hash(start),
+        end_generation=make_generation_hash(end),
+    )
+
+
+def apply_node_state_diff(state_changes, state_changes_diff,
+                          start_generation, end_generation):
+    """
+    Apply the arguments of a ``NodeStateDiffCommand`` to the state changes
+    last received from the same sender.
+
+    :param state_changes: The state changes last received, as returned by
+        ``_state_changes_to_pmap``, or ``None`` if none have been.
+    :param Diff state_changes_diff: The received diff.
+    :param GenerationHash start_generation: The received hash of the state
+        changes the diff was made against.
+    :param GenerationHash end_generation: The received hash of the state
+        changes the diff produces.
+
+    :raise NodeStateGenerationMismatch: If ``state_changes`` is not what the
+        diff was made against, or applying it does not produce the expected
+        state changes.
+
+    :return PMap: The new state changes, in the same form as
+        ``state_changes``.
+    """
+    if (state_changes is None or
+            make_generation_hash(state_changes) != start_generation):
+        raise NodeStateGenerationMismatch()
+    state_changes = state_changes_diff.apply(state_changes)
+    if make_generation_hash(state_changes) != end_generation:
+        raise NodeStateGenerationMismatch()
+    return state_changes
+
+
 class SetBlockDeviceIdForDatasetId(Command):
     """
     Indicate a specific block device id is the one for given dataset id.
@@ -385,6 +490,10 @@ class ControlServiceLocator(CommandLocator):
         # it.
         self._source = ChangeSource()
         self._timeout = timeout
+        # The state changes last received from the agent, for applying
+        # ``NodeStateDiffCommand`` to, as returned by
+        # ``_state_changes_to_pmap``:
+        self._state_changes = None
 
         self._reactor = reactor
         self.control_amp_service = control_amp_service
@@ -416,11 +525,32 @@ class ControlServiceLocator(CommandLocator):
     @NodeStateCommand.responder
     def node_changed(self, eliot_context, state_changes):
         with eliot_context:
+            self._state_changes = _state_changes_to_pmap(state_changes)
             self.control_amp_service.node_changed(
                 self._source, state_changes,
             )
             return {}
 
+    @NodeStateDiffCommand.responder
+    def node_changed_diff(self, eliot_context, state_changes_diff,
+                          start_generation, end_generation):
+        with eliot_context:
+            try:
+                state_changes = apply_node_state_diff(
+                    self._state_changes, state_changes_diff,
+                    start_generation, end_generation,
+                )
+            except NodeStateGenerationMismatch:
+                # Our copy no longer matches what the agent has, so make it
+                # send everything next time:
+                self._state_changes = None
+                raise
+            self._state_changes = state_changes
+            self.control_amp_service.node_changed(
+                self._source, _state_changes_from_pmap(state_changes),
+            )
+            return {}
+
     @SetNodeEraCommand.responder
     def set_node_era(self, era, node_uuid):
         # Further work will be done in FLOC-3380
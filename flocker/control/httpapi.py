@@ -77,6 +77,10 @@ LINK_ALIAS_COLLISION = make_bad_request(
 )
 DATASET_ID_COLLISION = make_bad_request(
     code=CONFLICT, description=u"The provided dataset_id is already in use.")
+DATASET_METADATA_COLLISION = make_bad_request(
+    code=CONFLICT,
+    description=u"The provided value of a unique metadata key is already "
+                u"in use.")
 PRIMARY_NODE_NOT_FOUND = make_bad_request(
     description=u"The provided primary node is not part of the cluster.")
 DATASET_NOT_FOUND = make_bad_request(
@@ -247,6 +251,11 @@ class ConfigurationAPIUserV1(object):
 
         Supports ``X-If-Configuration-Matches`` header in the request to
         ensure creation only happens if the configuration hasn't changed.
+
+        Alternatively ``unique_metadata`` can list metadata keys whose
+        values must not already be used by another dataset, e.g. a name.
+        The check and the creation happen together, so concurrent requests
+        for the same name can't both succeed and don't need retrying.
         """,
         header=u"Create new dataset",
         examples=[
@@ -270,7 +279,8 @@ class ConfigurationAPIUserV1(object):
         schema_store=SCHEMAS,
     )
     def create_dataset_configuration(self, primary, dataset_id=None,
-                                     maximum_size=None, metadata=None):
+                                     maximum_size=None, metadata=None,
+                                     unique_metadata=()):
         """
         Create a new dataset in the cluster configuration.
 
@@ -294,6 +304,10 @@ class ConfigurationAPIUserV1(object):
             for things like human-friendly dataset naming, ownership
             information, etc.
 
+        :param unique_metadata: A ``list`` of keys in ``metadata``.  If a
+            dataset which hasn't been deleted has the same value for any of
+            them the dataset is not created.
+
         :return: A ``dict`` describing the dataset which has been added to the
             cluster configuration or giving error information if this is not
             possible.
@@ -304,6 +318,9 @@ class ConfigurationAPIUserV1(object):
 
         if metadata is None:
             metadata = {}
+        unique = {
+            key: metadata[key] for key in unique_metadata if key in metadata
+        }
 
         primary = UUID(hex=primary)
 
@@ -312,8 +329,14 @@ class ConfigurationAPIUserV1(object):
         deployment = self.persistence_service.get()
         for node in deployment.nodes.itervalues():
             for manifestation in node.manifestations.values():
-                if manifestation.dataset.dataset_id == dataset_id:
+                existing = manifestation.dataset
+                if existing.dataset_id == dataset_id:
                     raise DATASET_ID_COLLISION
+                if existing.deleted:
+                    continue
+                for key, value in unique.items():
+                    if existing.metadata.get(key) == value:
+                        raise DATASET_METADATA_COLLISION
 
         # XXX Check cluster state to determine if the given primary node
         # actually exists.  If not, raise PRIMARY_NODE_NOT_FOUND.
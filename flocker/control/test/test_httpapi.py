@@ -1833,6 +1833,74 @@ class CreateDatasetTestsMixin(APITestsMixin):
         creating.addCallback(created)
         return creating
 
+    def _unique_metadata_test(self, existing_dataset, expected_code):
+        """
+        Assert the result of creating a dataset named ``"myvol"`` with
+        ``name`` as a unique metadata key when another dataset is already
+        configured.
+
+        :param Dataset existing_dataset: The dataset already configured.
+        :param int expected_code: The expected response code.
+
+        :return: A ``Deferred`` that fires with the result of the test.
+        """
+        existing_manifestation = Manifestation(
+            dataset=existing_dataset, primary=True)
+        saving = self.persistence_service.save(Deployment(
+            nodes={
+                Node(
+                    uuid=self.NODE_B_UUID,
+                    manifestations={existing_manifestation.dataset_id:
+                                    existing_manifestation}
+                ),
+            }
+        ))
+        saving.addCallback(lambda _: self.assertResponseCode(
+            b"POST", b"/configuration/datasets",
+            {u"primary": self.NODE_A,
+             u"metadata": {u"name": u"myvol", u"owner": u"alice"},
+             u"unique_metadata": [u"name"]},
+            expected_code
+        ))
+        return saving
+
+    def test_unique_metadata_collision(self):
+        """
+        If a configured dataset has the same value as the request body for a
+        key in ``unique_metadata`` the response is an error indicating the
+        collision and the dataset is not added to the desired
+        configuration.
+        """
+        existing = Dataset(
+            dataset_id=unicode(uuid4()), metadata={u"name": u"myvol"})
+        d = self._unique_metadata_test(existing, CONFLICT)
+        d.addCallback(lambda _: self.assertEqual(
+            [existing.dataset_id],
+            [manifestation.dataset_id
+             for node in self.persistence_service.get().nodes.values()
+             for manifestation in node.manifestations.values()]))
+        return d
+
+    def test_unique_metadata_different_value(self):
+        """
+        Datasets with a different value for a key in ``unique_metadata``
+        don't prevent creation.
+        """
+        return self._unique_metadata_test(
+            Dataset(dataset_id=unicode(uuid4()),
+                    metadata={u"name": u"othervol", u"owner": u"alice"}),
+            CREATED)
+
+    def test_unique_metadata_deleted(self):
+        """
+        Deleted datasets with the same value for a key in ``unique_metadata``
+        don't prevent creation.
+        """
+        return self._unique_metadata_test(
+            Dataset(dataset_id=unicode(uuid4()),
+                    metadata={u"name": u"myvol"}, deleted=True),
+            CREATED)
+
     def test_create_with_maximum_size(self):
         """
         A maximum size included with the creation of a dataset is included in
@@ -13,7 +13,7 @@ from pyrsistent import (
     pvector, PRecord
 )
 
-from testtools.matchers import Equals, IsInstance
+from testtools.matchers import Equals, Is, IsInstance
 
 from twisted.python.filepath import FilePath
 
@@ -377,8 +377,8 @@ class NodeStateTests(TestCase):
         self.assertEqual(
             [node_state.applications,
              node_state.manifestations, node_state.paths, node_state.devices,
-             node_state._provides_information()],
-            [None, None, None, None, False])
+             node_state.replicated_at, node_state._provides_information()],
+            [None, None, None, None, None, False])
 
     def assert_required_field_set(self, **fields):
         """
@@ -1149,6 +1149,19 @@ class PMapFieldTests(TestCase):
             IsInstance(PMap)
         )
 
+    @given(PYRSISTENT_STRUCT)
+    def test_factory_reuses_map(self, klass):
+        """
+        ``pmap_field``'s factory returns maps it created unchanged.
+        """
+        class Record(klass):
+            value = pmap_field(int, int, optional=True)
+        record = Record(value={1: 1234})
+        self.assertThat(
+            Record(value=record.value).value,
+            Is(record.value)
+        )
+
     @given(PYRSISTENT_STRUCT)
     def test_checked_map_key(self, klass):
         """
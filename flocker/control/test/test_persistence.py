@@ -22,7 +22,7 @@ from twisted.internet import reactor
 from twisted.internet.task import Clock
 from twisted.python.filepath import FilePath
 
-from pyrsistent import PClass, pset
+from pyrsistent import PClass, pset, pmap
 
 from testtools.matchers import Is, Equals, Not
 
@@ -34,7 +34,8 @@ from .._persistence import (
     _LOG_SAVE, _LOG_STARTUP, migrate_configuration,
     _CONFIG_VERSION, ConfigurationMigration, ConfigurationMigrationError,
     _LOG_UPGRADE, MissingMigrationError, update_leases, _LOG_EXPIRE,
-    _LOG_UNCHANGED_DEPLOYMENT_NOT_SAVED, to_unserialized_json, generation_hash
+    _LOG_UNCHANGED_DEPLOYMENT_NOT_SAVED, to_unserialized_json, generation_hash,
+    _IdentityCache, _MAPPING_TOKEN,
     )
 from .._model import (
     Deployment, Application, DockerImage, Node, Dataset, Manifestation,
@@ -974,3 +975,58 @@ class GenerationHashTests(TestCase):
             generation_hash(TEST_DEPLOYMENT_2),
             Equals(TEST_DEPLOYMENT_2_HASH)
         )
+
+    @given(deployment_strategy(), deployment_strategy())
+    def test_modified_hash(self, deployment_a, deployment_b):
+        """
+        A deployment which shares hashed parts with another deployment hashes
+        to the same value as an equal deployment which shares nothing.
+        """
+        generation_hash(deployment_a)
+        combined = deployment_a.set(
+            nodes=deployment_a.nodes.update(deployment_b.nodes)
+        )
+        self.assertThat(
+            generation_hash(combined),
+            Equals(generation_hash(wire_decode(wire_encode(combined))))
+        )
+
+    def test_map_values_hash_unchanged(self):
+        """
+        Mappings hash to the XOR of the hashes of their items and a mapping
+        token, as they did when they were hashed as a ``frozenset``.
+        """
+        self.assertThat(
+            generation_hash(pmap({u"a": 1, u"b": pset([2])})),
+            Equals(generation_hash(frozenset([
+                (u"a", 1), (u"b", pset([2])), _MAPPING_TOKEN,
+            ])))
+        )
+
+
+class IdentityCacheTests(TestCase):
+    """
+    Tests for ``_IdentityCache``.
+    """
+    def test_identity(self):
+        """
+        Values are only returned for the object they were stored for, not for
+        objects equal to it.
+        """
+        cache = _IdentityCache()
+        key = pset([1])
+        cache[key] = b"value"
+        self.assertEqual(
+            (b"value", None),
+            (cache.get(key, None), cache.get(pset([1]), None)),
+        )
+
+    def test_expired(self):
+        """
+        Entries are dropped when their object is garbage collected.
+        """
+        cache = _IdentityCache()
+        key = pset([1])
+        cache[key] = b"value"
+        del key
+        self.assertEqual(0, len(cache))
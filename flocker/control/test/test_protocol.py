@@ -44,7 +44,9 @@ from .._protocol import (
     NodeStateCommand, IConvergenceAgent, NoOp, AgentAMP, ControlAMP,
     _AgentLocator, ControlServiceLocator, LOG_SEND_CLUSTER_STATE,
     LOG_SEND_TO_AGENT, AGENT_CONNECTED, caching_wire_encode, SetNodeEraCommand,
-    timeout_for_protocol, CONTROL_SERVICE_BATCHING_DELAY
+    timeout_for_protocol, CONTROL_SERVICE_BATCHING_DELAY,
+    NodeStateDiffCommand, NodeStateGenerationMismatch,
+    node_state_diff_arguments,
 )
 from .. import (
     Deployment, Application, DockerImage, Node, NodeState, Manifestation,
@@ -501,6 +503,68 @@ class ControlAMPTests(ControlTestCase):
             self.control_amp_service.cluster_state.as_deployment(),
         )
 
+    def test_nodestate_diff_updates_node_state(self):
+        """
+        ``NodeStateDiffCommand`` updates the node state by applying the diff to
+        the state changes previously received on the same connection.
+        """
+        changes = (NODE_STATE, NONMANIFEST)
+        changed_node_state = NODE_STATE.transform(
+            ["applications", APP1.name], APP1.set(running=False),
+        )
+        changed = (changed_node_state, NONMANIFEST)
+        self.successResultOf(
+            self.client.callRemote(NodeStateCommand,
+                                   state_changes=changes,
+                                   eliot_context=TEST_ACTION))
+        self.successResultOf(
+            self.client.callRemote(NodeStateDiffCommand,
+                                   eliot_context=TEST_ACTION,
+                                   **node_state_diff_arguments(
+                                       changes, changed)))
+        self.assertEqual(
+            DeploymentState(
+                nodes={changed_node_state},
+                nonmanifest_datasets=NONMANIFEST.datasets,
+            ),
+            self.control_amp_service.cluster_state.as_deployment(),
+        )
+
+    def test_nodestate_diff_without_node_state(self):
+        """
+        ``NodeStateDiffCommand`` fails with ``NodeStateGenerationMismatch`` if
+        no node state has been received on the connection.
+        """
+        self.failureResultOf(
+            self.client.callRemote(NodeStateDiffCommand,
+                                   eliot_context=TEST_ACTION,
+                                   **node_state_diff_arguments(
+                                       (SIMPLE_NODE_STATE,), (NODE_STATE,))),
+            NodeStateGenerationMismatch,
+        )
+
+    def test_nodestate_diff_wrong_start(self):
+        """
+        ``NodeStateDiffCommand`` fails with ``NodeStateGenerationMismatch`` and
+        leaves the node state alone if the diff was made against some other
+        state than the one last received on the connection.
+        """
+        self.successResultOf(
+            self.client.callRemote(NodeStateCommand,
+                                   state_changes=(NODE_STATE,),
+                                   eliot_context=TEST_ACTION))
+        self.failureResultOf(
+            self.client.callRemote(NodeStateDiffCommand,
+                                   eliot_context=TEST_ACTION,
+                                   **node_state_diff_arguments(
+                                       (SIMPLE_NODE_STATE,), (NODE_STATE,))),
+            NodeStateGenerationMismatch,
+        )
+        self.assertEqual(
+            DeploymentState(nodes={NODE_STATE}),
+            self.control_amp_service.cluster_state.as_deployment(),
+        )
+
     def test_activity_refreshes_node_state(self):
         """
         Any time commands are dispatched by ``ControlAMP`` its activity
@@ -756,13 +756,40 @@ CONFIGURATION_DATASETS_CREATE_FAILING_INSTANCES.setdefault(
      u"dataset_id": valid_uuid}
 )
 
+CONFIGURATION_DATASETS_CREATE_FAILING_INSTANCES.setdefault(
+    INVALID_WRONG_TYPE, []
+).append(
+    # unique_metadata must be a list of keys
+    {u"primary": valid_uuid, u"unique_metadata": u"name"}
+)
+CONFIGURATION_DATASETS_CREATE_FAILING_INSTANCES.setdefault(
+    INVALID_ARRAY_ITEMS_NOT_UNIQUE, []
+).append(
+    {u"primary": valid_uuid, u"unique_metadata": [u"name", u"name"]}
+)
+CONFIGURATION_DATASETS_CREATE_FAILING_INSTANCES.setdefault(
+    INVALID_ARRAY_ITEMS_MAXIMUM, []
+).append(
+    {u"primary": valid_uuid,
+     u"unique_metadata": [unicode(i) for i in range(17)]}
+)
+
+CONFIGURATION_DATASETS_CREATE_PASSING_INSTANCES = (
+    CONFIGURATION_DATASETS_PASSING_INSTANCES + [
+        {u"primary": valid_uuid,
+         u"metadata": {u"name": u"x"},
+         u"unique_metadata": [u"name"]},
+        {u"primary": valid_uuid, u"unique_metadata": []},
+    ]
+)
+
 ConfigurationDatasetsCreateSchemaTests = build_schema_test(
     name="ConfigurationDatasetsCreateSchemaTests",
     schema={'$ref':
             '/v1/endpoints.json#/definitions/configuration_datasets_create'},
     schema_store=SCHEMAS,
     failing_instances=CONFIGURATION_DATASETS_CREATE_FAILING_INSTANCES,
-    passing_instances=CONFIGURATION_DATASETS_PASSING_INSTANCES,
+    passing_instances=CONFIGURATION_DATASETS_CREATE_PASSING_INSTANCES,
 )
 
 StateDatasetsArraySchemaTests = build_schema_test(
@@ -6,7 +6,6 @@ An HTTP API implementing the Docker Volumes Plugin API.
 See https://github.com/docker/docker/tree/master/docs/extend for details.
 """
 
-from itertools import repeat
 from functools import wraps
 
 import yaml
@@ -18,7 +17,11 @@ from eliot import writeFailure
 from eliot.twisted import DeferredContext
 
 from twisted.python.filepath import FilePath
-from twisted.internet.defer import CancelledError, gatherResults, maybeDeferred
+from twisted.internet.defer import (
+    CancelledError, Deferred, FirstError, gatherResults, maybeDeferred,
+    succeed,
+)
+from twisted.python.failure import Failure
 from twisted.web.http import OK
 
 from klein import Klein
@@ -26,11 +29,10 @@ from klein import Klein
 from ..restapi import (
     structured, EndpointResponse, BadRequest, make_bad_request,
 )
-from ..apiclient import DatasetAlreadyExists, conditional_create
+from ..apiclient import DatasetAlreadyExists
 from ..node.agents.blockdevice import PROFILE_METADATA_KEY
 from ..common import (
-    RACKSPACE_MINIMUM_VOLUME_SIZE, DEVICEMAPPER_LOOPBACK_SIZE,
-    loop_until, timeout,
+    RACKSPACE_MINIMUM_VOLUME_SIZE, DEVICEMAPPER_LOOPBACK_SIZE, timeout,
 )
 
 
@@ -144,6 +146,206 @@ NOT_FOUND_RESPONSE = make_bad_request(
     Err=u"Could not find volume with given name.")
 
 
+class _CachedListing(object):
+    """
+    The result of an expensive listing, reused until it is older than a
+    given age or is explicitly invalidated.
+
+    Callers asking for the listing while it is being fetched share that
+    fetch rather than starting their own.
+
+    :ivar _generation: Incremented by ``invalidate``, so that a fetch
+        which started before invalidation doesn't get cached.
+    :ivar _expires: The time at which the cached value becomes stale, or
+        ``None`` if there is no cached value.
+    :ivar _waiting: ``Deferred`` instances waiting for the fetch in
+        progress, or ``None`` if there isn't one.
+    """
+    def __init__(self, reactor, fetch, ttl):
+        """
+        :param IReactorTime reactor: Used to tell how old the listing is.
+        :param fetch: No-argument callable returning a ``Deferred`` that
+            fires with a new listing.
+        :param float ttl: For how many seconds, measured from when it was
+            requested, a listing may be reused.
+        """
+        self._reactor = reactor
+        self._fetch = fetch
+        self._ttl = ttl
+        self._generation = 0
+        self._value = None
+        self._expires = None
+        self._waiting = None
+
+    def get(self):
+        """
+        :return: ``Deferred`` firing with the cached listing if it is still
+            fresh, otherwise with a newly fetched one.
+        """
+        if (self._expires is not None and
+                self._reactor.seconds() < self._expires):
+            return succeed(self._value)
+        result = Deferred()
+        if self._waiting is not None:
+            self._waiting.append(result)
+            return result
+
+        waiting = self._waiting = [result]
+        generation = self._generation
+        started = self._reactor.seconds()
+
+        def fetched(value):
+            if generation == self._generation:
+                self._value = value
+                self._expires = started + self._ttl
+            return value
+
+        def notify(outcome):
+            if self._waiting is waiting:
+                self._waiting = None
+            for waiter in waiting:
+                if isinstance(outcome, Failure):
+                    waiter.errback(outcome)
+                else:
+                    waiter.callback(outcome)
+
+        d = maybeDeferred(self._fetch)
+        d.addCallback(fetched)
+        d.addBoth(notify)
+        return result
+
+    def invalidate(self):
+        """
+        Discard the cached listing, and stop sharing any fetch in progress,
+        so that the next ``get`` sees changes made until now.
+        """
+        self._generation += 1
+        self._value = None
+        self._expires = None
+        self._waiting = None
+
+
+class _MountWatcher(object):
+    """
+    Wait for datasets to be mounted on this node.
+
+    However many mounts are waiting, a single loop checks the state of the
+    cluster, waking each waiting mount once its dataset has a local
+    mountpoint.
+
+    :ivar _waiting: ``dict`` mapping the ``UUID`` of each dataset being
+        waited for to a ``list`` of ``Deferred`` instances to fire with its
+        mountpoint.
+    :ivar _checking: Whether a check is in progress.
+    :ivar _next_check: The ``IDelayedCall`` for the next check, or ``None``
+        if none is scheduled.
+    """
+    def __init__(self, reactor, paths, interval):
+        """
+        :param IReactorTime reactor: Used to schedule checks.
+        :param _CachedListing paths: Listing of local mountpoints, as
+            returned by ``_index_paths``.
+        :param float interval: Seconds to wait between checks.
+        """
+        self._reactor = reactor
+        self._paths = paths
+        self._interval = interval
+        self._waiting = {}
+        self._checking = False
+        self._next_check = None
+
+    def wait(self, dataset_id):
+        """
+        Wait for a dataset to be mounted on this node.
+
+        :param UUID dataset_id: The dataset to wait for.
+
+        :return: ``Deferred`` firing with the mountpoint ``FilePath`` of the
+            dataset. Cancelling it stops waiting.
+        """
+        def cancel(result):
+            waiters = self._waiting.get(dataset_id, [])
+            if result in waiters:
+                waiters.remove(result)
+                if not waiters:
+                    del self._waiting[dataset_id]
+            if not self._waiting and self._next_check is not None:
+                self._next_check.cancel()
+                self._next_check = None
+
+        result = Deferred(cancel)
+        self._waiting.setdefault(dataset_id, []).append(result)
+        if not self._checking and self._next_check is None:
+            self._check()
+        return result
+
+    def _check(self):
+        """
+        Wake the mounts whose datasets are now mounted, then schedule the
+        next check if any are still waiting.
+
+        If listing the mountpoints fails all of the waiting mounts fail.
+        """
+        self._next_check = None
+        self._checking = True
+
+        def got_paths(paths):
+            for dataset_id in list(self._waiting):
+                path = paths.get(dataset_id)
+                if path is not None:
+                    for waiter in self._waiting.pop(dataset_id):
+                        waiter.callback(path)
+
+        def failed(reason):
+            waiting, self._waiting = self._waiting, {}
+            for waiters in waiting.values():
+                for waiter in waiters:
+                    waiter.errback(reason)
+
+        def checked(_):
+            self._checking = False
+            if self._waiting:
+                self._next_check = self._reactor.callLater(
+                    self._interval, self._check)
+
+        d = self._paths.get()
+        d.addCallbacks(got_paths, failed)
+        d.addCallback(checked)
+
+
+def _index_names(configured):
+    """
+    Index the named datasets in a configuration listing.
+
+    :param configured: Iterable of configured ``Dataset`` instances.
+
+    :return: Tuple of a list of ``(name, dataset_id)`` for every dataset
+        with a name, in listing order, and a ``dict`` mapping each name to
+        the ID of the first dataset with that name.
+    """
+    volumes = [
+        (dataset.metadata[NAME_FIELD], dataset.dataset_id)
+        for dataset in configured if NAME_FIELD in dataset.metadata
+    ]
+    return volumes, dict(reversed(volumes))
+
+
+def _index_paths(node_id, datasets):
+    """
+    Index the datasets in a state listing which are mounted on a node.
+
+    :param UUID node_id: The node whose datasets to index.
+    :param datasets: Iterable of ``DatasetState`` instances.
+
+    :return: ``dict`` mapping the ``UUID`` of each dataset whose primary is
+        ``node_id`` to its mountpoint ``FilePath``.
+    """
+    return {
+        dataset.dataset_id: dataset.path
+        for dataset in datasets if dataset.primary == node_id
+    }
+
+
 class VolumePlugin(object):
     """
     An implementation of the Docker Volumes Plugin API.
@@ -152,9 +354,17 @@ class VolumePlugin(object):
     maintained by someone else, and lacking a schema provided by Docker we
     can't be sure they won't change things in minor ways. We do validate
     outputs to ensure we output the documented requirements.
+
+    Rather than listing the whole cluster for each call Docker makes,
+    dataset names and local mountpoints are looked up in indexes built from
+    recent listings. Names are cached for longer since they only change
+    when datasets are created, which the plugin invalidates the index for
+    when it does so itself.
     """
     _POLL_INTERVAL = 1.0
     _MOUNT_TIMEOUT = 120.0
+    _NAMES_TTL = 10.0
+    _PATHS_TTL = _POLL_INTERVAL
 
     app = Klein()
 
@@ -169,6 +379,29 @@ class VolumePlugin(object):
         self._reactor = reactor
         self._flocker_client = flocker_client
         self._node_id = node_id
+        self._names = _CachedListing(
+            reactor, self._list_names, self._NAMES_TTL)
+        self._paths = _CachedListing(
+            reactor, self._list_paths, self._PATHS_TTL)
+        self._mounts = _MountWatcher(reactor, self._paths, self._POLL_INTERVAL)
+
+    def _list_names(self):
+        """
+        :return: ``Deferred`` firing with the result of ``_index_names`` for
+            the current configuration.
+        """
+        d = self._flocker_client.list_datasets_configuration()
+        d.addCallback(_index_names)
+        return d
+
+    def _list_paths(self):
+        """
+        :return: ``Deferred`` firing with the result of ``_index_paths`` for
+            the current state of this node.
+        """
+        d = self._flocker_client.list_datasets_state()
+        d.addCallback(lambda datasets: _index_paths(self._node_id, datasets))
+        return d
 
     @app.route("/Plugin.Activate", methods=["POST"])
     @_endpoint(u"PluginActivate", ignore_body=True)
@@ -222,18 +455,27 @@ class VolumePlugin(object):
         :param name: The name of the volume, stored as ``"name"`` field in
             dataset metadata.
 
+        A name missing from the cached index may belong to a dataset
+        created since it was built, e.g. by another node's plugin, so the
+        index is refreshed once before giving up.
+
         :return: ``Deferred`` firing with dataset ID as ``UUID``, or
             errbacks with ``_NotFound`` if no dataset was found.
         """
-        listing = self._flocker_client.list_datasets_configuration()
-
-        def got_configured(configured):
-            for dataset in configured:
-                if dataset.metadata.get(NAME_FIELD) == name:
-                    return dataset.dataset_id
-            raise NOT_FOUND_RESPONSE
+        def got_names(index, refreshed):
+            _, dataset_ids = index
+            dataset_id = dataset_ids.get(name)
+            if dataset_id is not None:
+                return dataset_id
+            if refreshed:
+                raise NOT_FOUND_RESPONSE
+            self._names.invalidate()
+            d = self._names.get()
+            d.addCallback(got_names, refreshed=True)
+            return d
 
-        listing.addCallback(got_configured)
+        listing = self._names.get()
+        listing.addCallback(got_names, refreshed=False)
         return listing
 
     @app.route("/VolumeDriver.Create", methods=["POST"])
@@ -242,14 +484,11 @@ class VolumePlugin(object):
         """
         Create a volume with the given name.
 
-        We hash the name to give a consistent dataset. This ensures that
-        if due to race condition we attempt to create two volumes with
-        same name only one will be created.
-
-        We also check for existence of matching dataset based on
-        ``"name"`` field in metadata, in case we're talking to cluster
-        that has datasets that weren't created with this hashing
-        mechanism.
+        The control service ensures that no other dataset has the same
+        ``"name"`` field in its metadata, as part of the same request that
+        creates the dataset. This ensures that if due to race condition we
+        attempt to create two volumes with same name only one will be
+        created.
 
         If there is a duplicate we don't return an error, but rather
         success: we will likely get unneeded creates from Docker since it
@@ -278,15 +517,11 @@ class VolumePlugin(object):
         else:
             size = DEFAULT_SIZE
 
-        def ensure_unique_name(configured):
-            for dataset in configured:
-                if dataset.metadata.get(NAME_FIELD) == Name:
-                    raise DatasetAlreadyExists
-
-        creating = conditional_create(
-            self._flocker_client, self._reactor, ensure_unique_name,
-            self._node_id, int(size.to_Byte()), metadata=metadata)
+        creating = self._flocker_client.create_dataset(
+            self._node_id, int(size.to_Byte()), metadata=metadata,
+            unique_metadata=[NAME_FIELD])
         creating.addErrback(lambda reason: reason.trap(DatasetAlreadyExists))
+        creating.addCallback(lambda _: self._names.invalidate())
         creating.addCallback(lambda _: {u"Err": u""})
         return creating
 
@@ -300,16 +535,8 @@ class VolumePlugin(object):
             ``None`` if the dataset is not locally mounted, or errbacks
             with ``_NotFound`` if it is does not exist at all.
         """
-        d = self._flocker_client.list_datasets_state()
-
-        def got_state(datasets):
-            datasets = [dataset for dataset in datasets
-                        if dataset.dataset_id == dataset_id]
-            if datasets and datasets[0].primary == self._node_id:
-                return datasets[0].path
-            else:
-                return None
-        d.addCallback(got_state)
+        d = self._paths.get()
+        d.addCallback(lambda paths: paths.get(dataset_id))
         return d
 
     @app.route("/VolumeDriver.Mount", methods=["POST"])
@@ -319,7 +546,8 @@ class VolumePlugin(object):
         Move a volume with the given name to the current node and mount it.
 
         Since we need to return the filesystem path we wait until the
-        dataset is mounted locally.
+        dataset is mounted locally. All mounts in progress share the same
+        checks of the cluster state.
 
         :param unicode Name: The name of the volume.
         :param string ID: A unique ID for caller that requested the mount
@@ -334,12 +562,12 @@ class VolumePlugin(object):
         d.addCallback(lambda dataset_id:
                       self._flocker_client.move_dataset(self._node_id,
                                                         dataset_id))
-        d.addCallback(lambda dataset: dataset.dataset_id)
 
-        d.addCallback(lambda dataset_id: loop_until(
-            self._reactor,
-            lambda: self._get_path_from_dataset_id(dataset_id),
-            repeat(self._POLL_INTERVAL)))
+        def moved(dataset):
+            self._paths.invalidate()
+            return dataset.dataset_id
+        d.addCallback(moved)
+        d.addCallback(self._mounts.wait)
         d.addCallback(lambda p: {u"Err": u"", u"Mountpoint": p.path})
 
         timeout(self._reactor, d.result, self._MOUNT_TIMEOUT)
@@ -412,27 +640,24 @@ class VolumePlugin(object):
         :return: Result indicating success.
         """
         listing = DeferredContext(
-            self._flocker_client.list_datasets_configuration())
+            gatherResults([self._names.get(), self._paths.get()],
+                          consumeErrors=True))
 
-        def got_configured(configured):
+        def got_paths(indexes):
+            (volumes, _), paths = indexes
+            # Datasets without a name can't be used by the Docker plugin, so
+            # they aren't in the index at all.
             results = []
-            for dataset in configured:
-                # Datasets without a name can't be used by the Docker plugin:
-                if NAME_FIELD not in dataset.metadata:
-                    continue
-                dataset_name = dataset.metadata[NAME_FIELD]
-                d = self._get_path_from_dataset_id(dataset.dataset_id)
-                d.addCallback(lambda path, name=dataset_name: (path, name))
-                results.append(d)
-            return gatherResults(results)
-
-        listing.addCallback(got_configured)
-
-        def got_paths(results):
-            return {u"Err": u"",
-                    u"Volumes": sorted([
-                        {u"Name": name,
-                         u"Mountpoint": u"" if path is None else path.path}
-                        for (path, name) in results])}
+            for name, dataset_id in volumes:
+                path = paths.get(dataset_id)
+                results.append(
+                    {u"Name": name,
+                     u"Mountpoint": u"" if path is None else path.path})
+            return {u"Err": u"", u"Volumes": sorted(results)}
         listing.addCallback(got_paths)
+
+        def first_error(failure):
+            failure.trap(FirstError)
+            return failure.value.subFailure
+        listing.addErrback(first_error)
         return listing.result
@@ -9,9 +9,12 @@ from uuid import uuid4
 
 from bitmath import TiB, GiB, MiB, KiB, Byte
 
+from twisted.python.filepath import FilePath
 from twisted.web.http import OK, NOT_ALLOWED, NOT_FOUND
 from twisted.internet.task import Clock, LoopingCall
-from twisted.internet.defer import gatherResults
+from twisted.internet.defer import (
+    CancelledError, Deferred, fail, gatherResults, succeed,
+)
 
 from hypothesis import given
 from hypothesis.strategies import (
@@ -22,9 +25,12 @@ from pyrsistent import pmap
 
 from eliot.testing import capture_logging
 
-from .._api import VolumePlugin, DEFAULT_SIZE, parse_num, NAME_FIELD
-from ...apiclient import FakeFlockerClient, Dataset, DatasetsConfiguration
-from ...testtools import CustomException, random_name
+from .._api import (
+    VolumePlugin, DEFAULT_SIZE, parse_num, NAME_FIELD, _CachedListing,
+    _MountWatcher,
+)
+from ...apiclient import FakeFlockerClient, Dataset
+from ...testtools import CustomException, TestCase, random_name
 
 from ...restapi import make_bad_request
 from ...restapi.testtools import (
@@ -86,9 +92,9 @@ class APITestsMixin(APIAssertionsMixin):
         """
         self.volume_plugin_reactor = Clock()
         self.flocker_client = SimpleCountingProxy(FakeFlockerClient())
-        # The conditional_create operation used by the plugin relies on
-        # the passage of time... so make sure time passes! We still use a
-        # fake clock since some tests want to skip ahead.
+        # The plugin's caches of cluster listings rely on the passage of
+        # time... so make sure time passes! We still use a fake clock since
+        # some tests want to skip ahead.
         self.looping = LoopingCall(
             lambda: self.volume_plugin_reactor.advance(0.001))
         self.looping.start(0.001)
@@ -291,22 +297,36 @@ class APITestsMixin(APIAssertionsMixin):
         """
         name = u"thename"
 
-        # Create a dataset out-of-band with matching dataset ID and name
-        # which the docker plugin won't be able to see.
-        def create_after_list():
+        # Create a dataset out-of-band with matching name just before the
+        # plugin's own create request arrives:
+        def create_first(*args, **kwargs):
             # Clean up the patched version:
-            del self.flocker_client.list_datasets_configuration
-            # But first time we're called, we create dataset and lie about
-            # its existence:
+            del self.flocker_client.create_dataset
             d = self.flocker_client.create_dataset(
                 self.NODE_A, int(DEFAULT_SIZE.to_Byte()),
                 metadata={NAME_FIELD: name})
-            d.addCallback(lambda _: DatasetsConfiguration(
-                tag=u"1234", datasets={}))
+            d.addCallback(
+                lambda _: self.flocker_client.create_dataset(*args, **kwargs))
             return d
-        self.flocker_client.list_datasets_configuration = create_after_list
+        self.flocker_client.create_dataset = create_first
+
+        d = self.create(name)
+        d.addCallback(
+            lambda _: self.flocker_client.list_datasets_configuration())
+        d.addCallback(lambda results: self.assertEqual(len(list(results)), 1))
+        return d
 
-        return self.create(name)
+    def test_create_api_calls(self):
+        """
+        ``/VolumeDriver.Create`` makes a single API call, leaving it to the
+        control service to check the name is unique.
+        """
+        d = self.create(u"myvol")
+        d.addCallback(lambda _: self.assertEqual(
+            (1, 0),
+            (self.flocker_client.num_calls('create_dataset'),
+             self.flocker_client.num_calls('list_datasets_configuration'))))
+        return d
 
     def _flush_volume_plugin_reactor_on_endpoint_render(self):
         """
@@ -777,9 +797,249 @@ class APITestsMixin(APIAssertionsMixin):
                            u"Volumes": []}))
         return d
 
+    def test_list_api_calls(self):
+        """
+        ``/VolumeDriver.List`` lists the configuration and state once each,
+        however many volumes there are.
+        """
+        d = gatherResults([
+            self.flocker_client.create_dataset(
+                node, int(DEFAULT_SIZE.to_Byte()),
+                metadata={NAME_FIELD: u"vol{}".format(i)})
+            for i, node in enumerate([self.NODE_A, self.NODE_B] * 5)])
+        d.addCallback(lambda _: self.flocker_client.synchronize_state())
+        d.addCallback(lambda _: self.assertResponseCode(
+            b"POST", b"/VolumeDriver.List", {}, OK))
+        d.addCallback(lambda _: self.assertEqual(
+            (1, 1),
+            (self.flocker_client.num_calls('list_datasets_configuration'),
+             self.flocker_client.num_calls('list_datasets_state'))))
+        return d
+
+    def test_names_cached(self):
+        """
+        Looking up the same volume name repeatedly only lists the
+        configuration once.
+        """
+        name = u"myvol"
+        d = self.flocker_client.create_dataset(
+            self.NODE_B, int(DEFAULT_SIZE.to_Byte()),
+            metadata={NAME_FIELD: name})
+        for _ in range(3):
+            d.addCallback(lambda _: self.assertResponseCode(
+                b"POST", b"/VolumeDriver.Get", {u"Name": name}, OK))
+        d.addCallback(lambda _: self.assertEqual(
+            1, self.flocker_client.num_calls('list_datasets_configuration')))
+        return d
+
+    def test_names_refreshed_on_miss(self):
+        """
+        A volume created by something other than this plugin after the names
+        were cached can still be found.
+        """
+        name = u"myvol"
+        d = self.assertResult(
+            b"POST", b"/VolumeDriver.Get", {u"Name": name}, OK,
+            {u"Err": u"Could not find volume with given name."})
+        d.addCallback(lambda _: self.flocker_client.create_dataset(
+            self.NODE_B, int(DEFAULT_SIZE.to_Byte()),
+            metadata={NAME_FIELD: name}))
+        d.addCallback(lambda _: self.assertResult(
+            b"POST", b"/VolumeDriver.Get", {u"Name": name}, OK,
+            {u"Err": u"",
+             u"Volume": {u"Name": name, u"Mountpoint": u""}}))
+        return d
+
+    def test_list_after_create(self):
+        """
+        ``/VolumeDriver.List`` includes a volume created by
+        ``/VolumeDriver.Create`` even if the names were cached before it.
+        """
+        name = u"myvol"
+        d = self.assertResult(
+            b"POST", b"/VolumeDriver.List", {}, OK,
+            {u"Err": u"", u"Volumes": []})
+        d.addCallback(lambda _: self.create(name))
+        d.addCallback(lambda _: self.assertResult(
+            b"POST", b"/VolumeDriver.List", {}, OK,
+            {u"Err": u"",
+             u"Volumes": [{u"Name": name, u"Mountpoint": u""}]}))
+        return d
+
 
 def _build_app(test):
     test.initialize()
     return VolumePlugin(
         test.volume_plugin_reactor, test.flocker_client, test.NODE_A).app
 RealTestsAPI = build_UNIX_integration_tests(APITestsMixin, "API", _build_app)
+
+
+class CachedListingTests(TestCase):
+    """
+    Tests for ``_CachedListing``.
+    """
+    def setUp(self):
+        super(CachedListingTests, self).setUp()
+        self.clock = Clock()
+        self.fetches = []
+        self.listing = _CachedListing(self.clock, self.fetch, 5.0)
+
+    def fetch(self):
+        """
+        Start a fetch which completes when the test fires the ``Deferred``
+        recorded in ``self.fetches``.
+        """
+        d = Deferred()
+        self.fetches.append(d)
+        return d
+
+    def test_cached(self):
+        """
+        ``get`` reuses a fetched value until it is ``ttl`` seconds old.
+        """
+        first = self.listing.get()
+        self.fetches[0].callback(u"value")
+        self.clock.advance(4.9)
+        second = self.listing.get()
+        self.clock.advance(0.1)
+        self.listing.get()
+        self.assertEqual(
+            (u"value", u"value", 2),
+            (self.successResultOf(first), self.successResultOf(second),
+             len(self.fetches)))
+
+    def test_shared_fetch(self):
+        """
+        Callers of ``get`` while a fetch is in progress get its result.
+        """
+        first = self.listing.get()
+        second = self.listing.get()
+        self.fetches[0].callback(u"value")
+        self.assertEqual(
+            (u"value", u"value", 1),
+            (self.successResultOf(first), self.successResultOf(second),
+             len(self.fetches)))
+
+    def test_synchronous_fetch(self):
+        """
+        ``get`` works with a fetch whose result is already available.
+        """
+        listing = _CachedListing(self.clock, lambda: succeed(u"value"), 5.0)
+        self.assertEqual(u"value", self.successResultOf(listing.get()))
+
+    def test_failure_not_cached(self):
+        """
+        If fetching fails every caller waiting for it gets the failure, and
+        the next ``get`` fetches again.
+        """
+        first = self.listing.get()
+        second = self.listing.get()
+        self.fetches[0].errback(CustomException())
+        self.listing.get()
+        self.failureResultOf(first, CustomException)
+        self.failureResultOf(second, CustomException)
+        self.assertEqual(2, len(self.fetches))
+
+    def test_invalidate(self):
+        """
+        After ``invalidate`` the next ``get`` fetches again.
+        """
+        self.listing.get()
+        self.fetches[0].callback(u"old")
+        self.listing.invalidate()
+        d = self.listing.get()
+        self.fetches[1].callback(u"new")
+        self.assertEqual(u"new", self.successResultOf(d))
+
+    def test_invalidate_during_fetch(self):
+        """
+        A fetch in progress when ``invalidate`` is called is not shared with
+        later callers and its result is not cached.
+        """
+        first = self.listing.get()
+        self.listing.invalidate()
+        second = self.listing.get()
+        self.fetches[0].callback(u"old")
+        self.fetches[1].callback(u"new")
+        self.listing.get()
+        self.assertEqual(
+            (u"old", u"new", 2),
+            (self.successResultOf(first), self.successResultOf(second),
+             len(self.fetches)))
+
+
+class MountWatcherTests(TestCase):
+    """
+    Tests for ``_MountWatcher``.
+    """
+    def setUp(self):
+        super(MountWatcherTests, self).setUp()
+        self.clock = Clock()
+        self.paths = {}
+        self.fetches = 0
+        self.failing = False
+        self.watcher = _MountWatcher(
+            self.clock, _CachedListing(self.clock, self.fetch, 1.0), 1.0)
+
+    def fetch(self):
+        """
+        List the mountpoints in ``self.paths``, counting the listings, or
+        fail if ``self.failing`` is set.
+        """
+        self.fetches += 1
+        if self.failing:
+            return fail(CustomException())
+        return succeed(self.paths.copy())
+
+    def test_already_mounted(self):
+        """
+        ``wait`` fires immediately if the dataset is already mounted.
+        """
+        dataset_id = uuid4()
+        self.paths[dataset_id] = FilePath(b"/flocker/a")
+        self.assertEqual(
+            (FilePath(b"/flocker/a"), []),
+            (self.successResultOf(self.watcher.wait(dataset_id)),
+             self.clock.getDelayedCalls()))
+
+    def test_shared_checks(self):
+        """
+        Mounts waiting at the same time share checks of the state, each
+        being woken when its own dataset is mounted.
+        """
+        first_id, second_id = uuid4(), uuid4()
+        first = self.watcher.wait(first_id)
+        second = self.watcher.wait(second_id)
+        self.clock.advance(1.0)
+        self.paths[first_id] = FilePath(b"/flocker/first")
+        self.clock.advance(1.0)
+        first_result = self.successResultOf(first)
+        self.assertNoResult(second)
+        self.paths[second_id] = FilePath(b"/flocker/second")
+        self.clock.advance(1.0)
+        self.assertEqual(
+            (FilePath(b"/flocker/first"), FilePath(b"/flocker/second"), 4,
+             []),
+            (first_result, self.successResultOf(second), self.fetches,
+             self.clock.getDelayedCalls()))
+
+    def test_cancel(self):
+        """
+        Cancelling the last waiting mount stops checking the state.
+        """
+        d = self.watcher.wait(uuid4())
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual([], self.clock.getDelayedCalls())
+
+    def test_failure(self):
+        """
+        If listing the state fails every waiting mount fails.
+        """
+        first = self.watcher.wait(uuid4())
+        second = self.watcher.wait(uuid4())
+        self.failing = True
+        self.clock.advance(1.0)
+        self.failureResultOf(first, CustomException)
+        self.failureResultOf(second, CustomException)
+        self.assertEqual([], self.clock.getDelayedCalls())
@@ -12,7 +12,7 @@ from zope.interface import implementer
 
 from pyrsistent import PClass, field
 
-from eliot import Message, Logger, start_action
+from eliot import Message, Logger, start_action, writeFailure
 
 from twisted.internet.defer import succeed
 
@@ -161,6 +161,38 @@ class StopApplication(PClass):
         return deployer.docker_client.remove(unit_name)
 
 
+@implementer(IStateChange)
+class PullImage(PClass):
+    """
+    Start downloading an image in the background so that it is already
+    available when the containers that need it are started.
+
+    :ivar unicode image_name: The name of the image to pull.
+    """
+    image_name = field(type=unicode, mandatory=True)
+
+    @property
+    def eliot_action(self):
+        return start_action(
+            _logger, _eliot_system(u"pullimage"),
+            image=self.image_name,
+        )
+
+    def run(self, deployer, state_persister):
+        image_name = self.image_name
+        deployer.image_prefetched(image_name)
+        pulling = deployer.docker_client.pull(image_name)
+
+        def failed(failure):
+            # Let a later calculation try again:
+            deployer.forget_prefetched_image(image_name)
+            writeFailure(failure, _logger)
+        pulling.addErrback(failed)
+        # Starting a container waits for a pull of its image which is in
+        # progress, so there is no need to hold up anything else:
+        return succeed(None)
+
+
 @implementer(IDeployer)
 class ApplicationNodeDeployer(object):
     """
@@ -170,6 +202,9 @@ class ApplicationNodeDeployer(object):
             on.
     :ivar IDockerClient docker_client: The Docker client API to use in
         deployment operations. Default ``DockerClient``.
+    :ivar set _prefetched: Names of the images which have been pulled, or are
+        being pulled, ahead of starting containers by ``PullImage``.  Names
+        are dropped once no application waits for the image any more.
     """
     def __init__(self, hostname, docker_client=None, node_uuid=None):
         if node_uuid is None:
@@ -183,6 +218,25 @@ class ApplicationNodeDeployer(object):
         if docker_client is None:
             docker_client = DockerClient()
         self.docker_client = docker_client
+        self._prefetched = set()
+
+    def image_prefetched(self, image_name):
+        """
+        Record that an image is being pulled ahead of starting the containers
+        which need it, so that ``calculate_changes`` doesn't pull it again.
+
+        :param unicode image_name: The name of the image.
+        """
+        self._prefetched.add(image_name)
+
+    def forget_prefetched_image(self, image_name):
+        """
+        Forget that an image was pulled, so that ``calculate_changes`` pulls
+        it again if it is still needed.
+
+        :param unicode image_name: The name of the image.
+        """
+        self._prefetched.discard(image_name)
 
     def _attached_volume_for_container(
             self, container, path_to_manifestations
@@ -543,8 +597,10 @@ class ApplicationNodeDeployer(object):
 
         1. Change proxies to point to new addresses (should really be
            last, see https://clusterhq.atlassian.net/browse/FLOC-380)
-        2. Stop all relevant containers.
-        3. Start and restart any containers that should be running
+        2. Start downloading the images of containers which can't be
+           started straight away.
+        3. Stop all relevant containers.
+        4. Start and restart any containers that should be running
            locally, so long as their required datasets are available.
         """
         # We are a node-specific IDeployer:
@@ -614,6 +670,30 @@ class ApplicationNodeDeployer(object):
                                      node_state=current_node_state),
                 ]))
 
+        # Containers may have to wait for their datasets before they can be
+        # started, and restarted containers are only started again after
+        # they are stopped, so start downloading the images that aren't in
+        # use yet now rather than when their containers are started:
+        waiting_images = (
+            {app.image.full_name
+             for app in desired_node_applications.values()} -
+            {app.image.full_name for app in all_applications}
+        )
+        # Images whose applications now exist, or were removed from the
+        # configuration, are pulled again if they are needed again:
+        for image_name in self._prefetched - waiting_images:
+            self.forget_prefetched_image(image_name)
+        pull_images = sorted(
+            waiting_images -
+            {change.application.image.full_name
+             for change in start_containers} -
+            self._prefetched
+        )
+        if pull_images:
+            phases.append(in_parallel(changes=[
+                PullImage(image_name=image_name)
+                for image_name in pull_images
+            ]))
         if stop_containers:
             phases.append(in_parallel(changes=stop_containers))
         start_restart = start_containers + restart_containers
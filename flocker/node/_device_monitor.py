@@ -0,0 +1,100 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+# -*- test-case-name: flocker.node.test.test_device_monitor -*-
+
+"""
+Notice local block devices appearing and disappearing so the convergence loop
+can react as soon as the kernel reports them, instead of at its next timed
+iteration.
+"""
+
+from os import stat
+from stat import S_ISBLK
+
+from eliot import MessageType, Field
+
+from twisted.application.service import Service
+from twisted.internet import inotify
+from twisted.python.filepath import FilePath
+from twisted.python.runtime import platform
+
+
+DEVICE_CHANGED = MessageType(
+    u"flocker:node:device_monitor:changed",
+    [Field.for_types(u"path", [bytes], u"The device node that changed."),
+     Field.for_types(u"event", [unicode], u"What happened to it.")],
+    u"A block device node was created or removed.",
+)
+
+_MASK = inotify.IN_CREATE | inotify.IN_DELETE
+
+
+def _is_block_device(path):
+    """
+    :param FilePath path: A path which may or may not exist.
+
+    :return: ``True`` if ``path`` is a block device node, otherwise ``False``.
+    """
+    try:
+        return S_ISBLK(stat(path.path).st_mode)
+    except OSError:
+        return False
+
+
+def device_monitor_supported():
+    """
+    :return: ``True`` if ``DeviceMonitor`` can run on this platform.
+    """
+    return platform.supportsINotify()
+
+
+class DeviceMonitor(Service, object):
+    """
+    Watch a device directory (normally ``/dev``) and call a function whenever
+    a block device node is created there or any node is removed.
+
+    Mount changes are deliberately not watched: the agent makes those itself
+    and it already discovers them in the iteration that made them.
+
+    :ivar reactor: The reactor to watch with.
+    :ivar callable changed: Called with no arguments for each change.
+    :ivar FilePath path: The directory to watch.
+    """
+    def __init__(self, reactor, changed, path=FilePath(b"/dev")):
+        self.reactor = reactor
+        self.changed = changed
+        self.path = path
+        self._notifier = None
+
+    def startService(self):
+        Service.startService(self)
+        self._notifier = inotify.INotify(self.reactor)
+        self._notifier.startReading()
+        self._notifier.watch(
+            self.path, mask=_MASK, callbacks=[self._notified]
+        )
+
+    def stopService(self):
+        Service.stopService(self)
+        self._notifier.loseConnection()
+        self._notifier = None
+
+    def _notified(self, ignored, path, mask):
+        """
+        Handle one inotify event.
+
+        :param FilePath path: The node the event is about.
+        :param int mask: The inotify event mask.
+        """
+        if mask & inotify.IN_CREATE:
+            # Most nodes under /dev are not block devices and creating them
+            # (ttys, shared memory, ...) says nothing about datasets.
+            if not _is_block_device(path):
+                return
+            event = u"created"
+        elif mask & inotify.IN_DELETE:
+            # The node is already gone so there's no telling what it was.
+            event = u"removed"
+        else:
+            return
+        DEVICE_CHANGED(path=path.path, event=event).write()
+        self.changed()
@@ -7,22 +7,23 @@ Docker API client.
 
 from __future__ import absolute_import
 
+import json
+from collections import OrderedDict
 from datetime import timedelta
 
 from errno import ECONNREFUSED
 from socket import error as socket_error
 from functools import partial
 from itertools import repeat
-from time import sleep
+from threading import Lock
+from time import sleep, time
 
 from zope.interface import Interface, implementer
 
 from docker import Client
 from docker.errors import APIError, NotFound
 
-from eliot import Message, MessageType, Field, start_action
-
-from repoze.lru import LRUCache
+from eliot import Message, MessageType, ActionType, Field, start_action
 
 from pyrsistent import field, PClass, pset
 
@@ -34,7 +35,9 @@ from characteristic import with_cmp
 
 from twisted.python.components import proxyForInterface
 from twisted.python.filepath import FilePath
-from twisted.internet.defer import succeed, fail
+from twisted.internet.defer import (
+    Deferred, succeed, fail, gatherResults, DeferredSemaphore, FirstError,
+)
 from twisted.internet.threads import deferToThread
 from twisted.web.http import NOT_FOUND, INTERNAL_SERVER_ERROR
 
@@ -53,11 +56,57 @@ LOG_CACHED_IMAGE = MessageType(
     "An image was retrieved from the cache."
 )
 
+LOG_LIST_TIMINGS = MessageType(
+    u"flocker:node:docker:list_timings",
+    [Field.for_types(u"containers", [int],
+                     "The number of containers inspected."),
+     Field.for_types(u"list_seconds", [float],
+                     "Time spent listing containers."),
+     Field.for_types(u"inspect_seconds", [float],
+                     "Time spent inspecting containers and their images.")],
+    "The time taken by the phases of ``DockerClient.list``."
+)
+
+LOG_PULL = ActionType(
+    u"flocker:node:docker:pull",
+    [Field.for_types(u"image", [unicode], "The image being pulled.")],
+    [Field.for_types(u"pull_seconds", [float],
+                     "How long the download took.")],
+    "An image is downloaded from a registry."
+)
+
+LOG_PULL_PROGRESS = MessageType(
+    u"flocker:node:docker:pull_progress",
+    [Field.for_types(u"layer", [unicode, None], "The layer ID, if any."),
+     Field.for_types(u"status", [unicode], "What Docker is doing with it.")],
+    "The download of one layer of an image moved on to a new stage."
+)
+
+LOG_IMAGE_CACHE_STATS = MessageType(
+    u"flocker:node:docker:image_cache_stats",
+    [Field.for_types(u"hits", [int],
+                     "Lookups answered from the cache so far."),
+     Field.for_types(u"misses", [int],
+                     "Lookups the cache could not answer so far."),
+     Field.for_types(u"entries", [int],
+                     "The number of images in the cache.")],
+    "Image metadata cache statistics."
+)
+
+# Where the container agent remembers image metadata across restarts:
+DEFAULT_IMAGE_CACHE_PATH = b"/var/lib/flocker/docker-image-cache.json"
+
 
 class AlreadyExists(Exception):
     """A unit with the given name already exists."""
 
 
+class PullFailed(Exception):
+    """
+    Docker reported an error while downloading an image.
+    """
+
+
 @with_cmp(["address", "apierror"])
 class AddressInUse(Exception):
     """
@@ -135,6 +184,117 @@ class ImageDataCache(PClass):
     environment = field(mandatory=True, type=(list, type(None)))
 
 
+class ImageMetadataCache(object):
+    """
+    A bounded cache of ``ImageDataCache`` records keyed by image ID, which
+    can be saved to a file so that it is still warm after a restart.
+
+    Image IDs identify image content, so a record never goes stale; the
+    least recently used records are only dropped to bound the cache's size.
+    The cache may be used from several threads at once.
+
+    :ivar int size: The maximum number of records to keep.
+    :ivar FilePath path: The file to load from and ``save`` to, or ``None``
+        to keep the cache in memory only.
+    :ivar int hits: The number of ``get`` calls that found a record.
+    :ivar int misses: The number of ``get`` calls that found nothing.
+    """
+    def __init__(self, size, path=None):
+        self.size = size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._dirty = False
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        """
+        Load the records saved in ``self.path``, if there are any usable
+        ones.
+        """
+        try:
+            records = json.loads(self.path.getContent())
+            entries = [
+                (image, ImageDataCache(
+                    command=record[u"command"],
+                    environment=record[u"environment"],
+                ))
+                for (image, record) in records
+            ]
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            Message.new(
+                message_type=u"flocker:node:docker:image_cache_load_failed",
+                error_message=unicode(e),
+            ).write()
+            return
+        for image, data in entries[-self.size:]:
+            self._entries[image] = data
+
+    def get(self, image):
+        """
+        :param unicode image: The ID of an image.
+
+        :return: The ``ImageDataCache`` for the image or ``None`` if it is not
+            cached.
+        """
+        with self._lock:
+            data = self._entries.pop(image, None)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Move it to the most recently used end:
+            self._entries[image] = data
+            return data
+
+    def put(self, image, data):
+        """
+        Cache data about an image.
+
+        :param unicode image: The ID of the image.
+        :param ImageDataCache data: Data about the image.
+        """
+        with self._lock:
+            self._entries.pop(image, None)
+            self._entries[image] = data
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the records to ``self.path`` if it is set and they changed since
+        they were last saved.
+
+        Failures are logged rather than raised; a missing cache only costs
+        some extra image inspections after the next restart.
+        """
+        with self._lock:
+            if self.path is None or not self._dirty:
+                return
+            records = [
+                (image, {u"command": data.command,
+                         u"environment": data.environment})
+                for (image, data) in self._entries.items()
+            ]
+            self._dirty = False
+        try:
+            if not self.path.parent().exists():
+                self.path.parent().makedirs()
+            self.path.setContent(json.dumps(records))
+        except (IOError, OSError) as e:
+            Message.new(
+                message_type=u"flocker:node:docker:image_cache_save_failed",
+                error_message=unicode(e),
+            ).write()
+
+
 class Unit(PClass):
     """
     Information about a unit managed by Docker.
@@ -284,6 +444,18 @@ class IDockerClient(Interface):
         :return: ``Deferred`` firing with ``set`` of :class:`Unit`.
         """
 
+    def pull(image_name):
+        """
+        Make sure an image is available locally, downloading it if it isn't.
+
+        Pulling an image which is already being pulled waits for that pull
+        rather than starting another one.
+
+        :param unicode image_name: The Docker image to pull.
+
+        :return: ``Deferred`` that fires once the image is available.
+        """
+
 
 def make_response(code, message):
     """
@@ -323,6 +495,7 @@ class FakeDockerClient(object):
             units = {}
         self._units = units
         self._used_ports = pset()
+        self.pulled = []
 
     def add(self, unit_name, image_name, ports=frozenset(), environment=None,
             volumes=frozenset(), mem_limit=None, cpu_shares=None,
@@ -376,6 +549,10 @@ class FakeDockerClient(object):
         units = set(self._units.values())
         return succeed(units)
 
+    def pull(self, image_name):
+        self.pulled.append(image_name)
+        return succeed(None)
+
 
 # Basic namespace for Flocker containers:
 BASE_NAMESPACE = u"flocker--"
@@ -488,17 +665,33 @@ class DockerClient(object):
     :ivar str base_url: URL for connection to the Docker server.
     :ivar int long_timeout: Maximum time in seconds to wait for
         long-running operations, particularly pulling an image.
-    :ivar LRUCache _image_cache: Mapped cache of image IDs to their data.
+    :ivar int list_concurrency: Maximum number of containers ``list`` will
+        inspect at the same time.
+    :ivar int pull_concurrency: Maximum number of images ``pull`` will
+        download at the same time.
+    :ivar int image_cache_size: The maximum number of images to remember
+        metadata for.
+    :ivar FilePath image_cache_path: A file in which to remember image
+        metadata across restarts, or ``None`` to only remember it in memory.
+    :ivar ImageMetadataCache _image_cache: Mapped cache of image IDs to their
+        data.
     """
     def __init__(
             self, namespace=BASE_NAMESPACE, base_url=None,
-            long_timeout=600):
+            long_timeout=600, list_concurrency=8, image_cache_size=1000,
+            image_cache_path=None, pull_concurrency=2):
         self.namespace = namespace
+        self.list_concurrency = list_concurrency
+        self._pull_semaphore = DeferredSemaphore(pull_concurrency)
+        # Image names mapped to the Deferreds waiting for them to be pulled:
+        self._pulls = {}
         self._client = dockerpy_client(
             version="1.15", base_url=base_url,
             long_timeout=timedelta(seconds=long_timeout),
         )
-        self._image_cache = LRUCache(100)
+        self._image_cache = ImageMetadataCache(
+            image_cache_size, image_cache_path,
+        )
 
     def _to_container_name(self, unit_name):
         """
@@ -746,7 +939,7 @@ class DockerClient(object):
             except APIError as e:
                 if self._image_not_found(e):
                     # Pull it and try again
-                    self._client.pull(image_name)
+                    self._blocking_pull(image_name)
                     _create()
                 else:
                     # Unrecognized, just raise it.
@@ -765,7 +958,14 @@ class DockerClient(object):
                 else:
                     break
 
-        d = deferToThread(_add)
+        if image_name in self._pulls:
+            # Rather than downloading the image a second time, wait for it to
+            # arrive.  If that pull fails, ``_add`` gets to try again.
+            d = self.pull(image_name)
+            d.addErrback(lambda failure: None)
+            d.addCallback(lambda ignored: deferToThread(_add))
+        else:
+            d = deferToThread(_add)
 
         def _extract_error(failure):
             failure.trap(APIError)
@@ -785,6 +985,54 @@ class DockerClient(object):
         d.addErrback(_extract_error)
         return d
 
+    def _blocking_pull(self, image_name):
+        """
+        Blocking API to make sure an image is available locally, logging the
+        progress of its download if it isn't.
+
+        :param unicode image_name: The Docker image to pull.
+
+        :raise PullFailed: If Docker reports an error while downloading it.
+        """
+        try:
+            self._client.inspect_image(image_name)
+        except APIError as e:
+            if e.response.status_code != NOT_FOUND:
+                raise
+        else:
+            return
+
+        with LOG_PULL(image=image_name) as action:
+            started = time()
+            layer_status = {}
+            for progress in self._client.pull(
+                    image_name, stream=True, decode=True):
+                if u"error" in progress:
+                    raise PullFailed(image_name, progress[u"error"])
+                layer = progress.get(u"id")
+                status = progress.get(u"status", u"")
+                if layer_status.get(layer) != status:
+                    layer_status[layer] = status
+                    LOG_PULL_PROGRESS(layer=layer, status=status).write()
+            action.addSuccessFields(pull_seconds=time() - started)
+
+    def pull(self, image_name):
+        waiting = Deferred()
+        if image_name in self._pulls:
+            self._pulls[image_name].append(waiting)
+            return waiting
+
+        self._pulls[image_name] = [waiting]
+        pulling = self._pull_semaphore.run(
+            deferToThread, self._blocking_pull, image_name
+        )
+
+        def pulled(result):
+            for waiter in self._pulls.pop(image_name):
+                waiter.callback(result)
+        pulling.addBoth(pulled)
+        return waiting
+
     def _blocking_exists(self, container_name):
         """
         Blocking API to check if container exists.
@@ -902,101 +1150,166 @@ class DockerClient(object):
         d = deferToThread(_remove)
         return d
 
-    def list(self):
-        def _list():
-            result = set()
-            ids = [d[u"Id"] for d in
-                   self._client.containers(quiet=True, all=True)]
-            for i in ids:
+    def _in_namespace(self, container):
+        """
+        :param dict container: A container as returned by
+            ``self._client.containers``.
 
-                try:
-                    data = self._client.inspect_container(i)
-                except APIError as e:
-                    # The container ID returned by the list API call above, may
-                    # have been removed in another thread.
-                    if e.response.status_code == NOT_FOUND:
-                        continue
-                    else:
-                        raise
-
-                state = (u"active" if data[u"State"][u"Running"]
-                         else u"inactive")
-                name = data[u"Name"]
-                # Since tags (e.g. "busybox") aren't stable, ensure we're
-                # looking at the actual image by using the hash:
-                image = data[u"Image"]
-                image_tag = data[u"Config"][u"Image"]
-                command = data[u"Config"][u"Cmd"]
-                with start_action(
-                    action_type=u"flocker:node:docker:inspect_image",
-                    container=i,
-                    running=data[u"State"][u"Running"]
-                ):
-                    image_data = self._image_data(image)
-                if image_data.command == command:
-                    command = None
-                port_bindings = data[u"NetworkSettings"][u"Ports"]
-                if port_bindings is not None:
-                    ports = self._parse_container_ports(port_bindings)
-                else:
-                    ports = list()
-                volumes = []
-                binds = data[u"HostConfig"]['Binds']
-                if binds is not None:
-                    for bind_config in binds:
-                        parts = bind_config.split(':', 2)
-                        node_path, container_path = parts[:2]
-                        volumes.append(
-                            Volume(container_path=FilePath(container_path),
-                                   node_path=FilePath(node_path))
-                        )
-                if name.startswith(u"/" + self.namespace):
-                    name = name[1 + len(self.namespace):]
-                else:
-                    continue
-                # Retrieve environment variables for this container,
-                # disregarding any environment variables that are part
-                # of the image, rather than supplied in the configuration.
-                unit_environment = []
-                container_environment = data[u"Config"][u"Env"]
-                if image_data.environment is None:
-                    image_environment = []
-                else:
-                    image_environment = image_data.environment
-                if container_environment is not None:
-                    for environment in container_environment:
-                        if environment not in image_environment:
-                            env_key, env_value = environment.split('=', 1)
-                            unit_environment.append((env_key, env_value))
-                unit_environment = (
-                    Environment(variables=frozenset(unit_environment))
-                    if unit_environment else None
-                )
-                # Our Unit model counts None as the value for cpu_shares and
-                # mem_limit in containers without specified limits, however
-                # Docker returns the values in these cases as zero, so we
-                # manually convert.
-                cpu_shares = data[u"Config"][u"CpuShares"]
-                cpu_shares = None if cpu_shares == 0 else cpu_shares
-                mem_limit = data[u"Config"][u"Memory"]
-                mem_limit = None if mem_limit == 0 else mem_limit
-                restart_policy = self._parse_restart_policy(
-                    data[U"HostConfig"][u"RestartPolicy"])
-                result.add(Unit(
-                    name=name,
-                    container_name=self._to_container_name(name),
-                    activation_state=state,
-                    container_image=image_tag,
-                    ports=frozenset(ports),
-                    volumes=frozenset(volumes),
-                    environment=unit_environment,
-                    mem_limit=mem_limit,
-                    cpu_shares=cpu_shares,
-                    restart_policy=restart_policy,
-                    command_line=command)
+        :return: ``True`` if any of the container's names is in
+            ``self.namespace``.
+        """
+        prefix = u"/" + self.namespace
+        return any(
+            name.startswith(prefix) for name in container.get(u"Names") or ()
+        )
+
+    def _blocking_list_ids(self):
+        """
+        :return: The ids of all containers in ``self.namespace``, as a
+            ``list``.
+        """
+        return [
+            container[u"Id"]
+            for container in self._client.containers(all=True)
+            if self._in_namespace(container)
+        ]
+
+    def _blocking_inspect_unit(self, container_id):
+        """
+        Inspect a container and the image it was created from.
+
+        :param unicode container_id: The ID of the container.
+
+        :return: A ``Unit`` describing the container or ``None`` if it has
+            been removed or is not in ``self.namespace``.
+        """
+        try:
+            data = self._client.inspect_container(container_id)
+        except APIError as e:
+            # The container ID returned by the list API call, may have been
+            # removed in another thread.
+            if e.response.status_code == NOT_FOUND:
+                return None
+            else:
+                raise
+
+        state = (u"active" if data[u"State"][u"Running"]
+                 else u"inactive")
+        name = data[u"Name"]
+        # Since tags (e.g. "busybox") aren't stable, ensure we're
+        # looking at the actual image by using the hash:
+        image = data[u"Image"]
+        image_tag = data[u"Config"][u"Image"]
+        command = data[u"Config"][u"Cmd"]
+        with start_action(
+            action_type=u"flocker:node:docker:inspect_image",
+            container=container_id,
+            running=data[u"State"][u"Running"]
+        ):
+            image_data = self._image_data(image)
+        if image_data.command == command:
+            command = None
+        port_bindings = data[u"NetworkSettings"][u"Ports"]
+        if port_bindings is not None:
+            ports = self._parse_container_ports(port_bindings)
+        else:
+            ports = list()
+        volumes = []
+        binds = data[u"HostConfig"]['Binds']
+        if binds is not None:
+            for bind_config in binds:
+                parts = bind_config.split(':', 2)
+                node_path, container_path = parts[:2]
+                volumes.append(
+                    Volume(container_path=FilePath(container_path),
+                           node_path=FilePath(node_path))
                 )
-            return result
-        return deferToThread(_list)
+        if name.startswith(u"/" + self.namespace):
+            name = name[1 + len(self.namespace):]
+        else:
+            return None
+        # Retrieve environment variables for this container,
+        # disregarding any environment variables that are part
+        # of the image, rather than supplied in the configuration.
+        unit_environment = []
+        container_environment = data[u"Config"][u"Env"]
+        if image_data.environment is None:
+            image_environment = []
+        else:
+            image_environment = image_data.environment
+        if container_environment is not None:
+            for environment in container_environment:
+                if environment not in image_environment:
+                    env_key, env_value = environment.split('=', 1)
+                    unit_environment.append((env_key, env_value))
+        unit_environment = (
+            Environment(variables=frozenset(unit_environment))
+            if unit_environment else None
+        )
+        # Our Unit model counts None as the value for cpu_shares and
+        # mem_limit in containers without specified limits, however
+        # Docker returns the values in these cases as zero, so we
+        # manually convert.
+        cpu_shares = data[u"Config"][u"CpuShares"]
+        cpu_shares = None if cpu_shares == 0 else cpu_shares
+        mem_limit = data[u"Config"][u"Memory"]
+        mem_limit = None if mem_limit == 0 else mem_limit
+        restart_policy = self._parse_restart_policy(
+            data[U"HostConfig"][u"RestartPolicy"])
+        return Unit(
+            name=name,
+            container_name=self._to_container_name(name),
+            activation_state=state,
+            container_image=image_tag,
+            ports=frozenset(ports),
+            volumes=frozenset(volumes),
+            environment=unit_environment,
+            mem_limit=mem_limit,
+            cpu_shares=cpu_shares,
+            restart_policy=restart_policy,
+            command_line=command)
+
+    def list(self):
+        started = time()
+        timings = {}
+        listing = deferToThread(self._blocking_list_ids)
+
+        def inspect(ids):
+            timings[u"list_seconds"] = time() - started
+            # Each inspection is a separate request to the Docker server, so
+            # run several at once rather than one after the other, but not
+            # so many that they crowd out other users of the thread pool:
+            semaphore = DeferredSemaphore(self.list_concurrency)
+            return gatherResults([
+                semaphore.run(
+                    deferToThread, self._blocking_inspect_unit, container_id
+                ) for container_id in ids
+            ], consumeErrors=True)
+        listing.addCallback(inspect)
+
+        def first_error(failure):
+            failure.trap(FirstError)
+            return failure.value.subFailure
+        listing.addErrback(first_error)
+
+        def inspected(units):
+            timings[u"inspect_seconds"] = (
+                time() - started - timings[u"list_seconds"]
+            )
+            LOG_LIST_TIMINGS(containers=len(units), **timings).write()
+            LOG_IMAGE_CACHE_STATS(
+                hits=self._image_cache.hits,
+                misses=self._image_cache.misses,
+                entries=len(self._image_cache),
+            ).write()
+            # Writing the file blocks, so keep it out of the reactor thread:
+            saving = deferToThread(self._image_cache.save)
+            saving.addCallback(
+                lambda _: set(unit for unit in units if unit is not None)
+            )
+            return saving
+        listing.addCallback(inspected)
+        return listing
 
 
 class NamespacedDockerClient(proxyForInterface(IDockerClient, "_client")):
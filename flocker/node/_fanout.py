@@ -0,0 +1,230 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+# -*- test-case-name: flocker.node.test.test_fanout -*-
+
+"""
+Share one agent's connection to the control service with the other agents on
+the same node.
+
+The publishing agent listens on a Unix socket.  Other agents connect to it
+instead of to the control service and see the same protocol: cluster updates
+the publisher receives are sent on to them as ``ClusterStatusCommand``, and
+the commands they send are relayed to the control service over the
+publisher's connection.  Local agents are disconnected whenever the publisher
+is, so they see control service outages just as they would otherwise.
+
+The control service keeps a single node state diff base per connection, so
+state diffs from local agents are applied here, against a base kept for each
+local agent, and relayed as full state.  For the same reason the publisher
+does not send diffs itself while it shares its connection.
+"""
+
+from eliot import ActionType, Logger, writeFailure
+from eliot.twisted import DeferredContext
+
+from twisted.internet.defer import fail, maybeDeferred
+from twisted.internet.error import ConnectionLost
+from twisted.internet.protocol import ServerFactory
+from twisted.protocols.amp import AMP, CommandLocator
+
+from ..control._protocol import (
+    ClusterStatusCommand, NodeStateCommand, NoOp, SetNodeEraCommand,
+    SetBlockDeviceIdForDatasetId, NodeStateDiffCommand,
+    NodeStateGenerationMismatch, apply_node_state_diff,
+    _state_changes_to_pmap, _state_changes_from_pmap,
+)
+from ..control._persistence import make_generation_hash
+
+
+LOG_FAN_OUT = ActionType(
+    u"flocker:node:fanout:send_cluster_status",
+    [], [],
+    u"Send the configuration and state of the cluster to a local agent.",
+)
+
+
+class _LocalAgentLocator(CommandLocator):
+    """
+    Responders for the commands local agents send to the control service,
+    which relay them over the publisher's connection.
+
+    :ivar ClusterStateFanOut _fan_out: The fan-out the local agent is
+        connected to.
+    :ivar _state_changes: The state changes last received from the local
+        agent, for applying ``NodeStateDiffCommand`` to, as returned by
+        ``_state_changes_to_pmap``.
+    """
+    logger = Logger()
+
+    def __init__(self, fan_out):
+        CommandLocator.__init__(self)
+        self._fan_out = fan_out
+        self._state_changes = None
+
+    @NoOp.responder
+    def noop(self):
+        return {}
+
+    @NodeStateCommand.responder
+    def node_changed(self, eliot_context, state_changes):
+        self._state_changes = _state_changes_to_pmap(state_changes)
+        return self._fan_out.relay(
+            NodeStateCommand,
+            # They are decoded as a list, but the encoding cache needs them
+            # to be hashable:
+            state_changes=tuple(state_changes), eliot_context=eliot_context,
+        )
+
+    @NodeStateDiffCommand.responder
+    def node_changed_diff(self, eliot_context, state_changes_diff,
+                          start_generation, end_generation):
+        try:
+            state_changes = apply_node_state_diff(
+                self._state_changes, state_changes_diff,
+                start_generation, end_generation,
+            )
+        except NodeStateGenerationMismatch:
+            self._state_changes = None
+            raise
+        self._state_changes = state_changes
+        # The control service's diff base for this connection is shared
+        # with the publisher and the other local agents:
+        return self._fan_out.relay(
+            NodeStateCommand,
+            state_changes=_state_changes_from_pmap(state_changes),
+            eliot_context=eliot_context,
+        )
+
+    @SetNodeEraCommand.responder
+    def set_node_era(self, era, node_uuid):
+        return self._fan_out.relay(
+            SetNodeEraCommand, era=era, node_uuid=node_uuid,
+        )
+
+    @SetBlockDeviceIdForDatasetId.responder
+    def set_blockdevice_id(self, dataset_id, blockdevice_id):
+        return self._fan_out.relay(
+            SetBlockDeviceIdForDatasetId,
+            dataset_id=dataset_id, blockdevice_id=blockdevice_id,
+        )
+
+
+class _LocalAgentAMP(AMP):
+    """
+    AMP protocol for the publisher's side of a connection from a local agent.
+    """
+    def __init__(self, fan_out):
+        AMP.__init__(self, locator=_LocalAgentLocator(fan_out))
+        self._fan_out = fan_out
+
+    def connectionMade(self):
+        AMP.connectionMade(self)
+        self._fan_out.local_connected(self)
+
+    def connectionLost(self, reason):
+        AMP.connectionLost(self, reason)
+        self._fan_out.local_disconnected(self)
+
+
+class ClusterStateFanOut(object):
+    """
+    Republish the cluster updates one agent receives to the other agents on
+    the same node.
+
+    The publishing agent passes on its ``IConvergenceAgent`` notifications.
+
+    :ivar set connections: The connected local agents' ``_LocalAgentAMP``
+        protocols.
+    :ivar _upstream: The publisher's AMP client connected to the control
+        service, or ``None`` if it is not connected.
+    :ivar _cluster: The most recent ``(configuration, state)`` received from
+        the control service, or ``None``.
+    """
+    logger = Logger()
+
+    def __init__(self):
+        self.connections = set()
+        self._upstream = None
+        self._cluster = None
+
+    def factory(self):
+        """
+        :return: A factory for the publisher's side of connections from local
+            agents.
+        """
+        return ServerFactory.forProtocol(lambda: _LocalAgentAMP(self))
+
+    def connected(self, client):
+        self._upstream = client
+
+    def disconnected(self):
+        self._upstream = None
+        self._cluster = None
+        for connection in list(self.connections):
+            connection.transport.loseConnection()
+
+    def cluster_updated(self, configuration, cluster_state):
+        self._cluster = (configuration, cluster_state)
+        for connection in self.connections:
+            self._send(connection)
+
+    def local_connected(self, connection):
+        """
+        A local agent has connected.
+
+        :param _LocalAgentAMP connection: Its connection.
+        """
+        if self._upstream is None:
+            # It would have failed to connect to the control service too:
+            connection.transport.loseConnection()
+            return
+        self.connections.add(connection)
+        if self._cluster is not None:
+            self._send(connection)
+
+    def local_disconnected(self, connection):
+        """
+        A local agent has disconnected.
+
+        :param _LocalAgentAMP connection: Its connection.
+        """
+        self.connections.discard(connection)
+
+    def relay(self, command, **kwargs):
+        """
+        Send a command from a local agent to the control service.
+
+        :param command: The AMP ``Command`` to send.
+        :param kwargs: Its arguments.
+
+        :return Deferred: Fires with the control service's response.
+        """
+        if self._upstream is None:
+            return fail(ConnectionLost())
+        return self._upstream.callRemote(command, **kwargs)
+
+    def _send(self, connection):
+        """
+        Send the latest cluster update to a local agent.
+
+        :param _LocalAgentAMP connection: Its connection.
+        """
+        configuration, state = self._cluster
+        action = LOG_FAN_OUT(self.logger)
+        with action.context():
+            # The publisher has just hashed these same objects, so the hashes
+            # come from the generation hash cache.  Use ``maybeDeferred`` so
+            # if an exception happens, it will be wrapped in a ``Failure``:
+            d = DeferredContext(maybeDeferred(
+                connection.callRemote,
+                ClusterStatusCommand,
+                configuration=configuration,
+                configuration_generation=make_generation_hash(configuration),
+                state=state,
+                state_generation=make_generation_hash(state),
+                eliot_context=action,
+            ))
+            d.addErrback(
+                writeFailure, self.logger,
+                u"Failed to send cluster status to local agent.",
+            )
+            d.addActionFinish()
@@ -30,14 +30,16 @@ from eliot.twisted import DeferredContext
 
 from pyrsistent import field, PClass
 
-from characteristic import attributes
+from characteristic import attributes, Attribute
 
 from machinist import (
     trivialInput, TransitionTable, constructFiniteStateMachine,
     MethodSuffixOutputer,
 )
 
+from twisted.application.internet import StreamServerEndpointService
 from twisted.application.service import MultiService
+from twisted.internet.endpoints import UNIXServerEndpoint
 from twisted.python.constants import Names, NamedConstant
 from twisted.internet.defer import succeed, maybeDeferred
 from twisted.internet.protocol import ReconnectingClientFactory
@@ -45,12 +47,14 @@ from twisted.protocols.tls import TLSMemoryBIOFactory
 from twisted.python.reflect import safe_repr
 
 from . import run_state_change, NoOp
+from ._fanout import ClusterStateFanOut
 
 from ..common import gather_deferreds
 from ..common.logging import log_info
 from ..control import (
     NodeStateCommand, IConvergenceAgent, AgentAMP, SetNodeEraCommand,
-    IStatePersister, SetBlockDeviceIdForDatasetId,
+    IStatePersister, SetBlockDeviceIdForDatasetId, NodeStateDiffCommand,
+    node_state_diff_arguments,
 )
 from ..control._persistence import to_unserialized_json
 
@@ -237,6 +241,8 @@ class ConvergenceLoopInputs(Names):
     SLEEP = NamedConstant()
     # Stop sleeping:
     WAKEUP = NamedConstant()
+    # A local device or mount changed, so local state may have changed:
+    LOCAL_CHANGE = NamedConstant()
 
 
 @attributes(["client", "configuration", "state"])
@@ -368,6 +374,9 @@ class ConvergenceLoopOutputs(Names):
     CLEAR_WAKEUP = NamedConstant()
     # Check if we need to wakeup due to update from AMP client:
     UPDATE_MAYBE_WAKEUP = NamedConstant()
+    # Remember that local state changed during an iteration so the next one
+    # starts without sleeping:
+    RECORD_LOCAL_CHANGE = NamedConstant()
 
 
 _FIELD_CONNECTION = Field(
@@ -428,22 +437,35 @@ class ConvergenceLoop(object):
 
     :ivar _sleep_timeout: Current ``IDelayedCall`` for sleep timeout, or
         ``None`` if not in SLEEPING state.
+
+    :ivar bool _local_change_pending: Whether a local change was reported
+        after the current iteration's discovery started.
+
+    :ivar bool _state_diffs: Whether to send state to the control service as
+        a diff against the last acknowledged state.
     """
-    def __init__(self, reactor, deployer):
+    def __init__(self, reactor, deployer, state_diffs=True):
         """
         :param IReactorTime reactor: Used to schedule delays in the loop.
 
         :param IDeployer deployer: Used to discover local state and calculate
             necessary changes to match desired configuration.
+
+        :param bool state_diffs: Whether to send state to the control service
+            as diffs.  Diffs can only be applied against the last state
+            received on the connection, so they must be disabled if other
+            agents send state over the same connection.
         """
         self.reactor = reactor
         self.deployer = deployer
+        self._state_diffs = state_diffs
         self.cluster_state = None
         self.client = None
         self._last_discovered_local_state = None
         self._last_acknowledged_state = None
         self._sleep_timeout = None
         self._unconverged_sleep = _UnconvergedDelay()
+        self._local_change_pending = False
 
     def output_STORE_INFO(self, context):
         old_client = self.client
@@ -479,16 +501,56 @@ class ConvergenceLoop(object):
             if calculated < remaining:
                 self._sleep_timeout.reset(calculated)
 
+    def _call_node_state_command(self, state_changes, context):
+        """
+        Send ``state_changes`` to the control service, as a diff against the
+        last acknowledged state where there is one.  If the control service
+        cannot apply the diff, send the full state instead.
+
+        :param state_changes: State to send to the control service.
+        :type state_changes: tuple of IClusterStateChange
+        :param context: The eliot action to send along with the command.
+
+        :return Deferred: Fires when the control service has acknowledged the
+            state.
+        """
+        def send_full_state(ignored=None):
+            return self.client.callRemote(
+                NodeStateCommand,
+                state_changes=state_changes,
+                eliot_context=context)
+
+        if not self._state_diffs or self._last_acknowledged_state is None:
+            return send_full_state()
+
+        d = self.client.callRemote(
+            NodeStateDiffCommand,
+            eliot_context=context,
+            **node_state_diff_arguments(
+                self._last_acknowledged_state, state_changes
+            )
+        )
+
+        def diff_failed(failure):
+            Message.log(
+                message_type=u'flocker:node:_loop:state_diff_failed',
+                log_level=u'INFO',
+                message=u'Control service could not apply state diff, '
+                        u'sending full state.',
+                reason=failure.getErrorMessage(),
+            )
+            return send_full_state()
+        d.addErrback(diff_failed)
+        return d
+
     def _send_state_to_control_service(self, state_changes):
         context = LOG_SEND_TO_CONTROL_SERVICE(
             self.fsm.logger, connection=self.client,
             local_changes=list(state_changes),
         )
         with context.context():
-            d = DeferredContext(self.client.callRemote(
-                NodeStateCommand,
-                state_changes=state_changes,
-                eliot_context=context)
+            d = DeferredContext(
+                self._call_node_state_command(state_changes, context)
             )
 
             def record_acknowledged_state(ignored):
@@ -520,7 +582,12 @@ class ConvergenceLoop(object):
         else:
             return succeed(None)
 
+    def output_RECORD_LOCAL_CHANGE(self, context):
+        self._local_change_pending = True
+
     def output_CONVERGE(self, context):
+        # Discovery below will see any local change reported so far:
+        self._local_change_pending = False
         with LOG_CONVERGE(self.fsm.logger).context():
             log_discovery = LOG_DISCOVERY(self.fsm.logger)
             with log_discovery.context():
@@ -617,8 +684,13 @@ class ConvergenceLoop(object):
         d.addActionFinish()
 
     def output_SCHEDULE_WAKEUP(self, context):
+        delay_seconds = context.delay_seconds
+        if self._local_change_pending:
+            # Discovery may have missed a change reported while it was
+            # running, so start the next iteration straight away:
+            delay_seconds = 0
         self._sleep_timeout = self.reactor.callLater(
-            context.delay_seconds,
+            delay_seconds,
             lambda: self.fsm.receive(ConvergenceLoopInputs.WAKEUP))
 
     def output_CLEAR_WAKEUP(self, context):
@@ -639,22 +711,28 @@ def _build_convergence_loop_table():
     S = ConvergenceLoopStates
 
     table = TransitionTable()
-    table = table.addTransition(
-        S.STOPPED, I.STATUS_UPDATE, [O.STORE_INFO, O.CONVERGE], S.CONVERGING)
+    table = table.addTransitions(
+        S.STOPPED, {
+            I.STATUS_UPDATE: ([O.STORE_INFO, O.CONVERGE], S.CONVERGING),
+            I.LOCAL_CHANGE: ([], S.STOPPED),
+        })
     table = table.addTransitions(
         S.CONVERGING, {
             I.STATUS_UPDATE: ([O.STORE_INFO], S.CONVERGING),
             I.STOP: ([], S.CONVERGING_STOPPING),
             I.SLEEP: ([O.SCHEDULE_WAKEUP], S.SLEEPING),
+            I.LOCAL_CHANGE: ([O.RECORD_LOCAL_CHANGE], S.CONVERGING),
         })
     table = table.addTransitions(
         S.CONVERGING_STOPPING, {
             I.STATUS_UPDATE: ([O.STORE_INFO], S.CONVERGING),
             I.SLEEP: ([], S.STOPPED),
+            I.LOCAL_CHANGE: ([O.RECORD_LOCAL_CHANGE], S.CONVERGING_STOPPING),
         })
     table = table.addTransitions(
         S.SLEEPING, {
             I.WAKEUP: ([O.CLEAR_WAKEUP, O.CONVERGE], S.CONVERGING),
+            I.LOCAL_CHANGE: ([O.CLEAR_WAKEUP, O.CONVERGE], S.CONVERGING),
             I.STOP: ([O.CLEAR_WAKEUP], S.STOPPED),
             I.STATUS_UPDATE: (
                 [O.STORE_INFO, O.UPDATE_MAYBE_WAKEUP], S.SLEEPING),
@@ -665,7 +743,7 @@ def _build_convergence_loop_table():
 _CONVERGENCE_LOOP_FSM_TABLE = _build_convergence_loop_table()
 
 
-def build_convergence_loop_fsm(reactor, deployer):
+def build_convergence_loop_fsm(reactor, deployer, state_diffs=True):
     """
     Create a convergence loop FSM.
 
@@ -682,7 +760,11 @@ def build_convergence_loop_fsm(reactor, deployer):
     on that updated config+state whether a ``IStateChange`` needs to
     happen. If it does that means this change will have impact on what we
     do, so we interrupt the sleep. If calculation suggests a no-op then we
-    keep sleeping. Notably we do **not** do a discovery of local state
+    keep sleeping. A ``LOCAL_CHANGE`` input, on the other hand, means the
+    local state itself may have changed (e.g. the kernel reported a new block
+    device), so it interrupts the sleep and starts a new iteration; if it
+    arrives mid-iteration the next iteration starts without sleeping.
+    Notably we do **not** do a discovery of local state
     when an update is received while sleeping, since that is an expensive
     operation that can involve talking to external resources. Moreover an
     external update only implies external state/config changed, so we're
@@ -694,8 +776,11 @@ def build_convergence_loop_fsm(reactor, deployer):
 
     :param IDeployer deployer: Used to discover local state and calcualte
         necessary changes to match desired configuration.
+
+    :param bool state_diffs: Whether to send state to the control service as
+        diffs.
     """
-    loop = ConvergenceLoop(reactor, deployer)
+    loop = ConvergenceLoop(reactor, deployer, state_diffs)
     fsm = constructFiniteStateMachine(
         inputs=ConvergenceLoopInputs,
         outputs=ConvergenceLoopOutputs,
@@ -728,7 +813,9 @@ class RemoteStatePersister(PClass):
 
 
 @implementer(IConvergenceAgent)
-@attributes(["reactor", "deployer", "host", "port", "era"])
+@attributes(["reactor", "deployer", "host", "port", "era",
+             Attribute("publish_socket", default_value=None),
+             Attribute("subscribe_socket", default_value=None)])
 class AgentLoopService(MultiService, object):
     """
     Service in charge of running the convergence loop.
@@ -739,10 +826,20 @@ class AgentLoopService(MultiService, object):
     :ivar host: Host to connect to.
     :ivar port: Port to connect to.
     :ivar cluster_status: A cluster status FSM.
+    :ivar convergence_loop: The convergence loop FSM driven by
+        ``cluster_status``.
     :ivar factory: The factory used to connect to the control service.
     :ivar reconnecting_factory: The underlying factory used to connect to
         the control service, without the TLS wrapper.
     :ivar UUID era: This node's era.
+    :ivar FilePath publish_socket: If not ``None``, a Unix socket on which to
+        share this agent's connection to the control service with other
+        agents on the node.
+    :ivar FilePath subscribe_socket: If not ``None``, the Unix socket of
+        another agent on the node to connect to instead of connecting to the
+        control service at ``host`` and ``port``.
+    :ivar ClusterStateFanOut fan_out: The other agents sharing this agent's
+        connection, or ``None`` if ``publish_socket`` is ``None``.
     """
 
     def __init__(self, context_factory):
@@ -750,27 +847,55 @@ class AgentLoopService(MultiService, object):
         :param context_factory: TLS context factory for the AMP client.
         """
         MultiService.__init__(self)
-        convergence_loop = build_convergence_loop_fsm(
-            self.reactor, self.deployer
+        self.convergence_loop = build_convergence_loop_fsm(
+            self.reactor, self.deployer,
+            # Local agents' state is relayed over our connection as full
+            # state, which would invalidate any diff we sent:
+            state_diffs=self.publish_socket is None,
         )
-        self.logger = convergence_loop.logger
-        self.cluster_status = build_cluster_status_fsm(convergence_loop)
+        self.logger = self.convergence_loop.logger
+        self.cluster_status = build_cluster_status_fsm(self.convergence_loop)
         self.reconnecting_factory = ReconnectingClientFactory.forProtocol(
             lambda: AgentAMP(self.reactor, self)
         )
         self.reconnecting_factory.maxDelay = MAXIMUM_RECONNECT_DELAY
         self.factory = TLSMemoryBIOFactory(context_factory, True,
                                            self.reconnecting_factory)
+        self.fan_out = None
+        if self.publish_socket is not None:
+            self.fan_out = ClusterStateFanOut()
+            StreamServerEndpointService(
+                UNIXServerEndpoint(
+                    self.reactor, self.publish_socket.path,
+                    mode=0600, wantPID=True,
+                ),
+                self.fan_out.factory(),
+            ).setServiceParent(self)
 
     def startService(self):
         MultiService.startService(self)
-        self.reactor.connectTCP(self.host, self.port, self.factory)
+        if self.subscribe_socket is not None:
+            # The publishing agent is local and relays to the control
+            # service over its own TLS connection:
+            self.reactor.connectUNIX(
+                self.subscribe_socket.path, self.reconnecting_factory
+            )
+        else:
+            self.reactor.connectTCP(self.host, self.port, self.factory)
 
     def stopService(self):
         MultiService.stopService(self)
         self.reconnecting_factory.stopTrying()
         self.cluster_status.receive(ClusterStatusInputs.SHUTDOWN)
 
+    def local_change(self):
+        """
+        Tell the convergence loop that local state may have changed, e.g.
+        because a block device appeared, so that it converges without waiting
+        for its sleep to finish.
+        """
+        self.convergence_loop.receive(ConvergenceLoopInputs.LOCAL_CHANGE)
+
     # IConvergenceAgent methods:
 
     def connected(self, client):
@@ -782,12 +907,19 @@ class AgentLoopService(MultiService, object):
                               node_uuid=unicode(self.deployer.node_uuid))
         d.addErrback(writeFailure)
         self.cluster_status.receive(_ConnectedToControlService(client=client))
+        if self.fan_out is not None:
+            self.fan_out.connected(client)
 
     def disconnected(self):
         self.cluster_status.receive(
             ClusterStatusInputs.DISCONNECTED_FROM_CONTROL_SERVICE)
+        if self.fan_out is not None:
+            self.fan_out.disconnected()
 
     def cluster_updated(self, configuration, cluster_state):
+        if self.fan_out is not None:
+            # Other agents filter out stale state themselves:
+            self.fan_out.cluster_updated(configuration, cluster_state)
         # Filter out state for this node if the era doesn't match. Since
         # the era doesn't match ours that means it's old pre-reboot state
         # that hasn't expired yet and is likely wrong, so we don't want to
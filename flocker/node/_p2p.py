@@ -49,6 +49,19 @@ def _to_volume_name(dataset_id):
     return VolumeName(namespace=u"default", dataset_id=dataset_id)
 
 
+def _ssh_remote_volume_manager(hostname, node_uuid, compress=False):
+    """
+    :param bytes hostname: The node to send volumes to.
+    :param UUID node_uuid: The UUID of that node.  It is not used; SSH
+        authenticates the node by its host key instead.
+    :param bool compress: Whether SSH should compress the volumes sent.
+
+    :return: A ``RemoteVolumeManager`` which talks to ``flocker-volume`` on
+        that node over SSH.
+    """
+    return RemoteVolumeManager(standard_node(hostname, compress=compress))
+
+
 def _eliot_system(part):
     return u"flocker:p2pdeployer:" + part
 
@@ -103,7 +116,7 @@ class ResizeDataset(object):
 
 
 @implementer(IStateChange)
-@attributes(["dataset", "hostname"])
+@attributes(["dataset", "hostname", "node_uuid"])
 class HandoffDataset(object):
     """
     A dataset handoff that needs to be performed from this node to another
@@ -114,6 +127,7 @@ class HandoffDataset(object):
     :ivar Dataset dataset: The dataset to hand off.
     :ivar bytes hostname: The hostname of the node to which the dataset is
          meant to be handed off.
+    :ivar UUID node_uuid: The UUID of that node.
     """
 
     @property
@@ -126,14 +140,13 @@ class HandoffDataset(object):
 
     def run(self, deployer, state_persister):
         service = deployer.volume_service
-        destination = standard_node(self.hostname)
         return service.handoff(
             service.get(_to_volume_name(self.dataset.dataset_id)),
-            RemoteVolumeManager(destination))
+            deployer.remote_volume_manager(self.hostname, self.node_uuid))
 
 
 @implementer(IStateChange)
-@attributes(["dataset", "hostname"])
+@attributes(["dataset", "hostname", "node_uuid"])
 class PushDataset(object):
     """
     A dataset push that needs to be performed from this node to another
@@ -144,6 +157,7 @@ class PushDataset(object):
     :ivar Dataset: The dataset to push.
     :ivar bytes hostname: The hostname of the node to which the dataset is
          meant to be pushed.
+    :ivar UUID node_uuid: The UUID of that node.
     """
 
     @property
@@ -156,10 +170,200 @@ class PushDataset(object):
 
     def run(self, deployer, state_persister):
         service = deployer.volume_service
-        destination = standard_node(self.hostname)
         return service.push(
             service.get(_to_volume_name(self.dataset.dataset_id)),
-            RemoteVolumeManager(destination))
+            deployer.remote_volume_manager(self.hostname, self.node_uuid))
+
+
+@implementer(IStateChange)
+@attributes(["dataset", "hostname", "node_uuid"])
+class ReplicateDataset(object):
+    """
+    A periodic push of a locally-owned dataset to another node, so that a
+    later handoff to that node only has to send what changed since.
+
+    See :cls:`Replication` for more details.
+
+    :ivar Dataset: The dataset to push.
+    :ivar bytes hostname: The hostname of the node to which the dataset is
+         pushed.
+    :ivar UUID node_uuid: The UUID of that node.
+    """
+
+    @property
+    def eliot_action(self):
+        return start_action(
+            _logger, _eliot_system(u"replicate"),
+            dataset_id=self.dataset.dataset_id,
+            hostname=self.hostname,
+        )
+
+    def run(self, deployer, state_persister):
+        service = deployer.volume_service
+        replication = deployer.replication
+        dataset_id = self.dataset.dataset_id
+        volume = service.get(_to_volume_name(dataset_id))
+        destination = deployer.remote_volume_manager(
+            self.hostname, self.node_uuid)
+        started = replication.started(dataset_id, self.hostname)
+        pushing = service.push(volume, destination)
+        pushing.addCallback(lambda _: destination.snapshots(volume))
+        pushing.addCallback(
+            lambda snapshots: replication.replicated(
+                dataset_id, self.hostname, started, snapshots))
+        pushing.addCallback(
+            lambda _: self._prune(volume, replication, deployer.hostname))
+        return pushing
+
+    def _prune(self, volume, replication, local_hostname):
+        """
+        Destroy the local snapshots of a volume which no later push needs.
+
+        Each push takes a new snapshot, so without this they would pile up.
+
+        :param Volume volume: The replicated volume.
+        :param Replication replication: Its replication.
+        :param unicode local_hostname: This node, which is not pushed to.
+
+        :return: ``Deferred`` that fires when the snapshots are destroyed.
+            Failing to destroy them does not fail the replication.
+        """
+        filesystem = volume.get_filesystem()
+        listing = filesystem.snapshots()
+
+        def got_snapshots(snapshots):
+            base = replication.base_snapshot(
+                volume.name.dataset_id, snapshots, local_hostname)
+            if base is not None:
+                return filesystem.destroy_snapshots_before(base)
+        listing.addCallback(got_snapshots)
+        listing.addErrback(
+            write_failure, _logger, u"flocker:p2pdeployer:prune")
+        return listing
+
+
+class Replication(object):
+    """
+    When and where locally-owned datasets are periodically pushed, and how
+    far behind the pushed copies are.
+
+    The copies are ordinary remotely-owned volumes on the other nodes, so
+    handing a dataset off to one of them sends an incremental stream based
+    on the last replicated snapshot rather than everything.  Older local
+    snapshots are only needed until every node has a newer one.
+
+    :ivar frozenset hostnames: The nodes datasets are pushed to.
+    :ivar timedelta interval: How often each dataset is pushed to each node.
+    """
+    def __init__(self, clock, hostnames, interval):
+        """
+        :param IReactorTime clock: Used to find out the time.
+        :param hostnames: An iterable of the hostnames of the nodes to push
+            datasets to.
+        :param timedelta interval: How often to push each dataset to each
+            node.
+        """
+        self._clock = clock
+        self.hostnames = frozenset(hostnames)
+        self.interval = interval
+        # (dataset_id, hostname) -> when the latest push was started:
+        self._attempted = {}
+        # (dataset_id, hostname) -> when the latest successful push was
+        # started:
+        self._replicated = {}
+        # (dataset_id, hostname) -> the name of the latest snapshot the node
+        # had after the latest successful push:
+        self._snapshots = {}
+
+    def due(self, dataset_id):
+        """
+        :param unicode dataset_id: A locally-owned dataset.
+
+        :return: A sorted ``list`` of the hostnames the dataset should be
+            pushed to now, because no push to them has been started for at
+            least ``interval``.
+        """
+        now = self._clock.seconds()
+        interval = self.interval.total_seconds()
+        return sorted(
+            hostname for hostname in self.hostnames
+            if (dataset_id, hostname) not in self._attempted or
+            now - self._attempted[dataset_id, hostname] >= interval
+        )
+
+    def started(self, dataset_id, hostname):
+        """
+        Record that a push of a dataset is starting.
+
+        :param unicode dataset_id: The dataset being pushed.
+        :param hostname: The node it is being pushed to.
+
+        :return: The time it started.
+        """
+        now = self._clock.seconds()
+        self._attempted[dataset_id, hostname] = now
+        return now
+
+    def replicated(self, dataset_id, hostname, started, snapshots):
+        """
+        Record that a push of a dataset succeeded.
+
+        :param unicode dataset_id: The dataset which was pushed.
+        :param hostname: The node it was pushed to.
+        :param float started: The time the push started, as returned by
+            ``started``.
+        :param list snapshots: The ``Snapshot``\ s of the dataset on that
+            node after the push, ordered from oldest to newest.
+        """
+        self._replicated[dataset_id, hostname] = started
+        if snapshots:
+            self._snapshots[dataset_id, hostname] = snapshots[-1].name
+        else:
+            self._snapshots.pop((dataset_id, hostname), None)
+
+    def replicated_at(self, dataset_ids, local_hostname):
+        """
+        :param dataset_ids: The IDs of the locally-owned datasets.
+        :param unicode local_hostname: This node, which is not pushed to.
+
+        :return: A ``dict`` mapping the IDs of those datasets which have
+            been pushed to every other node to the time the oldest of their
+            copies was taken.  This only changes when a push completes.
+        """
+        result = {}
+        for dataset_id in dataset_ids:
+            pushed = [
+                self._replicated.get((dataset_id, hostname))
+                for hostname in self.hostnames - {local_hostname}
+            ]
+            if pushed and None not in pushed:
+                result[dataset_id] = min(pushed)
+        return result
+
+    def base_snapshot(self, dataset_id, snapshots, local_hostname):
+        """
+        Find the oldest local snapshot a later push of a dataset may be based
+        on.
+
+        :param unicode dataset_id: A locally-owned dataset.
+        :param list snapshots: Its local ``Snapshot``\ s, ordered from oldest
+            to newest.
+        :param unicode local_hostname: This node, which is not pushed to.
+
+        :return: The oldest of the ``Snapshot``\ s which are the latest on
+            each of the other nodes, or ``None`` if that is not known for
+            every one of them.  Snapshots older than it are no longer needed.
+        """
+        names = [snapshot.name for snapshot in snapshots]
+        positions = []
+        for hostname in self.hostnames - {local_hostname}:
+            name = self._snapshots.get((dataset_id, hostname))
+            if name not in names:
+                return None
+            positions.append(names.index(name))
+        if not positions:
+            return None
+        return snapshots[min(positions)]
 
 
 @implementer(IStateChange)
@@ -207,8 +411,14 @@ class P2PManifestationDeployer(object):
 
     :ivar unicode hostname: The hostname of the node that this is running on.
     :ivar VolumeService volume_service: The volume manager for this node.
+    :ivar remote_volume_manager: A callable which takes the hostname and
+        UUID of another node and returns an ``IRemoteVolumeManager`` for
+        sending volumes to it.  By default volumes are sent over SSH.
+    :ivar Replication replication: Where to periodically push locally-owned
+        datasets to, or ``None`` to only push them when they are handed off.
     """
-    def __init__(self, hostname, volume_service, node_uuid=None):
+    def __init__(self, hostname, volume_service, node_uuid=None,
+                 remote_volume_manager=None, replication=None):
         if node_uuid is None:
             # To be removed in https://clusterhq.atlassian.net/browse/FLOC-1795
             warn("UUID is required, this is for backwards compat with existing"
@@ -218,6 +428,10 @@ class P2PManifestationDeployer(object):
         self.node_uuid = node_uuid
         self.hostname = hostname
         self.volume_service = volume_service
+        if remote_volume_manager is None:
+            remote_volume_manager = _ssh_remote_volume_manager
+        self.remote_volume_manager = remote_volume_manager
+        self.replication = replication
 
     def discover_state(self, cluster_state, persistent_state):
         """
@@ -250,6 +464,10 @@ class P2PManifestationDeployer(object):
                 for (dataset_id, maximum_size) in
                 available_manifestations.values())
 
+            replicated_at = None
+            if self.replication is not None:
+                replicated_at = self.replication.replicated_at(
+                    manifestation_paths, self.hostname)
             return NodeLocalState(
                 node_state=NodeState(
                     uuid=self.node_uuid,
@@ -259,11 +477,40 @@ class P2PManifestationDeployer(object):
                                     manifestation in manifestations},
                     paths=manifestation_paths,
                     devices={},
+                    replicated_at=replicated_at,
                 )
             )
         volumes.addCallback(got_volumes)
         return volumes
 
+    def _replications(self, local_state, changing, node_uuids):
+        """
+        :param NodeState local_state: The last known state of this node.
+        :param set changing: The IDs of datasets which other changes are
+            about to resize, hand off or delete; these are not pushed.
+        :param dict node_uuids: The UUIDs of the nodes in the cluster, keyed
+            by hostname.
+
+        :return: A ``list`` of ``ReplicateDataset`` for the locally-owned
+            datasets which are due to be pushed to other nodes.
+        """
+        changes = []
+        for dataset_id, manifestation in sorted(
+                (local_state.manifestations or {}).items()):
+            if not manifestation.primary or dataset_id in changing:
+                continue
+            for hostname in self.replication.due(dataset_id):
+                if hostname == self.hostname:
+                    continue
+                if hostname not in node_uuids:
+                    # The node has not reported its state yet, so there is
+                    # no telling which node to expect at that address.
+                    continue
+                changes.append(ReplicateDataset(
+                    dataset=manifestation.dataset, hostname=hostname,
+                    node_uuid=node_uuids[hostname]))
+        return changes
+
     def calculate_changes(self, configuration, cluster_state, local_state):
         """
         Calculate necessary changes to peer-to-peer manifestations.
@@ -290,6 +537,8 @@ class P2PManifestationDeployer(object):
         # that are being newly created by this new configuration.
         dataset_changes = find_dataset_changes(
             self.node_uuid, cluster_state, configuration)
+        node_uuids = {node.hostname: node.uuid
+                      for node in cluster_state.nodes.values()}
 
         resizing = not_in_use_datasets(dataset_changes.resizing)
         if resizing:
@@ -302,7 +551,8 @@ class P2PManifestationDeployer(object):
         if going:
             phases.append(in_parallel(changes=[
                 HandoffDataset(dataset=handoff.dataset,
-                               hostname=handoff.hostname)
+                               hostname=handoff.hostname,
+                               node_uuid=node_uuids[handoff.hostname])
                 for handoff in going]))
 
         if dataset_changes.creating:
@@ -317,6 +567,18 @@ class P2PManifestationDeployer(object):
                 for dataset in deleting
                 ]))
 
+        if self.replication is not None:
+            replicating = self._replications(
+                local_state,
+                changing={dataset.dataset_id for dataset in chain(
+                    resizing, (handoff.dataset for handoff in going),
+                    dataset_changes.deleting,
+                )},
+                node_uuids=node_uuids,
+            )
+            if replicating:
+                phases.append(in_parallel(changes=replicating))
+
         return sequentially(changes=phases,
                             sleep_when_empty=timedelta(seconds=1))
 
@@ -1013,6 +1013,33 @@ class IBlockDeviceAsyncAPI(Interface):
         """
 
 
+class IBlockDeviceAsyncAPIProvider(Interface):
+    """
+    Implemented by ``IBlockDeviceAPI`` providers which also have a native
+    implementation of ``IBlockDeviceAsyncAPI``; one that does not occupy a
+    thread for the whole duration of each operation.
+    """
+    def async_block_device_api():
+        """
+        :returns: An ``IBlockDeviceAsyncAPI`` provider which operates on the
+            same volumes as this ``IBlockDeviceAPI`` provider.
+        """
+
+
+class IDevicePathCache(Interface):
+    """
+    Implemented by ``IBlockDeviceAPI`` providers which cache device paths and
+    so must be told when a volume is detached by some other means than their
+    own ``detach_volume``.
+    """
+    def forget_device_path(blockdevice_id):
+        """
+        Clear the cached device path of a volume, if it was cached.
+
+        :param unicode blockdevice_id: The volume which is being detached.
+        """
+
+
 class IBlockDeviceAPI(Interface):
     """
     Common operations provided by all block device backends, exposed via
@@ -1324,6 +1351,55 @@ class _SyncToThreadedAsyncAPIAdapter(PClass):
         )
 
 
+@implementer(IBlockDeviceAsyncAPI)
+class _NativeAsyncAPIAdapter(PClass):
+    """
+    Combine the native ``IBlockDeviceAsyncAPI`` of a backend with a
+    thread-pool based adapter around the ``IBlockDeviceAPI`` used by the
+    deployer.
+
+    The operations which create, attach, detach or destroy volumes spend most
+    of their time waiting for the backend and are performed natively.  The
+    remaining queries go through the threaded adapter so that they benefit
+    from any caching wrapped around the ``IBlockDeviceAPI``.
+
+    :ivar _native: The native ``IBlockDeviceAsyncAPI`` provider.
+    :ivar _threaded: The ``IBlockDeviceAsyncAPI`` provider wrapping ``_sync``.
+    :ivar _sync: The ``IBlockDeviceAPI`` provider used by the deployer.  If
+        it provides ``IDevicePathCache`` it is told about volumes detached by
+        ``_native``.
+    """
+    _native = field(mandatory=True)
+    _threaded = field(mandatory=True)
+    _sync = field(mandatory=True)
+
+    def allocation_unit(self):
+        return self._threaded.allocation_unit()
+
+    def compute_instance_id(self):
+        return self._threaded.compute_instance_id()
+
+    def list_volumes(self):
+        return self._threaded.list_volumes()
+
+    def get_device_path(self, blockdevice_id):
+        return self._threaded.get_device_path(blockdevice_id)
+
+    def create_volume(self, dataset_id, size):
+        return self._native.create_volume(dataset_id, size)
+
+    def destroy_volume(self, blockdevice_id):
+        return self._native.destroy_volume(blockdevice_id)
+
+    def attach_volume(self, blockdevice_id, attach_to):
+        return self._native.attach_volume(blockdevice_id, attach_to)
+
+    def detach_volume(self, blockdevice_id):
+        if IDevicePathCache.providedBy(self._sync):
+            self._sync.forget_device_path(blockdevice_id)
+        return self._native.detach_volume(blockdevice_id)
+
+
 def log_list_volumes(function):
     """
     Decorator to count calls to list_volumes.
@@ -1546,7 +1622,11 @@ class Poll(PClass):
     """
     @staticmethod
     def from_state_and_config(discovered_dataset, desired_dataset):
-        return NoOp(sleep=timedelta(seconds=3))
+        return POLL_AGAIN
+
+
+# Shared by every dataset waiting on another node, like ``NOTHING_TO_DO``:
+POLL_AGAIN = NoOp(sleep=timedelta(seconds=3))
 
 
 # Mapping from desired and discovered dataset state to
@@ -1602,23 +1682,141 @@ DATASET_TRANSITIONS = TransitionTable.create({
 del Desired, Discovered
 
 
+def _same(a, b):
+    """
+    :return: Whether ``a`` equals ``b``, checking identity first since
+        ``PClass.__eq__`` compares every field even of the same object.
+    """
+    return a is b or a == b
+
+
+class _CompiledTransitions(object):
+    """
+    A ``TransitionTable`` flattened into a list indexed by the positions of
+    the desired and discovered states in ``DatasetStates``.  Looking a
+    transition up here avoids searching two levels of ``CheckedPMap`` for
+    every dataset.
+
+    :ivar TransitionTable transitions: The table this was compiled from.
+    """
+    _INDEX = {
+        state: index
+        for index, state in enumerate(DatasetStates.iterconstants())
+    }
+
+    def __init__(self, transitions):
+        self.transitions = transitions
+        self._table = [None] * (len(self._INDEX) ** 2)
+        for desired_state, row in transitions.items():
+            for discovered_state, factory in row.items():
+                self._table[
+                    self._position(desired_state, discovered_state)
+                ] = factory
+
+    def _position(self, desired_state, discovered_state):
+        return (self._INDEX[desired_state] * len(self._INDEX) +
+                self._INDEX[discovered_state])
+
+    def lookup(self, desired_state, discovered_state):
+        """
+        :param NamedConstant desired_state: A ``DatasetStates`` constant.
+        :param NamedConstant discovered_state: A ``DatasetStates`` constant.
+
+        :return: The ``IDatasetStateChangeFactory`` for the given states.
+
+        :raises KeyError: If the table has no transition for them.
+        """
+        factory = self._table[self._position(desired_state, discovered_state)]
+        if factory is None:
+            raise KeyError((desired_state, discovered_state))
+        return factory
+
+
+class _DatasetChangeCache(object):
+    """
+    The state change last calculated for each dataset, along with the
+    discovered and desired datasets it was calculated from.
+
+    Each calculator has its own cache.  The cache never affects the changes
+    a calculator returns, so all caches compare equal and do not contribute
+    to the identity of the calculator holding them.
+
+    :ivar dict _changes: Mapping from dataset id to a tuple of the
+        ``discovered_dataset`` and ``desired_dataset`` inputs and the
+        resulting ``IStateChange``.
+    :ivar frozenset recalculated: The ids of the datasets whose changes were
+        calculated, rather than taken from the cache, by the most recent
+        calculation.
+    :ivar _CompiledTransitions _compiled: The calculator's transitions, as
+        most recently compiled.
+    """
+    def __init__(self):
+        self._changes = {}
+        self.recalculated = frozenset()
+        self._compiled = None
+
+    def compiled(self, transitions):
+        """
+        :param TransitionTable transitions: A calculator's transitions.
+
+        :return: The ``_CompiledTransitions`` for them, compiling them only
+            if they differ from the previous call's.  Changes calculated
+            with different transitions are discarded.
+        """
+        if (self._compiled is None or
+                self._compiled.transitions is not transitions):
+            self._compiled = _CompiledTransitions(transitions)
+            self._changes = {}
+        return self._compiled
+
+    def __eq__(self, other):
+        return isinstance(other, _DatasetChangeCache)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(_DatasetChangeCache)
+
+
 @implementer(ICalculator)
 class BlockDeviceCalculator(PClass):
     """
     An ``ICalculator`` that calculates actions that use a
     ``BlockDeviceDeployer``.
 
+    The change for each dataset is only recalculated when its discovered or
+    desired dataset differs from the previous calculation.
+
     :ivar TransitionTable transitions: Table of convergence actions.
+    :ivar _DatasetChangeCache _cache: The changes from the previous
+        calculation.
     """
     transitions = field(TransitionTable, mandatory=True,
                         factory=TransitionTable.create,
                         initial=DATASET_TRANSITIONS)
+    _cache = field(mandatory=True, initial=_DatasetChangeCache)
 
-    def _calculate_dataset_change(self, discovered_dataset, desired_dataset):
+    def set(self, *args, **kwargs):
+        """
+        Evolve this calculator.  Unless a cache is given explicitly, the new
+        calculator starts with an empty cache of its own rather than sharing
+        this calculator's.
+        """
+        if args:
+            kwargs[args[0]] = args[1]
+        kwargs.setdefault("_cache", _DatasetChangeCache())
+        return super(BlockDeviceCalculator, self).set(**kwargs)
+
+    def _calculate_dataset_change(
+        self, transitions, discovered_dataset, desired_dataset
+    ):
         """
         Calculate the state changes necessary to make ``discovered_dataset``
         state match ``desired_dataset`` configuration.
 
+        :param _CompiledTransitions transitions: The compiled
+            ``self.transitions``.
         :param discovered_dataset: The current state of the dataset.
         :type discovered_dataset: ``DiscoveredDataset`` or ``None``
         :param desired_dataset: The desired state of the dataset.
@@ -1634,8 +1832,8 @@ class BlockDeviceCalculator(PClass):
         discovered_state = (discovered_dataset.state
                             if discovered_dataset is not None
                             else DatasetStates.NON_EXISTENT)
-        if desired_state != discovered_state:
-            transition = self.transitions[desired_state][discovered_state]
+        if desired_state is not discovered_state:
+            transition = transitions.lookup(desired_state, discovered_state)
             return transition.from_state_and_config(
                 discovered_dataset=discovered_dataset,
                 desired_dataset=desired_dataset,
@@ -1647,15 +1845,34 @@ class BlockDeviceCalculator(PClass):
         self, discovered_datasets, desired_datasets
     ):
         actions = []
+        transitions = self._cache.compiled(self.transitions)
+        previous = self._cache._changes
+        changes = {}
+        recalculated = []
         # If a dataset isn't in the configuration, we don't act on it.
         for dataset_id in set(discovered_datasets) | set(desired_datasets):
             desired_dataset = desired_datasets.get(dataset_id)
             discovered_dataset = discovered_datasets.get(dataset_id)
-            actions.append(self._calculate_dataset_change(
+            cached = previous.get(dataset_id)
+            if (cached is not None and
+                    _same(cached[0], discovered_dataset) and
+                    _same(cached[1], desired_dataset)):
+                # Reuse the entry as is; unchanged datasets allocate nothing.
+                changes[dataset_id] = cached
+                actions.append(cached[2])
+                continue
+            change = self._calculate_dataset_change(
+                transitions,
                 discovered_dataset=discovered_dataset,
                 desired_dataset=desired_dataset,
-            ))
+            )
+            recalculated.append(dataset_id)
+            changes[dataset_id] = (discovered_dataset, desired_dataset, change)
+            actions.append(change)
 
+        # Datasets which have gone away are dropped from the cache.
+        self._cache._changes = changes
+        self._cache.recalculated = frozenset(recalculated)
         return in_parallel(changes=actions)
 
 
@@ -1692,7 +1909,8 @@ class BlockDeviceDeployer(PClass):
     calculator = field(
         invariant=provides(ICalculator),
         mandatory=True,
-        initial=BlockDeviceCalculator(),
+        # Each deployer gets a calculator, and so a cache, of its own.
+        initial=BlockDeviceCalculator,
     )
 
     @property
@@ -1720,15 +1938,24 @@ class BlockDeviceDeployer(PClass):
         for this deployer.
 
         During real operation, this is a threadpool-based wrapper around the
-        ``IBlockDeviceAPI`` provider.  For testing purposes it can be
+        ``IBlockDeviceAPI`` provider, combined with the backend's native
+        asynchronous API if it has one.  For testing purposes it can be
         overridden with a different object entirely (and this large amount of
         support code for this is necessary because this class is a ``PClass``
         subclass).
         """
         if self._async_block_device_api is None:
-            return _SyncToThreadedAsyncAPIAdapter.from_api(
+            threaded = _SyncToThreadedAsyncAPIAdapter.from_api(
                 self.block_device_api,
             )
+            underlying = self._underlying_blockdevice_api
+            if IBlockDeviceAsyncAPIProvider.providedBy(underlying):
+                return _NativeAsyncAPIAdapter(
+                    _native=underlying.async_block_device_api(),
+                    _threaded=threaded,
+                    _sync=self.block_device_api,
+                )
+            return threaded
         return self._async_block_device_api
 
     @log_list_volumes
@@ -2003,6 +2230,7 @@ class BlockDeviceDeployer(PClass):
         )
 
 
+@implementer(IDevicePathCache)
 class ProcessLifetimeCache(proxyForInterface(IBlockDeviceAPI, "_api")):
     """
     A transparent caching layer around an ``IBlockDeviceAPI`` instance,
@@ -2035,12 +2263,20 @@ class ProcessLifetimeCache(proxyForInterface(IBlockDeviceAPI, "_api")):
                 blockdevice_id)
         return self._device_paths[blockdevice_id]
 
-    def detach_volume(self, blockdevice_id):
+    def forget_device_path(self, blockdevice_id):
         """
         Clear the cached device path, if it was cached.
+
+        :param unicode blockdevice_id: The volume which is being detached.
         """
         try:
             del self._device_paths[blockdevice_id]
         except KeyError:
             pass
+
+    def detach_volume(self, blockdevice_id):
+        """
+        Clear the cached device path, if it was cached.
+        """
+        self.forget_device_path(blockdevice_id)
         return self._api.detach_volume(blockdevice_id)
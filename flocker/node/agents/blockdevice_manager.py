@@ -6,8 +6,12 @@ Interactions between the OS pertaining to block devices.
 This controls actions such as formatting and mounting a blockdevice.
 """
 
+import os
+import re
+import select
 import psutil
 from subprocess import CalledProcessError
+from threading import Lock
 
 from zope.interface import Attribute, Interface, implementer
 from zope.interface.interface import (
@@ -225,12 +229,269 @@ class IBlockDeviceManager(Interface):
         """
 
 
+def _get_mounts_psutil():
+    """
+    Get the mounted block devices using ``psutil``, which parses all of
+    ``/proc/mounts`` on every call.
+
+    :returns: An iterable of ``MountInfo``\ s of all known mounts.
+    """
+    mounts = psutil.disk_partitions()
+    return (MountInfo(blockdevice=FilePath(mount.device),
+                      mountpoint=FilePath(mount.mountpoint))
+            for mount in mounts)
+
+
+def _has_filesystem_blkid(blockdevice):
+    """
+    Determine whether a block device has a filesystem using ``blkid``.
+
+    :param FilePath blockdevice: The bockdevice to query for a filesystem.
+    :returns: True if the blockdevice has a filesystem.
+    """
+    try:
+        run_process(
+            [b"blkid", b"-p", b"-u", b"filesystem", blockdevice.path]
+        )
+    except CalledProcessError as e:
+        # According to the man page:
+        #   the specified token was not found, or no (specified) devices
+        #   could be identified
+        #
+        # Experimentation shows that there is no output in the case of the
+        # former, and an error printed to stderr in the case of the
+        # latter.
+        #
+        # FLOC-2388: We're assuming an interface. We should test this
+        # assumption.
+        if e.returncode == 2 and not e.output:
+            # There is no filesystem on this device.
+            return False
+        raise
+    return True
+
+
+_OCTAL_ESCAPE = re.compile(br"\\([0-7]{3})")
+
+
+def _unescape_mountinfo(value):
+    """
+    Undo the octal escaping of spaces, tabs, newlines and backslashes in a
+    ``mountinfo`` field.
+    """
+    return _OCTAL_ESCAPE.sub(lambda match: chr(int(match.group(1), 8)), value)
+
+
+def _block_filesystem_types(filesystems):
+    """
+    Determine which filesystem types are backed by block devices, the same
+    way ``psutil.disk_partitions`` does.
+
+    :param bytes filesystems: The content of ``/proc/filesystems``.
+    :returns: A ``set`` of filesystem type names.
+    """
+    types = set()
+    for line in filesystems.splitlines():
+        fields = line.split()
+        if len(fields) == 1:
+            types.add(fields[0])
+        elif fields == [b"nodev", b"zfs"]:
+            types.add(b"zfs")
+    return types
+
+
+def _parse_mountinfo(mountinfo, types):
+    """
+    Parse the content of ``/proc/self/mountinfo``.
+
+    :param bytes mountinfo: The content to parse.
+    :param set types: The filesystem types to include.
+
+    :returns: A ``list`` of ``MountInfo``\ s.
+    """
+    mounts = []
+    for line in mountinfo.splitlines():
+        fields = line.split(b" ")
+        # The optional fields are terminated by a single hyphen.
+        separator = fields.index(b"-", 6)
+        fstype, source = fields[separator + 1:separator + 3]
+        if fstype in types and source:
+            mounts.append(MountInfo(
+                blockdevice=FilePath(_unescape_mountinfo(source)),
+                mountpoint=FilePath(_unescape_mountinfo(fields[4])),
+            ))
+    return mounts
+
+
+class _MountTable(object):
+    """
+    The mounted block devices, re-read only when the mount table changes.
+
+    The kernel reports a change to ``/proc/self/mountinfo`` by marking the
+    open file with ``POLLPRI`` and ``POLLERR``, so a zero-timeout ``poll``
+    tells us whether the previously parsed table is still current.
+
+    :ivar FilePath _mountinfo: The ``mountinfo`` file to read.
+    :ivar FilePath _filesystems: The ``filesystems`` file listing the
+        filesystem types known to the kernel.
+    :ivar _poll: A callable like ``select.poll``.
+    """
+    def __init__(self, mountinfo=FilePath(b"/proc/self/mountinfo"),
+                 filesystems=FilePath(b"/proc/filesystems"),
+                 poll=select.poll):
+        self._mountinfo = mountinfo
+        self._filesystems = filesystems
+        self._poll = poll
+        self._lock = Lock()
+        self._file = None
+        self._poller = None
+        self._mounts = None
+
+    def _changed(self):
+        """
+        :returns: ``True`` if the mount table may have changed since it was
+            last read.
+        """
+        if self._file is None:
+            self._file = self._mountinfo.open()
+            self._poller = self._poll()
+            self._poller.register(
+                self._file.fileno(), select.POLLPRI | select.POLLERR
+            )
+            return True
+        return any(
+            events & (select.POLLPRI | select.POLLERR)
+            for (_, events) in self._poller.poll(0)
+        )
+
+    def mounts(self):
+        """
+        :returns: A ``list`` of ``MountInfo``\ s of all mounted block
+            devices.
+        """
+        with self._lock:
+            if self._changed() or self._mounts is None:
+                self._file.seek(0)
+                # Filesystem modules may be loaded on first use, so the
+                # types are re-read along with the table.
+                self._mounts = _parse_mountinfo(
+                    self._file.read(),
+                    _block_filesystem_types(self._filesystems.getContent()),
+                )
+            return self._mounts
+
+
+# The offsets and values of the magic numbers identifying the superblocks of
+# the filesystems Flocker creates.
+_SUPERBLOCK_MAGIC = [
+    # XFS: "XFSB" at the start of the device.
+    (0, b"XFSB"),
+    # ext2/3/4: 0xEF53, little endian, 56 bytes into the superblock which
+    # begins 1024 bytes into the device.
+    (1080, b"\x53\xef"),
+]
+
+
+def _read_superblock_header(blockdevice):
+    """
+    Read the start of a block device, far enough to include the superblock
+    magic numbers of the filesystems in ``_SUPERBLOCK_MAGIC``.
+
+    :param FilePath blockdevice: The block device to read.
+
+    :returns: The ``bytes`` read or ``None`` if the device cannot be read.
+    """
+    try:
+        with blockdevice.open() as device:
+            return device.read(
+                max(offset + len(magic) for (offset, magic)
+                    in _SUPERBLOCK_MAGIC)
+            )
+    except IOError:
+        return None
+
+
+def _has_known_superblock(header):
+    """
+    :param bytes header: The start of a block device.
+
+    :returns: ``True`` if ``header`` has the magic number of one of the
+        filesystems in ``_SUPERBLOCK_MAGIC``.
+    """
+    return any(
+        header[offset:offset + len(magic)] == magic
+        for (offset, magic) in _SUPERBLOCK_MAGIC
+    )
+
+
+class _FilesystemProbe(object):
+    """
+    Determine whether block devices have a filesystem.
+
+    The superblock magic of the filesystems Flocker creates is checked
+    in-process on every call, which is cheap and notices filesystems however
+    they were created.  Only for other devices is the slower fallback used,
+    and its answer is remembered for as long as the device file (by device
+    number, inode and change time) and the start of the device stay the
+    same.
+
+    :ivar _fallback: A callable like ``_has_filesystem_blkid`` used when
+        the superblock is not recognized.
+    """
+    def __init__(self, fallback=_has_filesystem_blkid):
+        self._fallback = fallback
+        self._lock = Lock()
+        self._results = {}
+
+    def has_filesystem(self, blockdevice):
+        """
+        :param FilePath blockdevice: The bockdevice to query for a filesystem.
+        :returns: True if the blockdevice has a filesystem.
+        """
+        header = _read_superblock_header(blockdevice)
+        if header is not None and _has_known_superblock(header):
+            return True
+        status = os.stat(blockdevice.path)
+        identity = (status.st_rdev, status.st_ino, status.st_ctime, header)
+        with self._lock:
+            cached = self._results.get(blockdevice)
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+        result = self._fallback(blockdevice)
+        with self._lock:
+            self._results[blockdevice] = (identity, result)
+        return result
+
+    def invalidate(self, blockdevice):
+        """
+        Forget the answer for a block device.
+
+        :param FilePath blockdevice: The block device.
+        """
+        with self._lock:
+            self._results.pop(blockdevice, None)
+
+
+# There is one mount table and one set of block devices per host, so the
+# caches are shared by all ``BlockDeviceManager``\ s by default.
+_SYSTEM_MOUNT_TABLE = _MountTable()
+_SYSTEM_FILESYSTEM_PROBE = _FilesystemProbe()
+
+
 @implementer(IBlockDeviceManager)
 class BlockDeviceManager(PClass):
     """
     Real implementation of IBlockDeviceManager.
+
+    :ivar _MountTable _mount_table: The source of ``get_mounts`` results.
+    :ivar _FilesystemProbe _filesystems: The source of ``has_filesystem``
+        results.
     """
+    _mount_table = field(mandatory=True, initial=_SYSTEM_MOUNT_TABLE)
+    _filesystems = field(mandatory=True, initial=_SYSTEM_FILESYSTEM_PROBE)
+
     def make_filesystem(self, blockdevice, filesystem):
+        self._filesystems.invalidate(blockdevice)
         try:
             run_process([
                 b"mkfs", b"-t", filesystem.encode("ascii"),
@@ -246,28 +507,10 @@ class BlockDeviceManager(PClass):
                                       source_message=e.output)
 
     def has_filesystem(self, blockdevice):
-        try:
-            run_process(
-                [b"blkid", b"-p", b"-u", b"filesystem", blockdevice.path]
-            )
-        except CalledProcessError as e:
-            # According to the man page:
-            #   the specified token was not found, or no (specified) devices
-            #   could be identified
-            #
-            # Experimentation shows that there is no output in the case of the
-            # former, and an error printed to stderr in the case of the
-            # latter.
-            #
-            # FLOC-2388: We're assuming an interface. We should test this
-            # assumption.
-            if e.returncode == 2 and not e.output:
-                # There is no filesystem on this device.
-                return False
-            raise
-        return True
+        return self._filesystems.has_filesystem(blockdevice)
 
     def mount(self, blockdevice, mountpoint):
+        self._filesystems.invalidate(blockdevice)
         try:
             run_process([b"mount", blockdevice.path, mountpoint.path])
         except CalledProcessError as e:
@@ -282,10 +525,7 @@ class BlockDeviceManager(PClass):
                                source_message=e.output)
 
     def get_mounts(self):
-        mounts = psutil.disk_partitions()
-        return (MountInfo(blockdevice=FilePath(mount.device),
-                          mountpoint=FilePath(mount.mountpoint))
-                for mount in mounts)
+        return iter(self._mount_table.mounts())
 
     def bind_mount(self, source_path, mountpoint):
         try:
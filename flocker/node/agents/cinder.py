@@ -6,7 +6,9 @@ A Cinder implementation of the ``IBlockDeviceAPI``.
 """
 from itertools import repeat
 import json
+import sys
 import time
+from threading import Condition
 from uuid import UUID
 
 from bitmath import Byte, GiB
@@ -15,6 +17,8 @@ from eliot import Message, writeTraceback
 
 from pyrsistent import PClass, field
 
+from six import reraise
+
 from keystoneauth1.exceptions.catalog import EndpointNotFound
 from keystoneclient.openstack.common.apiclient.exceptions import (
     HttpError as KeystoneHttpError,
@@ -38,6 +42,7 @@ from ...common import (
     interface_decorator, get_all_ips, ipaddress_from_string,
     poll_until,
 )
+from ...common._era import get_era
 from .blockdevice import (
     IBlockDeviceAPI, BlockDeviceVolume, UnknownVolume, AlreadyAttachedVolume,
     UnattachedVolume, UnknownInstanceID, get_blockdevice_volume, ICloudAPI,
@@ -64,6 +69,13 @@ CINDER_TIMEOUT = 600
 # The longest time we're willing to wait for a Cinder volume to be destroyed
 CINDER_VOLUME_DESTRUCTION_TIMEOUT = 300
 
+# How long, in seconds, a listing of the live Nova servers is reused for.
+LIVE_NODES_CACHE_TTL = 30
+
+# Where the compute instance ID of this node is remembered across agent
+# restarts.
+DEFAULT_INSTANCE_ID_CACHE_PATH = b"/var/lib/flocker/openstack-instance-id.json"
+
 CONFIG_DRIVE_LABEL = u"config-2"
 METADATA_RELATIVE_PATH = ['openstack', 'latest', 'meta_data.json']
 METADATA_SERVICE_ENDPOINT = (b"169.254.169.254", 80)
@@ -151,6 +163,55 @@ def metadata_from_service(metadata_service_endpoint=METADATA_SERVICE_ENDPOINT,
             ).write()
 
 
+def _read_instance_id_cache(cache_path):
+    """
+    Load a compute instance ID remembered by ``_write_instance_id_cache``.
+
+    The instance ID of a node cannot change without a reboot, so a
+    remembered ID is only used if it was recorded during the current era.
+
+    :param FilePath cache_path: The file in which the ID is remembered.
+    :return: The ``unicode`` instance ID, or ``None`` if there is no usable
+        remembered ID.
+    """
+    try:
+        record = json.loads(cache_path.getContent())
+        if record[u"era"] == unicode(get_era()):
+            return record[u"instance_id"]
+    except (IOError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def _write_instance_id_cache(cache_path, instance_id, source):
+    """
+    Remember a compute instance ID for the current era.
+
+    Failures are logged rather than raised; a missing cache only costs a
+    slower lookup on the next agent start.
+
+    :param FilePath cache_path: The file in which to remember the ID.
+    :param unicode instance_id: The instance ID.
+    :param unicode source: Where the instance ID was discovered.
+    """
+    record = {
+        u"era": unicode(get_era()),
+        u"instance_id": instance_id,
+        u"source": source,
+    }
+    try:
+        if not cache_path.parent().exists():
+            cache_path.parent().makedirs()
+        cache_path.setContent(json.dumps(record))
+    except (IOError, OSError) as e:
+        Message.new(
+            message_type=(
+                u"flocker:node:agents:blockdevice:openstack:"
+                u"compute_instance_id:cache_write_failed"),
+            error_message=unicode(e),
+        ).write()
+
+
 def _openstack_logged_method(method_name, original_name):
     """
     Run a method and log additional information about any exceptions that are
@@ -413,6 +474,21 @@ class VolumeStateMonitor:
                 raise TimeoutException(
                     self.expected_volume, self.desired_state, elapsed_time)
             return None
+        return self.check_volume(existing_volume)
+
+    def check_volume(self, existing_volume):
+        """
+        Test whether an already retrieved ``Volume`` has reached the desired
+        state.
+
+        :param Volume existing_volume: The current Cinder ``Volume`` with the
+            same ``id`` as ``expected_volume``.
+
+        :raises: UnexpectedStateException: If ``existing_volume`` is in an
+            invalid state.
+        :returns: ``existing_volume`` if it has the desired state, otherwise
+            ``None``.
+        """
         # Could miss the expected status because race conditions.
         # FLOC-1832
         current_state = existing_volume.status
@@ -429,8 +505,171 @@ class VolumeStateMonitor:
                 self.expected_volume, self.desired_state, current_state)
 
 
+class _VolumeWaiter(object):
+    """
+    The progress of one ``VolumeStateMonitor`` registered with a
+    ``CinderVolumePoller``.
+
+    :ivar VolumeStateMonitor monitor: The monitor being driven.
+    :ivar done: ``True`` once ``result`` or ``exc_info`` has been set.
+    :ivar result: The ``Volume`` which reached the desired state.
+    :ivar exc_info: The ``sys.exc_info()`` of an exception raised while
+        checking the volume, if any.
+    :ivar last_status: The volume status seen by the most recent poll.
+    """
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.done = False
+        self.result = None
+        self.exc_info = None
+        self.last_status = None
+
+    def finish(self, result=None, exc_info=None):
+        self.done = True
+        self.result = result
+        self.exc_info = exc_info
+
+    def get_result(self):
+        """
+        :return: The volume which reached the desired state, or re-raise the
+            exception encountered while waiting for it.
+        """
+        if self.exc_info is not None:
+            reraise(*self.exc_info)
+        return self.result
+
+
+class CinderVolumePoller(object):
+    """
+    Share the Cinder API calls made by concurrent ``wait_for_volume_state``
+    callers.
+
+    Every thread waiting for a volume registers a ``VolumeStateMonitor``.
+    One of the waiting threads at a time takes the role of poller: it
+    refreshes every registered volume with a single ``list`` call per
+    interval and wakes up the waiters whose volumes have reached (or failed
+    to reach) their desired state.  The other threads simply block until
+    they are woken.  The number of Cinder API calls is therefore
+    independent of the number of concurrent waits.
+
+    Volumes which are missing from the listing (for example because the
+    listing was truncated by the server) are looked up individually, as are
+    all of them if the ``list`` call fails, so that each waiter only fails
+    if its own lookup does.
+
+    The interval between polls starts at ``interval`` and is multiplied by
+    ``backoff`` (up to ``max_interval``) each time a poll finds no change in
+    the status of any watched volume.  It is reset when a volume changes
+    status or a new waiter arrives.
+
+    :ivar ICinderVolumeManager volume_manager: An API for listing volumes.
+    """
+    def __init__(self, volume_manager, interval=1.0, max_interval=5.0,
+                 backoff=1.5, sleep=None):
+        """
+        :param ICinderVolumeManager volume_manager: An API for listing
+            volumes.
+        :param float interval: The initial delay between polls, in seconds.
+        :param float max_interval: The longest delay between polls, in
+            seconds.
+        :param float backoff: The factor by which the delay grows when
+            nothing changes.
+        :param callable sleep: Called with the interval to delay on.
+            Defaults to ``time.sleep``.
+        """
+        if sleep is None:
+            sleep = time.sleep
+        self.volume_manager = volume_manager
+        self._initial_interval = interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._sleep = sleep
+        self._interval = interval
+        self._condition = Condition()
+        self._waiters = []
+        self._polling = False
+
+    def wait(self, monitor):
+        """
+        Block until the volume watched by ``monitor`` reaches its desired
+        state.
+
+        :param VolumeStateMonitor monitor: The volume and state to wait for.
+
+        :raises: Any exception raised by ``monitor`` or by the Cinder API.
+        :returns: The listed ``Volume`` that matches
+            ``monitor.expected_volume``.
+        """
+        waiter = _VolumeWaiter(monitor)
+        with self._condition:
+            self._waiters.append(waiter)
+            self._interval = self._initial_interval
+            while self._polling and not waiter.done:
+                self._condition.wait()
+            if waiter.done:
+                return waiter.get_result()
+            # Nobody else is polling; this thread takes over until its own
+            # volume is done.
+            self._polling = True
+        try:
+            while True:
+                self._poll()
+                if waiter.done:
+                    return waiter.get_result()
+                self._sleep(self._interval)
+        finally:
+            with self._condition:
+                self._polling = False
+                self._condition.notify_all()
+
+    def _poll(self):
+        """
+        Refresh all registered volumes with one ``list`` call, record the
+        outcome for each waiter and wake up the ones which are done.
+        """
+        with self._condition:
+            waiters = list(self._waiters)
+        changed = False
+        try:
+            listed = {
+                volume.id: volume
+                for volume in self.volume_manager.list(detailed=True)
+            }
+        except:
+            writeTraceback()
+            listed = {}
+        for waiter in waiters:
+            volume = listed.get(waiter.monitor.expected_volume.id)
+            try:
+                if volume is None:
+                    result = waiter.monitor.reached_desired_state()
+                else:
+                    if volume.status != waiter.last_status:
+                        changed = True
+                        waiter.last_status = volume.status
+                    result = waiter.monitor.check_volume(volume)
+            except:
+                waiter.finish(exc_info=sys.exc_info())
+            else:
+                if result:
+                    waiter.finish(result=result)
+        with self._condition:
+            remaining = [w for w in self._waiters if not w.done]
+            if len(remaining) != len(self._waiters):
+                changed = True
+            self._waiters = remaining
+            if changed:
+                self._interval = self._initial_interval
+            else:
+                self._interval = min(
+                    self._interval * self._backoff, self._max_interval
+                )
+            self._condition.notify_all()
+
+
 def wait_for_volume_state(volume_manager, expected_volume, desired_state,
-                          transient_states=(), time_limit=CINDER_TIMEOUT):
+                          transient_states=(), time_limit=CINDER_TIMEOUT,
+                          poller=None):
     """
     Wait for a ``Volume`` with the same ``id`` as ``expected_volume`` to be
     listed and to have a ``status`` value of ``desired_state``.
@@ -440,6 +679,9 @@ def wait_for_volume_state(volume_manager, expected_volume, desired_state,
     :param transient_states: A sequence of valid intermediate states.
     :param int time_limit: The maximum time, in seconds, to wait for the
         ``expected_volume`` to have ``desired_state``.
+    :param CinderVolumePoller poller: A poller shared with other waiters for
+        ``volume_manager``.  If ``None``, the volume is polled on its own
+        with a ``get`` call every second.
     :raises: UnexpectedStateException: If ``expected_volume`` enters an
         invalid state.
     :raises TimeoutException: If ``expected_volume`` with
@@ -449,6 +691,8 @@ def wait_for_volume_state(volume_manager, expected_volume, desired_state,
     waiter = VolumeStateMonitor(
         volume_manager, expected_volume, desired_state, transient_states,
         time_limit)
+    if poller is not None:
+        return poller.wait(waiter)
     return poll_until(waiter.reached_desired_state, repeat(1))
 
 
@@ -496,7 +740,7 @@ def _get_compute_id(local_ips, id_to_node_ips):
 
 
 def _nova_detach(nova_volume_manager, cinder_volume_manager,
-                 server_id, cinder_volume):
+                 server_id, cinder_volume, poller=None):
     """
     Detach a Cinder volume from a Nova host and block until the volume has
     detached.
@@ -505,6 +749,8 @@ def _nova_detach(nova_volume_manager, cinder_volume_manager,
     :param cinder_volume_manager: A ``cinder.VolumManager``.
     :param server_id: The Nova server ID.
     :param cinder_volume: A cinder.Volume.
+    :param CinderVolumePoller poller: The poller to share while waiting for
+        the volume to detach.
     """
     try:
         nova_volume_manager.delete_server_volume(
@@ -522,7 +768,8 @@ def _nova_detach(nova_volume_manager, cinder_volume_manager,
         volume_manager=cinder_volume_manager,
         expected_volume=cinder_volume,
         desired_state=u'available',
-        transient_states=(u'in-use', u'detaching')
+        transient_states=(u'in-use', u'detaching'),
+        poller=poller,
     )
 
 
@@ -538,7 +785,9 @@ class CinderBlockDeviceAPI(object):
                  nova_volume_manager, nova_server_manager,
                  cluster_id,
                  timeout=CINDER_VOLUME_DESTRUCTION_TIMEOUT,
-                 time_module=None):
+                 time_module=None,
+                 live_nodes_ttl=LIVE_NODES_CACHE_TTL,
+                 instance_id_cache_path=None):
         """
         :param ICinderVolumeManager cinder_volume_manager: A client for
             interacting with Cinder API.
@@ -549,6 +798,11 @@ class CinderBlockDeviceAPI(object):
         :param UUID cluster_id: An ID that will be included in the names of
             Cinder block devices in order to associate them with a particular
             Flocker cluster.
+        :param float live_nodes_ttl: How long, in seconds, a listing of the
+            live Nova servers is reused for.
+        :param FilePath instance_id_cache_path: A file in which to remember
+            the result of ``compute_instance_id`` across agent restarts, or
+            ``None`` to look it up again in every process.
         """
         self.cinder_volume_manager = cinder_volume_manager
         self.nova_volume_manager = nova_volume_manager
@@ -558,6 +812,11 @@ class CinderBlockDeviceAPI(object):
         if time_module is None:
             time_module = time
         self._time = time_module
+        self._volume_poller = CinderVolumePoller(cinder_volume_manager)
+        self._live_nodes_ttl = live_nodes_ttl
+        self._active_servers = None
+        self._active_servers_time = None
+        self._instance_id_cache_path = instance_id_cache_path
         self._config_drive_label = CONFIG_DRIVE_LABEL
         self._metadata_service_endpoint = METADATA_SERVICE_ENDPOINT
 
@@ -582,10 +841,8 @@ class CinderBlockDeviceAPI(object):
         local_ips = get_all_ips()
         api_ip_map = {}
         id_to_node_ips = {}
-        for server in self.nova_server_manager.list():
-            # Servers which are not active will not have any IP addresses
-            if server.status != u'ACTIVE':
-                continue
+        # Servers which are not active will not have any IP addresses
+        for server in self._list_active_servers():
             api_addresses = _extract_nova_server_addresses(server.addresses)
             id_to_node_ips[server.id] = api_addresses
             for ip in api_addresses:
@@ -600,33 +857,72 @@ class CinderBlockDeviceAPI(object):
                 local_ips=local_ips, api_ips=api_ip_map
             ).write()
 
-    def compute_instance_id(self):
+    def _list_active_servers(self):
+        """
+        List the ``ACTIVE`` Nova servers, reusing a listing made less than
+        ``live_nodes_ttl`` seconds ago.
+
+        :return: A ``list`` of Nova ``Server`` objects.
+        """
+        now = self._time.time()
+        if (self._active_servers is None or
+                now - self._active_servers_time >= self._live_nodes_ttl):
+            self._active_servers = [
+                server for server in self.nova_server_manager.list()
+                if server.status == u'ACTIVE'
+            ]
+            self._active_servers_time = now
+        return self._active_servers
+
+    def _lookup_compute_instance_id(self):
         """
         Attempt to retrieve node UUID from the metadata in a config drive or
         from the metadata service.
         Fall back to finging the ``ACTIVE`` Nova API server with an
         intersection of the IPv4 and IPv6 addresses on this node.
+
+        :return: A tuple of the instance ID and a ``unicode`` description of
+            where it was found.
         """
         metadata_checkers = [
-            lambda: metadata_from_config_drive(
+            (u"config-drive", lambda: metadata_from_config_drive(
                 config_drive_label=self._config_drive_label
-            ),
-            lambda: metadata_from_service(
+            )),
+            (u"metadata-service", lambda: metadata_from_service(
                 metadata_service_endpoint=self._metadata_service_endpoint
-            ),
+            )),
         ]
-        for checker in metadata_checkers:
+        for source, checker in metadata_checkers:
             metadata = checker()
             if metadata:
-                return metadata["uuid"]
+                return metadata["uuid"], source
         try:
             result = self._compute_instance_id_by_ipaddress_match()
         except:
             writeTraceback()
         else:
-            return result
+            return result, u"ip-address"
         raise UnknownInstanceID(self)
 
+    def compute_instance_id(self):
+        """
+        Return the instance ID remembered from an earlier agent process
+        during this boot, if any.  Otherwise look it up from the config
+        drive, the metadata service or the Nova server listing, and remember
+        the result.
+        """
+        if self._instance_id_cache_path is not None:
+            instance_id = _read_instance_id_cache(
+                self._instance_id_cache_path)
+            if instance_id is not None:
+                return instance_id
+        instance_id, source = self._lookup_compute_instance_id()
+        if (self._instance_id_cache_path is not None and
+                instance_id is not None):
+            _write_instance_id_cache(
+                self._instance_id_cache_path, instance_id, source)
+        return instance_id
+
     def create_volume(self, dataset_id, size):
         """
         Create a block device using the ICinderVolumeManager.
@@ -652,6 +948,7 @@ class CinderBlockDeviceAPI(object):
             expected_volume=requested_volume,
             desired_state=u'available',
             transient_states=(u'creating',),
+            poller=self._volume_poller,
         )
         return _blockdevicevolume_from_cinder_volume(
             cinder_volume=created_volume,
@@ -703,6 +1000,7 @@ class CinderBlockDeviceAPI(object):
             expected_volume=nova_volume,
             desired_state=u'in-use',
             transient_states=(u'available', u'attaching',),
+            poller=self._volume_poller,
         )
 
         attached_volume = unattached_volume.set('attached_to', attach_to)
@@ -722,6 +1020,7 @@ class CinderBlockDeviceAPI(object):
             cinder_volume_manager=self.cinder_volume_manager,
             server_id=server_id,
             cinder_volume=cinder_volume,
+            poller=self._volume_poller,
         )
 
     def destroy_volume(self, blockdevice_id):
@@ -851,12 +1150,13 @@ class CinderBlockDeviceAPI(object):
 
     # ICloudAPI:
     def list_live_nodes(self):
-        return list(server.id for server in self.nova_server_manager.list()
-                    if server.status == u'ACTIVE')
+        return list(server.id for server in self._list_active_servers())
 
     def start_node(self, node_id):
         server = self.nova_server_manager.get(node_id)
         server.start()
+        # The cached listing no longer reflects which nodes are live.
+        self._active_servers = None
 
 
 def _is_virtio_blk(device_path):
@@ -1134,13 +1434,17 @@ def get_nova_v2_client(session, region):
     )
 
 
-def cinder_from_configuration(region, cluster_id, **config):
+def cinder_from_configuration(
+        region, cluster_id,
+        instance_id_cache_path=DEFAULT_INSTANCE_ID_CACHE_PATH, **config):
     """
     Build a ``CinderBlockDeviceAPI`` using configuration and credentials
     in ``config``.
 
     :param str region: The Openstack region to access.
     :param cluster_id: The unique identifier for the cluster to access.
+    :param instance_id_cache_path: The path of a file in which to remember
+        the compute instance ID of this node across agent restarts.
     :param config: A dictionary of configuration options for Openstack.
     """
     def lazy_cinder_loader():
@@ -1201,4 +1505,5 @@ def cinder_from_configuration(region, cluster_id, **config):
         nova_volume_manager=logging_nova_volume_manager,
         nova_server_manager=logging_nova_server_manager,
         cluster_id=cluster_id,
+        instance_id_cache_path=FilePath(instance_id_cache_path),
     )
@@ -6,7 +6,6 @@ An EBS implementation of the ``IBlockDeviceAPI``.
 """
 
 from types import NoneType
-from subprocess import check_output
 import threading
 import time
 import logging
@@ -475,10 +474,13 @@ def _expected_device(requested_device):
 
     This maps EBS required ``/dev/sdX`` names to ``/dev/vbdX`` names that are
     used by currently supported platforms (Ubuntu 14.04 and CentOS 7).
+    ``/dev/xvdXY`` names are used as they are.
     """
     prefix = b"/dev/sd"
     if requested_device.startswith(prefix):
         return FilePath(b"/dev").child(b"xvd" + requested_device[len(prefix):])
+    if requested_device.startswith(b"/dev/xvd"):
+        return FilePath(requested_device)
     raise ValueError(
         "Unsupported requested device {!r}".format(requested_device)
     )
@@ -730,7 +732,7 @@ def _wait_for_volume_state_change(operation,
     )
 
 
-def _get_device_size(device):
+def _get_device_size(device, sys_block=None):
     """
     Helper function to fetch the size of given block device.
 
@@ -747,15 +749,21 @@ def _get_device_size(device):
     * https://github.com/karelzak/util-linux/tree/master/disk-utils
 
     :param unicode device: Name of the block device to fetch size for.
+    :param FilePath sys_block: The ``/sys/block`` directory listing the block
+        devices.  Defaults to the real one.
 
     :returns: Size, in SI metric bytes, of device we are interested in.
     :rtype: int
     """
-    size_file = FilePath('/sys/block/{}/size'.format(device))
+    if sys_block is None:
+        sys_block = FilePath(b"/sys/block")
+    size_file = sys_block.descendant([device, b"size"])
     return int(size_file.getContent()) * 512
 
 
-def _wait_for_new_device(base, expected_size, time_limit=60):
+def _wait_for_new_device(base, expected_size, time_limit=60,
+                         sys_block=None, expected_name=None,
+                         overlapped=lambda: False):
     """
     Helper function to wait for up to 60s for new
     EBS block device (`/dev/sd*` or `/dev/xvd*`) to
@@ -768,18 +776,33 @@ def _wait_for_new_device(base, expected_size, time_limit=60):
         manifest in the OS.
     :param int time_limit: Time, in seconds, to wait for
         new device to manifest. Defaults to 60s.
+    :param FilePath sys_block: The ``/sys/block`` directory listing the block
+        devices.  Defaults to the real one.
+    :param bytes expected_name: The basename of the device the operation
+        is expected to create.
+    :param overlapped: A no-argument callable which returns ``True`` if
+        other operations creating block devices have been in progress at
+        the same time as this one.  Any other new device may then be theirs,
+        so only the device named ``expected_name`` is accepted.
 
     :returns: The path of the new block device file.
     :rtype: ``FilePath``
     """
+    if sys_block is None:
+        sys_block = FilePath(b"/sys/block")
     start_time = time.time()
     elapsed_time = time.time() - start_time
     while elapsed_time < time_limit:
-        for device in list(set(FilePath(b"/sys/block").children()) -
-                           set(base)):
+        # Checked before listing the devices: another operation's device
+        # can only appear after that operation has started.
+        only_expected = overlapped()
+        for device in list(set(sys_block.children()) - set(base)):
             device_name = device.basename()
+            if only_expected and device_name != expected_name:
+                continue
             if (device_name.startswith((b"sd", b"xvd")) and
-                    _get_device_size(device_name) == expected_size):
+                    _get_device_size(device_name, sys_block) ==
+                    expected_size):
                 return FilePath(b"/dev").child(device_name)
         time.sleep(0.1)
         elapsed_time = time.time() - start_time
@@ -789,10 +812,10 @@ def _wait_for_new_device(base, expected_size, time_limit=60):
     # for debuggability.
     new_devices = list(
         device.basename()
-        for device in set(FilePath(b"/sys/block").children()) - set(base)
+        for device in set(sys_block.children()) - set(base)
     )
     new_devices_size = list(
-        _get_device_size(device_name)
+        _get_device_size(device_name, sys_block)
         for device_name in new_devices
     )
     NO_NEW_DEVICE_IN_OS(new_devices=new_devices,
@@ -840,7 +863,8 @@ def _is_cluster_volume(cluster_id, ebs_volume):
 
 
 def _attach_volume_and_wait_for_device(
-    volume, attach_to, attach_volume, detach_volume, device, blockdevices
+    volume, attach_to, attach_volume, detach_volume, device, blockdevices,
+    sys_block=None, overlapped=lambda: False,
 ):
     """
     Attempt to attach an EBS volume to an EC2 instance and wait for the
@@ -855,6 +879,9 @@ def _attach_volume_and_wait_for_device(
     :param list blockdevices: The OS device paths (as ``FilePath``) which are
         already present on the system before this operation is attempted
         (primarily useful to make testing easier).
+    :param FilePath sys_block: The ``/sys/block`` directory listing the block
+        devices.  Defaults to the real one.
+    :param overlapped: See ``_wait_for_new_device``.
     :raise: Anything ``attach_volume`` can raise.  Or
         ``AttachedUnexpectedDevice`` if the volume appears to become attached
         to the wrong OS device file.
@@ -877,11 +904,15 @@ def _attach_volume_and_wait_for_device(
         # in EC2 for mapping `device` to the name device driver
         # picked (http://docs.aws.amazon.com/AWSEC2/latest/
         # UserGuide/device_naming.html), wait for new block device
-        # to be available to the OS, and interpret it as ours.
-        # Wait under lock scope to reduce false positives.
+        # to be available to the OS, and interpret it as ours.  If other
+        # attaches are in progress any new device may be theirs, so then
+        # only the expected device is interpreted as ours.
         device_path = _wait_for_new_device(
             base=blockdevices,
             expected_size=volume.size,
+            sys_block=sys_block,
+            expected_name=_expected_device(device).basename(),
+            overlapped=overlapped,
         )
         # We do, however, expect the attached device name to follow
         # a certain simple pattern.  Verify that now and signal an
@@ -907,44 +938,59 @@ def _attach_volume_and_wait_for_device(
         return True
 
 
-def _get_blockdevices():
-    return FilePath(b"/sys/block").children()
+def _device_path_from_serial(blockdevice_id, sys_block):
+    """
+    Find the OS device for an EBS volume using the serial number the block
+    device reports.
 
+    EBS volumes exposed as NVMe devices (on Nitro based instances) report
+    the volume id, without the hyphen, as their serial number, e.g.
+    ``vol0123456789abcdef0``.  Xen ``xvd`` devices do not report a serial
+    number, so no device will be found for them.
 
-def _next_device():
-    """
-    Get the next available EBS device name for this EC2 instance.
+    :param unicode blockdevice_id: The EBS volume id.
+    :param FilePath sys_block: The ``/sys/block`` directory to search.
 
-    :return unicode file_name: available device name for attaching EBS volume.
+    :return: The ``FilePath`` of the device or ``None`` if no device reports
+        the volume id as its serial number.
     """
-
-    return _select_free_device(_find_allocated_devices())
+    serial = blockdevice_id.replace(u"-", u"").encode("ascii")
+    try:
+        devices = sys_block.children()
+    except OSError:
+        return None
+    for device in devices:
+        serial_file = device.descendant([b"device", b"serial"])
+        try:
+            if serial_file.getContent().strip() == serial:
+                return FilePath(b"/dev").child(device.basename())
+        except IOError:
+            continue
+    return None
 
 
-def _find_allocated_devices():
+def _find_allocated_devices(sys_block=None):
     """
     Enumerate the allocated device names on this host.
 
+    :param FilePath sys_block: The ``/sys/block`` directory listing the block
+        devices.  Defaults to the real one.
+
     :return Sequence[bytes]: List of allocated device basenames
         (e.g. ``[b'sda']``).
     """
-    command = [
-        b"/bin/lsblk",
-        b"--nodeps",           # Only print top-level devices
-        b"--noheadings",       # Do not display KNAME header
-        b"--output", b"KNAME"  # Only display kernel device name
-    ]
-    command_result = check_output(command)
-    existing = [
-        dev for dev in command_result.split("\n")
-        if dev.startswith(b"xvd") or dev.startswith(b'sd')
-    ]
-    return existing
+    if sys_block is None:
+        sys_block = FilePath(b"/sys/block")
+    return list(
+        device.basename() for device in sys_block.children()
+        if device.basename().startswith((b"xvd", b"sd"))
+    )
 
 
-def _select_free_device(existing):
+def _candidate_devices():
     """
-    Given a list of allocated devices, return an available device name.
+    Generate the device names which may be used to attach EBS volumes, in the
+    order they should be used.
 
     According to
     http://docs.aws.amazon.com/AWSEC2/latest/UserGuide/device_naming.html
@@ -958,12 +1004,27 @@ def _select_free_device(existing):
 
     ``sd[f-p]`` only allows 11 devices, so to increase this, ignore the
     least stringent statement above, and allow ``sd[f-z]`` (21 devices).
-
     To reduce the risk of failing on custom AMIs, select from ``[f-p]`` first.
 
-    Any further increase will need to start mining the ``hd[a-z][1-15]``
-    and ``xvd[b-c][a-z]`` namespaces, but which to use depends on whether
-    the AMI uses paravirtualization or HVM.
+    After those, the ``xvd[b-c][a-z]`` namespace (52 more devices) which HVM
+    instances support is used.
+
+    :return: An iterator of pairs of the ``unicode`` device name to request
+        from EBS and the device basenames (``bytes``) which conflict with it.
+    """
+    for suffix in b"fghijklmonpqrstuvwxyz":
+        yield u'/dev/sd' + unicode(suffix), [b'xvd' + suffix, b'sd' + suffix]
+    for first in b"bc":
+        for second in b"abcdefghijklmnopqrstuvwxyz":
+            name = b'xvd' + first + second
+            yield u'/dev/' + name.decode("ascii"), [name]
+
+
+def _select_free_device(existing):
+    """
+    Given a list of allocated devices, return an available device name.
+
+    See ``_candidate_devices`` for the names which may be returned.
 
     :param Sequence[bytes]: List of allocated device basenames
         (e.g. ``[b'sda']``).
@@ -974,13 +1035,7 @@ def _select_free_device(existing):
     sorted_devices = sorted(existing)
     IN_USE_DEVICES(devices=sorted_devices).write()
 
-    for suffix in b"fghijklmonpqrstuvwxyz":
-        next_local_device = b'xvd' + suffix
-        next_local_sd_device = b'sd' + suffix
-        file_name = u'/dev/sd' + unicode(suffix)
-        possible_devices = [
-            next_local_device, next_local_sd_device
-        ]
+    for file_name, possible_devices in _candidate_devices():
         if not local_devices.intersection(possible_devices):
             return file_name
 
@@ -990,6 +1045,72 @@ def _select_free_device(existing):
     raise NoAvailableDevice()
 
 
+class _DeviceAllocator(object):
+    """
+    Allocate device names for attaching EBS volumes.
+
+    A name is reserved from the moment it is allocated until it is released,
+    so concurrent attaches never choose the same name even before the first
+    device appears in ``/sys/block``.
+
+    :ivar FilePath _sys_block: The ``/sys/block`` directory listing the block
+        devices.
+    :ivar set _reserved: The device basenames which are currently reserved.
+    :ivar set _overlapped: The reserved device basenames which have been
+        reserved at the same time as some other name.
+    """
+    def __init__(self, sys_block):
+        self._sys_block = sys_block
+        self._lock = threading.Lock()
+        self._reserved = set()
+        self._overlapped = set()
+
+    def reserve(self):
+        """
+        Reserve an available device name.
+
+        :raises NoAvailableDevice: If there are no available device names.
+
+        :return unicode: The device name to request from EBS.
+        """
+        with self._lock:
+            device = _select_free_device(
+                _find_allocated_devices(self._sys_block) +
+                list(self._reserved)
+            )
+            self._reserved.add(_expected_device(device).basename())
+            if len(self._reserved) > 1:
+                self._overlapped.update(self._reserved)
+            return device
+
+    def release(self, device):
+        """
+        Release a device name returned by ``reserve``.
+
+        :param unicode device: The device name.
+        """
+        with self._lock:
+            name = _expected_device(device).basename()
+            self._reserved.discard(name)
+            self._overlapped.discard(name)
+
+    def overlapped(self, device):
+        """
+        :param unicode device: A device name returned by ``reserve`` and not
+            yet released.
+
+        :return bool: Whether any other name has been reserved at the same
+            time as ``device`` since it was reserved.
+        """
+        with self._lock:
+            return _expected_device(device).basename() in self._overlapped
+
+
+# Shared by every ``EBSBlockDeviceAPI`` using the real ``/sys/block`` so that
+# reservations are respected across instances.
+_SYSTEM_DEVICE_ALLOCATOR = _DeviceAllocator(FilePath(b"/sys/block"))
+
+
 @implementer(IBlockDeviceAPI)
 @implementer(IProfiledBlockDeviceAPI)
 @implementer(ICloudAPI)
@@ -998,18 +1119,30 @@ class EBSBlockDeviceAPI(object):
     An EBS implementation of ``IBlockDeviceAPI`` which creates
     block devices in an EC2 cluster using Boto APIs.
     """
-    def __init__(self, ec2_client, cluster_id):
+    def __init__(self, ec2_client, cluster_id, sys_block=None):
         """
         Initialize EBS block device API instance.
 
         :param _EC2 ec2_client: A record of EC2 connection and zone.
         :param UUID cluster_id: UUID of cluster for this
             API instance.
+        :param FilePath sys_block: The ``/sys/block`` directory used to find
+            the OS devices of attached volumes.  Only intended to be used
+            in tests.
         """
         self.connection = ec2_client.connection
         self.zone = ec2_client.zone
         self.cluster_id = cluster_id
         self.lock = threading.Lock()
+        if sys_block is None:
+            sys_block = FilePath(b"/sys/block")
+            self._devices = _SYSTEM_DEVICE_ALLOCATOR
+        else:
+            self._devices = _DeviceAllocator(sys_block)
+        self._sys_block = sys_block
+        # Mapping from blockdevice_id to the device requested when the
+        # volume was attached to this instance.
+        self._attached_devices = {}
 
     def allocation_unit(self):
         """
@@ -1112,6 +1245,34 @@ class EBSBlockDeviceAPI(object):
             else:
                 raise
 
+    @boto3_log
+    def _list_attached_ebs_volumes(self, instance_id):
+        """
+        List all the volumes attached to an instance.
+
+        :param unicode instance_id: The instance ID.
+
+        :return: A ``list`` of ``Volume`` objects.
+        """
+        return list(self.connection.volumes.filter(
+            Filters=[
+                {'Name': 'attachment.instance-id', 'Values': [instance_id]},
+            ],
+        ))
+
+    def _load_attached_devices(self):
+        """
+        Record the devices of all volumes attached to this instance, using a
+        single EC2 API call.
+        """
+        instance_id = self.compute_instance_id()
+        attached_devices = {}
+        for ebs_volume in self._list_attached_ebs_volumes(instance_id):
+            for attachment in ebs_volume.attachments:
+                if attachment['InstanceId'] == instance_id:
+                    attached_devices[ebs_volume.id] = attachment['Device']
+        self._attached_devices = attached_devices
+
     @boto3_log
     def _detach_ebs_volume(self, volume_id):
         """
@@ -1281,21 +1442,31 @@ class EBSBlockDeviceAPI(object):
 
         attached = False
         for _ in range(3):
+            # The reservation keeps concurrent attaches from choosing the
+            # same name, so the lock is only needed to take it together
+            # with a consistent snapshot of the existing devices.  While
+            # attaches overlap each only accepts its expected device.
             with self.lock:
-                device = _next_device()
-                blockdevices = _get_blockdevices()
+                device = self._devices.reserve()
+                blockdevices = self._sys_block.children()
+            try:
                 attached = _attach_volume_and_wait_for_device(
                     volume, attach_to,
                     self._attach_ebs_volume,
                     self._detach_ebs_volume,
                     device, blockdevices,
+                    sys_block=self._sys_block,
+                    overlapped=lambda: self._devices.overlapped(device),
                 )
                 if attached:
                     _wait_for_volume_state_change(
                         VolumeOperations.ATTACH, ebs_volume,
                     )
-                    attached_volume = volume.set('attached_to', attach_to)
-                    return attached_volume
+                    self._attached_devices[blockdevice_id] = device
+            finally:
+                self._devices.release(device)
+            if attached:
+                return volume.set('attached_to', attach_to)
 
         raise AttachFailed(volume.blockdevice_id, attach_to, device)
 
@@ -1340,6 +1511,7 @@ class EBSBlockDeviceAPI(object):
                 ).write()
                 raise VolumeBusy(ebs_volume)
 
+        self._attached_devices.pop(blockdevice_id, None)
         self._detach_ebs_volume(blockdevice_id)
 
         _wait_for_volume_state_change(VolumeOperations.DETACH, ebs_volume)
@@ -1380,6 +1552,14 @@ class EBSBlockDeviceAPI(object):
         Get device path for the EBS volume corresponding to the given
         block device.
 
+        The device is found without any EC2 API calls if it reports the
+        volume id as its serial number, or if the volume is known to have
+        been attached to this instance.  Otherwise the devices of all the
+        volumes attached to this instance are loaded with a single API call,
+        so that discovering the devices of many volumes (e.g. after the
+        agent restarts) does not cost an API call per volume.  Only if the
+        volume is still not found is it loaded on its own.
+
         :param unicode blockdevice_id: EBS UUID for the volume to look up.
 
         :returns: A ``FilePath`` for the device.
@@ -1388,6 +1568,17 @@ class EBSBlockDeviceAPI(object):
         :raises UnattachedVolume: If the supplied ``blockdevice_id`` is
             not attached to a host.
         """
+        device_path = _device_path_from_serial(
+            blockdevice_id, self._sys_block)
+        if device_path is not None:
+            return device_path
+
+        if blockdevice_id not in self._attached_devices:
+            self._load_attached_devices()
+        device = self._attached_devices.get(blockdevice_id)
+        if device is not None:
+            return _expected_device(device)
+
         ebs_volume = self._get_ebs_volume(blockdevice_id)
         volume = _blockdevicevolume_from_ebs_volume(ebs_volume)
         if not volume.attached_to:
@@ -997,6 +997,9 @@ class ComputeInstanceIDTests(AsyncTestCase):
             "username": "unknown_user",
             "api_key": "unknown_api_key",
             "auth_url": "http://{}:{}/identity/v2.0".format(*find_free_port()),
+            # Don't let an instance ID remembered by one test leak into
+            # another.
+            "instance_id_cache_path": self.mktemp(),
         })
         self.api = get_api(
             backend=backend,
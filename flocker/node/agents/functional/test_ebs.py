@@ -26,7 +26,8 @@ from ..ebs import (
     VolumeOperations, VolumeStateTable, VolumeStates,
     TimeoutException, _reached_end_state, UnexpectedStateException,
     EBSMandatoryProfileAttributes, _get_volume_tag,
-    AttachUnexpectedInstance, VolumeBusy, _next_device,
+    AttachUnexpectedInstance, VolumeBusy, _select_free_device,
+    _find_allocated_devices,
 )
 from ....testtools import AsyncTestCase, async_runner
 
@@ -198,7 +199,8 @@ class EBSBlockDeviceAPIInterfaceTests(
         instance_id = self.api.compute_instance_id()
 
         # Attach manual volume using /xvd* device.
-        device_name = _next_device().replace(u'/sd', u'/xvd')
+        device_name = _select_free_device(
+            _find_allocated_devices()).replace(u'/sd', u'/xvd')
         self.api._attach_ebs_volume(
             created_volume.id, instance_id, device_name)
         _wait_for_volume_state_change(VolumeOperations.ATTACH, created_volume)
@@ -24,6 +24,9 @@ from googleapiclient.errors import HttpError
 from oauth2client.client import GoogleCredentials
 from oauth2client.service_account import ServiceAccountCredentials
 from pyrsistent import PClass, field
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
 from twisted.python.filepath import FilePath
 from twisted.python.constants import (
     Values, ValueConstant
@@ -32,7 +35,9 @@ from zope.interface import implementer, Interface
 
 from .blockdevice import (
     IBlockDeviceAPI, IProfiledBlockDeviceAPI, ICloudAPI, BlockDeviceVolume,
-    AlreadyAttachedVolume, UnknownVolume, UnattachedVolume, MandatoryProfiles
+    AlreadyAttachedVolume, UnknownVolume, UnattachedVolume, MandatoryProfiles,
+    IBlockDeviceAsyncAPI, IBlockDeviceAsyncAPIProvider,
+    _SyncToThreadedAsyncAPIAdapter,
 )
 from ...common import poll_until, loop_until
 
@@ -53,6 +58,13 @@ VOLUME_INSERT_TIMEOUT = 20
 VOLUME_ATTACH_TIMEOUT = 90
 VOLUME_DETATCH_TIMEOUT = 120
 
+# How often, in seconds, the shared poller asks GCE about all of the pending
+# operations.
+OPERATION_POLL_INTERVAL = 1
+
+# The largest number of requests GCE accepts in one batch request.
+_MAX_BATCH_SIZE = 1000
+
 
 class GCEVolumeException(Exception):
     """
@@ -93,6 +105,19 @@ class OperationPoller(Interface):
             resource.
         """
 
+    def request(compute):
+        """
+        Build, but do not execute, the request for the latest version of the
+        requested operation.  This allows the request to be batched with
+        others.
+
+        :param compute: The GCE compute python API object.
+
+        :returns: A ``googleapiclient.http.HttpRequest`` whose response is a
+            dict representing the latest version of the GCE operation
+            resource.
+        """
+
 
 @implementer(OperationPoller)
 class ZoneOperationPoller(PClass):
@@ -108,11 +133,14 @@ class ZoneOperationPoller(PClass):
     operation_name = field(type=unicode)
 
     def poll(self, compute):
+        return self.request(compute).execute()
+
+    def request(self, compute):
         return compute.zoneOperations().get(
             project=self.project,
             zone=self.zone,
             operation=self.operation_name
-        ).execute()
+        )
 
 
 @implementer(OperationPoller)
@@ -127,10 +155,13 @@ class GlobalOperationPoller(PClass):
     operation_name = field(type=unicode)
 
     def poll(self, compute):
+        return self.request(compute).execute()
+
+    def request(self, compute):
         return compute.globalOperations().get(
             project=self.project,
             operation=self.operation_name
-        ).execute()
+        )
 
 
 class MalformedOperation(Exception):
@@ -230,7 +261,8 @@ def wait_for_operation(compute, operation, timeout_steps, sleep=None):
         return final_operation
 
 
-def wait_for_operation_async(reactor, compute, operation, timeout_steps):
+def wait_for_operation_async(reactor, compute, operation, timeout_steps,
+                             poll=None):
     """
     Fires a deferred once a GCE operation is complete, or timeout passes.
 
@@ -244,11 +276,18 @@ def wait_for_operation_async(reactor, compute, operation, timeout_steps):
         This can be either a zone or a global operation.
     :param timeout_steps: Iterable of times in seconds to wait until timing out
         the operation.
+    :param poll: A callable taking an ``OperationPoller`` and returning the
+        latest version of the operation or a ``Deferred`` that fires with it,
+        for example ``SharedOperationPoller.poll``.  Defaults to polling the
+        operation directly with ``compute``.
 
     :returns Deferred: A Deferred firing with the concluded GCE operation
         resource or calling its errback if it times out.
     """
     poller = _create_poller(operation)
+    if poll is None:
+        def poll(poller):
+            return poller.poll(compute)
 
     eliot_action = start_action(
         action_type=u"flocker:node:agents:gce:wait_for_operation_async",
@@ -259,10 +298,11 @@ def wait_for_operation_async(reactor, compute, operation, timeout_steps):
     # interactions with deferred confuse me.
     with eliot_action.context():
         def finished_operation_result():
-            latest_operation = poller.poll(compute)
-            if latest_operation['status'] == 'DONE':
-                return latest_operation
-            return None
+            def check(latest_operation):
+                if latest_operation['status'] == 'DONE':
+                    return latest_operation
+                return None
+            return maybeDeferred(poll, poller).addCallback(check)
 
         operation_deferred = loop_until(
             reactor,
@@ -279,6 +319,73 @@ def wait_for_operation_async(reactor, compute, operation, timeout_steps):
     return operation_deferred
 
 
+class SharedOperationPoller(object):
+    """
+    Poll many pending GCE operations with one batched request.
+
+    Every call to ``poll`` made between two ticks is answered by the same
+    call to ``fetch`` at the next tick, so the number of GCE API calls and
+    threads used is independent of the number of operations being waited
+    for.
+
+    :ivar _reactor: The ``IReactorTime`` provider used to schedule ticks.
+    :ivar _fetch: A callable taking a ``list`` of ``OperationPoller``\ s and
+        returning a ``Deferred`` that fires with a ``list`` of the same
+        length.  Each element is either the latest version of the
+        corresponding operation or the ``Exception`` raised when retrieving
+        it.
+    :ivar _interval: The time between ticks, in seconds.
+    """
+    def __init__(self, reactor, fetch, interval=OPERATION_POLL_INTERVAL):
+        self._reactor = reactor
+        self._fetch = fetch
+        self._interval = interval
+        self._pending = []
+        self._tick = None
+
+    def poll(self, operation_poller):
+        """
+        Get the latest version of an operation at the next tick.
+
+        :param OperationPoller operation_poller: The operation to get.
+
+        :returns Deferred: Fires with a dict representing the latest version
+            of the operation.
+        """
+        result = Deferred()
+        self._pending.append((operation_poller, result))
+        if self._tick is None:
+            self._tick = self._reactor.callLater(self._interval, self._flush)
+        return result
+
+    def _flush(self):
+        """
+        Fetch all of the pending operations and fire the ``Deferred``\ s
+        returned by ``poll`` for them.
+        """
+        self._tick = None
+        pending, self._pending = self._pending, []
+        with start_action(
+            action_type=u"flocker:node:agents:gce:poll_operations",
+            count=len(pending),
+        ):
+            fetching = maybeDeferred(
+                self._fetch, list(poller for (poller, _) in pending)
+            )
+
+        def fetched(operations):
+            for (_, result), operation in zip(pending, operations):
+                if isinstance(operation, Exception):
+                    result.errback(Failure(operation))
+                else:
+                    result.callback(operation)
+
+        def failed(reason):
+            for (_, result) in pending:
+                result.errback(reason)
+        fetching.addCallbacks(fetched, failed)
+
+
 def get_metadata_path(path):
     """
     Requests a metadata path from the metadata server available within GCE.
@@ -409,6 +516,7 @@ def gce_credentials_from_config(gce_credentials_config=None):
 @implementer(IBlockDeviceAPI)
 @implementer(IProfiledBlockDeviceAPI)
 @implementer(ICloudAPI)
+@implementer(IBlockDeviceAsyncAPIProvider)
 class GCEBlockDeviceAPI(PClass):
     """
     A GCE Persistent Disk (PD) implementation of ``IBlockDeviceAPI`` which
@@ -455,7 +563,8 @@ class GCEBlockDeviceAPI(PClass):
         - You can have multiple clusters within the same project.
         - Multiple clusters within the same project cannot have datasets with
             the same UUID.
-        - We could add filtering by cluster by filtering on description.
+        - Disk listings are filtered by cluster on the GCE side by matching
+            the description.
         - The path of the device (or at least the path to a symlink to a path
             of the volume) is a pure function of blockdevice_id.
 
@@ -479,6 +588,22 @@ class GCEBlockDeviceAPI(PClass):
         """
         return u"flocker-v1-cluster-id: " + unicode(self._cluster_id)
 
+    def _disk_list_filter(self):
+        """
+        Returns a GCE list filter expression which matches the disks of this
+        cluster.
+
+        GCE interprets the value of a filter expression as a regular
+        expression which must match the whole field.  The space in the
+        description is matched by ``.`` so that the expression does not need
+        quoting.
+
+        :returns unicode: The filter expression.
+        """
+        return u"description eq " + (
+            self._disk_resource_description().replace(u" ", u".")
+        )
+
     def allocation_unit(self):
         """
         Can only allocate PDs in GiB units.
@@ -505,6 +630,7 @@ class GCEBlockDeviceAPI(PClass):
                 response = self._operations.list_disks(
                     page_size=self._page_size,
                     page_token=page_token,
+                    filter_expression=self._disk_list_filter(),
                 )
 
                 disks.extend(
@@ -578,26 +704,29 @@ class GCEBlockDeviceAPI(PClass):
         fqdn = get_metadata_path("instance/hostname")
         return unicode(fqdn.split(".")[0])
 
-    def create_volume_with_profile(self, dataset_id, size, profile_name):
-        blockdevice_id = _dataset_id_to_blockdevice_id(dataset_id)
-        size = Byte(size)
+    def _create_disk_arguments(self, dataset_id, size, profile_name):
+        """
+        Compute the arguments to ``IGCEOperations.create_disk`` for a new
+        volume.
+
+        :returns dict: The keyword arguments.
+        """
         profile_type = MandatoryProfiles.lookupByValue(profile_name).name
-        gce_disk_type = GCEStorageProfiles.lookupByName(profile_type).value
-        try:
-            self._operations.create_disk(
-                name=blockdevice_id,
-                size=size,
-                description=self._disk_resource_description(),
-                gce_disk_type=gce_disk_type
-            )
-        except HttpError as e:
-            if e.resp.status == 409:
-                msg = ("A dataset named {} already exists in this GCE "
-                       "project.".format(dataset_id))
-                raise GCEVolumeException(msg)
-            else:
-                raise
+        return dict(
+            name=_dataset_id_to_blockdevice_id(dataset_id),
+            size=Byte(size),
+            description=self._disk_resource_description(),
+            gce_disk_type=GCEStorageProfiles.lookupByName(profile_type).value,
+        )
+
+    def _created_volume(self, blockdevice_id):
+        """
+        Describe a newly created volume.
+
+        :param unicode blockdevice_id: The volume that was created.
 
+        :returns BlockDeviceVolume: The volume.
+        """
         disk = self._operations.get_disk_details(blockdevice_id)
         return BlockDeviceVolume(
             blockdevice_id=blockdevice_id,
@@ -606,6 +735,16 @@ class GCEBlockDeviceAPI(PClass):
             dataset_id=_blockdevice_id_to_dataset_id(blockdevice_id),
         )
 
+    def create_volume_with_profile(self, dataset_id, size, profile_name):
+        arguments = self._create_disk_arguments(
+            dataset_id, size, profile_name)
+        try:
+            self._operations.create_disk(**arguments)
+        except HttpError as e:
+            _translate_create_error(dataset_id, e)
+            raise
+        return self._created_volume(arguments["name"])
+
     def create_volume(self, dataset_id, size):
         return self.create_volume_with_profile(
             dataset_id, size, MandatoryProfiles.DEFAULT.value)
@@ -623,26 +762,9 @@ class GCEBlockDeviceAPI(PClass):
                 )
 
             except HttpError as e:
-                if e.resp.status == 400:
-                    write_traceback()
-                    raise UnknownVolume(blockdevice_id)
-                else:
-                    raise
-            errors = result.get('error', {}).get('errors', [])
-            for e in errors:
-                if e.get('code') == u"RESOURCE_IN_USE_BY_ANOTHER_RESOURCE":
-                    write_traceback()
-                    raise AlreadyAttachedVolume(blockdevice_id)
-                elif e.get('code') == u'RESOURCE_NOT_FOUND':
-                    write_traceback()
-                    raise UnknownVolume(blockdevice_id)
-            disk = self._operations.get_disk_details(blockdevice_id)
-            result = BlockDeviceVolume(
-                blockdevice_id=blockdevice_id,
-                size=int(GiB(int(disk['sizeGb'])).to_Byte()),
-                attached_to=attach_to,
-                dataset_id=_blockdevice_id_to_dataset_id(blockdevice_id),
-            )
+                _translate_attach_error(blockdevice_id, e)
+                raise
+            result = self._attached_volume(blockdevice_id, attach_to, result)
             action.add_success_fields(
                 final_volume={
                     'blockdevice_id': result.blockdevice_id,
@@ -653,6 +775,36 @@ class GCEBlockDeviceAPI(PClass):
             )
             return result
 
+    def _attached_volume(self, blockdevice_id, attach_to, operation):
+        """
+        Check the outcome of an attach operation and describe the attached
+        volume.
+
+        :param unicode blockdevice_id: The volume that was attached.
+        :param unicode attach_to: The instance it was attached to.
+        :param dict operation: The concluded GCE attach operation resource.
+
+        :raises AlreadyAttachedVolume: If the volume was attached elsewhere.
+        :raises UnknownVolume: If the volume does not exist.
+
+        :returns BlockDeviceVolume: The attached volume.
+        """
+        errors = operation.get('error', {}).get('errors', [])
+        for e in errors:
+            if e.get('code') == u"RESOURCE_IN_USE_BY_ANOTHER_RESOURCE":
+                write_traceback()
+                raise AlreadyAttachedVolume(blockdevice_id)
+            elif e.get('code') == u'RESOURCE_NOT_FOUND':
+                write_traceback()
+                raise UnknownVolume(blockdevice_id)
+        disk = self._operations.get_disk_details(blockdevice_id)
+        return BlockDeviceVolume(
+            blockdevice_id=blockdevice_id,
+            size=int(GiB(int(disk['sizeGb'])).to_Byte()),
+            attached_to=attach_to,
+            dataset_id=_blockdevice_id_to_dataset_id(blockdevice_id),
+        )
+
     def _get_attached_to(self, blockdevice_id):
         """
         Determines the instance a blockdevice is attached to.
@@ -694,53 +846,62 @@ class GCEBlockDeviceAPI(PClass):
                 instance_name=attached_to,
                 disk_name=blockdevice_id
             )
+            self._check_detached(blockdevice_id, result)
+            return None
 
-            # If there is an outstanding detach operation, attach_to will be
-            # reported, but an attempt to detach will quickly fail with an
-            # `INVALID_FIELD_VALUE`.
-            #
-            # Attempt to detect this scenario, and poll until the volume is
-            # detached.
-            if 'error' in result:
-                potentially_detaching_error = None
-                for error in result['error']['errors']:
-                    if (
-                        error.get('code') == 'INVALID_FIELD_VALUE' or
-                        error.get('code') == 'INVALID_USAGE'
-                    ):
-                        potentially_detaching_error = error
-
-                if potentially_detaching_error is not None:
-                    try:
-                        # We want to poll until _get_attached_to no longer
-                        # returns a compute_instance_id, and instead raises an
-                        # UnattachedVolume exception.
-                        poll_until(
-                            lambda: not bool(
-                                self._get_attached_to(blockdevice_id)
-                            ),
-                            [1] * VOLUME_DETATCH_TIMEOUT
-                        )
-                        raise GCEVolumeException(
-                            "Volume appeared to be detaching, but never "
-                            "detached {}: {}".format(
-                                blockdevice_id,
-                                str(potentially_detaching_error)
-                            )
-                        )
-                    except UnattachedVolume:
-                        # If we eventually get an `UnattachedVolume` exception
-                        # then the volume has been successfully detached.
-                        pass
-                else:
+    def _check_detached(self, blockdevice_id, operation):
+        """
+        Check the outcome of a detach operation.
+
+        :param unicode blockdevice_id: The volume that was detached.
+        :param dict operation: The concluded GCE detach operation resource.
+
+        :raises GCEVolumeException: If the volume could not be detached.
+        """
+        # If there is an outstanding detach operation, attach_to will be
+        # reported, but an attempt to detach will quickly fail with an
+        # `INVALID_FIELD_VALUE`.
+        #
+        # Attempt to detect this scenario, and poll until the volume is
+        # detached.
+        if 'error' in operation:
+            potentially_detaching_error = None
+            for error in operation['error']['errors']:
+                if (
+                    error.get('code') == 'INVALID_FIELD_VALUE' or
+                    error.get('code') == 'INVALID_USAGE'
+                ):
+                    potentially_detaching_error = error
+
+            if potentially_detaching_error is not None:
+                try:
+                    # We want to poll until _get_attached_to no longer
+                    # returns a compute_instance_id, and instead raises an
+                    # UnattachedVolume exception.
+                    poll_until(
+                        lambda: not bool(
+                            self._get_attached_to(blockdevice_id)
+                        ),
+                        [1] * VOLUME_DETATCH_TIMEOUT
+                    )
                     raise GCEVolumeException(
-                        "Error detaching volume {}: {}".format(
+                        "Volume appeared to be detaching, but never "
+                        "detached {}: {}".format(
                             blockdevice_id,
-                            str(result['error'])
+                            str(potentially_detaching_error)
                         )
                     )
-
-            return None
+                except UnattachedVolume:
+                    # If we eventually get an `UnattachedVolume` exception
+                    # then the volume has been successfully detached.
+                    pass
+            else:
+                raise GCEVolumeException(
+                    "Error detaching volume {}: {}".format(
+                        blockdevice_id,
+                        str(operation['error'])
+                    )
+                )
 
     def get_device_path(self, blockdevice_id):
         self._get_attached_to(blockdevice_id)
@@ -750,16 +911,8 @@ class GCEBlockDeviceAPI(PClass):
         try:
             self._operations.destroy_disk(blockdevice_id)
         except HttpError as e:
-            if e.resp.status == 404:
-                raise UnknownVolume(blockdevice_id)
-            elif e.resp.status == 400:
-                raise GCEVolumeException(
-                    "Cannot destroy volume {}: {}".format(
-                        blockdevice_id, str(e)
-                    )
-                )
-            else:
-                raise
+            _translate_destroy_error(blockdevice_id, e)
+            raise
         return None
 
     def list_live_nodes(self):
@@ -789,6 +942,169 @@ class GCEBlockDeviceAPI(PClass):
         """
         self._operations.stop_node(node_id)
 
+    def async_block_device_api(self):
+        """
+        Return a ``GCEBlockDeviceAsyncAPI`` if ``_operations`` can wait for
+        operations asynchronously, otherwise a thread-pool based adapter.
+        """
+        if (IGCEAsyncOperations.providedBy(self._operations) and
+                self._operations._reactor is not None):
+            return GCEBlockDeviceAsyncAPI(_sync=self)
+        return _SyncToThreadedAsyncAPIAdapter.from_api(self)
+
+
+def _translate_create_error(dataset_id, error):
+    """
+    Translate an error from the GCE API when creating a disk.  Errors which
+    are not translated are left for the caller to re-raise.
+
+    :param UUID dataset_id: The dataset the disk was created for.
+    :param HttpError error: The error.
+    """
+    if error.resp.status == 409:
+        msg = ("A dataset named {} already exists in this GCE "
+               "project.".format(dataset_id))
+        raise GCEVolumeException(msg)
+
+
+def _translate_attach_error(blockdevice_id, error):
+    """
+    Translate an error from the GCE API when attaching a disk.  Errors which
+    are not translated are left for the caller to re-raise.
+
+    :param unicode blockdevice_id: The volume being attached.
+    :param HttpError error: The error.
+    """
+    if error.resp.status == 400:
+        write_traceback()
+        raise UnknownVolume(blockdevice_id)
+
+
+def _translate_destroy_error(blockdevice_id, error):
+    """
+    Translate an error from the GCE API when destroying a disk.  Errors which
+    are not translated are left for the caller to re-raise.
+
+    :param unicode blockdevice_id: The volume being destroyed.
+    :param HttpError error: The error.
+    """
+    if error.resp.status == 404:
+        raise UnknownVolume(blockdevice_id)
+    elif error.resp.status == 400:
+        raise GCEVolumeException(
+            "Cannot destroy volume {}: {}".format(
+                blockdevice_id, str(error)
+            )
+        )
+
+
+def _trap_http_error(translate, *args):
+    """
+    Create an errback which translates ``HttpError`` failures with one of
+    the ``_translate_*_error`` functions.
+
+    :param translate: The function to call with ``args`` and the error.
+    """
+    def errback(reason):
+        reason.trap(HttpError)
+        translate(*(args + (reason.value,)))
+        return reason
+    return errback
+
+
+@implementer(IBlockDeviceAsyncAPI)
+class GCEBlockDeviceAsyncAPI(PClass):
+    """
+    An ``IBlockDeviceAsyncAPI`` for GCE which waits for GCE operations using
+    ``wait_for_operation_async`` and a shared operation poller, rather than
+    a thread per operation.
+
+    Requests which return promptly are made in the reactor thread pool.
+    Queries which do not involve GCE operations are delegated to a
+    thread-pool based adapter around ``_sync``.
+
+    :ivar GCEBlockDeviceAPI _sync: The synchronous API whose ``_operations``
+        provide ``IGCEAsyncOperations``.
+    """
+    _sync = field(type=GCEBlockDeviceAPI, mandatory=True)
+
+    @property
+    def _threaded(self):
+        return _SyncToThreadedAsyncAPIAdapter.from_api(
+            self._sync, reactor=self._sync._operations._reactor,
+        )
+
+    def _in_thread(self, function, *args, **kwargs):
+        reactor = self._sync._operations._reactor
+        return deferToThreadPool(
+            reactor, reactor.getThreadPool(), function, *args, **kwargs
+        )
+
+    def allocation_unit(self):
+        return self._threaded.allocation_unit()
+
+    def compute_instance_id(self):
+        return self._threaded.compute_instance_id()
+
+    def list_volumes(self):
+        return self._threaded.list_volumes()
+
+    def get_device_path(self, blockdevice_id):
+        return self._threaded.get_device_path(blockdevice_id)
+
+    def create_volume(self, dataset_id, size):
+        arguments = self._sync._create_disk_arguments(
+            dataset_id, size, MandatoryProfiles.DEFAULT.value)
+        creating = self._sync._operations.create_disk_async(**arguments)
+        creating.addErrback(
+            _trap_http_error(_translate_create_error, dataset_id))
+        creating.addCallback(
+            lambda _: self._in_thread(
+                self._sync._created_volume, arguments["name"])
+        )
+        return creating
+
+    def attach_volume(self, blockdevice_id, attach_to):
+        attaching = self._sync._operations.attach_disk_async(
+            disk_name=blockdevice_id,
+            instance_name=attach_to,
+        )
+        attaching.addErrback(
+            _trap_http_error(_translate_attach_error, blockdevice_id))
+        attaching.addCallback(
+            lambda operation: self._in_thread(
+                self._sync._attached_volume, blockdevice_id, attach_to,
+                operation,
+            )
+        )
+        return attaching
+
+    def detach_volume(self, blockdevice_id):
+        detaching = self._in_thread(
+            self._sync._get_attached_to, blockdevice_id)
+        detaching.addCallback(
+            lambda attached_to: self._sync._operations.detach_disk_async(
+                instance_name=attached_to,
+                disk_name=blockdevice_id,
+            )
+        )
+
+        def detached(operation):
+            # Only an operation which failed because of a detach that was
+            # already in progress needs further (thread-based) polling.
+            if 'error' in operation:
+                return self._in_thread(
+                    self._sync._check_detached, blockdevice_id, operation)
+        detaching.addCallback(detached)
+        return detaching
+
+    def destroy_volume(self, blockdevice_id):
+        destroying = self._sync._operations.destroy_disk_async(blockdevice_id)
+        destroying.addErrback(
+            _trap_http_error(_translate_destroy_error, blockdevice_id))
+        destroying.addCallback(lambda _: None)
+        return destroying
+
 
 class IGCEOperations(Interface):
     """
@@ -843,12 +1159,14 @@ class IGCEOperations(Interface):
             operation.
         """
 
-    def list_disks(page_token=None, page_size=None):
+    def list_disks(page_token=None, page_size=None, filter_expression=None):
         """
         List GCE disks.
 
         :param page_token: The page token for the page of disks to retrieve.
         :param page_size: The number of results to return per page.
+        :param unicode filter_expression: A GCE filter expression restricting
+            the disks which are returned, or ``None`` to list all disks.
 
         :returns: A GCE API list of disk resources. See:
             https://google-api-client-libraries.appspot.com/documentation/compute/v1/python/latest/compute_v1.disks.html#list # noqa
@@ -897,7 +1215,38 @@ class IGCEOperations(Interface):
         """
 
 
-@implementer(IGCEOperations)
+class IGCEAsyncOperations(Interface):
+    """
+    Interface describing the GCE operations which the driver can wait for
+    without blocking a thread.
+
+    Each method takes the same arguments as the corresponding method of
+    ``IGCEOperations`` and returns a ``Deferred`` that fires with the
+    concluded GCE operation resource dict.
+    """
+
+    def create_disk_async(name, size, description, gce_disk_type):
+        """
+        See ``IGCEOperations.create_disk``.
+        """
+
+    def attach_disk_async(disk_name, instance_name):
+        """
+        See ``IGCEOperations.attach_disk``.
+        """
+
+    def detach_disk_async(instance_name, disk_name):
+        """
+        See ``IGCEOperations.detach_disk``.
+        """
+
+    def destroy_disk_async(disk_name):
+        """
+        See ``IGCEOperations.destroy_disk``.
+        """
+
+
+@implementer(IGCEOperations, IGCEAsyncOperations)
 class GCEOperations(PClass):
     """
     Class that encompasses all operations that can be done against GCE.
@@ -908,15 +1257,42 @@ class GCEOperations(PClass):
     :class:`IBlockDeviceAPI` tests. Also it restricts the use of the GCE
     compute object to this class.
 
+    The ``IGCEAsyncOperations`` methods can only be used if ``_reactor`` and
+    ``_operation_poller`` are supplied.
+
     :ivar _compute: The GCE compute object to use to interact with the GCE API.
     :ivar unicode _project: The project where this block device driver will
         operate.
     :ivar unicode _zone: The zone where this block device driver will operate.
+    :ivar _reactor: The reactor used to wait for operations asynchronously.
+    :ivar SharedOperationPoller _operation_poller: The poller used to wait
+        for operations asynchronously.
     """
     _compute = field(mandatory=True)
     _project = field(type=unicode, mandatory=True)
     _zone = field(type=unicode, mandatory=True)
     _lock = field(mandatory=True, initial=Lock())
+    _reactor = field(mandatory=True, initial=None)
+    _operation_poller = field(mandatory=True, initial=None)
+
+    def _start_operation(self, function, **kwargs):
+        """
+        Start a GCE operation.
+
+        This will call `function` with the passed in keyword arguments plus
+        additional keyword arguments for project and zone which come from the
+        private member variables with the same name. It is expected that
+        `function` returns an object that has an `execute()` method that
+        returns a GCE operation resource dict.
+
+        The caller must hold ``_lock``.
+
+        :returns dict: A dict representing the pending GCE operation
+            resource.
+        """
+        args = dict(project=self._project, zone=self._zone)
+        args.update(kwargs)
+        return function(**args).execute()
 
     def _do_blocking_operation(self,
                                function,
@@ -926,11 +1302,7 @@ class GCEOperations(PClass):
         """
         Perform a GCE operation, blocking until the operation completes.
 
-        This will call `function` with the passed in keyword arguments plus
-        additional keyword arguments for project and zone which come from the
-        private member variables with the same name. It is expected that
-        `function` returns an object that has an `execute()` method that
-        returns a GCE operation resource dict.
+        The operation is started with ``_start_operation``.
 
         This function will then poll the operation until it reaches
         state 'DONE' or times out, and then returns the final
@@ -969,14 +1341,79 @@ class GCEOperations(PClass):
             finally:
                 self._lock.acquire()
 
-        args = dict(project=self._project, zone=self._zone)
-        args.update(kwargs)
         with self._lock:
-            operation = function(**args).execute()
+            operation = self._start_operation(function, **kwargs)
             return wait_for_operation(
                 self._compute, operation, [1]*timeout_sec, lock_dropped_sleep)
 
-    def create_disk(self, name, size, description, gce_disk_type):
+    def _do_async_operation(self,
+                            function,
+                            timeout_sec=VOLUME_DEFAULT_TIMEOUT,
+                            **kwargs):
+        """
+        Perform a GCE operation without blocking a thread while waiting for
+        it to complete.
+
+        The request starting the operation is made in the reactor thread
+        pool.  The operation is then polled by ``_operation_poller`` together
+        with every other pending operation, once per tick.
+
+        :param function: See ``_do_blocking_operation``.
+        :param int timeout_sec: The maximum amount of time to wait in seconds
+            for the operation to complete.
+        :param kwargs: Additional keyword arguments to pass to function.
+
+        :returns Deferred: Fires with a dict representing the concluded GCE
+            operation resource.
+        """
+        def start():
+            with self._lock:
+                return self._start_operation(function, **kwargs)
+
+        starting = deferToThreadPool(
+            self._reactor, self._reactor.getThreadPool(), start
+        )
+        # The shared poller already spaces its polls one tick apart, so no
+        # extra delay is needed between steps.
+        ticks = timeout_sec // OPERATION_POLL_INTERVAL
+        return starting.addCallback(
+            lambda operation: wait_for_operation_async(
+                self._reactor, self._compute, operation, [0] * ticks,
+                poll=self._operation_poller.poll,
+            )
+        )
+
+    def get_operations(self, operation_pollers):
+        """
+        Get the latest versions of many operations using batched requests.
+
+        :param operation_pollers: A ``list`` of ``OperationPoller``\ s.
+
+        :returns: A ``list`` of the same length as ``operation_pollers``.
+            Each element is a dict representing the latest version of the
+            corresponding operation or the ``Exception`` raised when
+            retrieving it.
+        """
+        results = {}
+
+        def record(request_id, response, exception):
+            if exception is not None:
+                response = exception
+            results[int(request_id)] = response
+
+        with self._lock:
+            for start in range(0, len(operation_pollers), _MAX_BATCH_SIZE):
+                batch = self._compute.new_batch_http_request(callback=record)
+                chunk = operation_pollers[start:start + _MAX_BATCH_SIZE]
+                for index, poller in enumerate(chunk, start):
+                    batch.add(
+                        poller.request(self._compute),
+                        request_id=unicode(index),
+                    )
+                batch.execute()
+        return list(results[index] for index in range(len(operation_pollers)))
+
+    def _create_disk_operation(self, name, size, description, gce_disk_type):
         sizeGiB = int(size.to_GiB())
         config = dict(
             name=name,
@@ -985,13 +1422,13 @@ class GCEOperations(PClass):
             type="projects/{project}/zones/{zone}/diskTypes/{type}".format(
                 project=self._project, zone=self._zone, type=gce_disk_type)
         )
-        return self._do_blocking_operation(
-            self._compute.disks().insert,
+        return dict(
+            function=self._compute.disks().insert,
             body=config,
             timeout_sec=VOLUME_INSERT_TIMEOUT,
         )
 
-    def attach_disk(self, disk_name, instance_name):
+    def _attach_disk_operation(self, disk_name, instance_name):
         config = dict(
             deviceName=disk_name,
             autoDelete=False,
@@ -1001,32 +1438,69 @@ class GCEOperations(PClass):
                 "disks/%s" % (self._project, self._zone, disk_name)
             )
         )
-        return self._do_blocking_operation(
-            self._compute.instances().attachDisk,
+        return dict(
+            function=self._compute.instances().attachDisk,
             instance=instance_name,
             body=config,
             timeout_sec=VOLUME_ATTACH_TIMEOUT,
         )
 
-    def detach_disk(self, instance_name, disk_name):
-        return self._do_blocking_operation(
-            self._compute.instances().detachDisk, instance=instance_name,
-            deviceName=disk_name, timeout_sec=VOLUME_DETATCH_TIMEOUT
+    def _detach_disk_operation(self, instance_name, disk_name):
+        return dict(
+            function=self._compute.instances().detachDisk,
+            instance=instance_name,
+            deviceName=disk_name,
+            timeout_sec=VOLUME_DETATCH_TIMEOUT,
         )
 
-    def destroy_disk(self, disk_name):
-        return self._do_blocking_operation(
-            self._compute.disks().delete,
+    def _destroy_disk_operation(self, disk_name):
+        return dict(
+            function=self._compute.disks().delete,
             disk=disk_name,
             timeout_sec=VOLUME_DELETE_TIMEOUT,
         )
 
-    def list_disks(self, page_token=None, page_size=None):
+    def create_disk(self, name, size, description, gce_disk_type):
+        return self._do_blocking_operation(**self._create_disk_operation(
+            name, size, description, gce_disk_type))
+
+    def attach_disk(self, disk_name, instance_name):
+        return self._do_blocking_operation(**self._attach_disk_operation(
+            disk_name, instance_name))
+
+    def detach_disk(self, instance_name, disk_name):
+        return self._do_blocking_operation(**self._detach_disk_operation(
+            instance_name, disk_name))
+
+    def destroy_disk(self, disk_name):
+        return self._do_blocking_operation(**self._destroy_disk_operation(
+            disk_name))
+
+    def create_disk_async(self, name, size, description, gce_disk_type):
+        return self._do_async_operation(**self._create_disk_operation(
+            name, size, description, gce_disk_type))
+
+    def attach_disk_async(self, disk_name, instance_name):
+        return self._do_async_operation(**self._attach_disk_operation(
+            disk_name, instance_name))
+
+    def detach_disk_async(self, instance_name, disk_name):
+        return self._do_async_operation(**self._detach_disk_operation(
+            instance_name, disk_name))
+
+    def destroy_disk_async(self, disk_name):
+        return self._do_async_operation(**self._destroy_disk_operation(
+            disk_name))
+
+    def list_disks(self, page_token=None, page_size=None,
+                   filter_expression=None):
         with self._lock:
             return self._compute.disks().list(project=self._project,
                                               zone=self._zone,
                                               maxResults=page_size,
-                                              pageToken=page_token).execute()
+                                              pageToken=page_token,
+                                              filter=filter_expression,
+                                              ).execute()
 
     def get_disk_details(self, disk_name):
         with self._lock:
@@ -1059,7 +1533,7 @@ class GCEOperations(PClass):
 
 
 def gce_from_configuration(cluster_id, project=None, zone=None,
-                           credentials=None):
+                           credentials=None, reactor=None):
     """
     Build a ``GCEBlockDeviceAPI`` instance using data from configuration
 
@@ -1072,6 +1546,9 @@ def gce_from_configuration(cluster_id, project=None, zone=None,
         account that has permissions to carry out GCE volume actions
         (create, delete, detatch, etc.). If this is omitted the user
         must enable the default service account on all cluster nodes.
+    :param reactor: The reactor used to wait for GCE operations without
+        blocking threads.  If ``None``, operations are only performed
+        synchronously.
 
     :return: A ``GCEBlockDeviceAPI`` instance.
     """
@@ -1085,11 +1562,23 @@ def gce_from_configuration(cluster_id, project=None, zone=None,
         'compute', 'v1', credentials=gce_credentials
     )
 
+    operations = GCEOperations(
+        _compute=compute,
+        _project=unicode(project),
+        _zone=unicode(zone)
+    )
+    if reactor is not None:
+        operations = operations.set(
+            _reactor=reactor,
+            _operation_poller=SharedOperationPoller(
+                reactor=reactor,
+                fetch=lambda pollers: deferToThreadPool(
+                    reactor, reactor.getThreadPool(),
+                    operations.get_operations, pollers,
+                ),
+            ),
+        )
     return GCEBlockDeviceAPI(
-        _operations=GCEOperations(
-            _compute=compute,
-            _project=unicode(project),
-            _zone=unicode(zone)
-        ),
+        _operations=operations,
         _cluster_id=unicode(cluster_id),
     )
@@ -61,7 +61,8 @@ from ..blockdevice import (
     CreateFilesystem, DestroyVolume, MountBlockDevice,
     RegisterVolume,
 
-    DATASET_TRANSITIONS, IDatasetStateChangeFactory,
+    DATASET_TRANSITIONS, IDatasetStateChangeFactory, DoNothing,
+    _CompiledTransitions,
     ICalculator, NOTHING_TO_DO,
 
     DiscoveredDataset, DesiredDataset, DatasetStates,
@@ -77,7 +78,9 @@ from ..blockdevice import (
     UNREGISTERED_VOLUME_ATTACHED,
 
     IBlockDeviceAsyncAPI,
+    IDevicePathCache,
     _SyncToThreadedAsyncAPIAdapter,
+    _NativeAsyncAPIAdapter,
     allocated_size,
     ProcessLifetimeCache,
     FilesystemExists,
@@ -1539,6 +1542,156 @@ class TransitionTests(TestCase):
         )
 
 
+class BlockDeviceCalculatorCacheTests(TestCase):
+    """
+    Tests for the caching of changes by ``BlockDeviceCalculator``.
+    """
+    def setUp(self):
+        super(BlockDeviceCalculatorCacheTests, self).setUp()
+        self.calculator = BlockDeviceCalculator()
+        self.dataset_ids = [uuid4(), uuid4()]
+        self.discovered = {
+            dataset_id: DiscoveredDataset(
+                state=DatasetStates.NON_MANIFEST,
+                dataset_id=dataset_id,
+                maximum_size=LOOPBACK_MINIMUM_ALLOCATABLE_SIZE,
+                blockdevice_id=_create_blockdevice_id_for_test(dataset_id),
+            )
+            for dataset_id in self.dataset_ids
+        }
+        self.desired = {
+            dataset_id: DesiredDataset(
+                state=DatasetStates.MOUNTED,
+                dataset_id=dataset_id,
+                maximum_size=LOOPBACK_MINIMUM_ALLOCATABLE_SIZE,
+                mount_point=FilePath(b"/flocker").child(bytes(dataset_id)),
+            )
+            for dataset_id in self.dataset_ids
+        }
+
+    def calculate(self):
+        return self.calculator.calculate_changes_for_datasets(
+            discovered_datasets=self.discovered,
+            desired_datasets=self.desired,
+        )
+
+    def test_unchanged(self):
+        """
+        When the inputs equal those of the previous calculation no change is
+        recalculated and the same changes are returned.
+        """
+        first = self.calculate()
+        # Equal but not identical inputs.
+        self.discovered = {
+            dataset_id: dataset.set(state=DatasetStates.NON_MANIFEST)
+            for dataset_id, dataset in self.discovered.items()
+        }
+        second = self.calculate()
+        self.assertEqual(
+            (first, frozenset()),
+            (second, self.calculator._cache.recalculated),
+        )
+
+    def test_changed(self):
+        """
+        Only the change for a dataset whose discovered or desired dataset
+        differs from the previous calculation is recalculated.
+        """
+        self.calculate()
+        changed_id = self.dataset_ids[0]
+        self.desired[changed_id] = DesiredDataset(
+            state=DatasetStates.NON_MANIFEST,
+            dataset_id=changed_id,
+            maximum_size=LOOPBACK_MINIMUM_ALLOCATABLE_SIZE,
+        )
+        changes = self.calculate()
+        self.assertEqual(
+            (frozenset([changed_id]), changes),
+            (self.calculator._cache.recalculated,
+             BlockDeviceCalculator().calculate_changes_for_datasets(
+                 discovered_datasets=self.discovered,
+                 desired_datasets=self.desired,
+             )),
+        )
+
+    def test_evolved_cache(self):
+        """
+        A calculator evolved from another does not share its cache.
+        """
+        evolved = self.calculator.set(transitions=DATASET_TRANSITIONS)
+        self.assertIsNot(self.calculator._cache, evolved._cache)
+
+    def test_deployer_cache(self):
+        """
+        Each ``BlockDeviceDeployer`` has a calculator with a cache of its own.
+        """
+        deployers = [
+            BlockDeviceDeployer(
+                hostname=u"192.0.2.1",
+                node_uuid=uuid4(),
+                block_device_api=UnusableAPI(),
+            )
+            for i in range(2)
+        ]
+        self.assertIsNot(
+            deployers[0].calculator._cache, deployers[1].calculator._cache,
+        )
+
+    def test_transitions_changed(self):
+        """
+        When a calculator's transitions change, changes calculated with the
+        previous transitions are not reused, even for datasets whose inputs
+        are unchanged.
+        """
+        self.calculate()
+        mounted = DATASET_TRANSITIONS[DatasetStates.MOUNTED]
+        # Keep the cache so that only the transitions differ.
+        self.calculator = self.calculator.set(
+            transitions=DATASET_TRANSITIONS.set(
+                DatasetStates.MOUNTED,
+                mounted.set(DatasetStates.NON_MANIFEST, DoNothing),
+            ),
+            _cache=self.calculator._cache,
+        )
+        self.assertEqual(
+            (in_parallel(changes=[NOTHING_TO_DO] * len(self.dataset_ids)),
+             frozenset(self.dataset_ids)),
+            (self.calculate(), self.calculator._cache.recalculated),
+        )
+
+
+class CompiledTransitionsTests(TestCase):
+    """
+    Tests for ``_CompiledTransitions``.
+    """
+    def test_lookup(self):
+        """
+        ``_CompiledTransitions.lookup`` returns the factory the
+        ``TransitionTable`` has for the given states.
+        """
+        compiled = _CompiledTransitions(DATASET_TRANSITIONS)
+        self.assertEqual(
+            DATASET_TRANSITIONS,
+            {desired_state: {
+                discovered_state: compiled.lookup(
+                    desired_state, discovered_state
+                )
+                for discovered_state in row
+            } for desired_state, row in DATASET_TRANSITIONS.items()},
+        )
+
+    def test_missing(self):
+        """
+        ``_CompiledTransitions.lookup`` raises ``KeyError`` for states the
+        ``TransitionTable`` has no transition for.
+        """
+        compiled = _CompiledTransitions(DATASET_TRANSITIONS)
+        self.assertRaises(
+            KeyError,
+            compiled.lookup, DatasetStates.MOUNTED, DatasetStates.DELETED,
+        )
+
+
 def assert_desired_datasets(
     case,
     deployer,
@@ -4902,6 +5055,140 @@ class ProcessLifetimeCacheTests(TestCase):
         self.assertRaises(UnattachedVolume,
                           self.cache.get_device_path, attached_id1)
 
+    def test_forget_device_path(self):
+        """
+        After ``forget_device_path`` the result of ``get_device_path`` is
+        retrieved from the wrapped API again.
+        """
+        attached_id1, _ = self.attached_volumes()
+        self.cache.get_device_path(attached_id1)
+        self.cache.forget_device_path(attached_id1)
+        self.cache.get_device_path(attached_id1)
+        self.assertEqual(
+            2, self.counting_proxy.num_calls("get_device_path", attached_id1)
+        )
+
+    def test_interface(self):
+        """
+        ``ProcessLifetimeCache`` provides ``IDevicePathCache``.
+        """
+        self.assertTrue(verifyObject(IDevicePathCache, self.cache))
+
+
+def _non_threaded_async_api(api):
+    """
+    Adapt ``api`` to ``IBlockDeviceAsyncAPI`` without using any threads.
+
+    :param IBlockDeviceAPI api: The API to adapt.
+    """
+    return _SyncToThreadedAsyncAPIAdapter(
+        _sync=api, _reactor=NonReactor(), _threadpool=NonThreadPool(),
+    )
+
+
+class NativeAsyncAPIAdapterTests(TestCase):
+    """
+    Tests for ``_NativeAsyncAPIAdapter``.
+    """
+    def setUp(self):
+        super(NativeAsyncAPIAdapterTests, self).setUp()
+        self.api = loopbackblockdeviceapi_for_test(self)
+        self.counting_proxy = CountingProxy(self.api)
+        self.cache = ProcessLifetimeCache(self.counting_proxy)
+        # The native API operates on the backend directly, bypassing the
+        # cache, just as the native API of a real backend does.
+        self.native = _non_threaded_async_api(self.api)
+
+    def adapter(self, sync):
+        """
+        :param IBlockDeviceAPI sync: The API used by the deployer.
+
+        :return: A ``_NativeAsyncAPIAdapter`` combining ``self.native`` with
+            a non-threaded adapter around ``sync``.
+        """
+        return _NativeAsyncAPIAdapter(
+            _native=self.native,
+            _threaded=_non_threaded_async_api(sync),
+            _sync=sync,
+        )
+
+    def attached_volume(self, adapter):
+        """
+        Create a volume and attach it to this node using ``adapter``.
+
+        :return: The ``blockdevice_id`` of the volume.
+        """
+        volume = self.successResultOf(adapter.create_volume(
+            dataset_id=uuid4(), size=LOOPBACK_MINIMUM_ALLOCATABLE_SIZE,
+        ))
+        return self.successResultOf(adapter.attach_volume(
+            volume.blockdevice_id,
+            attach_to=self.successResultOf(adapter.compute_instance_id()),
+        )).blockdevice_id
+
+    def test_interface(self):
+        """
+        ``_NativeAsyncAPIAdapter`` provides ``IBlockDeviceAsyncAPI``.
+        """
+        self.assertTrue(
+            verifyObject(IBlockDeviceAsyncAPI, self.adapter(self.cache))
+        )
+
+    def test_queries_cached(self):
+        """
+        Queries are answered through ``_sync`` so that its cached results are
+        used.
+        """
+        adapter = self.adapter(self.cache)
+        blockdevice_id = self.attached_volume(adapter)
+        first = self.successResultOf(adapter.get_device_path(blockdevice_id))
+        second = self.successResultOf(adapter.get_device_path(blockdevice_id))
+        self.assertEqual(
+            (first, 1),
+            (second,
+             self.counting_proxy.num_calls("get_device_path", blockdevice_id)),
+        )
+
+    def test_operations_native(self):
+        """
+        Volumes are created, attached, detached and destroyed by ``_native``
+        rather than through ``_sync``.
+        """
+        adapter = self.adapter(self.cache)
+        blockdevice_id = self.attached_volume(adapter)
+        self.successResultOf(adapter.detach_volume(blockdevice_id))
+        self.successResultOf(adapter.destroy_volume(blockdevice_id))
+        self.assertEqual(
+            ([], {"compute_instance_id"}),
+            (self.api.list_volumes(),
+             set(name for [name, _, _] in self.counting_proxy.call_count)),
+        )
+
+    def test_detach_forgets_device_path(self):
+        """
+        When ``_sync`` provides ``IDevicePathCache``, detaching a volume
+        clears its cached device path even though ``_sync`` is not used to
+        detach it.
+        """
+        adapter = self.adapter(self.cache)
+        blockdevice_id = self.attached_volume(adapter)
+        self.successResultOf(adapter.get_device_path(blockdevice_id))
+        self.successResultOf(adapter.detach_volume(blockdevice_id))
+        self.failureResultOf(
+            adapter.get_device_path(blockdevice_id), UnattachedVolume
+        )
+
+    def test_detach_without_cache(self):
+        """
+        When ``_sync`` does not provide ``IDevicePathCache``, volumes are
+        detached by ``_native`` alone.
+        """
+        adapter = self.adapter(self.api)
+        blockdevice_id = self.attached_volume(adapter)
+        self.successResultOf(adapter.detach_volume(blockdevice_id))
+        [volume] = self.api.list_volumes()
+        self.assertEqual(None, volume.attached_to)
+
 
 class FakeCloudAPITests(make_icloudapi_tests(
         lambda test_case: FakeCloudAPI(
@@ -5,6 +5,7 @@ Tests for ``flocker.node.agents.blockdevice_manager``.
 """
 
 import errno
+import select
 from uuid import uuid4
 
 from testtools import ExpectedException
@@ -12,6 +13,8 @@ from testtools.matchers import Not, FileExists
 
 from zope.interface.verify import verifyObject
 
+from twisted.python.filepath import FilePath
+
 from ....testtools import TestCase, random_name, if_root
 
 from ..loopback import LOOPBACK_MINIMUM_ALLOCATABLE_SIZE
@@ -29,6 +32,9 @@ from ..blockdevice_manager import (
     temporary_mount,
     mount,
     UnmountError,
+    _FilesystemProbe,
+    _MountTable,
+    _parse_mountinfo,
 )
 from ..testtools import (
     filesystem_label_for_test,
@@ -504,3 +510,165 @@ class TemporaryMountTests(TestCase):
             )
         self.assertFalse(mounts[1].exists())
         self.assertNotEqual(*mounts)
+
+
+MOUNTINFO = (
+    b"17 60 0:16 / /sys rw,nosuid shared:6 - sysfs sysfs rw\n"
+    b"60 0 202:1 / / rw,relatime shared:1 - ext4 /dev/xvda1 rw\n"
+    b"61 60 202:80 / /flocker/a\\040b rw master:2 - xfs /dev/xvdf rw\n"
+    b"62 60 0:40 / /tmp/x rw - tmpfs tmpfs rw\n"
+)
+FILESYSTEMS = b"nodev\tsysfs\nnodev\ttmpfs\n\text4\n\txfs\n"
+
+
+class ParseMountInfoTests(TestCase):
+    """
+    Tests for ``_parse_mountinfo``.
+    """
+    def test_block_devices(self):
+        """
+        Only mounts of block device filesystem types are included, with any
+        optional fields skipped and escaped characters restored.
+        """
+        self.assertEqual(
+            [MountInfo(blockdevice=FilePath(b"/dev/xvda1"),
+                       mountpoint=FilePath(b"/")),
+             MountInfo(blockdevice=FilePath(b"/dev/xvdf"),
+                       mountpoint=FilePath(b"/flocker/a b"))],
+            _parse_mountinfo(MOUNTINFO, {b"ext4", b"xfs"}),
+        )
+
+
+class FakePoll(object):
+    """
+    A fake ``select.poll`` object.
+
+    :ivar list events: The events the next ``poll`` call reports.
+    """
+    def __init__(self):
+        self.events = []
+
+    def register(self, fd, eventmask):
+        self.fd = fd
+
+    def poll(self, timeout):
+        events, self.events = self.events, []
+        return events
+
+
+class MountTableTests(TestCase):
+    """
+    Tests for ``_MountTable``.
+    """
+    def setUp(self):
+        super(MountTableTests, self).setUp()
+        self.mountinfo = FilePath(self.mktemp())
+        self.mountinfo.setContent(MOUNTINFO)
+        filesystems = FilePath(self.mktemp())
+        filesystems.setContent(FILESYSTEMS)
+        self.poller = FakePoll()
+        self.table = _MountTable(
+            mountinfo=self.mountinfo, filesystems=filesystems,
+            poll=lambda: self.poller,
+        )
+        self.addCleanup(lambda: self.table._file and self.table._file.close())
+
+    def rewrite(self, content):
+        """
+        Replace the content of the ``mountinfo`` file in place.
+        """
+        with self.mountinfo.open("w") as mountinfo:
+            mountinfo.write(content)
+
+    def test_not_reread_unchanged(self):
+        """
+        The table is not re-read unless ``poll`` reports a change.
+        """
+        first = self.table.mounts()
+        self.rewrite(b"")
+        self.assertEqual((2, first), (len(first), self.table.mounts()))
+
+    def test_reread_changed(self):
+        """
+        The table is re-read when ``poll`` reports a change.
+        """
+        self.table.mounts()
+        self.rewrite(MOUNTINFO.splitlines(True)[1])
+        self.poller.events = [
+            (self.poller.fd, select.POLLPRI | select.POLLERR)
+        ]
+        self.assertEqual(
+            [MountInfo(blockdevice=FilePath(b"/dev/xvda1"),
+                       mountpoint=FilePath(b"/"))],
+            self.table.mounts(),
+        )
+
+
+class FilesystemProbeTests(TestCase):
+    """
+    Tests for ``_FilesystemProbe``.
+    """
+    def setUp(self):
+        super(FilesystemProbeTests, self).setUp()
+        self.fallback_calls = []
+        self.probe = _FilesystemProbe(fallback=self.fallback)
+        self.device = FilePath(self.mktemp())
+
+    def fallback(self, blockdevice):
+        self.fallback_calls.append(blockdevice)
+        return False
+
+    def test_ext4(self):
+        """
+        A device with the ext2/3/4 superblock magic has a filesystem.
+        """
+        self.device.setContent(b"\0" * 1080 + b"\x53\xef" + b"\0" * 100)
+        self.assertEqual(
+            (True, []),
+            (self.probe.has_filesystem(self.device), self.fallback_calls),
+        )
+
+    def test_xfs(self):
+        """
+        A device with the XFS superblock magic has a filesystem.
+        """
+        self.device.setContent(b"XFSB" + b"\0" * 2000)
+        self.assertEqual(
+            (True, []),
+            (self.probe.has_filesystem(self.device), self.fallback_calls),
+        )
+
+    def test_unknown_cached(self):
+        """
+        The fallback is used once for a device whose superblock is not
+        recognized, and its answer is remembered.
+        """
+        self.device.setContent(b"\0" * 2048)
+        results = [self.probe.has_filesystem(self.device) for _ in range(3)]
+        self.assertEqual(
+            ([False] * 3, [self.device]), (results, self.fallback_calls),
+        )
+
+    def test_filesystem_created(self):
+        """
+        A known filesystem created after the device was probed is noticed
+        without ``invalidate``.
+        """
+        self.device.setContent(b"\0" * 2048)
+        self.probe.has_filesystem(self.device)
+        with self.device.open("w") as device:
+            device.write(b"XFSB" + b"\0" * 2000)
+        self.assertEqual(
+            (True, [self.device]),
+            (self.probe.has_filesystem(self.device), self.fallback_calls),
+        )
+
+    def test_invalidate(self):
+        """
+        After ``invalidate`` the device is probed again.
+        """
+        self.device.setContent(b"\0" * 2048)
+        self.probe.has_filesystem(self.device)
+        self.probe.invalidate(self.device)
+        self.probe.has_filesystem(self.device)
+        self.assertEqual([self.device] * 2, self.fallback_calls)
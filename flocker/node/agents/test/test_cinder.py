@@ -4,8 +4,23 @@
 Tests for ``flocker.node.agents.cinder``.
 """
 
-from ..cinder import _openstack_verify_from_config, _get_compute_id
+import json
+from threading import Thread
+import time
+from uuid import uuid4
+
+from cinderclient.exceptions import NotFound as CinderClientNotFound
+
+from eliot.testing import capture_logging
+
+from twisted.python.filepath import FilePath
+
+from ..cinder import (
+    _openstack_verify_from_config, _get_compute_id, CinderVolumePoller,
+    UnexpectedStateException, wait_for_volume_state, CinderBlockDeviceAPI,
+)
 from ....common import ipaddress_from_string
+from ....common._era import get_era
 from ....testtools import TestCase
 
 
@@ -157,3 +172,332 @@ class GetComputeIdTests(TestCase):
         reported_ips = {u"server2": {ipaddress_from_string("192.0.0.1")},
                         u"server1": set()}
         self.assertEqual(_get_compute_id(local_ips, reported_ips), u"server2")
+
+
+class FakeCinderVolume(object):
+    """
+    The parts of a Cinder ``Volume`` used by ``VolumeStateMonitor``.
+    """
+    def __init__(self, id, status):
+        self.id = id
+        self.status = status
+
+
+class FakeCinderVolumeManager(object):
+    """
+    A fake ``ICinderVolumeManager`` which counts API calls.
+
+    :ivar list statuses: The status reported for every volume by successive
+        API calls.  The last status is repeated once the list is exhausted.
+    """
+    def __init__(self, volume_ids, statuses):
+        self.volume_ids = volume_ids
+        self.statuses = statuses
+        self.list_calls = 0
+        self.get_calls = 0
+
+    def _status(self, calls):
+        return self.statuses[min(calls, len(self.statuses)) - 1]
+
+    def list(self, detailed=True):
+        self.list_calls += 1
+        status = self._status(self.list_calls)
+        return [FakeCinderVolume(volume_id, status)
+                for volume_id in self.volume_ids]
+
+    def get(self, volume_id):
+        self.get_calls += 1
+        if volume_id not in self.volume_ids:
+            raise CinderClientNotFound(404)
+        return FakeCinderVolume(volume_id, self._status(self.get_calls))
+
+
+class CinderVolumePollerTests(TestCase):
+    """
+    Tests for ``CinderVolumePoller``.
+    """
+    def wait(self, volume_manager, poller, volume_id):
+        return wait_for_volume_state(
+            volume_manager=volume_manager,
+            expected_volume=FakeCinderVolume(volume_id, u"creating"),
+            desired_state=u"available",
+            transient_states=(u"creating",),
+            poller=poller,
+        )
+
+    def test_desired_state(self):
+        """
+        ``wait_for_volume_state`` with a poller returns the listed volume once
+        it reaches the desired state, sleeping between listings.
+        """
+        manager = FakeCinderVolumeManager(
+            [u"a"], [u"creating", u"creating", u"available"])
+        sleeps = []
+        poller = CinderVolumePoller(manager, sleep=sleeps.append)
+        volume = self.wait(manager, poller, u"a")
+        self.assertEqual(
+            (volume.id, volume.status, manager.list_calls, manager.get_calls,
+             len(sleeps)),
+            (u"a", u"available", 3, 0, 2),
+        )
+
+    def test_backoff(self):
+        """
+        The interval between polls grows while no watched volume changes
+        status, up to the maximum interval.
+        """
+        manager = FakeCinderVolumeManager(
+            [u"a"], [u"creating"] * 5 + [u"available"])
+        sleeps = []
+        poller = CinderVolumePoller(
+            manager, interval=1.0, max_interval=3.0, backoff=2.0,
+            sleep=sleeps.append,
+        )
+        self.wait(manager, poller, u"a")
+        # The first poll sees a new status, so no backoff happens yet.
+        self.assertEqual(sleeps, [1.0, 2.0, 3.0, 3.0, 3.0])
+
+    def test_unexpected_state(self):
+        """
+        An exception raised while checking a listed volume is raised by
+        ``wait_for_volume_state``.
+        """
+        manager = FakeCinderVolumeManager([u"a"], [u"error"])
+        poller = CinderVolumePoller(manager, sleep=lambda interval: None)
+        self.assertRaises(
+            UnexpectedStateException, self.wait, manager, poller, u"a")
+
+    @capture_logging(None)
+    def test_list_error(self, logger):
+        """
+        If the ``list`` call fails the volume is looked up individually, and
+        an exception raised by that is raised by ``wait_for_volume_state``.
+        """
+        class BrokenManager(object):
+            def list(self, detailed=True):
+                raise ZeroDivisionError()
+
+            def get(self, volume_id):
+                raise ZeroDivisionError()
+        poller = CinderVolumePoller(
+            BrokenManager(), sleep=lambda interval: None)
+        self.assertRaises(
+            ZeroDivisionError, self.wait, BrokenManager(), poller, u"a")
+        logger.flush_tracebacks(ZeroDivisionError)
+
+    @capture_logging(None)
+    def test_list_error_individual(self, logger):
+        """
+        If the ``list`` call fails, waiters whose volumes can be looked up
+        individually are not failed.
+        """
+        manager = FakeCinderVolumeManager([u"a"], [u"available"])
+
+        def list(detailed=True):
+            raise ZeroDivisionError()
+        manager.list = list
+        poller = CinderVolumePoller(manager, sleep=lambda interval: None)
+        volume = self.wait(manager, poller, u"a")
+        logger.flush_tracebacks(ZeroDivisionError)
+        self.assertEqual((u"a", 1), (volume.id, manager.get_calls))
+
+    def test_missing_from_listing(self):
+        """
+        A volume which is not included in the listing is looked up
+        individually.
+        """
+        manager = FakeCinderVolumeManager([u"a"], [u"available"])
+        listing_manager = FakeCinderVolumeManager([], [u"available"])
+        listing_manager.get = manager.get
+        poller = CinderVolumePoller(
+            listing_manager, sleep=lambda interval: None)
+        volume = self.wait(listing_manager, poller, u"a")
+        self.assertEqual(
+            (volume.id, listing_manager.list_calls, manager.get_calls),
+            (u"a", 1, 1),
+        )
+
+    def test_concurrent_waits_share_listing(self):
+        """
+        The number of Cinder API calls made while waiting for many volumes
+        concurrently is the same as for waiting on a single volume.
+        """
+        volume_ids = [unicode(i) for i in range(20)]
+        manager = FakeCinderVolumeManager(
+            volume_ids, [u"creating", u"creating", u"available"])
+        poller = CinderVolumePoller(
+            manager, sleep=lambda interval: time.sleep(0.01))
+        # Hold the first listing until every waiter has registered so that
+        # the result doesn't depend on thread scheduling.
+        original_list = manager.list
+
+        def list(detailed=True):
+            while len(poller._waiters) < len(volume_ids):
+                time.sleep(0.001)
+            return original_list(detailed)
+        manager.list = list
+
+        results = {}
+
+        def wait(volume_id):
+            results[volume_id] = self.wait(manager, poller, volume_id)
+        threads = [Thread(target=wait, args=(volume_id,))
+                   for volume_id in volume_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            (sorted(results), manager.list_calls, manager.get_calls),
+            (sorted(volume_ids), 3, 0),
+        )
+
+
+class FakeTime(object):
+    """
+    A replacement for the ``time`` module which only advances when told to.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+class FakeServer(object):
+    """
+    The parts of a Nova ``Server`` used by ``CinderBlockDeviceAPI``.
+    """
+    def __init__(self, id, status=u"ACTIVE"):
+        self.id = id
+        self.status = status
+        self.addresses = {}
+
+    def start(self):
+        self.status = u"ACTIVE"
+
+
+class FakeNovaServerManager(object):
+    """
+    A fake ``INovaServerManager`` which counts ``list`` calls.
+    """
+    def __init__(self, servers):
+        self.servers = {server.id: server for server in servers}
+        self.list_calls = 0
+
+    def list(self):
+        self.list_calls += 1
+        return list(self.servers.values())
+
+    def get(self, server_id):
+        return self.servers[server_id]
+
+
+class CinderCacheTests(TestCase):
+    """
+    Tests for the caching of Nova lookups by ``CinderBlockDeviceAPI``.
+    """
+    def api(self, servers, **kwargs):
+        self.time = FakeTime()
+        self.servers = FakeNovaServerManager(servers)
+        return CinderBlockDeviceAPI(
+            cinder_volume_manager=object(),
+            nova_volume_manager=object(),
+            nova_server_manager=self.servers,
+            cluster_id=uuid4(),
+            time_module=self.time,
+            **kwargs
+        )
+
+    def test_live_nodes_cached(self):
+        """
+        ``list_live_nodes`` reuses a server listing made less than
+        ``live_nodes_ttl`` seconds ago.
+        """
+        api = self.api([FakeServer(u"a"), FakeServer(u"b", u"SHUTOFF")],
+                       live_nodes_ttl=10)
+        first = api.list_live_nodes()
+        self.time.now += 9
+        second = api.list_live_nodes()
+        self.assertEqual(
+            (first, second, self.servers.list_calls),
+            ([u"a"], [u"a"], 1),
+        )
+
+    def test_live_nodes_expire(self):
+        """
+        ``list_live_nodes`` lists the servers again once ``live_nodes_ttl``
+        seconds have passed.
+        """
+        api = self.api([FakeServer(u"a")], live_nodes_ttl=10)
+        api.list_live_nodes()
+        self.servers.servers[u"a"].status = u"SHUTOFF"
+        self.time.now += 10
+        self.assertEqual(
+            (api.list_live_nodes(), self.servers.list_calls), ([], 2))
+
+    def test_start_node_invalidates(self):
+        """
+        ``start_node`` discards the cached server listing.
+        """
+        api = self.api([FakeServer(u"a", u"SHUTOFF")], live_nodes_ttl=10)
+        api.list_live_nodes()
+        api.start_node(u"a")
+        self.assertEqual(
+            (api.list_live_nodes(), self.servers.list_calls), ([u"a"], 2))
+
+    def test_instance_id_persisted(self):
+        """
+        ``compute_instance_id`` remembers the instance ID in
+        ``instance_id_cache_path`` so that a new ``CinderBlockDeviceAPI``
+        does not need to look it up again.
+        """
+        path = FilePath(self.mktemp())
+        lookups = []
+
+        def lookup():
+            lookups.append(None)
+            return u"instance", u"config-drive"
+
+        first = self.api([], instance_id_cache_path=path)
+        first._lookup_compute_instance_id = lookup
+        second = self.api([], instance_id_cache_path=path)
+        second._lookup_compute_instance_id = lookup
+        self.assertEqual(
+            (first.compute_instance_id(), second.compute_instance_id(),
+             len(lookups)),
+            (u"instance", u"instance", 1),
+        )
+
+    def test_instance_id_other_era(self):
+        """
+        An instance ID remembered during a previous boot is not used.
+        """
+        path = FilePath(self.mktemp())
+        path.setContent(json.dumps({
+            u"era": unicode(uuid4()),
+            u"instance_id": u"old",
+            u"source": u"config-drive",
+        }))
+        api = self.api([], instance_id_cache_path=path)
+        api._lookup_compute_instance_id = lambda: (u"new", u"config-drive")
+        self.assertEqual(
+            (api.compute_instance_id(),
+             json.loads(path.getContent())[u"era"]),
+            (u"new", unicode(get_era())),
+        )
+
+    def test_instance_id_corrupt_cache(self):
+        """
+        A cache file which cannot be parsed is ignored and replaced.
+        """
+        path = FilePath(self.mktemp())
+        path.setContent(b"not json")
+        api = self.api([], instance_id_cache_path=path)
+        api._lookup_compute_instance_id = lambda: (u"new", u"config-drive")
+        self.assertEqual(
+            (api.compute_instance_id(),
+             json.loads(path.getContent())[u"instance_id"]),
+            (u"new", u"new"),
+        )
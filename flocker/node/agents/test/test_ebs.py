@@ -22,10 +22,11 @@ from eliot.testing import capture_logging, assertHasMessage
 
 from ..ebs import (
     AttachedUnexpectedDevice, _expected_device,
-    _attach_volume_and_wait_for_device, _get_blockdevices,
-    _get_device_size, _wait_for_new_device, _find_allocated_devices,
+    _attach_volume_and_wait_for_device,
+    _wait_for_new_device, _find_allocated_devices,
     _select_free_device, NoAvailableDevice,
-    _is_cluster_volume, CLUSTER_ID_LABEL
+    _is_cluster_volume, CLUSTER_ID_LABEL, _device_path_from_serial,
+    EBSBlockDeviceAPI, _EC2, _DeviceAllocator,
 )
 from .._logging import NO_NEW_DEVICE_IN_OS, INVALID_FLOCKER_CLUSTER_ID
 from ..blockdevice import BlockDeviceVolume
@@ -132,6 +133,20 @@ class AttachVolumeAndWaitTests(TestCase):
             blockdevices=[],
         )
 
+    def attach(self, sys_block, names):
+        """
+        :param FilePath sys_block: A fake ``/sys/block`` directory.
+        :param list names: The basenames of the devices to make appear, the
+            size of the volume.
+
+        :return: A function like ``EC2Connection.attach_volume`` which makes
+            the devices appear in ``sys_block``.
+        """
+        def attach_volume(blockdevice_id, compute_id, device):
+            for name in names:
+                add_device(sys_block, name, self.volume.size)
+        return attach_volume
+
     @given(device=device_path)
     def test_unexpected_device_discovered(self, device):
         """
@@ -140,69 +155,66 @@ class AttachVolumeAndWaitTests(TestCase):
         expected way, ``AttachedUnexpectedDevice`` is raised giving details
         about the expected and received paths.
         """
-        unexpected_device = []
-
-        # The implementation is going to look at the real system to see what
-        # block devices exist.  It would be nice to have an abstraction in
-        # place to easily manipulate these results for the tests.  Lacking
-        # that, just grab the actual block devices from the system and then
-        # drop one to make it look like that one has just appeared as a result
-        # of the attach operation.
-        blockdevices = _get_blockdevices()
-
-        # But there are complex criteria for selection.  So be careful which
-        # device we select so as to fool the implementation.
-        for wrong_device in blockdevices:
-            # Don't pick the one that's actually the right result
-            if wrong_device.basename().endswith(device[-1]):
-                continue
-
-            if wrong_device.basename().startswith((b"sd", b"xvd")):
-                size = _get_device_size(wrong_device.basename())
-                volume = self.volume.set("size", size)
-                blockdevices.remove(wrong_device)
-                unexpected_device.append(wrong_device)
-                break
-        else:
-            # Ideally we'd have more control over the implementation so we
-            # wouldn't have to give up when running on a system lacking just
-            # the right devices to let us exercise the code we want to
-            # exercise.  Getting to that point involves fixing all of the
-            # things in ebs.py like _get_blockdevices and _get_device_size that
-            # pass around raw strings or FilePath instances representing
-            # devices and then go off and interact directly with the underlying
-            # system.
-            #
-            # We need control over (at least) what devices the code-under-test
-            # can discover and what size it thinks they are.  Until then we
-            # just have to give up.  If you can't get this test to run without
-            # skipping, try adding another block device to your system (eg plug
-            # in a usb device).
-            #
-            # With apologies,
-            #  -jean-paul
-            raise self.skipTest(
-                "Could not find a suitable device to use as a bad device."
-            )
+        sys_block = make_sys_block(self, {b"xvda": None})
+        # Never the expected ``xvd`` name for an ``sd`` device:
+        unexpected_device = b"sdzzz"
+        detached = []
 
         exception = self.assertRaises(
             AttachedUnexpectedDevice,
             _attach_volume_and_wait_for_device,
-            volume=volume,
+            volume=self.volume,
             attach_to=self.compute_id,
-            attach_volume=lambda *a, **kw: None,
-            detach_volume=lambda *a, **kw: None,
+            attach_volume=self.attach(sys_block, [unexpected_device]),
+            detach_volume=detached.append,
             device=device,
-            blockdevices=blockdevices,
+            blockdevices=sys_block.children(),
+            sys_block=sys_block,
         )
         self.assertEqual(
-            AttachedUnexpectedDevice(
+            (AttachedUnexpectedDevice(
                 requested=FilePath(device),
-                discovered=FilePath(b"/dev/").child(
-                    unexpected_device.pop().basename()
-                ),
-            ),
-            exception,
+                discovered=FilePath(b"/dev/").child(unexpected_device),
+            ), [self.volume.blockdevice_id]),
+            (exception, detached),
+        )
+
+    def test_expected_device(self):
+        """
+        If the expected device appears after attaching the volume,
+        ``_attach_volume_and_wait_for_device`` returns ``True``.
+        """
+        sys_block = make_sys_block(self, {b"xvda": None})
+        self.assertTrue(
+            _attach_volume_and_wait_for_device(
+                volume=self.volume,
+                attach_to=self.compute_id,
+                attach_volume=self.attach(sys_block, [b"xvdf"]),
+                detach_volume=lambda *a, **kw: None,
+                device=b"/dev/sdf",
+                blockdevices=sys_block.children(),
+                sys_block=sys_block,
+            )
+        )
+
+    def test_overlapped_other_device(self):
+        """
+        If other attaches overlap this one, a new device of the same size
+        with a name other than the expected one is taken to be theirs rather
+        than the wrong device for this attach.
+        """
+        sys_block = make_sys_block(self, {b"xvda": None})
+        self.assertTrue(
+            _attach_volume_and_wait_for_device(
+                volume=self.volume,
+                attach_to=self.compute_id,
+                attach_volume=self.attach(sys_block, [b"xvdg", b"xvdf"]),
+                detach_volume=lambda *a, **kw: None,
+                device=b"/dev/sdf",
+                blockdevices=sys_block.children(),
+                sys_block=sys_block,
+                overlapped=lambda: True,
+            )
         )
 
 
@@ -219,6 +231,14 @@ class ExpectedDeviceTests(TestCase):
             (_expected_device(b"/dev/sdj"), _expected_device(b"/dev/sdo")),
         )
 
+    def test_xvdXY_unchanged(self):
+        """
+        ``xvdXY``-style devices are used as they are.
+        """
+        self.assertEqual(
+            FilePath(b"/dev/xvdba"), _expected_device(b"/dev/xvdba"),
+        )
+
     def test_non_dev_rejected(self):
         """
         Devices not in ``/dev`` are rejected with ``ValueError``.
@@ -256,6 +276,44 @@ class WaitForNewDeviceTests(TestCase):
             )
         )
 
+    def test_new_device(self):
+        """
+        ``_wait_for_new_device`` returns the ``/dev`` path of a device of the
+        expected size which appears in the given ``/sys/block`` directory.
+        """
+        sys_block = make_sys_block(self, {b"xvda": None})
+        base = sys_block.children()
+        add_device(sys_block, b"xvdf", 1024)
+        self.assertEqual(
+            FilePath(b"/dev/xvdf"),
+            _wait_for_new_device(
+                base=base,
+                expected_size=1024,
+                time_limit=1,
+                sys_block=sys_block,
+            )
+        )
+
+    def test_overlapped_unexpected_device(self):
+        """
+        While other operations overlap, a new device other than the expected
+        one is not interpreted as the new device.
+        """
+        sys_block = make_sys_block(self, {b"xvda": None})
+        base = sys_block.children()
+        add_device(sys_block, b"xvdg", 1024)
+        self.assertIs(
+            None,
+            _wait_for_new_device(
+                base=base,
+                expected_size=1024,
+                time_limit=0.2,
+                sys_block=sys_block,
+                expected_name=b"xvdf",
+                overlapped=lambda: True,
+            )
+        )
+
 
 class FindAllocatedDeviceTests(TestCase):
     """
@@ -289,9 +347,76 @@ class SelectFreeDeviceTests(TestCase):
         """
         Raises exception if no available device names.
         """
-        existing = ['sd' + ch for ch in ascii_lowercase]
+        existing = ['sd' + ch for ch in ascii_lowercase] + [
+            'xvd' + first + second
+            for first in 'bc' for second in ascii_lowercase
+        ]
         self.assertRaises(NoAvailableDevice, _select_free_device, existing)
 
+    def test_xvd_namespace(self):
+        """
+        Once ``sd[f-z]`` are used, names from the ``xvd[b-c][a-z]`` namespace
+        are provided.
+        """
+        existing = ['sd' + ch for ch in ascii_lowercase]
+        self.assertEqual(u'/dev/xvdba', _select_free_device(existing))
+
+
+class DeviceAllocatorTests(TestCase):
+    """
+    Tests for ``_DeviceAllocator``.
+    """
+
+    def test_allocated_devices_skipped(self):
+        """
+        Devices present in ``/sys/block`` are not reserved.
+        """
+        sys_block = make_sys_block(
+            self, {b"xvda": None, b"xvdf": None, b"loop0": None})
+        self.assertEqual(
+            ([b"xvda", b"xvdf"], u"/dev/sdg"),
+            (sorted(_find_allocated_devices(sys_block)),
+             _DeviceAllocator(sys_block).reserve()),
+        )
+
+    def test_reservations_distinct(self):
+        """
+        Names are not reserved again until they are released.
+        """
+        allocator = _DeviceAllocator(make_sys_block(self, {b"xvda": None}))
+        first = allocator.reserve()
+        second = allocator.reserve()
+        allocator.release(first)
+        third = allocator.reserve()
+        self.assertEqual(
+            (u"/dev/sdf", u"/dev/sdg", u"/dev/sdf"), (first, second, third),
+        )
+
+    def test_overlapped(self):
+        """
+        A name is overlapped once another name is reserved while it is, even
+        after the other name is released.
+        """
+        allocator = _DeviceAllocator(make_sys_block(self, {b"xvda": None}))
+        first = allocator.reserve()
+        alone = allocator.overlapped(first)
+        second = allocator.reserve()
+        allocator.release(second)
+        self.assertEqual(
+            (False, True), (alone, allocator.overlapped(first)),
+        )
+
+    def test_overlapped_released(self):
+        """
+        A name reserved again after being released is not overlapped because
+        of the earlier reservation.
+        """
+        allocator = _DeviceAllocator(make_sys_block(self, {b"xvda": None}))
+        first = allocator.reserve()
+        allocator.release(allocator.reserve())
+        allocator.release(first)
+        self.assertFalse(allocator.overlapped(allocator.reserve()))
+
 
 def boto_volume_for_test(test, cluster_id):
     """
@@ -390,3 +515,149 @@ class IsClusterVolumeTests(TestCase):
                 )
             )
         )
+
+
+def make_sys_block(test, serials):
+    """
+    Create a fake ``/sys/block`` directory.
+
+    :param test: The ``TestCase`` to create the directory for.
+    :param dict serials: Mapping from device name to the serial number it
+        reports, or ``None`` for a device which reports no serial number.
+
+    :return: The ``FilePath`` of the directory.
+    """
+    sys_block = FilePath(test.mktemp())
+    for name, serial in serials.items():
+        device = sys_block.descendant([name, b"device"])
+        device.makedirs()
+        if serial is not None:
+            device.child(b"serial").setContent(serial + b"\n")
+    return sys_block
+
+
+def add_device(sys_block, name, size):
+    """
+    Add a device to a fake ``/sys/block`` directory.
+
+    :param FilePath sys_block: The directory.
+    :param bytes name: The device name.
+    :param int size: The size of the device in bytes.
+    """
+    device = sys_block.child(name)
+    device.makedirs()
+    device.child(b"size").setContent(b"%d\n" % (size // 512,))
+
+
+class DevicePathFromSerialTests(TestCase):
+    """
+    Tests for ``_device_path_from_serial``.
+    """
+
+    def test_found(self):
+        """
+        The device which reports the volume id without its hyphen as its
+        serial number is found.
+        """
+        sys_block = make_sys_block(self, {
+            b"xvda": None,
+            b"nvme1n1": b"vol0123456789abcdef0",
+            b"nvme2n1": b"vol0123456789abcdef1",
+        })
+        self.assertEqual(
+            FilePath(b"/dev/nvme2n1"),
+            _device_path_from_serial(u"vol-0123456789abcdef1", sys_block),
+        )
+
+    def test_not_found(self):
+        """
+        ``None`` is returned if no device reports the volume id.
+        """
+        sys_block = make_sys_block(self, {
+            b"xvda": None,
+            b"nvme1n1": b"vol0123456789abcdef0",
+        })
+        self.assertIs(
+            None,
+            _device_path_from_serial(u"vol-0123456789abcdef1", sys_block),
+        )
+
+
+def attached_volume_data(volume_id, instance_id, device):
+    """
+    Create an EC2 ``DescribeVolumes`` response entry for a volume attached
+    to an instance.
+    """
+    return dict(
+        VolumeId=volume_id,
+        State=u"in-use",
+        Attachments=[dict(
+            VolumeId=volume_id,
+            InstanceId=instance_id,
+            Device=device,
+            State=u"attached",
+        )],
+    )
+
+
+class GetDevicePathTests(TestCase):
+    """
+    Tests for ``EBSBlockDeviceAPI.get_device_path``.
+    """
+    instance_id = u"i-0123456789abcdef0"
+
+    def setUp(self):
+        super(GetDevicePathTests, self).setUp()
+        region_name = u"some-test-region-1"
+        session = Boto3Session(
+            botocore_session=botocore_get_session(),
+            region_name=region_name,
+        )
+        ec2 = session.resource("ec2", region_name=region_name)
+        self.stubber = Stubber(ec2.meta.client)
+        self.stubber.activate()
+        self.sys_block = make_sys_block(self, {
+            b"xvda": None,
+            b"nvme1n1": b"vol0123456789abcdef0",
+        })
+        self.api = EBSBlockDeviceAPI(
+            ec2_client=_EC2(zone=u"some-test-region-1a", connection=ec2),
+            cluster_id=uuid4(),
+            sys_block=self.sys_block,
+        )
+        self.patch(self.api, "compute_instance_id", lambda: self.instance_id)
+
+    def test_serial(self):
+        """
+        A device reporting the volume id as its serial number is found
+        without any API calls.
+        """
+        self.assertEqual(
+            FilePath(b"/dev/nvme1n1"),
+            self.api.get_device_path(u"vol-0123456789abcdef0"),
+        )
+
+    def test_attached_volumes_loaded_once(self):
+        """
+        The devices of all volumes attached to this instance are loaded with
+        a single API call.
+        """
+        self.stubber.add_response(
+            "describe_volumes",
+            dict(Volumes=[
+                attached_volume_data(
+                    u"vol-1", self.instance_id, u"/dev/sdf"),
+                attached_volume_data(
+                    u"vol-2", self.instance_id, u"/dev/sdg"),
+            ]),
+            dict(Filters=[{
+                'Name': 'attachment.instance-id',
+                'Values': [self.instance_id],
+            }]),
+        )
+        self.assertEqual(
+            [FilePath(b"/dev/xvdf"), FilePath(b"/dev/xvdg")],
+            [self.api.get_device_path(u"vol-1"),
+             self.api.get_device_path(u"vol-2")],
+        )
+        self.stubber.assert_no_pending_responses()
@@ -4,6 +4,11 @@
 Unit Tests for utilities in ``flocker.node.agents.gce``.
 """
 
+from uuid import uuid4
+
+from bitmath import GiB
+from googleapiclient.errors import HttpError
+from httplib2 import Response
 from testtools.matchers import (
     Contains,
     Equals,
@@ -12,18 +17,41 @@ from testtools.matchers import (
     MatchesStructure,
     Raises,
 )
-from zope.interface.verify import verifyClass
+from zope.interface.verify import verifyClass, verifyObject
+
+from twisted.internet.defer import succeed, fail
+from twisted.internet.task import Clock
 
+from ....common._retry import LoopExceeded
+from ....common.test.test_thread import NonThreadPool
 from ....testtools import TestCase
 
+from .. import gce
+from ..blockdevice import (
+    AlreadyAttachedVolume,
+    BlockDeviceVolume,
+    IBlockDeviceAsyncAPI,
+    UnattachedVolume,
+    UnknownVolume,
+)
 from ..gce import (
+    GCEBlockDeviceAPI,
+    GCEBlockDeviceAsyncAPI,
     GCEOperations,
+    GCEVolumeException,
     GlobalOperationPoller,
+    IGCEAsyncOperations,
     IGCEOperations,
     MalformedOperation,
+    OPERATION_POLL_INTERVAL,
     OperationPoller,
+    SharedOperationPoller,
+    VOLUME_INSERT_TIMEOUT,
     ZoneOperationPoller,
     _create_poller,
+    _dataset_id_to_blockdevice_id,
+    _extract_attached_to,
+    wait_for_operation_async,
 )
 
 
@@ -287,3 +315,643 @@ class GCEOperationsTests(TestCase):
         :class:`GCEOperations` implements :class:`IGCEOperations`.
         """
         verifyClass(IGCEOperations, GCEOperations)
+
+    def test_async_interface(self):
+        """
+        :class:`GCEOperations` implements :class:`IGCEAsyncOperations`.
+        """
+        verifyClass(IGCEAsyncOperations, GCEOperations)
+
+
+class DiskListFilterTests(TestCase):
+    """
+    Tests for ``GCEBlockDeviceAPI._disk_list_filter``.
+    """
+
+    def test_matches_description(self):
+        """
+        The filter matches the description of this cluster's disks, with
+        spaces matched by any character.
+        """
+        api = GCEBlockDeviceAPI(
+            _operations=None,
+            _cluster_id=u"abc",
+        )
+        self.assertThat(
+            api._disk_list_filter(),
+            Equals(u"description eq flocker-v1-cluster-id:.abc"),
+        )
+
+
+def _zone_poller(name):
+    """
+    Create a ``ZoneOperationPoller`` for an operation named ``name``.
+    """
+    return ZoneOperationPoller(
+        zone=u"ZZ", project=u"PP", operation_name=name,
+    )
+
+
+class SharedOperationPollerTests(TestCase):
+    """
+    Tests for :class:`SharedOperationPoller`.
+    """
+
+    def setUp(self):
+        super(SharedOperationPollerTests, self).setUp()
+        self.clock = Clock()
+        self.fetches = []
+
+    def fetch(self, pollers):
+        self.fetches.append(pollers)
+        return succeed(list(
+            {u"name": poller.operation_name, u"status": u"DONE"}
+            for poller in pollers
+        ))
+
+    def test_one_fetch_per_tick(self):
+        """
+        All of the operations polled before a tick are retrieved with a
+        single call to ``fetch`` and each ``Deferred`` fires with its own
+        operation.
+        """
+        poller = SharedOperationPoller(self.clock, self.fetch, interval=1)
+        results = list(
+            poller.poll(_zone_poller(name)) for name in [u"a", u"b", u"c"]
+        )
+        self.assertEqual([], self.fetches)
+        self.clock.advance(1)
+        self.assertEqual(
+            ([[_zone_poller(u"a"), _zone_poller(u"b"), _zone_poller(u"c")]],
+             [u"a", u"b", u"c"]),
+            (self.fetches,
+             list(self.successResultOf(result)[u"name"]
+                  for result in results)),
+        )
+
+    def test_next_tick(self):
+        """
+        Operations polled after a tick are retrieved at the following tick.
+        """
+        poller = SharedOperationPoller(self.clock, self.fetch, interval=1)
+        poller.poll(_zone_poller(u"a"))
+        self.clock.advance(1)
+        result = poller.poll(_zone_poller(u"b"))
+        self.assertNoResult(result)
+        self.clock.advance(1)
+        self.assertEqual(
+            ([[_zone_poller(u"a")], [_zone_poller(u"b")]], u"b"),
+            (self.fetches, self.successResultOf(result)[u"name"]),
+        )
+
+    def test_individual_error(self):
+        """
+        An exception in place of an operation is delivered only to the
+        ``Deferred`` for that operation.
+        """
+        def fetch(pollers):
+            return succeed([ZeroDivisionError(), {u"status": u"DONE"}])
+        poller = SharedOperationPoller(self.clock, fetch, interval=1)
+        failing = poller.poll(_zone_poller(u"a"))
+        succeeding = poller.poll(_zone_poller(u"b"))
+        self.clock.advance(1)
+        self.failureResultOf(failing, ZeroDivisionError)
+        self.assertEqual(
+            {u"status": u"DONE"}, self.successResultOf(succeeding)
+        )
+
+    def test_fetch_error(self):
+        """
+        If ``fetch`` fails, every ``Deferred`` waiting for that tick fails.
+        """
+        poller = SharedOperationPoller(
+            self.clock, lambda pollers: fail(ZeroDivisionError()), interval=1
+        )
+        results = [
+            poller.poll(_zone_poller(u"a")), poller.poll(_zone_poller(u"b"))
+        ]
+        self.clock.advance(1)
+        for result in results:
+            self.failureResultOf(result, ZeroDivisionError)
+
+
+class WaitForOperationAsyncTests(TestCase):
+    """
+    Tests for :func:`wait_for_operation_async`.
+    """
+
+    def test_custom_poll(self):
+        """
+        When ``poll`` is given it is used to get the latest version of the
+        operation until the operation is done.
+        """
+        clock = Clock()
+        statuses = [u"RUNNING", u"DONE"]
+        polled = []
+
+        def poll(poller):
+            polled.append(poller)
+            return succeed(
+                {u"name": poller.operation_name, u"status": statuses.pop(0)}
+            )
+        result = wait_for_operation_async(
+            clock, None,
+            {u"name": u"op", u"zone": u"projects/PP/zones/ZZ"},
+            [1] * 5, poll=poll,
+        )
+        clock.advance(1)
+        self.assertEqual(
+            ({u"name": u"op", u"status": u"DONE"},
+             [_zone_poller(u"op")] * 2),
+            (self.successResultOf(result), polled),
+        )
+
+
+class _FakeRequest(object):
+    """
+    A fake GCE API request.
+
+    :ivar _execute: A no-argument callable which performs the request.
+    """
+    def __init__(self, execute):
+        self._execute = execute
+
+    def execute(self):
+        return self._execute()
+
+
+class _FakeCollection(object):
+    """
+    A fake GCE API resource collection, such as ``compute.disks()``.
+    """
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class _FakeBatch(object):
+    """
+    A fake GCE batch request which records the requests it executes.
+
+    :ivar _compute: The ``FakeCompute`` the batch was created by.
+    :ivar _callback: The callable called with the result of each request.
+    """
+    def __init__(self, compute, callback):
+        self._compute = compute
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._compute.batches.append(
+            list(request_id for (request_id, _) in self._requests)
+        )
+        for request_id, request in self._requests:
+            try:
+                response = request.execute()
+            except HttpError as e:
+                self._callback(request_id, None, e)
+            else:
+                self._callback(request_id, response, None)
+
+
+def _http_error(status):
+    """
+    Create an ``HttpError`` like those raised by the GCE API.
+
+    :param int status: The HTTP status of the error.
+    """
+    return HttpError(Response({u"status": status}), b"")
+
+
+class FakeCompute(object):
+    """
+    A fake of the parts of the GCE compute API used to manage disks, in the
+    zone ``ZZ`` of project ``PP``.
+
+    Operations take effect as soon as they are started and are reported as
+    ``DONE`` the first time they are retrieved, unless ``pending`` is set.
+
+    :ivar dict disk_resources: Mapping from disk name to disk resource.
+    :ivar dict operations: Mapping from operation name to operation resource.
+    :ivar dict start_errors: Mapping from the name of a method which starts
+        an operation to an ``HttpError`` raised when the request starting
+        the operation is executed.
+    :ivar dict operation_errors: Mapping from the name of a method which
+        starts an operation to the ``error`` of the concluded operation.
+        Operations with errors have no effect.
+    :ivar bool pending: Whether operations never conclude.
+    :ivar list batches: The request ids of the requests in each batch request
+        that has been executed.
+    """
+    def __init__(self):
+        self.disk_resources = {}
+        self.operations = {}
+        self.start_errors = {}
+        self.operation_errors = {}
+        self.pending = False
+        self.batches = []
+
+    def _start(self, method, effect):
+        """
+        Create a request which starts an operation.
+
+        :param str method: The name of the method starting the operation.
+        :param effect: A no-argument callable which performs the operation.
+
+        :return: A ``_FakeRequest``.
+        """
+        def execute():
+            if method in self.start_errors:
+                raise self.start_errors[method]
+            name = u"operation-{}".format(len(self.operations))
+            operation = {
+                u"name": name,
+                u"zone": u"projects/PP/zones/ZZ",
+                u"status": u"RUNNING",
+            }
+            if method in self.operation_errors:
+                operation[u"error"] = self.operation_errors[method]
+            else:
+                effect()
+            self.operations[name] = operation
+            return dict(operation)
+        return _FakeRequest(execute)
+
+    def _get_operation(self, project, zone, operation):
+        def execute():
+            if operation not in self.operations:
+                raise _http_error(404)
+            if not self.pending:
+                self.operations[operation][u"status"] = u"DONE"
+            return dict(self.operations[operation])
+        return _FakeRequest(execute)
+
+    def _get_disk(self, project, zone, disk):
+        def execute():
+            if disk not in self.disk_resources:
+                raise _http_error(404)
+            return self.disk_resources[disk]
+        return _FakeRequest(execute)
+
+    def _insert_disk(self, project, zone, body):
+        def effect():
+            self.disk_resources[body[u"name"]] = {
+                u"name": body[u"name"],
+                u"sizeGb": unicode(body[u"sizeGb"]),
+                u"description": body[u"description"],
+            }
+        return self._start("insert", effect)
+
+    def _delete_disk(self, project, zone, disk):
+        return self._start("delete", lambda: self.disk_resources.pop(disk))
+
+    def _attach_disk(self, project, zone, instance, body):
+        def effect():
+            self.disk_resources[body[u"deviceName"]][u"users"] = [
+                u"projects/PP/zones/ZZ/instances/" + instance
+            ]
+        return self._start("attachDisk", effect)
+
+    def _detach_disk(self, project, zone, instance, deviceName):
+        return self._start(
+            "detachDisk", lambda: self.disk_resources[deviceName].pop(u"users")
+        )
+
+    def disks(self):
+        return _FakeCollection(
+            insert=self._insert_disk,
+            delete=self._delete_disk,
+            get=self._get_disk,
+        )
+
+    def instances(self):
+        return _FakeCollection(
+            attachDisk=self._attach_disk,
+            detachDisk=self._detach_disk,
+        )
+
+    def zoneOperations(self):
+        return _FakeCollection(get=self._get_operation)
+
+    def new_batch_http_request(self, callback):
+        return _FakeBatch(self, callback)
+
+
+class _ThreadlessClock(Clock):
+    """
+    A ``Clock`` which runs the functions given to its thread pool
+    synchronously.
+    """
+    def getThreadPool(self):
+        return NonThreadPool()
+
+    def callFromThread(self, f, *args, **kwargs):
+        f(*args, **kwargs)
+
+
+def _operations(compute, reactor):
+    """
+    Create a ``GCEOperations`` which waits for operations asynchronously
+    using a ``SharedOperationPoller``.
+
+    :param FakeCompute compute: The GCE compute API to use.
+    :param _ThreadlessClock reactor: The reactor to use.
+    """
+    operations = GCEOperations(
+        _compute=compute, _project=u"PP", _zone=u"ZZ", _reactor=reactor,
+    )
+    return operations.set(
+        _operation_poller=SharedOperationPoller(
+            reactor=reactor, fetch=operations.get_operations,
+        ),
+    )
+
+
+class GetOperationsTests(TestCase):
+    """
+    Tests for :meth:`GCEOperations.get_operations`.
+    """
+    def setUp(self):
+        super(GetOperationsTests, self).setUp()
+        self.compute = FakeCompute()
+        self.operations = GCEOperations(
+            _compute=self.compute, _project=u"PP", _zone=u"ZZ",
+        )
+
+    def started(self, count):
+        """
+        Start some operations.
+
+        :param int count: The number of operations to start.
+
+        :return: A ``list`` of ``OperationPoller``\ s for the operations.
+        """
+        return list(
+            _create_poller(
+                self.compute._start("insert", lambda: None).execute()
+            )
+            for _ in range(count)
+        )
+
+    def test_batched(self):
+        """
+        The operations are retrieved with batch requests of at most
+        ``_MAX_BATCH_SIZE`` requests and returned in the order they were
+        given.
+        """
+        self.patch(gce, "_MAX_BATCH_SIZE", 2)
+        pollers = self.started(5)
+        result = self.operations.get_operations(pollers)
+        self.assertEqual(
+            ([[u"0", u"1"], [u"2", u"3"], [u"4"]],
+             list(poller.operation_name for poller in pollers)),
+            (self.compute.batches,
+             list(operation[u"name"] for operation in result)),
+        )
+
+    def test_individual_error(self):
+        """
+        The exception raised when retrieving an operation is returned in
+        place of that operation.
+        """
+        [poller] = self.started(1)
+        missing = _zone_poller(u"missing")
+        result = self.operations.get_operations([missing, poller])
+        self.assertEqual(
+            (HttpError, poller.operation_name),
+            (type(result[0]), result[1][u"name"]),
+        )
+
+    def test_empty(self):
+        """
+        No requests are made if there are no operations to retrieve.
+        """
+        self.assertEqual(
+            ([], []),
+            (self.operations.get_operations([]), self.compute.batches),
+        )
+
+
+class GCEBlockDeviceAsyncAPITests(TestCase):
+    """
+    Tests for :class:`GCEBlockDeviceAsyncAPI`.
+    """
+    def setUp(self):
+        super(GCEBlockDeviceAsyncAPITests, self).setUp()
+        self.compute = FakeCompute()
+        self.reactor = _ThreadlessClock()
+        self.sync = GCEBlockDeviceAPI(
+            _operations=_operations(self.compute, self.reactor),
+            _cluster_id=u"abc",
+        )
+        self.api = self.sync.async_block_device_api()
+
+    def created_volume(self, attach_to=None):
+        """
+        Create a volume directly in ``self.compute``.
+
+        :param unicode attach_to: The instance the volume is attached to, or
+            ``None``.
+
+        :return: The ``blockdevice_id`` of the volume.
+        """
+        blockdevice_id = _dataset_id_to_blockdevice_id(uuid4())
+        self.compute.disk_resources[blockdevice_id] = {
+            u"name": blockdevice_id,
+            u"sizeGb": u"10",
+            u"description": self.sync._disk_resource_description(),
+        }
+        if attach_to is not None:
+            self.compute.disk_resources[blockdevice_id][u"users"] = [
+                u"projects/PP/zones/ZZ/instances/" + attach_to
+            ]
+        return blockdevice_id
+
+    def test_async_block_device_api(self):
+        """
+        ``GCEBlockDeviceAPI.async_block_device_api`` returns a
+        ``GCEBlockDeviceAsyncAPI`` providing ``IBlockDeviceAsyncAPI`` if its
+        operations can be waited for asynchronously.
+        """
+        self.assertEqual(
+            (GCEBlockDeviceAsyncAPI, True),
+            (type(self.api), verifyObject(IBlockDeviceAsyncAPI, self.api)),
+        )
+
+    def test_create_volume(self):
+        """
+        ``create_volume`` creates a disk and fires with the new volume.
+        """
+        dataset_id = uuid4()
+        creating = self.api.create_volume(dataset_id, int(GiB(10).to_Byte()))
+        self.assertNoResult(creating)
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        blockdevice_id = _dataset_id_to_blockdevice_id(dataset_id)
+        self.assertEqual(
+            (BlockDeviceVolume(
+                blockdevice_id=blockdevice_id,
+                size=int(GiB(10).to_Byte()),
+                attached_to=None,
+                dataset_id=dataset_id,
+            ), [blockdevice_id]),
+            (self.successResultOf(creating),
+             list(self.compute.disk_resources)),
+        )
+
+    def test_operations_share_poll(self):
+        """
+        Operations which are waited for at the same time are retrieved with
+        one batch request.
+        """
+        results = list(
+            self.api.create_volume(uuid4(), int(GiB(10).to_Byte()))
+            for _ in range(3)
+        )
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        for result in results:
+            self.successResultOf(result)
+        self.assertEqual([[u"0", u"1", u"2"]], self.compute.batches)
+
+    def test_create_volume_exists(self):
+        """
+        ``create_volume`` fails with ``GCEVolumeException`` if GCE reports a
+        conflict.
+        """
+        self.compute.start_errors["insert"] = _http_error(409)
+        self.failureResultOf(
+            self.api.create_volume(uuid4(), int(GiB(10).to_Byte())),
+            GCEVolumeException,
+        )
+
+    def test_create_volume_error(self):
+        """
+        ``create_volume`` fails with the ``HttpError`` from GCE if it is not
+        a conflict.
+        """
+        self.compute.start_errors["insert"] = _http_error(500)
+        self.failureResultOf(
+            self.api.create_volume(uuid4(), int(GiB(10).to_Byte())),
+            HttpError,
+        )
+
+    def test_create_volume_timeout(self):
+        """
+        ``create_volume`` fails with ``LoopExceeded`` if the operation does
+        not conclude within ``VOLUME_INSERT_TIMEOUT`` seconds.
+        """
+        self.compute.pending = True
+        creating = self.api.create_volume(uuid4(), int(GiB(10).to_Byte()))
+        self.reactor.pump([OPERATION_POLL_INTERVAL] * VOLUME_INSERT_TIMEOUT)
+        self.assertNoResult(creating)
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        self.failureResultOf(creating, LoopExceeded)
+
+    def test_attach_volume(self):
+        """
+        ``attach_volume`` attaches the disk and fires with the attached
+        volume.
+        """
+        blockdevice_id = self.created_volume()
+        attaching = self.api.attach_volume(blockdevice_id, u"node1")
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        self.assertEqual(
+            (u"node1", u"node1"),
+            (self.successResultOf(attaching).attached_to,
+             _extract_attached_to(
+                 self.compute.disk_resources[blockdevice_id])),
+        )
+
+    def test_attach_volume_in_use(self):
+        """
+        ``attach_volume`` fails with ``AlreadyAttachedVolume`` if the
+        operation reports that the disk is in use.
+        """
+        blockdevice_id = self.created_volume(attach_to=u"node2")
+        self.compute.operation_errors["attachDisk"] = {u"errors": [
+            {u"code": u"RESOURCE_IN_USE_BY_ANOTHER_RESOURCE"},
+        ]}
+        attaching = self.api.attach_volume(blockdevice_id, u"node1")
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        self.failureResultOf(attaching, AlreadyAttachedVolume)
+
+    def test_attach_volume_unknown(self):
+        """
+        ``attach_volume`` fails with ``UnknownVolume`` if GCE rejects the
+        request to attach the disk.
+        """
+        self.compute.start_errors["attachDisk"] = _http_error(400)
+        self.failureResultOf(
+            self.api.attach_volume(self.created_volume(), u"node1"),
+            UnknownVolume,
+        )
+
+    def test_detach_volume(self):
+        """
+        ``detach_volume`` detaches the disk from the instance it is attached
+        to and fires with ``None``.
+        """
+        blockdevice_id = self.created_volume(attach_to=u"node1")
+        detaching = self.api.detach_volume(blockdevice_id)
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        self.assertEqual(
+            (None, None),
+            (self.successResultOf(detaching),
+             _extract_attached_to(
+                 self.compute.disk_resources[blockdevice_id])),
+        )
+
+    def test_detach_volume_unattached(self):
+        """
+        ``detach_volume`` fails with ``UnattachedVolume`` if the disk is not
+        attached.
+        """
+        self.failureResultOf(
+            self.api.detach_volume(self.created_volume()), UnattachedVolume,
+        )
+
+    def test_detach_volume_error(self):
+        """
+        ``detach_volume`` fails with ``GCEVolumeException`` if the operation
+        reports an error other than a detach already being in progress.
+        """
+        self.compute.operation_errors["detachDisk"] = {u"errors": [
+            {u"code": u"INTERNAL_ERROR"},
+        ]}
+        detaching = self.api.detach_volume(
+            self.created_volume(attach_to=u"node1"))
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        self.failureResultOf(detaching, GCEVolumeException)
+
+    def test_destroy_volume(self):
+        """
+        ``destroy_volume`` deletes the disk and fires with ``None``.
+        """
+        destroying = self.api.destroy_volume(self.created_volume())
+        self.reactor.advance(OPERATION_POLL_INTERVAL)
+        self.assertEqual(
+            (None, {}),
+            (self.successResultOf(destroying), self.compute.disk_resources),
+        )
+
+    def test_destroy_volume_unknown(self):
+        """
+        ``destroy_volume`` fails with ``UnknownVolume`` if GCE reports that
+        the disk does not exist.
+        """
+        self.compute.start_errors["delete"] = _http_error(404)
+        self.failureResultOf(
+            self.api.destroy_volume(self.created_volume()), UnknownVolume,
+        )
+
+    def test_destroy_volume_in_use(self):
+        """
+        ``destroy_volume`` fails with ``GCEVolumeException`` if GCE rejects
+        the request to delete the disk.
+        """
+        self.compute.start_errors["delete"] = _http_error(400)
+        self.failureResultOf(
+            self.api.destroy_volume(self.created_volume()),
+            GCEVolumeException,
+        )
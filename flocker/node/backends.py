@@ -25,7 +25,8 @@ from .agents.gce import gce_from_configuration
 
 
 def _zfs_storagepool(
-        reactor, pool=FLOCKER_POOL, mount_root=None, volume_config_path=None):
+        reactor, pool=FLOCKER_POOL, mount_root=None, volume_config_path=None,
+        compressed_send=False):
     """
     Create a ``VolumeService`` with a ``zfs.StoragePool``.
 
@@ -34,6 +35,9 @@ def _zfs_storagepool(
         will be mounted.
     :param bytes volume_config_path: The path to the volume service's
         configuration file.
+    :param bool compressed_send: Whether to send blocks compressed as they
+        are on disk (``zfs send -c``).  Every node must have a ``zfs`` which
+        can receive such streams.
 
     :return: The ``VolumeService``, started.
     """
@@ -48,11 +52,13 @@ def _zfs_storagepool(
 
     pool = zfs.StoragePool(
         reactor=reactor, name=pool, mount_root=mount_root,
+        compressed_send=compressed_send,
     )
     api = VolumeService(
         config_path=config_path,
         pool=pool,
         reactor=reactor,
+        threadpool=reactor.getThreadPool(),
     )
     api.startService()
     return api
@@ -140,7 +146,7 @@ _DEFAULT_BACKENDS = [
         },
     ),
     BackendDescription(
-        name=u"gce", needs_reactor=False, needs_cluster_id=True,
+        name=u"gce", needs_reactor=True, needs_cluster_id=True,
         api_factory=gce_from_configuration,
         deployer_type=DeployerType.block,
         required_config=set([]),
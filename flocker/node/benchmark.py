@@ -1,19 +1,50 @@
 # Copyright ClusterHQ Inc.  See LICENSE file for details.
 
 import sys
+from os import urandom
+from tempfile import mkdtemp
+from timeit import timeit, default_timer
+from uuid import uuid4
 
+from twisted.python.filepath import FilePath
 from twisted.python.usage import Options, UsageError
-from twisted.internet.defer import succeed
+from twisted.internet.defer import succeed, gatherResults
+from twisted.internet.endpoints import TCP4ClientEndpoint
+from twisted.internet.threads import deferToThread
 
 from pyrsistent import PClass
 
 from zope.interface import implementer
 
 from .diagnostics import list_hardware
+from .agents.blockdevice import (
+    BlockDeviceCalculator, DatasetStates, DesiredDataset, DiscoveredDataset,
+)
+from .agents.blockdevice_manager import (
+    BlockDeviceManager, _get_mounts_psutil, _has_filesystem_blkid,
+)
 
+from ..apiclient import FlockerClient
+from ..apiclient._client import DEFAULT_MAX_CONNECTIONS
+from ..ca import (
+    RootCredential, ControlCredential, UserCredential,
+    rest_api_context_factory,
+)
+from ..control import DeploymentState, NodeState, Manifestation, Dataset
+from ..control._clusterstate import ClusterStateService
+from ..control._diffing import create_diff
+from ..control._persistence import (
+    ConfigurationPersistenceService, generation_hash,
+)
+from ..control.httpapi import create_api_service
+from ..common import ProcessNode
 from ..common.script import (
     ICommandLineScript,
     flocker_standard_options, FlockerScriptRunner)
+from ..volume.service import VolumeService, VolumeName
+from ..volume.filesystems.memory import FilesystemStoragePool
+from ..volume._copy import copy_stream
+from ..volume._transfer import TransferClient, volume_transfer_factory
 
 
 class HardwareReportOptions(Options):
@@ -25,6 +56,98 @@ class HardwareReportOptions(Options):
     """
 
 
+class DeviceDiscoveryOptions(Options):
+    """
+    Command line options for ``flocker-benchmark device-discovery``.
+    """
+    longdesc = """\
+    Compare the time taken to discover mounts and filesystems using the
+    cached in-process implementations and the subprocess based ones.
+    """
+
+    synopsis = "[--iterations N] [DEVICE ...]"
+
+    optParameters = [
+        ['iterations', None, 100, "The number of times to repeat each "
+         "operation.", int],
+    ]
+
+    def parseArgs(self, *devices):
+        self['devices'] = list(FilePath(device) for device in devices)
+
+
+class DatasetCalculationOptions(Options):
+    """
+    Command line options for ``flocker-benchmark dataset-calculation``.
+    """
+    longdesc = """\
+    Compare the time taken to calculate the changes for a node with many
+    mounted datasets with and without the changes of the previous
+    calculation.
+    """
+
+    optParameters = [
+        ['datasets', None, 2000, "The number of datasets on the node.", int],
+        ['iterations', None, 100, "The number of times to repeat each "
+         "calculation.", int],
+    ]
+
+
+class DiffApplicationOptions(Options):
+    """
+    Command line options for ``flocker-benchmark diff-application``.
+    """
+    longdesc = """\
+    Time how long an agent takes to apply a diff which changes a single node
+    to a large cluster state and to verify the hash of the result.
+    """
+
+    optParameters = [
+        ['nodes', None, 1000, "The number of nodes in the cluster.", int],
+        ['datasets', None, 5, "The number of datasets on each node.", int],
+        ['iterations', None, 100, "The number of diffs to apply.", int],
+    ]
+
+
+class VolumeTransferOptions(Options):
+    """
+    Command line options for ``flocker-benchmark volume-transfer``.
+    """
+    longdesc = """\
+    Time how long it takes to push a volume to a volume transfer server
+    listening on the loopback interface.  If an SSH key is given, also time
+    sending the same volume data to the loopback interface over SSH, the way
+    ``flocker-volume`` sends it.
+    """
+
+    optParameters = [
+        ['size', None, 64, "The size of the volume in MiB.", int],
+        ['iterations', None, 5, "The number of volumes to push.", int],
+        ['ssh-key', None, None, "Path to a private key which can be used to "
+         "SSH to the loopback interface.", FilePath],
+        ['ssh-user', None, b"root", "The user to SSH as."],
+        ['ssh-port', None, 22, "The port of the SSH server.", int],
+    ]
+
+
+class APIRequestsOptions(Options):
+    """
+    Command line options for ``flocker-benchmark api-requests``.
+    """
+    longdesc = """\
+    Time requests made with ``FlockerClient`` to a control service REST API
+    listening on the loopback interface, one at a time and several at once,
+    both making a new connection for every request and keeping connections
+    open for reuse.
+    """
+
+    optParameters = [
+        ['requests', None, 200, "The number of requests to time.", int],
+        ['concurrency', None, 10, "The number of requests to make at once "
+         "when timing concurrent requests.", int],
+    ]
+
+
 @flocker_standard_options
 class BenchmarkOptions(Options):
     """
@@ -39,6 +162,16 @@ class BenchmarkOptions(Options):
     subCommands = [
         ['hardware-report', None, HardwareReportOptions,
          "Print a hardware report."],
+        ['device-discovery', None, DeviceDiscoveryOptions,
+         "Time mount and filesystem discovery."],
+        ['dataset-calculation', None, DatasetCalculationOptions,
+         "Time the calculation of dataset changes."],
+        ['diff-application', None, DiffApplicationOptions,
+         "Time the application of cluster state diffs."],
+        ['volume-transfer', None, VolumeTransferOptions,
+         "Time pushing a volume to another node."],
+        ['api-requests', None, APIRequestsOptions,
+         "Time requests to the control service REST API."],
     ]
 
     def postOptions(self):
@@ -54,6 +187,343 @@ def hardware_report(options):
     return succeed(None)
 
 
+def device_discovery(options):
+    """
+    Print the average time taken by each implementation of mount and
+    filesystem discovery to stdout.
+    """
+    manager = BlockDeviceManager()
+    devices = options['devices']
+    operations = [
+        ('get_mounts (psutil)', lambda: list(_get_mounts_psutil())),
+        ('get_mounts (mountinfo)', lambda: list(manager.get_mounts())),
+        ('has_filesystem (blkid)',
+         lambda: list(_has_filesystem_blkid(d) for d in devices)),
+        ('has_filesystem (probe)',
+         lambda: list(manager.has_filesystem(d) for d in devices)),
+    ]
+    iterations = options['iterations']
+    for name, operation in operations:
+        sys.stdout.write('{}: {:.6f}s\n'.format(
+            name, timeit(operation, number=iterations) / iterations,
+        ))
+    return succeed(None)
+
+
+def dataset_calculation(options):
+    """
+    Print the average time taken to calculate the changes for many mounted
+    datasets to stdout.
+    """
+    discovered = {}
+    desired = {}
+    for _ in range(options['datasets']):
+        dataset_id = uuid4()
+        mount_point = FilePath(b"/flocker").child(bytes(dataset_id))
+        discovered[dataset_id] = DiscoveredDataset(
+            state=DatasetStates.MOUNTED,
+            dataset_id=dataset_id,
+            maximum_size=2 ** 30,
+            blockdevice_id=unicode(dataset_id),
+            device_path=FilePath(b"/dev/null"),
+            mount_point=mount_point,
+        )
+        desired[dataset_id] = DesiredDataset(
+            state=DatasetStates.MOUNTED,
+            dataset_id=dataset_id,
+            maximum_size=2 ** 30,
+            mount_point=mount_point,
+        )
+
+    calculator = BlockDeviceCalculator()
+    operations = [
+        ('uncached', lambda: BlockDeviceCalculator(
+        ).calculate_changes_for_datasets(discovered, desired)),
+        ('cached', lambda: calculator.calculate_changes_for_datasets(
+            discovered, desired)),
+    ]
+    iterations = options['iterations']
+    for name, operation in operations:
+        sys.stdout.write('{}: {:.6f}s\n'.format(
+            name, timeit(operation, number=iterations) / iterations,
+        ))
+    return succeed(None)
+
+
+def _node_state(datasets):
+    """
+    :param int datasets: The number of datasets to put on the node.
+
+    :return: A ``NodeState`` with that many mounted datasets.
+    """
+    manifestations = {}
+    paths = {}
+    for _ in range(datasets):
+        dataset_id = unicode(uuid4())
+        manifestations[dataset_id] = Manifestation(
+            dataset=Dataset(dataset_id=dataset_id), primary=True,
+        )
+        paths[dataset_id] = FilePath(b"/flocker").child(bytes(dataset_id))
+    return NodeState(
+        uuid=uuid4(), hostname=u"192.0.2.1", applications=None,
+        manifestations=manifestations, paths=paths, devices={},
+    )
+
+
+def diff_application(options):
+    """
+    Print the average time taken to apply a diff changing a single node to a
+    large cluster state, and to hash the result, to stdout.
+    """
+    nodes = [_node_state(options['datasets']) for _ in range(options['nodes'])]
+    state = DeploymentState(nodes=nodes)
+    # The agent has already hashed the state the diffs start from:
+    generation_hash(state)
+
+    diffs = []
+    target = state
+    for i in range(options['iterations']):
+        node = nodes[i % len(nodes)]
+        changed = target.update_node(node.set(hostname=u"192.0.2.2"))
+        diffs.append(create_diff(target, changed))
+        target = changed
+
+    applying = hashing = 0
+    for diff in diffs:
+        start = default_timer()
+        state = diff.apply(state)
+        applied = default_timer()
+        generation_hash(state)
+        applying += applied - start
+        hashing += default_timer() - applied
+
+    iterations = options['iterations']
+    sys.stdout.write('apply: {:.6f}s\n'.format(applying / iterations))
+    sys.stdout.write('verify: {:.6f}s\n'.format(hashing / iterations))
+    return succeed(None)
+
+
+def _volume_service(reactor, root):
+    """
+    :param reactor: The reactor to use.
+    :param FilePath root: A new directory to keep the service's state and
+        storage pool in.
+
+    :return: A started ``VolumeService`` with an in-memory storage pool,
+        which pushes volumes in the reactor's threadpool.
+    """
+    pool = root.child(b"pool")
+    pool.makedirs()
+    service = VolumeService(
+        root.child(b"volume.json"), FilesystemStoragePool(pool), reactor,
+        threadpool=reactor.getThreadPool(),
+    )
+    service.startService()
+    return service
+
+
+def _timed(operation):
+    """
+    :param operation: A callable returning a ``Deferred``.
+
+    :return: A ``Deferred`` firing with the number of seconds it took the
+        result of ``operation`` to fire.
+    """
+    start = default_timer()
+    d = operation()
+    d.addCallback(lambda _: default_timer() - start)
+    return d
+
+
+def _ssh_send(options, volume):
+    """
+    Send a volume's data to ``/dev/null`` on the loopback interface over
+    SSH, blocking until it has all been sent.
+
+    :param options: The ``VolumeTransferOptions``.
+    :param Volume volume: The volume to send.
+    """
+    node = ProcessNode.using_ssh(
+        b"127.0.0.1", options['ssh-port'], options['ssh-user'],
+        options['ssh-key'],
+    )
+    with volume.get_filesystem().reader() as source:
+        with node.run([b"sh", b"-c", b"cat > /dev/null"]) as destination:
+            copy_stream(source, destination)
+
+
+def volume_transfer(options):
+    """
+    Print the average time taken to push a volume to a volume transfer
+    server on the loopback interface to stdout, along with the time taken to
+    send the same data over SSH if an SSH key was given.
+    """
+    from twisted.internet import reactor
+
+    root = FilePath(mkdtemp())
+    source = _volume_service(reactor, root.child(b"source"))
+    destination = _volume_service(reactor, root.child(b"destination"))
+    port = reactor.listenTCP(
+        0, volume_transfer_factory(
+            reactor, reactor.getThreadPool(), destination,
+        ),
+        interface=b"127.0.0.1",
+    )
+    client = TransferClient(
+        reactor,
+        lambda hostname, node_uuid: TCP4ClientEndpoint(
+            reactor, hostname, port.getHost().port,
+        ),
+    )
+    # Plain TCP does not authenticate the node, so its UUID is not needed:
+    remote = client.manager(b"127.0.0.1", None)
+
+    volumes = [
+        source.get(VolumeName(
+            namespace=u"benchmark", dataset_id=unicode(uuid4()),
+        ))
+        for _ in range(options['iterations'])
+    ]
+    creating = gatherResults([source.create(volume) for volume in volumes])
+
+    def created(ignored):
+        for volume in volumes:
+            path = volume.get_filesystem().get_path()
+            with path.child(b"data").open("wb") as f:
+                for _ in range(options['size']):
+                    f.write(urandom(1024 * 1024))
+    creating.addCallback(created)
+
+    timings = {}
+
+    def time_all(name, operation):
+        def loop(_, remaining):
+            if not remaining:
+                return
+            d = _timed(lambda: operation(remaining[0]))
+            d.addCallback(
+                lambda seconds: timings.setdefault(name, []).append(seconds)
+            )
+            d.addCallback(loop, remaining[1:])
+            return d
+        creating.addCallback(loop, volumes)
+
+    time_all('transfer', lambda volume: source.push(volume, remote))
+    if options['ssh-key'] is not None:
+        time_all(
+            'ssh', lambda volume: deferToThread(_ssh_send, options, volume),
+        )
+
+    def report(_):
+        for name in ['transfer', 'ssh']:
+            if name in timings:
+                sys.stdout.write('{}: {:.6f}s\n'.format(
+                    name, sum(timings[name]) / len(timings[name]),
+                ))
+    creating.addCallback(report)
+
+    def cleanup(passthrough):
+        client.disconnect()
+        port.stopListening()
+        root.remove()
+        return passthrough
+    creating.addBoth(cleanup)
+    return creating
+
+
+def _time_requests(request, count, concurrency):
+    """
+    Time requests, making several at once.
+
+    :param request: A callable returning a ``Deferred`` that fires when a
+        request has finished.
+    :param int count: The number of requests to make.
+    :param int concurrency: The number of requests to make at once.
+
+    :return: A ``Deferred`` firing with a ``list`` of the number of seconds
+        each request took.
+    """
+    timings = []
+
+    def batch(ignored, remaining):
+        if remaining <= 0:
+            return timings
+        size = min(concurrency, remaining)
+        d = gatherResults([_timed(request) for _ in range(size)])
+        d.addCallback(timings.extend)
+        d.addCallback(batch, remaining - size)
+        return d
+    return batch(None, count)
+
+
+def api_requests(options):
+    """
+    Print the average latency of requests to a control service REST API on
+    the loopback interface to stdout, for sequential and concurrent requests
+    with and without persistent connections.
+    """
+    from twisted.internet import reactor
+
+    root = FilePath(mkdtemp())
+    authority = RootCredential.initialize(root, b"benchmark")
+    control = ControlCredential.initialize(root, authority, b"127.0.0.1")
+    UserCredential.initialize(root, authority, u"user")
+
+    persistence = ConfigurationPersistenceService(
+        reactor, root.child(b"persistence"),
+    )
+    persistence.startService()
+    cluster_state = ClusterStateService(reactor)
+    cluster_state.startService()
+    api = create_api_service(
+        persistence, cluster_state, None,
+        rest_api_context_factory(authority.credential.certificate, control),
+        reactor,
+    )
+    port = reactor.listenTCP(0, api.factory, interface=b"127.0.0.1")
+
+    def run(_, label, max_connections, mode, concurrency):
+        client = FlockerClient(
+            reactor, b"127.0.0.1", port.getHost().port,
+            root.child(b"cluster.crt"), root.child(b"user.crt"),
+            root.child(b"user.key"), max_connections=max_connections,
+        )
+        d = _time_requests(
+            client.list_datasets_configuration, options['requests'],
+            concurrency,
+        )
+        d.addCallback(lambda timings: sys.stdout.write(
+            '{} ({}): {:.6f}s\n'.format(
+                mode, label, sum(timings) / len(timings),
+            )
+        ))
+        d.addBoth(
+            lambda passthrough: client.disconnect().addCallback(
+                lambda _: passthrough
+            )
+        )
+        return d
+
+    running = succeed(None)
+    for label, max_connections in [
+        ('new connections', 0),
+        ('persistent connections', DEFAULT_MAX_CONNECTIONS),
+    ]:
+        for mode, concurrency in [
+            ('sequential', 1), ('concurrent', options['concurrency']),
+        ]:
+            running.addCallback(run, label, max_connections, mode, concurrency)
+
+    def cleanup(passthrough):
+        port.stopListening()
+        cluster_state.stopService()
+        persistence.stopService()
+        root.remove()
+        return passthrough
+    running.addBoth(cleanup)
+    return running
+
+
 @implementer(ICommandLineScript)
 class BenchmarkScript(PClass):
     """
@@ -61,6 +531,11 @@ class BenchmarkScript(PClass):
     """
     _subcommands = {
         'hardware-report': hardware_report,
+        'device-discovery': device_discovery,
+        'dataset-calculation': dataset_calculation,
+        'diff-application': diff_application,
+        'volume-transfer': volume_transfer,
+        'api-requests': api_requests,
     }
 
     def main(self, reactor, options):
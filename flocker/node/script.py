@@ -12,12 +12,13 @@ import signal
 import sys
 from functools import partial
 from time import sleep, clock
+from datetime import timedelta
 
 import yaml
 
 from jsonschema import FormatChecker, Draft4Validator
 
-from pyrsistent import PClass, field, PMap, pmap
+from pyrsistent import PClass, field, PMap, pmap, pset_field
 
 from eliot import ActionType, fields
 
@@ -28,6 +29,8 @@ from twisted.python.usage import Options, UsageError
 from twisted.internet.ssl import Certificate
 from twisted.internet import reactor  # pylint: disable=unused-import
 from twisted.internet.defer import succeed
+from twisted.internet.endpoints import SSL4ServerEndpoint
+from twisted.application.internet import StreamServerEndpointService
 
 
 from ..common.script import (
@@ -35,7 +38,10 @@ from ..common.script import (
     flocker_standard_options, FlockerScriptRunner, main_for_service,
     enable_profiling, disable_profiling)
 from . import P2PManifestationDeployer, ApplicationNodeDeployer
+from ._p2p import Replication, _ssh_remote_volume_manager
 from ._loop import AgentLoopService
+from ._device_monitor import DeviceMonitor, device_monitor_supported
+from ._docker import DockerClient, DEFAULT_IMAGE_CACHE_PATH
 from .exceptions import StorageInitializationError
 from .diagnostics import (
     current_distribution, FlockerDebugArchive, DISTRIBUTION_BY_LABEL,
@@ -44,8 +50,11 @@ from .diagnostics import (
 from .agents.blockdevice import (
     BlockDeviceDeployer, ProcessLifetimeCache,
 )
-from ..ca import ControlServicePolicy, NodeCredential
+from ..ca import (
+    ControlServicePolicy, NodeCredential, node_transfer_context_factory,
+)
 from ..common._era import get_era
+from ..volume._transfer import TransferClient, volume_transfer_factory
 
 from .backends import (
     BackendDescription,
@@ -92,7 +101,10 @@ def flocker_container_agent_main():
     This starts a Docker-based container convergence agent.
     """
     def deployer_factory(cluster_uuid, **kwargs):
-        return ApplicationNodeDeployer(**kwargs)
+        docker_client = DockerClient(
+            image_cache_path=FilePath(DEFAULT_IMAGE_CACHE_PATH),
+        )
+        return ApplicationNodeDeployer(docker_client=docker_client, **kwargs)
     service_factory = AgentServiceFactory(
         deployer_factory=deployer_factory
     ).get_service
@@ -230,6 +242,45 @@ def validate_configuration(configuration):
                 # Format described at https://www.python.org/dev/peps/pep-0391/
                 "type": "object",
             },
+            # Path of a Unix socket on which the dataset agent shares its
+            # control service connection with the container agent:
+            "cluster-state-socket": {
+                "type": "string",
+            },
+            # TCP port on which the dataset agent of a peer-to-peer (ZFS)
+            # backend receives volumes from other nodes over TLS, instead of
+            # them being sent over SSH:
+            "volume-transfer-port": {
+                "type": "integer",
+                "minimum": 1,
+                "maximum": 65535,
+            },
+            # Whether the dataset agent of a peer-to-peer (ZFS) backend
+            # compresses the volumes it sends to other nodes over SSH, which
+            # helps on slow links but costs CPU time on fast ones:
+            "ssh-compression": {
+                "type": "boolean",
+            },
+            # Nodes to which the dataset agent of a peer-to-peer (ZFS)
+            # backend periodically pushes its datasets, so that handing them
+            # off to those nodes is quick:
+            "replication": {
+                "type": "object",
+                "properties": {
+                    "hostnames": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                    },
+                    # Seconds between pushes of each dataset to each node:
+                    "interval": {
+                        "type": "number",
+                        "exclusiveMinimum": True,
+                        "minimum": 0,
+                    },
+                },
+                "required": ["hostnames"],
+                "additionalProperties": False,
+            },
         }
     }
 
@@ -340,6 +391,10 @@ class AgentServiceFactory(PClass):
         tls_info = _context_factory_and_credential(
             options["agent-config"].parent(), host, port)
 
+        subscribe_socket = None
+        if "cluster-state-socket" in configuration:
+            subscribe_socket = FilePath(configuration["cluster-state-socket"])
+
         return AgentLoopService(
             reactor=reactor,
             deployer=self.deployer_factory(
@@ -348,6 +403,7 @@ class AgentServiceFactory(PClass):
             host=host, port=port,
             context_factory=tls_info.context_factory,
             era=get_era(),
+            subscribe_socket=subscribe_socket,
         )
 
 
@@ -378,6 +434,10 @@ def get_configuration(options):
     return configuration
 
 
+# How often datasets are pushed to each replication node, unless configured
+# otherwise:
+DEFAULT_REPLICATION_INTERVAL = timedelta(minutes=1)
+
 _DEFAULT_DEPLOYERS = {
     DeployerType.p2p: lambda api, **kw:
         P2PManifestationDeployer(volume_service=api, **kw),
@@ -436,6 +496,9 @@ class AgentService(PClass):
     :ivar api_args: Extra arguments to pass to the factory from ``backends``.
     :ivar get_external_ip: Typically ``_get_external_ip``, but
         overrideable for tests.
+    :ivar cluster_state_socket: The path of a Unix socket on which to share
+        the control service connection with other agents on this node, or
+        ``None``.
     """
     backend_description = field(
         BackendDescription,
@@ -457,6 +520,21 @@ class AgentService(PClass):
 
     api_args = field(type=PMap, factory=pmap, mandatory=True)
 
+    cluster_state_socket = field(
+        type=(FilePath, type(None)), initial=None, mandatory=True,
+    )
+
+    volume_transfer_port = field(
+        type=(int, type(None)), initial=None, mandatory=True,
+    )
+
+    ssh_compression = field(type=bool, initial=False, mandatory=True)
+
+    replication_hostnames = pset_field(unicode)
+    replication_interval = field(
+        type=timedelta, initial=DEFAULT_REPLICATION_INTERVAL, mandatory=True,
+    )
+
     @classmethod
     def from_configuration(cls, configuration, reactor=None):
         """
@@ -494,6 +572,26 @@ class AgentService(PClass):
             backend_description=backend_description,
             api_args=api_args,
         )
+        if 'cluster-state-socket' in configuration:
+            kwargs['cluster_state_socket'] = FilePath(
+                configuration['cluster-state-socket']
+            )
+        if 'volume-transfer-port' in configuration:
+            kwargs['volume_transfer_port'] = configuration[
+                'volume-transfer-port'
+            ]
+        if 'ssh-compression' in configuration:
+            kwargs['ssh_compression'] = configuration['ssh-compression']
+        if 'replication' in configuration:
+            replication = configuration['replication']
+            # YAML gives ``str`` for ASCII scalars.
+            kwargs['replication_hostnames'] = {
+                unicode(hostname) for hostname in replication['hostnames']
+            }
+            if 'interval' in replication:
+                kwargs['replication_interval'] = timedelta(
+                    seconds=replication['interval']
+                )
         if reactor is not None:
             kwargs['reactor'] = reactor
         return cls(**kwargs)
@@ -515,6 +613,28 @@ class AgentService(PClass):
             node_credential=self.node_credential,
         )
 
+    def _transfers_volumes(self):
+        """
+        :return: ``True`` if volumes are sent between nodes over the volume
+            transfer port rather than over SSH.
+        """
+        return (
+            self.volume_transfer_port is not None and
+            self.backend_description.deployer_type == DeployerType.p2p
+        )
+
+    def get_volume_transfer_context(self, peer_uuid=None):
+        """
+        :param UUID peer_uuid: The node connected to, or ``None`` to accept
+            connections from any node of the cluster.
+
+        :return: A TLS context factory for connections between the volume
+            transfer ports of this and other nodes.
+        """
+        return node_transfer_context_factory(
+            self.ca_certificate, self.node_credential, peer_uuid,
+        )
+
     def get_api(self):
         """
         Get an storage driver which can be used to create an ``IDeployer``.
@@ -550,8 +670,25 @@ class AgentService(PClass):
             self.control_service_host, self.control_service_port,
         )
         node_uuid = self.node_credential.uuid
+        kwargs = {}
+        if self._transfers_volumes():
+            kwargs["remote_volume_manager"] = TransferClient.using_tls(
+                self.reactor, self.get_volume_transfer_context,
+                self.volume_transfer_port,
+            ).manager
+        elif (self.ssh_compression and
+                self.backend_description.deployer_type == DeployerType.p2p):
+            kwargs["remote_volume_manager"] = partial(
+                _ssh_remote_volume_manager, compress=True
+            )
+        if (self.replication_hostnames and
+                self.backend_description.deployer_type == DeployerType.p2p):
+            kwargs["replication"] = Replication(
+                self.reactor, self.replication_hostnames,
+                self.replication_interval,
+            )
         return deployer_factory(
-            api=api, hostname=address, node_uuid=node_uuid,
+            api=api, hostname=address, node_uuid=node_uuid, **kwargs
         )
 
     def get_loop_service(self, deployer):
@@ -561,15 +698,36 @@ class AgentService(PClass):
 
         :return: An ``AgentLoopService`` which will use the given deployer to
             discover changes to send to the control service and to deploy
-            configuration changes received from the control service.
+            configuration changes received from the control service.  Where
+            the platform supports it the loop is also woken up when local
+            block devices appear or disappear.  If a volume transfer port is
+            configured the loop service also listens on it for volumes sent
+            by other nodes.
         """
-        return AgentLoopService(
+        loop_service = AgentLoopService(
             reactor=self.reactor,
             deployer=deployer,
             host=self.control_service_host, port=self.control_service_port,
             context_factory=self.get_tls_context().context_factory,
             era=get_era(),
+            publish_socket=self.cluster_state_socket,
         )
+        if device_monitor_supported():
+            DeviceMonitor(
+                self.reactor, loop_service.local_change
+            ).setServiceParent(loop_service)
+        if self._transfers_volumes():
+            StreamServerEndpointService(
+                SSL4ServerEndpoint(
+                    self.reactor, self.volume_transfer_port,
+                    self.get_volume_transfer_context(),
+                ),
+                volume_transfer_factory(
+                    self.reactor, self.reactor.getThreadPool(),
+                    deployer.volume_service,
+                ),
+            ).setServiceParent(loop_service)
+        return loop_service
 
 
 class DatasetServiceFactory(PClass):
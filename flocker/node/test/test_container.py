@@ -10,6 +10,9 @@ from pyrsistent import pset, pvector
 
 from bitmath import GiB
 
+from eliot.testing import validate_logging
+
+from twisted.internet.defer import fail
 from twisted.python.filepath import FilePath
 
 from .. import (
@@ -32,8 +35,9 @@ from .._deploy import (
     NodeLocalState,
 )
 from .._container import (
-    StartApplication, StopApplication, _link_environment
+    PullImage, StartApplication, StopApplication, _link_environment
 )
+from .. import _container
 from ...control.testtools import InMemoryStatePersister
 from ...control._model import (
     AttachedVolume, Dataset, Manifestation, PersistentState,
@@ -154,6 +158,56 @@ StopApplicationIStageChangeTests = make_istatechange_tests(
 )
 
 
+PullImageIStateChangeTests = make_istatechange_tests(
+    PullImage,
+    dict(image_name=u"clusterhq/flocker:release-14.0"),
+    dict(image_name=u"clusterhq/postgresql:9.4"),
+)
+
+
+class PullImageTests(TestCase):
+    """
+    Tests for ``PullImage``.
+    """
+    def test_pull(self):
+        """
+        ``PullImage.run`` pulls the image and records that it has been.
+        """
+        fake_docker = FakeDockerClient()
+        api = ApplicationNodeDeployer(u'example.com',
+                                      docker_client=fake_docker,
+                                      node_uuid=uuid4())
+        result = PullImage(image_name=u'clusterhq/postgresql:9.4').run(
+            api, state_persister=InMemoryStatePersister())
+        self.assertEqual(
+            (None, [u'clusterhq/postgresql:9.4'],
+             {u'clusterhq/postgresql:9.4'}),
+            (self.successResultOf(result), fake_docker.pulled,
+             api._prefetched),
+        )
+
+    @validate_logging(None)
+    def test_failed_pull_forgotten(self, logger):
+        """
+        If the pull fails ``PullImage.run`` logs it and forgets the image was
+        pulled, so that a later calculation can try again.
+        """
+        self.patch(_container, "_logger", logger)
+        fake_docker = FakeDockerClient()
+        self.patch(
+            fake_docker, "pull",
+            lambda image_name: fail(ZeroDivisionError()))
+        api = ApplicationNodeDeployer(u'example.com',
+                                      docker_client=fake_docker,
+                                      node_uuid=uuid4())
+        result = PullImage(image_name=u'clusterhq/postgresql:9.4').run(
+            api, state_persister=InMemoryStatePersister())
+        logger.flush_tracebacks(ZeroDivisionError)
+        self.assertEqual(
+            (None, set()), (self.successResultOf(result), api._prefetched),
+        )
+
+
 class StartApplicationTests(TestCase):
     """
     Tests for ``StartApplication``.
@@ -1166,6 +1220,122 @@ class ApplicationNodeDeployerCalculateChangesTests(TestCase):
                                       node_state=node_state)])])
         self.assertEqual(expected, result)
 
+    def test_prefetches_images(self):
+        """
+        ``ApplicationNodeDeployer.calculate_changes`` pulls the images of
+        applications desired on the node which aren't running and can't be
+        started yet.
+        """
+        api = ApplicationNodeDeployer(u'example.com',
+                                      docker_client=FakeDockerClient(),
+                                      node_uuid=uuid4())
+        running = Application(
+            name=u'running',
+            image=DockerImage(repository=u'clusterhq/flocker',
+                              tag=u'release-14.0')
+        )
+        manifestation = Manifestation(
+            dataset=Dataset(dataset_id=unicode(uuid4())),
+            primary=True,
+        )
+        waiting = Application(
+            name=u'waiting',
+            image=DockerImage(repository=u'clusterhq/postgresql',
+                              tag=u'9.4'),
+            volume=AttachedVolume(
+                manifestation=manifestation,
+                mountpoint=FilePath(b"/var/lib/postgresql"),
+            ),
+        )
+        desired = Deployment(nodes=[
+            Node(uuid=api.node_uuid, applications={running, waiting},
+                 manifestations={manifestation.dataset_id: manifestation}),
+        ])
+        node_state = NodeState(
+            hostname=api.hostname, uuid=api.node_uuid,
+            applications=[running], manifestations={}, devices={}, paths={})
+        result = api.calculate_changes(
+            desired_configuration=desired,
+            current_cluster_state=DeploymentState(nodes=[node_state]),
+            local_state=NodeLocalState(node_state=node_state))
+        expected = sequentially(changes=[in_parallel(changes=[
+            PullImage(image_name=u'clusterhq/postgresql:9.4'),
+        ])])
+        self.assertEqual(expected, result)
+
+    def test_prefetched_images_not_pulled_again(self):
+        """
+        ``ApplicationNodeDeployer.calculate_changes`` does not pull images
+        which ``PullImage`` has already pulled.
+        """
+        api = ApplicationNodeDeployer(u'example.com',
+                                      docker_client=FakeDockerClient(),
+                                      node_uuid=uuid4())
+        manifestation = Manifestation(
+            dataset=Dataset(dataset_id=unicode(uuid4())),
+            primary=True,
+        )
+        waiting = Application(
+            name=u'waiting',
+            image=DockerImage(repository=u'clusterhq/postgresql',
+                              tag=u'9.4'),
+            volume=AttachedVolume(
+                manifestation=manifestation,
+                mountpoint=FilePath(b"/var/lib/postgresql"),
+            ),
+        )
+        desired = Deployment(nodes=[
+            Node(uuid=api.node_uuid, applications={waiting},
+                 manifestations={manifestation.dataset_id: manifestation}),
+        ])
+        node_state = NodeState(
+            hostname=api.hostname, uuid=api.node_uuid,
+            applications=[], manifestations={}, devices={}, paths={})
+        PullImage(image_name=u'clusterhq/postgresql:9.4').run(
+            api, state_persister=InMemoryStatePersister())
+        result = api.calculate_changes(
+            desired_configuration=desired,
+            current_cluster_state=DeploymentState(nodes=[node_state]),
+            local_state=NodeLocalState(node_state=node_state))
+        self.assertEqual(
+            sequentially(changes=[], sleep_when_empty=NOOP_SLEEP_TIME),
+            result,
+        )
+
+    def test_prefetched_images_forgotten(self):
+        """
+        ``ApplicationNodeDeployer.calculate_changes`` forgets that an image
+        was pulled once its application exists or is no longer desired, so
+        that the image is pulled again if it is needed again later.
+        """
+        api = ApplicationNodeDeployer(u'example.com',
+                                      docker_client=FakeDockerClient(),
+                                      node_uuid=uuid4())
+        started = Application(
+            name=u'started',
+            image=DockerImage(repository=u'clusterhq/flocker',
+                              tag=u'release-14.0')
+        )
+        removed = Application(
+            name=u'removed',
+            image=DockerImage(repository=u'clusterhq/postgresql',
+                              tag=u'9.4'),
+        )
+        for application in (started, removed):
+            PullImage(image_name=application.image.full_name).run(
+                api, state_persister=InMemoryStatePersister())
+        desired = Deployment(nodes=[
+            Node(uuid=api.node_uuid, applications={started}),
+        ])
+        node_state = NodeState(
+            hostname=api.hostname, uuid=api.node_uuid,
+            applications=[started], manifestations={}, devices={}, paths={})
+        api.calculate_changes(
+            desired_configuration=desired,
+            current_cluster_state=DeploymentState(nodes=[node_state]),
+            local_state=NodeLocalState(node_state=node_state))
+        self.assertEqual(set(), api._prefetched)
+
     def test_only_this_node(self):
         """
         ``ApplicationNodeDeployer.calculate_changes`` does not specify
@@ -1352,13 +1522,18 @@ class ApplicationNodeDeployerCalculateChangesTests(TestCase):
             local_state=NodeLocalState(node_state=node_state)
         )
 
-        expected = sequentially(changes=[in_parallel(changes=[
-            sequentially(changes=[
-                StopApplication(application=old_postgres_app),
-                StartApplication(application=new_postgres_app,
-                                 node_state=node_state)
+        expected = sequentially(changes=[
+            in_parallel(changes=[
+                PullImage(image_name=u'docker/postgres:latest'),
+            ]),
+            in_parallel(changes=[
+                sequentially(changes=[
+                    StopApplication(application=old_postgres_app),
+                    StartApplication(application=new_postgres_app,
+                                     node_state=node_state)
                 ]),
-        ])])
+            ]),
+        ])
 
         self.assertEqual(expected, result)
 
@@ -1515,13 +1690,18 @@ class ApplicationNodeDeployerCalculateChangesTests(TestCase):
             local_state=NodeLocalState(node_state=node_state),
         )
 
-        expected = sequentially(changes=[in_parallel(changes=[
-            sequentially(changes=[
-                StopApplication(application=old_postgres_app),
-                StartApplication(application=new_postgres_app,
-                                 node_state=node_state)
+        expected = sequentially(changes=[
+            in_parallel(changes=[
+                PullImage(image_name=u'docker/postgres:latest'),
+            ]),
+            in_parallel(changes=[
+                sequentially(changes=[
+                    StopApplication(application=old_postgres_app),
+                    StartApplication(application=new_postgres_app,
+                                     node_state=node_state)
                 ]),
-        ])])
+            ]),
+        ])
 
         self.assertEqual(expected, result)
 
@@ -0,0 +1,81 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+
+"""
+Tests for ``flocker.node._device_monitor``.
+"""
+
+from unittest import skipUnless
+
+from eliot.testing import capture_logging, assertHasMessage
+
+from twisted.internet import reactor, inotify
+from twisted.internet.defer import Deferred
+from twisted.python.filepath import FilePath
+
+from ...testtools import TestCase
+from .._device_monitor import (
+    DeviceMonitor, DEVICE_CHANGED, device_monitor_supported, _is_block_device,
+)
+
+LOOP0 = FilePath(b"/dev/loop0")
+
+
+class DeviceMonitorTests(TestCase):
+    """
+    Tests for ``DeviceMonitor``.
+    """
+    def setUp(self):
+        super(DeviceMonitorTests, self).setUp()
+        self.changes = []
+        self.path = FilePath(self.mktemp())
+        self.path.makedirs()
+        self.monitor = DeviceMonitor(
+            reactor, lambda: self.changes.append(None), self.path,
+        )
+
+    def test_non_block_device_created(self):
+        """
+        Creating a node which is not a block device is not reported.
+        """
+        created = self.path.child(b"tty0")
+        created.touch()
+        self.monitor._notified(None, created, inotify.IN_CREATE)
+        self.assertEqual(self.changes, [])
+
+    @skipUnless(_is_block_device(LOOP0), "/dev/loop0 is not available.")
+    def test_block_device_created(self):
+        """
+        Creating a block device node is reported.
+        """
+        self.monitor._notified(None, LOOP0, inotify.IN_CREATE)
+        self.assertEqual(self.changes, [None])
+
+    @capture_logging(None)
+    def test_removed(self, logger):
+        """
+        Removing a node is reported and logged.
+        """
+        removed = self.path.child(b"sdf")
+        self.monitor._notified(None, removed, inotify.IN_DELETE)
+        self.assertEqual(self.changes, [None])
+        assertHasMessage(
+            self, logger, DEVICE_CHANGED,
+            dict(path=removed.path, event=u"removed"),
+        )
+
+    @skipUnless(device_monitor_supported(), "inotify is not supported.")
+    def test_watches_directory(self):
+        """
+        Once started, ``DeviceMonitor`` reports nodes removed from the
+        directory it watches.
+        """
+        removed = self.path.child(b"sdf")
+        removed.touch()
+        changed = Deferred()
+        monitor = DeviceMonitor(
+            reactor, lambda: changed.callback(None), self.path,
+        )
+        monitor.startService()
+        self.addCleanup(monitor.stopService)
+        removed.remove()
+        return changed
@@ -10,7 +10,11 @@ from pyrsistent import pset, pvector
 
 from docker.errors import APIError
 
+from eliot.testing import capture_logging, LoggedMessage, LoggedAction
+
+from twisted.internet.defer import gatherResults
 from twisted.python.filepath import FilePath
+from twisted.python.threadable import isInIOThread
 
 from ...testtools import (
     AsyncTestCase, TestCase, random_name, make_with_init_tests,
@@ -19,7 +23,9 @@ from ..testtools import add_with_port_collision_retry
 
 from .._docker import (
     IDockerClient, FakeDockerClient, AddressInUse, AlreadyExists, PortMap,
-    Unit, Environment, Volume,
+    Unit, Environment, Volume, DockerClient, LOG_LIST_TIMINGS, make_response,
+    ImageDataCache, ImageMetadataCache, LOG_PULL, LOG_PULL_PROGRESS,
+    PullFailed,
 )
 
 from ...control._model import RestartAlways, RestartNever, RestartOnFailure
@@ -195,6 +201,15 @@ def make_idockerclient_tests(fixture):
             d.addCallback(failed)
             return d
 
+        def test_pull(self):
+            """
+            ``pull()`` fires once the image is available.
+            """
+            client = fixture(self)
+            d = client.pull(ANY_IMAGE)
+            d.addCallback(self.assertIs, None)
+            return d
+
         def test_added_is_listed(self):
             """
             An added container is included in the output of ``list()``.
@@ -498,3 +513,355 @@ class VolumeInitTests(
     """
     Tests for ``Volume.__init__``.
     """
+
+
+def _container_data(name, running=True):
+    """
+    :param unicode name: The name of a container.
+    :param bool running: Whether the container is running.
+
+    :return dict: Minimal data about the container, in the format returned
+        by ``docker.Client.inspect_container``.
+    """
+    return {
+        u"Name": u"/" + name,
+        u"Image": u"sha256:abc",
+        u"State": {u"Running": running},
+        u"Config": {
+            u"Image": u"busybox:latest", u"Cmd": [u"sh"], u"Env": None,
+            u"CpuShares": 0, u"Memory": 0,
+        },
+        u"NetworkSettings": {u"Ports": None},
+        u"HostConfig": {
+            u"Binds": None,
+            u"RestartPolicy": {u"Name": u"", u"MaximumRetryCount": 0},
+        },
+    }
+
+
+class _FakeDockerPy(object):
+    """
+    The parts of ``docker.Client`` that ``DockerClient.list`` uses.
+
+    :ivar list inspected: The ids of the containers that have been inspected.
+    :ivar set missing_images: The names of images to pretend haven't been
+        pulled yet.
+    :ivar list pulled: The names of the images that have been pulled.
+    :ivar dict pull_errors: Maps the names of images to the error to report
+        while pulling them.
+    """
+    def __init__(self, names):
+        """
+        :param names: The names of the containers to pretend exist.  Each
+            container's id is its name.
+        """
+        self._names = names
+        self.inspected = []
+        self.missing_images = set()
+        self.pulled = []
+        self.pull_errors = {}
+
+    def containers(self, all=False):
+        return [{u"Id": name, u"Names": [u"/" + name]} for name in self._names]
+
+    def inspect_container(self, container_id):
+        self.inspected.append(container_id)
+        return _container_data(container_id)
+
+    def inspect_image(self, image):
+        if image in self.missing_images:
+            raise APIError("", make_response(404, "No such image"))
+        return {u"Config": {u"Cmd": [u"sh"], u"Env": None}}
+
+    def pull(self, image, stream=False, decode=False):
+        self.pulled.append(image)
+        if image in self.pull_errors:
+            return iter([
+                {u"status": u"Pulling from library/busybox", u"id": u"latest"},
+                {u"error": self.pull_errors[image]},
+            ])
+        self.missing_images.discard(image)
+        return iter([
+            {u"status": u"Pulling from library/busybox", u"id": u"latest"},
+            {u"status": u"Downloading", u"id": u"abc"},
+            {u"status": u"Downloading", u"id": u"abc"},
+            {u"status": u"Pull complete", u"id": u"abc"},
+        ])
+
+
+class DockerClientListTests(AsyncTestCase):
+    """
+    Tests for ``DockerClient.list`` which don't need a Docker server.
+    """
+    def setUp(self):
+        super(DockerClientListTests, self).setUp()
+        self.client = DockerClient(namespace=u"ns--", list_concurrency=2)
+        self.docker = _FakeDockerPy(
+            [u"ns--a", u"ns--b", u"ns--c", u"other--d"]
+        )
+        self.client._client = self.docker
+
+    def test_lists_namespace(self):
+        """
+        ``DockerClient.list`` returns a ``Unit`` for each container in its
+        namespace, without inspecting the other containers.
+        """
+        d = self.client.list()
+
+        def listed(units):
+            self.assertEqual(
+                ([u"a", u"b", u"c"], [u"ns--a", u"ns--b", u"ns--c"]),
+                (sorted(unit.name for unit in units),
+                 sorted(self.docker.inspected)),
+            )
+        return d.addCallback(listed)
+
+    def test_inspect_error(self):
+        """
+        ``DockerClient.list`` fails with the error from inspecting a
+        container, other than the container having been removed.
+        """
+        def error(container_id):
+            raise APIError("", make_response(500, "Simulated error"))
+        self.patch(self.docker, "inspect_container", error)
+        return self.assertFailure(self.client.list(), APIError)
+
+    def test_removed_container(self):
+        """
+        ``DockerClient.list`` skips containers that are removed before it
+        inspects them.
+        """
+        inspect_container = self.docker.inspect_container
+
+        def removed(container_id):
+            if container_id == u"ns--b":
+                raise APIError("", make_response(404, "No such container"))
+            return inspect_container(container_id)
+        self.patch(self.docker, "inspect_container", removed)
+        d = self.client.list()
+        d.addCallback(
+            lambda units: self.assertEqual(
+                [u"a", u"c"], sorted(unit.name for unit in units)
+            )
+        )
+        return d
+
+    @capture_logging(None)
+    def test_timings_logged(self, logger):
+        """
+        ``DockerClient.list`` logs how long each of its phases took.
+        """
+        d = self.client.list()
+
+        def listed(units):
+            [message] = LoggedMessage.of_type(
+                logger.messages, LOG_LIST_TIMINGS)
+            self.assertEqual(
+                (3, float, float),
+                (message.message[u"containers"],
+                 type(message.message[u"list_seconds"]),
+                 type(message.message[u"inspect_seconds"])),
+            )
+        return d.addCallback(listed)
+
+    def test_image_cache_persisted(self):
+        """
+        Image metadata ``DockerClient.list`` discovers is saved to the
+        ``image_cache_path`` and used by later ``DockerClient`` instances.
+        """
+        path = FilePath(self.mktemp())
+        client = DockerClient(namespace=u"ns--", image_cache_path=path)
+        client._client = self.docker
+        d = client.list()
+
+        def listed(ignored):
+            restarted = DockerClient(namespace=u"ns--", image_cache_path=path)
+            restarted._client = self.docker
+
+            def inspect_image(image):
+                raise APIError("", make_response(500, "Not cached"))
+            self.patch(self.docker, "inspect_image", inspect_image)
+            return restarted.list()
+        d.addCallback(listed)
+        d.addCallback(
+            lambda units: self.assertEqual(3, len(units))
+        )
+        return d
+
+    def test_image_cache_saved_in_thread(self):
+        """
+        ``DockerClient.list`` saves the image cache outside the reactor
+        thread.
+        """
+        client = DockerClient(
+            namespace=u"ns--", image_cache_path=FilePath(self.mktemp()),
+        )
+        client._client = self.docker
+        in_io_thread = []
+        self.patch(
+            client._image_cache, "save",
+            lambda: in_io_thread.append(isInIOThread()),
+        )
+        d = client.list()
+        d.addCallback(lambda ignored: self.assertEqual([False], in_io_thread))
+        return d
+
+
+class ImageMetadataCacheTests(TestCase):
+    """
+    Tests for ``ImageMetadataCache``.
+    """
+    data = ImageDataCache(command=[u"sh"], environment=[u"A=b"])
+
+    def test_miss(self):
+        """
+        ``ImageMetadataCache.get`` returns ``None`` for an image that has not
+        been cached and counts a miss.
+        """
+        cache = ImageMetadataCache(10)
+        self.assertEqual(
+            (None, 0, 1),
+            (cache.get(u"sha256:abc"), cache.hits, cache.misses),
+        )
+
+    def test_hit(self):
+        """
+        ``ImageMetadataCache.get`` returns the data put for an image and counts
+        a hit.
+        """
+        cache = ImageMetadataCache(10)
+        cache.put(u"sha256:abc", self.data)
+        self.assertEqual(
+            (self.data, 1, 0),
+            (cache.get(u"sha256:abc"), cache.hits, cache.misses),
+        )
+
+    def test_bounded(self):
+        """
+        ``ImageMetadataCache`` drops the least recently used image once it
+        holds more than ``size`` images.
+        """
+        cache = ImageMetadataCache(2)
+        cache.put(u"a", self.data)
+        cache.put(u"b", self.data)
+        cache.get(u"a")
+        cache.put(u"c", self.data)
+        self.assertEqual(
+            (2, self.data, None, self.data),
+            (len(cache), cache.get(u"a"), cache.get(u"b"), cache.get(u"c")),
+        )
+
+    def test_save_and_load(self):
+        """
+        A new ``ImageMetadataCache`` loads the images saved by an earlier one
+        with the same ``path``, keeping only the most recently used ones if
+        it is smaller.
+        """
+        path = FilePath(self.mktemp())
+        cache = ImageMetadataCache(10, path)
+        cache.put(u"a", self.data)
+        cache.put(u"b", self.data)
+        cache.save()
+        loaded = ImageMetadataCache(1, path)
+        self.assertEqual(
+            (None, self.data), (loaded.get(u"a"), loaded.get(u"b"))
+        )
+
+    def test_save_unchanged(self):
+        """
+        ``ImageMetadataCache.save`` doesn't write anything if nothing has been
+        put since the cache was loaded.
+        """
+        path = FilePath(self.mktemp())
+        ImageMetadataCache(10, path).save()
+        self.assertFalse(path.exists())
+
+    def test_load_corrupt(self):
+        """
+        ``ImageMetadataCache`` starts empty if its ``path`` does not contain a
+        saved cache.
+        """
+        path = FilePath(self.mktemp())
+        path.setContent(b"not json")
+        self.assertEqual(0, len(ImageMetadataCache(10, path)))
+
+
+class DockerClientPullTests(AsyncTestCase):
+    """
+    Tests for ``DockerClient.pull`` which don't need a Docker server.
+    """
+    def setUp(self):
+        super(DockerClientPullTests, self).setUp()
+        self.client = DockerClient()
+        self.docker = _FakeDockerPy([])
+        self.client._client = self.docker
+
+    def test_pull_present(self):
+        """
+        ``DockerClient.pull`` doesn't download an image which is already
+        available.
+        """
+        d = self.client.pull(u"busybox:latest")
+        d.addCallback(lambda ignored: self.assertEqual([], self.docker.pulled))
+        return d
+
+    @capture_logging(None)
+    def test_pull_missing(self, logger):
+        """
+        ``DockerClient.pull`` downloads a missing image, logging each layer's
+        progress once per stage and how long the download took.
+        """
+        self.docker.missing_images.add(u"busybox:latest")
+        d = self.client.pull(u"busybox:latest")
+
+        def pulled(ignored):
+            [action] = LoggedAction.of_type(logger.messages, LOG_PULL)
+            progress = [
+                (message.message[u"layer"], message.message[u"status"])
+                for message in LoggedMessage.of_type(
+                    logger.messages, LOG_PULL_PROGRESS)
+            ]
+            self.assertEqual(
+                ([u"busybox:latest"],
+                 [(u"latest", u"Pulling from library/busybox"),
+                  (u"abc", u"Downloading"), (u"abc", u"Pull complete")],
+                 float),
+                (self.docker.pulled, progress,
+                 type(action.end_message[u"pull_seconds"])),
+            )
+        return d.addCallback(pulled)
+
+    def test_pull_error(self):
+        """
+        ``DockerClient.pull`` fails with ``PullFailed`` if Docker reports an
+        error while downloading the image, and a later pull tries again.
+        """
+        self.docker.missing_images.add(u"busybox:latest")
+        self.docker.pull_errors[u"busybox:latest"] = u"unauthorized"
+        d = self.assertFailure(self.client.pull(u"busybox:latest"), PullFailed)
+
+        def failed(exception):
+            del self.docker.pull_errors[u"busybox:latest"]
+            return self.client.pull(u"busybox:latest")
+        d.addCallback(failed)
+        d.addCallback(
+            lambda ignored: self.assertEqual(
+                [u"busybox:latest", u"busybox:latest"], self.docker.pulled)
+        )
+        return d
+
+    def test_concurrent_pulls(self):
+        """
+        Pulling an image that is already being pulled waits for the first
+        pull instead of downloading it again.
+        """
+        self.docker.missing_images.add(u"busybox:latest")
+        d = gatherResults([
+            self.client.pull(u"busybox:latest"),
+            self.client.pull(u"busybox:latest"),
+        ])
+        d.addCallback(
+            lambda ignored: self.assertEqual(
+                [u"busybox:latest"], self.docker.pulled)
+        )
+        return d
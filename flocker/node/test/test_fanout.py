@@ -0,0 +1,223 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+
+"""
+Tests for ``flocker.node._fanout``.
+"""
+
+from uuid import uuid4
+
+from twisted.internet.error import ConnectionLost
+from twisted.internet.task import Clock
+from twisted.test.iosim import connectedServerAndClient
+
+from ...testtools import TestCase
+from ...testtools.amp import FakeAMPClient
+from ...control import Deployment, DeploymentState, NodeState
+from ...control._protocol import (
+    AgentAMP, SetNodeEraCommand, NodeStateCommand, NodeStateDiffCommand,
+    NodeStateGenerationMismatch, node_state_diff_arguments,
+)
+from ...control.testtools import make_loopback_control_client
+from ...control.test.test_protocol import FakeAgent, TEST_ACTION
+from .._fanout import ClusterStateFanOut
+
+
+class ClusterStateFanOutTests(TestCase):
+    """
+    Tests for ``ClusterStateFanOut``.
+    """
+    def setUp(self):
+        super(ClusterStateFanOutTests, self).setUp()
+        self.fan_out = ClusterStateFanOut()
+        self.upstream = FakeAMPClient()
+        self.configuration = Deployment()
+        self.state = DeploymentState(
+            nodes=[NodeState(uuid=uuid4(), hostname=u"192.0.2.1")],
+        )
+
+    def connect_local_agent(self):
+        """
+        Connect a local agent to ``self.fan_out``.
+
+        :return: A ``(FakeAgent, AgentAMP, IOPump)`` tuple.
+        """
+        agent = FakeAgent()
+        client = AgentAMP(Clock(), agent)
+        server = self.fan_out.factory().buildProtocol(None)
+        pump = connectedServerAndClient(lambda: server, lambda: client)[2]
+        pump.flush()
+        return agent, client, pump
+
+    def test_cluster_updated(self):
+        """
+        Cluster updates received from the control service are sent on to
+        connected local agents.
+        """
+        self.fan_out.connected(self.upstream)
+        agent, _, pump = self.connect_local_agent()
+        self.fan_out.cluster_updated(self.configuration, self.state)
+        pump.flush()
+        self.assertEqual(
+            (self.configuration, self.state, 1),
+            (agent.desired, agent.actual, agent.cluster_updated_count),
+        )
+
+    def test_latest_update_on_connect(self):
+        """
+        A local agent which connects after a cluster update was received is
+        sent that update.
+        """
+        self.fan_out.connected(self.upstream)
+        self.fan_out.cluster_updated(self.configuration, self.state)
+        agent, _, pump = self.connect_local_agent()
+        pump.flush()
+        self.assertEqual(
+            (self.configuration, self.state),
+            (agent.desired, agent.actual),
+        )
+
+    def test_not_connected_upstream(self):
+        """
+        A local agent which connects while the publisher is not connected to
+        the control service is disconnected.
+        """
+        agent, _, _ = self.connect_local_agent()
+        self.assertEqual(
+            (True, set()), (agent.is_disconnected, self.fan_out.connections)
+        )
+
+    def test_upstream_disconnected(self):
+        """
+        Local agents are disconnected when the publisher is disconnected from
+        the control service.
+        """
+        self.fan_out.connected(self.upstream)
+        agent, _, pump = self.connect_local_agent()
+        self.fan_out.disconnected()
+        pump.flush()
+        self.assertEqual(
+            (True, set()), (agent.is_disconnected, self.fan_out.connections)
+        )
+
+    def test_relay(self):
+        """
+        Commands sent by local agents are relayed to the control service and
+        its response is returned to them.
+        """
+        arguments = dict(era=unicode(uuid4()), node_uuid=unicode(uuid4()))
+        self.upstream.register_response(SetNodeEraCommand, arguments, {})
+        self.fan_out.connected(self.upstream)
+        _, client, pump = self.connect_local_agent()
+        d = client.callRemote(SetNodeEraCommand, **arguments)
+        pump.flush()
+        self.successResultOf(d)
+        self.assertEqual(
+            [(SetNodeEraCommand, arguments)], self.upstream.calls
+        )
+
+    def test_relay_not_connected(self):
+        """
+        ``ClusterStateFanOut.relay`` fails with ``ConnectionLost`` if the
+        publisher is not connected to the control service.
+        """
+        self.failureResultOf(
+            self.fan_out.relay(
+                SetNodeEraCommand,
+                era=unicode(uuid4()), node_uuid=unicode(uuid4()),
+            ),
+            ConnectionLost,
+        )
+
+    def test_state_diff_relayed_as_full_state(self):
+        """
+        A node state diff from a local agent is applied to the state it last
+        sent and relayed to the control service as full state.
+        """
+        self.fan_out.connected(self.upstream)
+        _, client, pump = self.connect_local_agent()
+        node_state = NodeState(uuid=uuid4(), hostname=u"192.0.2.1")
+        changed = node_state.set(hostname=u"192.0.2.2")
+        for command, arguments in [
+            (NodeStateCommand, dict(state_changes=(node_state,))),
+            (NodeStateCommand, dict(state_changes=(changed,))),
+        ]:
+            self.upstream.register_response(command, arguments, {})
+        client.callRemote(
+            NodeStateCommand, state_changes=(node_state,),
+            eliot_context=TEST_ACTION,
+        )
+        d = client.callRemote(
+            NodeStateDiffCommand, eliot_context=TEST_ACTION,
+            **node_state_diff_arguments((node_state,), (changed,))
+        )
+        pump.flush()
+        self.successResultOf(d)
+        self.assertEqual(
+            [(NodeStateCommand, dict(state_changes=(node_state,))),
+             (NodeStateCommand, dict(state_changes=(changed,)))],
+            self.upstream.calls,
+        )
+
+    def test_state_diff_mismatch(self):
+        """
+        A node state diff from a local agent which was not made against the
+        state it last sent fails with ``NodeStateGenerationMismatch`` and is
+        not relayed.
+        """
+        self.fan_out.connected(self.upstream)
+        _, client, pump = self.connect_local_agent()
+        node_state = NodeState(uuid=uuid4(), hostname=u"192.0.2.1")
+        d = client.callRemote(
+            NodeStateDiffCommand, eliot_context=TEST_ACTION,
+            **node_state_diff_arguments(
+                (node_state,), (node_state.set(hostname=u"192.0.2.2"),)
+            )
+        )
+        # The protocol drops the connection if the failure is still unhandled
+        # when it arrives:
+        d.addErrback(lambda failure: failure.trap(NodeStateGenerationMismatch))
+        pump.flush()
+        self.assertEqual(
+            (NodeStateGenerationMismatch, []),
+            (self.successResultOf(d), self.upstream.calls),
+        )
+
+    def test_two_agents_state_diffs(self):
+        """
+        Two local agents can each send their node state as full state and
+        then as diffs over the publisher's single connection to the control
+        service, which ends up with the latest state from both.
+        """
+        control_amp_service, upstream = make_loopback_control_client(
+            self, reactor=Clock(),
+        )
+        self.fan_out.connected(upstream)
+        agents = [self.connect_local_agent() for i in range(2)]
+        states = [
+            NodeState(uuid=uuid4(), hostname=u"192.0.2.1"),
+            NodeState(uuid=uuid4(), hostname=u"192.0.2.2"),
+        ]
+        changed_states = [
+            state.set(hostname=state.hostname + u"0") for state in states
+        ]
+        results = []
+        for (_, client, pump), state in zip(agents, states):
+            results.append(client.callRemote(
+                NodeStateCommand, state_changes=(state,),
+                eliot_context=TEST_ACTION,
+            ))
+            pump.flush()
+        for (_, client, pump), state, changed in zip(
+            agents, states, changed_states
+        ):
+            results.append(client.callRemote(
+                NodeStateDiffCommand, eliot_context=TEST_ACTION,
+                **node_state_diff_arguments((state,), (changed,))
+            ))
+            pump.flush()
+        for d in results:
+            self.successResultOf(d)
+        self.assertEqual(
+            DeploymentState(nodes=changed_states),
+            control_amp_service.cluster_state.as_deployment(),
+        )
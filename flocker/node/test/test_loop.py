@@ -23,6 +23,7 @@ from twisted.internet.protocol import ReconnectingClientFactory
 from twisted.internet.defer import succeed, Deferred, fail
 from twisted.internet.ssl import ClientContextFactory
 from twisted.internet.task import Clock
+from twisted.python.filepath import FilePath
 from twisted.protocols.tls import TLSMemoryBIOFactory, TLSMemoryBIOProtocol
 from twisted.protocols.amp import AMP, CommandLocator
 from twisted.test.iosim import connectedServerAndClient
@@ -31,6 +32,7 @@ from ...testtools.amp import (
     FakeAMPClient, DelayedAMPClient, connected_amp_protocol,
 )
 from ...testtools import CustomException, TestCase
+from .. import _loop
 from .._loop import (
     build_cluster_status_fsm, ClusterStatusInputs, _ClientStatusUpdate,
     _StatusUpdate, _ConnectedToControlService, ConvergenceLoopInputs,
@@ -47,7 +49,10 @@ from ...control import (
     NodeState, Deployment, Manifestation, Dataset, DeploymentState,
     Application, DockerImage, PersistentState,
 )
-from ...control._protocol import NodeStateCommand, AgentAMP, SetNodeEraCommand
+from ...control._protocol import (
+    NodeStateCommand, AgentAMP, SetNodeEraCommand, NodeStateDiffCommand,
+    NodeStateGenerationMismatch, node_state_diff_arguments,
+)
 from ...control.testtools import (
     make_istatepersister_tests,
     make_loopback_control_client,
@@ -312,7 +317,8 @@ class ConvergenceLoopFSMTests(TestCase):
     def make_amp_client(self, local_states, successes=None):
         """
         Create AMP client that can respond successfully to a
-        ``NodeStateCommand``.
+        ``NodeStateCommand``, and to a ``NodeStateDiffCommand`` from each
+        state to the next one.
 
         :param local_states: The node states we expect to be able to send.
         :param successes: List indicating whether the response to the
@@ -327,17 +333,29 @@ class ConvergenceLoopFSMTests(TestCase):
         command = NodeStateCommand
         if successes is None:
             successes = repeat(True)
+        previous_state = None
         for local_state, success in zip(local_states, successes):
             kwargs = dict(state_changes=(local_state,))
-            if success:
-                client.register_response(
-                    command=command, kwargs=kwargs, response={"result": None},
-                )
-            else:
-                client.register_response(
-                    command=command, kwargs=kwargs,
-                    response=Exception("Simulated request problem"),
-                )
+            commands = [(command, kwargs)]
+            if previous_state is not None:
+                commands.append((
+                    NodeStateDiffCommand,
+                    node_state_diff_arguments(
+                        (previous_state,), (local_state,)
+                    ),
+                ))
+            previous_state = local_state
+            for command_type, command_kwargs in commands:
+                if success:
+                    client.register_response(
+                        command=command_type, kwargs=command_kwargs,
+                        response={"result": None},
+                    )
+                else:
+                    client.register_response(
+                        command=command_type, kwargs=command_kwargs,
+                        response=Exception("Simulated request problem"),
+                    )
         return client
 
     def assert_discovery_and_send_logged(self, logger):
@@ -450,13 +468,83 @@ class ConvergenceLoopFSMTests(TestCase):
                 # Check that the loop has run twice
                 [(local_state, configuration, state),
                  (changed_local_state, configuration, changed_state)],
-                # And the state was sent twice
+                # And the state was sent twice, the second time as a diff
                 [(NodeStateCommand, dict(state_changes=(local_state,))),
-                 (NodeStateCommand,
-                  dict(state_changes=(changed_local_state,)))],
+                 (NodeStateDiffCommand,
+                  node_state_diff_arguments(
+                      (local_state,), (changed_local_state,)))],
             )
         )
 
+    def test_convergence_state_diff_fails(self):
+        """
+        If the control service cannot apply a state diff the full state is
+        sent instead.
+        """
+        local_state = NodeState(hostname=u'192.0.2.123')
+        changed_local_state = local_state.set(
+            applications=pset([Application(
+                name=u"app",
+                image=DockerImage.from_string(u"nginx"))]),
+        )
+        configuration = Deployment(nodes=[to_node(local_state)])
+        state = DeploymentState(nodes=[local_state])
+        deployer = ControllableDeployer(
+            local_state.hostname,
+            [succeed(local_state), succeed(changed_local_state)],
+            [no_action(), no_action()])
+        client = self.make_amp_client([local_state, changed_local_state])
+        diff_kwargs = node_state_diff_arguments(
+            (local_state,), (changed_local_state,))
+        client.register_response(
+            command=NodeStateDiffCommand, kwargs=diff_kwargs,
+            response=NodeStateGenerationMismatch(),
+        )
+        reactor = Clock()
+        loop = build_convergence_loop_fsm(reactor, deployer)
+        loop.receive(_ClientStatusUpdate(
+            client=client, configuration=configuration, state=state))
+        reactor.advance(_UNCONVERGED_DELAY)
+
+        self.assertEqual(
+            [(NodeStateCommand, dict(state_changes=(local_state,))),
+             (NodeStateDiffCommand, diff_kwargs),
+             (NodeStateCommand,
+              dict(state_changes=(changed_local_state,)))],
+            client.calls,
+        )
+
+    def test_convergence_no_state_diffs(self):
+        """
+        If state diffs are disabled every state change is sent to the control
+        service as full state.
+        """
+        local_state = NodeState(hostname=u'192.0.2.123')
+        changed_local_state = local_state.set(
+            applications=pset([Application(
+                name=u"app",
+                image=DockerImage.from_string(u"nginx"))]),
+        )
+        configuration = Deployment(nodes=[to_node(local_state)])
+        state = DeploymentState(nodes=[local_state])
+        deployer = ControllableDeployer(
+            local_state.hostname,
+            [succeed(local_state), succeed(changed_local_state)],
+            [no_action(), no_action()])
+        client = self.make_amp_client([local_state, changed_local_state])
+        reactor = Clock()
+        loop = build_convergence_loop_fsm(reactor, deployer, state_diffs=False)
+        loop.receive(_ClientStatusUpdate(
+            client=client, configuration=configuration, state=state))
+        reactor.advance(_UNCONVERGED_DELAY)
+
+        self.assertEqual(
+            [(NodeStateCommand, dict(state_changes=(local_state,))),
+             (NodeStateCommand,
+              dict(state_changes=(changed_local_state,)))],
+            client.calls,
+        )
+
     def test_convergence_sent_state_fail_resends(self):
         """
         If sending state to the control node fails the next iteration will send
@@ -556,6 +644,9 @@ class ConvergenceLoopFSMTests(TestCase):
                 # And that state was re-sent even though it matched the last
                 # acknowledged state
                 [(NodeStateCommand, dict(state_changes=(local_state,))),
+                 (NodeStateDiffCommand,
+                  node_state_diff_arguments(
+                      (local_state,), (changed_local_state,))),
                  (NodeStateCommand,
                   dict(state_changes=(changed_local_state,))),
                  (NodeStateCommand, dict(state_changes=(local_state,)))],
@@ -719,6 +810,56 @@ class ConvergenceLoopFSMTests(TestCase):
             dict(state=loop.state, calls=self.reactor.getDelayedCalls()),
             dict(state=ConvergenceLoopStates.STOPPED, calls=[]))
 
+    def test_local_change_while_sleeping(self):
+        """
+        When a convergence loop in the sleeping state receives a
+        ``LOCAL_CHANGE`` it starts a new iteration without waiting for the
+        sleep to finish.
+        """
+        loop = self.convergence_iteration(later_actions=[NO_OP, NO_OP])
+        loop.receive(ConvergenceLoopInputs.LOCAL_CHANGE)
+        self.assertEqual(
+            dict(calculations=len(self.deployer.calculate_inputs),
+                 state=loop.state,
+                 calls=len(self.reactor.getDelayedCalls())),
+            dict(calculations=2,
+                 state=ConvergenceLoopStates.SLEEPING,
+                 calls=1))
+
+    def test_local_change_while_converging(self):
+        """
+        When a convergence loop receives a ``LOCAL_CHANGE`` during an
+        iteration the next iteration starts without sleeping.
+        """
+        local_state = NodeState(hostname=u'192.0.2.123')
+        action = ControllableAction(result=Deferred())
+        deployer = ControllableDeployer(
+            local_state.hostname, [succeed(local_state), succeed(local_state)],
+            [action, NO_OP],
+        )
+        client = self.make_amp_client([local_state])
+        reactor = Clock()
+        loop = build_convergence_loop_fsm(reactor, deployer)
+        loop.receive(_ClientStatusUpdate(
+            client=client, configuration=Deployment(),
+            state=DeploymentState()))
+        loop.receive(ConvergenceLoopInputs.LOCAL_CHANGE)
+        action.result.callback(None)
+        reactor.advance(0)
+        self.assertEqual(len(deployer.calculate_inputs), 2)
+
+    def test_local_change_while_stopped(self):
+        """
+        A stopped convergence loop ignores ``LOCAL_CHANGE``.
+        """
+        deployer = ControllableDeployer(u"192.168.1.1", [], [])
+        reactor = Clock()
+        loop = build_convergence_loop_fsm(reactor, deployer)
+        loop.receive(ConvergenceLoopInputs.LOCAL_CHANGE)
+        self.assertEqual(
+            dict(state=loop.state, calls=reactor.getDelayedCalls()),
+            dict(state=ConvergenceLoopStates.STOPPED, calls=[]))
+
     def test_convergence_iteration_status_update_no_consequences(self):
         """
         When a convergence loop in the sleeping state receives a status update
@@ -1287,6 +1428,17 @@ class AgentLoopServiceTests(TestCase):
             fsm.inputted,
             [ClusterStatusInputs.DISCONNECTED_FROM_CONTROL_SERVICE])
 
+    def test_local_change(self):
+        """
+        When ``local_change()`` is called a ``LOCAL_CHANGE`` input is passed to
+        the convergence loop FSM.
+        """
+        service = self.service
+        service.convergence_loop = fsm = StubFSM()
+        service.local_change()
+        self.assertEqual(
+            fsm.inputted, [ConvergenceLoopInputs.LOCAL_CHANGE])
+
     def test_cluster_updated(self):
         """
         When ``cluster_updated()`` is called a ``_StatusUpdate`` input is
@@ -1318,6 +1470,83 @@ class AgentLoopServiceTests(TestCase):
                          [_StatusUpdate(configuration=config,
                                         state=state.set(nodes=[]))])
 
+    def test_subscribe(self):
+        """
+        If a subscribe socket is given, starting the service connects to it
+        instead of to the control service, without TLS.
+        """
+        path = FilePath(self.mktemp())
+        service = AgentLoopService(
+            reactor=self.reactor, deployer=self.deployer,
+            host=u"example.com", port=1234,
+            context_factory=ClientContextFactory(), era=uuid4(),
+            subscribe_socket=path,
+        )
+        service.startService()
+        self.addCleanup(service.stopService)
+        address, factory = self.reactor.unixClients[0][:2]
+        self.assertEqual(
+            (address, factory, [], AgentAMP),
+            (path.path, service.reconnecting_factory, self.reactor.tcpClients,
+             factory.buildProtocol(None).__class__),
+        )
+
+    def test_publish(self):
+        """
+        If a publish socket is given, the service listens on it and sends the
+        cluster updates it receives on to the agents that connect there.
+        """
+        path = FilePath(self.mktemp())
+        service = AgentLoopService(
+            reactor=self.reactor, deployer=self.deployer,
+            host=u"example.com", port=1234,
+            context_factory=ClientContextFactory(), era=uuid4(),
+            publish_socket=path,
+        )
+        service.cluster_status = StubFSM()
+        service.fan_out = fan_out = StubFanOut()
+        service.startService()
+        self.addCleanup(service.stopService)
+        config = Deployment()
+        state = DeploymentState(nodes=[self.node_state])
+        service.cluster_updated(config, state)
+        self.assertEqual(
+            (path.path, [(config, state)]),
+            (self.reactor.unixServers[0][0], fan_out.updates),
+        )
+
+    def test_publish_no_state_diffs(self):
+        """
+        If a publish socket is given, the service's convergence loop does not
+        send state diffs, since the agents it relays for send state over the
+        same connection.
+        """
+        used = []
+
+        def build(reactor, deployer, state_diffs=True):
+            used.append(state_diffs)
+            return build_convergence_loop_fsm(reactor, deployer, state_diffs)
+        self.patch(_loop, "build_convergence_loop_fsm", build)
+        for publish_socket in [FilePath(self.mktemp()), None]:
+            AgentLoopService(
+                reactor=self.reactor, deployer=self.deployer,
+                host=u"example.com", port=1234,
+                context_factory=ClientContextFactory(), era=uuid4(),
+                publish_socket=publish_socket,
+            )
+        self.assertEqual([False, True], used)
+
+
+class StubFanOut(object):
+    """
+    A stand-in for ``ClusterStateFanOut`` which records cluster updates.
+    """
+    def __init__(self):
+        self.updates = []
+
+    def cluster_updated(self, configuration, cluster_state):
+        self.updates.append((configuration, cluster_state))
+
 
 def _build_service(test):
     """
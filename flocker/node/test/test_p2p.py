@@ -12,7 +12,8 @@ from pytz import UTC
 
 from eliot.testing import validate_logging
 
-from twisted.internet.defer import fail, Deferred
+from twisted.internet.defer import fail, succeed, Deferred
+from twisted.internet.task import Clock
 from twisted.python.filepath import FilePath
 
 from .. import (
@@ -31,7 +32,7 @@ from .._deploy import (
 )
 from .._p2p import (
     CreateDataset, HandoffDataset, PushDataset, ResizeDataset,
-    _to_volume_name, DeleteDataset
+    _to_volume_name, DeleteDataset, ReplicateDataset, Replication,
 )
 from ...testtools import AsyncTestCase, TestCase, CustomException
 from .. import _p2p
@@ -40,6 +41,7 @@ from ...control._model import (
 )
 from ...volume.service import VolumeName
 from ...volume._model import VolumeSize
+from ...volume.filesystems.zfs import Snapshot
 from ...volume.testtools import create_volume_service
 from ...volume._ipc import RemoteVolumeManager, standard_node
 
@@ -86,6 +88,7 @@ DISCOVERED_APPLICATION_WITH_VOLUME = APPLICATION_WITH_VOLUME
 
 _DATASET_A = Dataset(dataset_id=unicode(uuid4()))
 _DATASET_B = Dataset(dataset_id=unicode(uuid4()))
+_NODE_UUID = uuid4()
 
 
 CreateDatasetIStateChangeTests = make_istatechange_tests(
@@ -95,13 +98,18 @@ CreateDatasetIStateChangeTests = make_istatechange_tests(
 )
 HandoffVolumeIStateChangeTests = make_istatechange_tests(
     HandoffDataset,
-    dict(dataset=_DATASET_A, hostname=b"123"),
-    dict(dataset=_DATASET_B, hostname=b"123")
+    dict(dataset=_DATASET_A, hostname=b"123", node_uuid=_NODE_UUID),
+    dict(dataset=_DATASET_B, hostname=b"123", node_uuid=_NODE_UUID)
 )
 PushVolumeIStateChangeTests = make_istatechange_tests(
     PushDataset,
-    dict(dataset=_DATASET_A, hostname=b"123"),
-    dict(dataset=_DATASET_B, hostname=b"123")
+    dict(dataset=_DATASET_A, hostname=b"123", node_uuid=_NODE_UUID),
+    dict(dataset=_DATASET_B, hostname=b"123", node_uuid=_NODE_UUID)
+)
+ReplicateDatasetIStateChangeTests = make_istatechange_tests(
+    ReplicateDataset,
+    dict(dataset=_DATASET_A, hostname=b"123", node_uuid=_NODE_UUID),
+    dict(dataset=_DATASET_B, hostname=b"123", node_uuid=_NODE_UUID)
 )
 DeleteDatasetTests = make_istatechange_tests(
     DeleteDataset,
@@ -347,7 +355,8 @@ class P2PManifestationDeployerLeaseTests(TestCase):
         expected = sequentially(changes=[
             in_parallel(changes=[HandoffDataset(
                 dataset=MANIFESTATION.dataset,
-                hostname=self.NODE_HOSTNAMES[self.NODE_ID])]),
+                hostname=self.NODE_HOSTNAMES[self.NODE_ID],
+                node_uuid=self.NODE_ID)]),
         ])
         self.assertEqual(expected, changes)
 
@@ -556,7 +565,8 @@ class P2PManifestationDeployerCalculateChangesTests(TestCase):
         expected = sequentially(changes=[
             in_parallel(changes=[HandoffDataset(
                 dataset=volume.dataset,
-                hostname=another_node_state.hostname)]),
+                hostname=another_node_state.hostname,
+                node_uuid=another_node_state.uuid)]),
         ])
         self.assertEqual(expected, changes)
 
@@ -787,7 +797,8 @@ class P2PManifestationDeployerCalculateChangesTests(TestCase):
             in_parallel(
                 changes=[HandoffDataset(
                     dataset=dataset,
-                    hostname=u'node2.example.com')]
+                    hostname=u'node2.example.com',
+                    node_uuid=current_nodes[1].uuid)]
             )])
         self.assertEqual(expected, changes)
 
@@ -825,6 +836,357 @@ class P2PManifestationDeployerCalculateChangesTests(TestCase):
         self.assertEqual(expected, changes)
 
 
+class ReplicationTests(TestCase):
+    """
+    Tests for ``Replication``.
+    """
+    def setUp(self):
+        super(ReplicationTests, self).setUp()
+        self.clock = Clock()
+        self.clock.advance(1000)
+        self.replication = Replication(
+            self.clock, [u"10.0.0.2", u"10.0.0.1"], timedelta(seconds=60),
+        )
+
+    def test_due_initially(self):
+        """
+        A dataset which has not been pushed yet is due to be pushed to every
+        node.
+        """
+        self.assertEqual(
+            [u"10.0.0.1", u"10.0.0.2"], self.replication.due(DATASET_ID)
+        )
+
+    def test_not_due_within_interval(self):
+        """
+        A dataset is not due to be pushed to a node again until the interval
+        has passed since the last push to it started.
+        """
+        self.replication.started(DATASET_ID, u"10.0.0.1")
+        self.clock.advance(59)
+        due_early = self.replication.due(DATASET_ID)
+        self.clock.advance(1)
+        self.assertEqual(
+            ([u"10.0.0.2"], [u"10.0.0.1", u"10.0.0.2"]),
+            (due_early, self.replication.due(DATASET_ID)),
+        )
+
+    def test_replicated_at(self):
+        """
+        ``Replication.replicated_at`` reports when the oldest copy of each
+        dataset pushed to every other node was taken, and nothing for
+        datasets which have not been.
+        """
+        first = self.replication.started(DATASET_ID, u"10.0.0.1")
+        self.clock.advance(10)
+        second = self.replication.started(DATASET_ID, u"10.0.0.2")
+        self.replication.started(_DATASET_A.dataset_id, u"10.0.0.2")
+        self.clock.advance(5)
+        self.replication.replicated(DATASET_ID, u"10.0.0.1", first, [])
+        self.replication.replicated(DATASET_ID, u"10.0.0.2", second, [])
+        replicated_at = self.replication.replicated_at(
+            [DATASET_ID, _DATASET_A.dataset_id], u"10.0.0.3")
+        self.clock.advance(5)
+        self.assertEqual(
+            ({DATASET_ID: 1000.0}, replicated_at),
+            (replicated_at,
+             self.replication.replicated_at(
+                 [DATASET_ID, _DATASET_A.dataset_id], u"10.0.0.3")),
+        )
+
+    def test_replicated_at_excludes_local(self):
+        """
+        ``Replication.replicated_at`` does not wait for datasets to be pushed
+        to the local node.
+        """
+        started = self.replication.started(DATASET_ID, u"10.0.0.2")
+        self.replication.replicated(DATASET_ID, u"10.0.0.2", started, [])
+        self.assertEqual(
+            {DATASET_ID: 1000.0},
+            self.replication.replicated_at([DATASET_ID], u"10.0.0.1"),
+        )
+
+    def test_base_snapshot(self):
+        """
+        ``Replication.base_snapshot`` returns the oldest of the latest
+        snapshots on the other nodes.
+        """
+        snapshots = [Snapshot(name=name) for name in [b"a", b"b", b"c"]]
+        self.replication.replicated(
+            DATASET_ID, u"10.0.0.1", 0, [Snapshot(name=b"c")])
+        self.replication.replicated(
+            DATASET_ID, u"10.0.0.2", 0, snapshots[:2])
+        self.assertEqual(
+            Snapshot(name=b"b"),
+            self.replication.base_snapshot(
+                DATASET_ID, snapshots, u"10.0.0.3"),
+        )
+
+    def test_base_snapshot_unknown(self):
+        """
+        ``Replication.base_snapshot`` returns ``None`` if the latest snapshot
+        on one of the other nodes is not known or no longer exists locally.
+        """
+        snapshots = [Snapshot(name=name) for name in [b"a", b"b"]]
+        self.replication.replicated(
+            DATASET_ID, u"10.0.0.1", 0, [Snapshot(name=b"b")])
+        not_pushed = self.replication.base_snapshot(
+            DATASET_ID, snapshots, u"10.0.0.3")
+        self.replication.replicated(
+            DATASET_ID, u"10.0.0.2", 0, [Snapshot(name=b"x")])
+        self.assertEqual(
+            (None, None),
+            (not_pushed,
+             self.replication.base_snapshot(
+                 DATASET_ID, snapshots, u"10.0.0.3")),
+        )
+
+
+class P2PManifestationDeployerReplicationTests(TestCase):
+    """
+    Tests for ``P2PManifestationDeployer`` with periodic replication.
+    """
+    def setUp(self):
+        super(P2PManifestationDeployerReplicationTests, self).setUp()
+        self.clock = Clock()
+        self.node_state = NodeState(
+            hostname=u"10.1.1.1",
+            uuid=uuid4(),
+            manifestations={MANIFESTATION.dataset_id: MANIFESTATION},
+            devices={}, paths={},
+            applications=[],
+        )
+        self.other_node_state = NodeState(hostname=u"10.1.2.3", uuid=uuid4())
+        self.volume_service = create_volume_service(self)
+        self.deployer = P2PManifestationDeployer(
+            self.node_state.hostname, self.volume_service,
+            node_uuid=self.node_state.uuid,
+            replication=Replication(
+                self.clock, [u"10.1.1.1", u"10.1.2.3"],
+                timedelta(seconds=60),
+            ),
+        )
+
+    def calculate_changes(self, manifestation=MANIFESTATION,
+                          other_nodes=None):
+        """
+        Calculate changes for a node which owns ``MANIFESTATION`` and is
+        configured to have the given manifestation.
+
+        :param other_nodes: The ``NodeState``\ s of the other nodes in the
+            cluster.  By default there is one, at ``10.1.2.3``.
+        """
+        if other_nodes is None:
+            other_nodes = [self.other_node_state]
+        current = DeploymentState(nodes=[self.node_state] + other_nodes)
+        desired = Deployment(nodes=[
+            Node(hostname=self.deployer.hostname,
+                 uuid=self.deployer.node_uuid,
+                 manifestations={manifestation.dataset_id: manifestation})])
+        return self.deployer.calculate_changes(
+            desired, current, NodeLocalState(node_state=self.node_state))
+
+    def test_replicate(self):
+        """
+        ``P2PManifestationDeployer.calculate_changes`` pushes locally-owned
+        datasets which are due to be replicated to the other replication
+        nodes.
+        """
+        self.assertEqual(
+            sequentially(changes=[
+                in_parallel(changes=[
+                    ReplicateDataset(dataset=DATASET, hostname=u"10.1.2.3",
+                                     node_uuid=self.other_node_state.uuid),
+                ]),
+            ]),
+            self.calculate_changes(),
+        )
+
+    def test_unknown_node_not_replicated(self):
+        """
+        ``P2PManifestationDeployer.calculate_changes`` does not push datasets
+        to a replication node which has not reported its state, since it
+        cannot tell which node to expect at that address.
+        """
+        self.assertEqual(NO_CHANGES, self.calculate_changes(other_nodes=[]))
+
+    def test_not_due(self):
+        """
+        ``P2PManifestationDeployer.calculate_changes`` does not push datasets
+        which are not due to be replicated.
+        """
+        self.deployer.replication.started(DATASET_ID, u"10.1.2.3")
+        self.assertEqual(NO_CHANGES, self.calculate_changes())
+
+    def test_deleted_not_replicated(self):
+        """
+        ``P2PManifestationDeployer.calculate_changes`` does not push datasets
+        which are being deleted.
+        """
+        changes = self.calculate_changes(
+            MANIFESTATION.transform(["dataset", "deleted"], True)
+        )
+        self.assertEqual(
+            sequentially(changes=[
+                in_parallel(changes=[
+                    DeleteDataset(dataset=DATASET.set("deleted", True)),
+                ]),
+            ]),
+            changes,
+        )
+
+    def test_discover_replicated_at(self):
+        """
+        ``P2PManifestationDeployer.discover_state`` reports when the node's
+        datasets were last replicated to every other node.
+        """
+        self.successResultOf(self.volume_service.create(
+            self.volume_service.get(_to_volume_name(DATASET_ID))
+        ))
+        self.clock.advance(3)
+        started = self.deployer.replication.started(DATASET_ID, u"10.1.2.3")
+        self.deployer.replication.replicated(
+            DATASET_ID, u"10.1.2.3", started, [])
+        self.clock.advance(3)
+        node_state = self.successResultOf(self.deployer.discover_state(
+            DeploymentState(nodes={self.node_state}),
+            persistent_state=PersistentState(),
+        )).node_state
+        self.assertEqual({DATASET_ID: 3.0}, node_state.replicated_at)
+
+
+class _SnapshotsDestination(object):
+    """
+    A stand-in for the ``IRemoteVolumeManager`` of the node datasets are
+    replicated to, which reports that it has the source's latest snapshot.
+
+    :ivar source: The source ``Volume``.
+    """
+    def __init__(self, source):
+        self.source = source
+
+    def snapshots(self, volume):
+        listing = self.source.get_filesystem().snapshots()
+        listing.addCallback(lambda snapshots: snapshots[-1:])
+        return listing
+
+
+class ReplicateDatasetTests(TestCase):
+    """
+    Tests for ``ReplicateDataset``.
+    """
+    def setUp(self):
+        super(ReplicateDatasetTests, self).setUp()
+        self.clock = Clock()
+        self.volume_service = create_volume_service(self)
+        self.volume = self.successResultOf(self.volume_service.create(
+            self.volume_service.get(_to_volume_name(DATASET_ID))
+        ))
+        self.hostname = u"10.1.2.3"
+        self.node_uuid = uuid4()
+        self.destination = _SnapshotsDestination(self.volume)
+        self.deployer = P2PManifestationDeployer(
+            u"10.1.1.1", self.volume_service,
+            remote_volume_manager=lambda hostname, node_uuid: (
+                self.destination),
+            replication=Replication(
+                self.clock, [u"10.1.1.1", self.hostname],
+                timedelta(seconds=1)),
+        )
+        self.snapshots = iter(range(1000))
+
+    def push(self, volume, destination):
+        """
+        Pretend to push a volume, taking a snapshot of it as a real push
+        would.
+        """
+        volume.get_filesystem().snapshot(b"%d" % (next(self.snapshots),))
+        return succeed(None)
+
+    def test_run(self):
+        """
+        ``ReplicateDataset.run()`` pushes the named volume to the given node
+        and records that it was replicated once the push succeeds.
+        """
+        pushed = []
+        result = Deferred()
+
+        def _push(volume, destination):
+            pushed.extend([volume, destination])
+            return result
+        self.patch(self.volume_service, "push", _push)
+        replicate = ReplicateDataset(
+            dataset=DATASET, hostname=self.hostname, node_uuid=self.node_uuid)
+        d = replicate.run(
+            self.deployer, state_persister=InMemoryStatePersister())
+        self.clock.advance(2)
+        while_pushing = self.deployer.replication.replicated_at(
+            [DATASET_ID], u"10.1.1.1")
+        result.callback(None)
+        self.successResultOf(d)
+        self.assertEqual(
+            ([self.volume, self.destination], {}, {DATASET_ID: 0.0}),
+            (pushed, while_pushing,
+             self.deployer.replication.replicated_at(
+                 [DATASET_ID], u"10.1.1.1")),
+        )
+
+    def test_snapshots_bounded(self):
+        """
+        ``ReplicateDataset.run()`` destroys the local snapshots which are
+        older than the latest one on every other node, so they do not pile
+        up however often the dataset is replicated.
+        """
+        self.patch(self.volume_service, "push", self.push)
+        replicate = ReplicateDataset(
+            dataset=DATASET, hostname=self.hostname, node_uuid=self.node_uuid)
+        for _ in range(5):
+            self.successResultOf(replicate.run(
+                self.deployer, state_persister=InMemoryStatePersister()))
+        self.assertEqual(
+            [Snapshot(name=b"4")],
+            self.successResultOf(self.volume.get_filesystem().snapshots()),
+        )
+
+    @validate_logging(None)
+    def test_prune_failure_logged(self, logger):
+        """
+        ``ReplicateDataset.run()`` still succeeds if destroying older
+        snapshots fails, logging the failure instead.
+        """
+        self.patch(_p2p, "_logger", logger)
+        self.patch(self.volume_service, "push", self.push)
+        filesystem_type = type(self.volume.get_filesystem())
+        self.patch(
+            filesystem_type, "destroy_snapshots_before",
+            lambda filesystem, snapshot: fail(CustomException()))
+        replicate = ReplicateDataset(
+            dataset=DATASET, hostname=self.hostname, node_uuid=self.node_uuid)
+        self.successResultOf(replicate.run(
+            self.deployer, state_persister=InMemoryStatePersister()))
+        logger.flush_tracebacks(CustomException)
+
+    def test_ssh_destination(self):
+        """
+        By default ``ReplicateDataset.run()`` pushes volumes over SSH.
+        """
+        pushed = []
+
+        def _push(volume, destination):
+            pushed.append(destination)
+            return Deferred()
+        self.patch(self.volume_service, "push", _push)
+        deployer = P2PManifestationDeployer(
+            u"10.1.1.1", self.volume_service,
+            replication=self.deployer.replication,
+        )
+        ReplicateDataset(
+            dataset=DATASET, hostname=self.hostname, node_uuid=self.node_uuid,
+        ).run(deployer, state_persister=InMemoryStatePersister())
+        self.assertEqual(
+            [RemoteVolumeManager(standard_node(self.hostname))], pushed)
+
+
 class CreateDatasetTests(TestCase):
     """
     Tests for ``CreateDataset``.
@@ -984,6 +1346,7 @@ class HandoffVolumeTests(TestCase):
         """
         volume_service = create_volume_service(self)
         hostname = b"dest.example.com"
+        node_uuid = uuid4()
 
         result = []
 
@@ -994,7 +1357,7 @@ class HandoffVolumeTests(TestCase):
             u'example.com', volume_service)
         handoff = HandoffDataset(
             dataset=APPLICATION_WITH_VOLUME.volume.dataset,
-            hostname=hostname)
+            hostname=hostname, node_uuid=node_uuid)
         handoff.run(
             deployer, state_persister=InMemoryStatePersister())
         self.assertEqual(
@@ -1002,6 +1365,31 @@ class HandoffVolumeTests(TestCase):
             [volume_service.get(_to_volume_name(DATASET.dataset_id)),
              RemoteVolumeManager(standard_node(hostname))])
 
+    def test_remote_volume_manager(self):
+        """
+        ``HandoffVolume.run()`` hands off the volume to the
+        ``IRemoteVolumeManager`` which the deployer's
+        ``remote_volume_manager`` returns for the destination.
+        """
+        volume_service = create_volume_service(self)
+        hostname = b"dest.example.com"
+        node_uuid = uuid4()
+
+        result = []
+
+        def _handoff(volume, destination):
+            result.append(destination)
+        self.patch(volume_service, "handoff", _handoff)
+        deployer = P2PManifestationDeployer(
+            u'example.com', volume_service,
+            remote_volume_manager=lambda host, uuid: (u"manager", host, uuid))
+        handoff = HandoffDataset(
+            dataset=APPLICATION_WITH_VOLUME.volume.dataset,
+            hostname=hostname, node_uuid=node_uuid)
+        handoff.run(
+            deployer, state_persister=InMemoryStatePersister())
+        self.assertEqual([(u"manager", hostname, node_uuid)], result)
+
     def test_return(self):
         """
         ``HandoffVolume.run()`` returns the result of
@@ -1015,7 +1403,7 @@ class HandoffVolumeTests(TestCase):
             u'example.com', volume_service)
         handoff = HandoffDataset(
             dataset=APPLICATION_WITH_VOLUME.volume.dataset,
-            hostname=b"dest.example.com")
+            hostname=b"dest.example.com", node_uuid=uuid4())
         handoff_result = handoff.run(
             deployer, state_persister=InMemoryStatePersister())
         self.assertIs(handoff_result, result)
@@ -1042,7 +1430,7 @@ class PushVolumeTests(TestCase):
             u'example.com', volume_service)
         push = PushDataset(
             dataset=APPLICATION_WITH_VOLUME.volume.dataset,
-            hostname=hostname)
+            hostname=hostname, node_uuid=uuid4())
         push.run(
             deployer, state_persister=InMemoryStatePersister())
         self.assertEqual(
@@ -1063,7 +1451,7 @@ class PushVolumeTests(TestCase):
             u'example.com', volume_service)
         push = PushDataset(
             dataset=APPLICATION_WITH_VOLUME.volume.dataset,
-            hostname=b"dest.example.com")
+            hostname=b"dest.example.com", node_uuid=uuid4())
         push_result = push.run(
             deployer, state_persister=InMemoryStatePersister())
         self.assertIs(push_result, result)
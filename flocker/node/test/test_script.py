@@ -9,6 +9,7 @@ import logging
 import socket
 from unittest import skipUnless
 from uuid import uuid4
+from datetime import timedelta
 
 import yaml
 from ipaddr import IPAddress
@@ -24,6 +25,7 @@ from zope.interface.verify import verifyObject
 from twisted.internet.defer import Deferred
 from twisted.python.filepath import FilePath
 from twisted.application.service import Service
+from twisted.application.internet import StreamServerEndpointService
 from twisted.python.runtime import platform
 from twisted.python.usage import UsageError
 
@@ -42,8 +44,11 @@ from ..script import (
 from ..backends import BackendDescription, LOOPBACK, ZFS
 
 from .._loop import AgentLoopService
+from .._device_monitor import DeviceMonitor, device_monitor_supported
 from ...testtools import MemoryCoreReactor, TestCase, random_name
 from ...ca.testtools import get_credential_sets
+from ...volume._transfer import TransferRemoteVolumeManager
+from ...volume._ipc import RemoteVolumeManager, standard_node
 
 from .dummybackend import DUMMY_API
 
@@ -258,6 +263,32 @@ class AgentServiceFromConfigurationTests(TestCase):
             ),
         )
 
+    def test_replication(self):
+        """
+        Replication hostnames loaded from YAML, which gives ``str`` for ASCII
+        scalars, are used as ``unicode``.
+        """
+        config = yaml.safe_load(
+            b"control-service:\n"
+            b"  hostname: 192.0.2.13\n"
+            b"  port: 2314\n"
+            b"dataset:\n"
+            b"  backend: zfs\n"
+            b"replication:\n"
+            b"  hostnames: [10.0.0.2, 10.0.0.3]\n"
+            b"  interval: 30\n"
+        )
+        config.update({'node-credential': None, 'ca-certificate': None})
+        agent_service = AgentService.from_configuration(config)
+        self.assertEqual(
+            ({u"10.0.0.2", u"10.0.0.3"}, [unicode, unicode],
+             timedelta(seconds=30)),
+            (set(agent_service.replication_hostnames),
+             [type(hostname)
+              for hostname in agent_service.replication_hostnames],
+             agent_service.replication_interval),
+        )
+
     @_restore_logging(log_name='flocker.test')
     def test_logging(self, log_name):
         """
@@ -551,6 +582,85 @@ class AgentServiceDeployerTests(TestCase):
             deployer,
         )
 
+    def test_replication(self):
+        """
+        If replication hostnames are configured for a peer-to-peer backend,
+        ``AgentService.get_deployer`` gives the deployer a ``Replication``
+        which pushes datasets to them at the configured interval.
+        """
+        class Deployer(PClass):
+            api = field(mandatory=True)
+            hostname = field(mandatory=True)
+            node_uuid = field(mandatory=True)
+            replication = field(mandatory=True)
+
+        agent_service = self.agent_service.set(
+            get_external_ip=lambda host, port: b"192.0.2.7",
+            backend_description=ZFS,
+            deployers={DeployerType.p2p: Deployer},
+            replication_hostnames=[u"192.0.2.8"],
+            replication_interval=timedelta(seconds=30),
+        )
+        deployer = agent_service.get_deployer(object())
+        self.assertEqual(
+            (frozenset([u"192.0.2.8"]), timedelta(seconds=30)),
+            (deployer.replication.hostnames, deployer.replication.interval),
+        )
+
+    def test_volume_transfer_port(self):
+        """
+        If a volume transfer port is configured for a peer-to-peer backend,
+        ``AgentService.get_deployer`` gives the deployer a
+        ``remote_volume_manager`` which sends volumes to that port on other
+        nodes, only accepting the node it was asked for.
+        """
+        class Deployer(PClass):
+            api = field(mandatory=True)
+            hostname = field(mandatory=True)
+            node_uuid = field(mandatory=True)
+            remote_volume_manager = field(mandatory=True)
+
+        agent_service = self.agent_service.set(
+            get_external_ip=lambda host, port: b"192.0.2.7",
+            backend_description=ZFS,
+            deployers={DeployerType.p2p: Deployer},
+            volume_transfer_port=4526,
+        )
+        deployer = agent_service.get_deployer(object())
+        peer_uuid = uuid4()
+        manager = deployer.remote_volume_manager(b"192.0.2.8", peer_uuid)
+        endpoint = manager._client._endpoint_factory(b"192.0.2.8", peer_uuid)
+        self.assertEqual(
+            (TransferRemoteVolumeManager, b"192.0.2.8", 4526,
+             b"node-" + bytes(peer_uuid)),
+            (manager.__class__, manager._hostname, endpoint._port,
+             endpoint._sslContextFactory.common_name),
+        )
+
+    def test_ssh_compression(self):
+        """
+        If SSH compression is configured for a peer-to-peer backend,
+        ``AgentService.get_deployer`` gives the deployer a
+        ``remote_volume_manager`` which compresses volumes sent over SSH.
+        """
+        class Deployer(PClass):
+            api = field(mandatory=True)
+            hostname = field(mandatory=True)
+            node_uuid = field(mandatory=True)
+            remote_volume_manager = field(mandatory=True)
+
+        agent_service = self.agent_service.set(
+            get_external_ip=lambda host, port: b"192.0.2.7",
+            backend_description=ZFS,
+            deployers={DeployerType.p2p: Deployer},
+            ssh_compression=True,
+        )
+        deployer = agent_service.get_deployer(object())
+        self.assertEqual(
+            RemoteVolumeManager(standard_node(b"192.0.2.8", compress=True)),
+            deployer.remote_volume_manager(b"192.0.2.8", uuid4()),
+        )
+
 
 class AgentServiceLoopTests(TestCase):
     """
@@ -582,6 +692,72 @@ class AgentServiceLoopTests(TestCase):
             loop_service,
         )
 
+    @skipUnless(device_monitor_supported(), "inotify is not supported.")
+    def test_device_monitor(self):
+        """
+        The ``AgentLoopService`` returned by ``AgentService.get_loop_service``
+        has a ``DeviceMonitor`` child which reports device changes to it.
+        """
+        loop_service = self.agent_service.get_loop_service(object())
+        [monitor] = list(loop_service)
+        self.assertEqual(
+            (DeviceMonitor, self.reactor, loop_service.local_change),
+            (monitor.__class__, monitor.reactor, monitor.changed),
+        )
+
+    def test_cluster_state_socket(self):
+        """
+        The ``AgentLoopService`` returned by ``AgentService.get_loop_service``
+        publishes cluster state on the ``AgentService``'s cluster state
+        socket.
+        """
+        path = FilePath(self.mktemp())
+        agent_service = self.agent_service.set(cluster_state_socket=path)
+        loop_service = agent_service.get_loop_service(object())
+        self.assertEqual(path, loop_service.publish_socket)
+
+    def test_volume_transfer_port(self):
+        """
+        If a volume transfer port is configured for a peer-to-peer backend,
+        the ``AgentLoopService`` returned by ``AgentService.get_loop_service``
+        has a child service which listens on that port with TLS and receives
+        volumes into the deployer's volume service.
+        """
+        threadpool = object()
+        self.reactor.getThreadPool = lambda: threadpool
+
+        class Deployer(PClass):
+            volume_service = field()
+        deployer = Deployer(volume_service=object())
+        agent_service = self.agent_service.set(
+            backend_description=ZFS, volume_transfer_port=4526,
+        )
+        loop_service = agent_service.get_loop_service(deployer)
+        [server] = [
+            child for child in loop_service
+            if isinstance(child, StreamServerEndpointService)
+        ]
+        locator = server.factory.buildProtocol(None)._transfer_locator
+        self.assertEqual(
+            (4526, self.reactor, threadpool, deployer.volume_service),
+            (server.endpoint._port, server.endpoint._reactor,
+             locator._threadpool, locator._service),
+        )
+
+    def test_no_volume_transfer_port(self):
+        """
+        Without a configured volume transfer port the ``AgentLoopService``
+        returned by ``AgentService.get_loop_service`` does not listen for
+        volumes.
+        """
+        agent_service = self.agent_service.set(backend_description=ZFS)
+        loop_service = agent_service.get_loop_service(object())
+        self.assertEqual(
+            [],
+            [child for child in loop_service
+             if isinstance(child, StreamServerEndpointService)],
+        )
+
 
 class AgentServiceFactoryTests(TestCase):
     """
@@ -926,6 +1102,88 @@ class ValidateConfigurationTests(TestCase):
         # Nothing is raised
         validate_configuration(self.configuration)
 
+    def test_cluster_state_socket(self):
+        """
+        A path for the cluster state socket may be given.
+        """
+        self.configuration['cluster-state-socket'] = u"/var/run/flocker.sock"
+        # Nothing is raised
+        validate_configuration(self.configuration)
+
+    def test_error_on_invalid_cluster_state_socket(self):
+        """
+        A ``ValidationError`` is raised if the cluster state socket is not a
+        string.
+        """
+        self.configuration['cluster-state-socket'] = 1234
+        self.assertRaises(
+            ValidationError, validate_configuration, self.configuration)
+
+    def test_volume_transfer_port(self):
+        """
+        A port for receiving volumes from other nodes may be given.
+        """
+        self.configuration['volume-transfer-port'] = 4526
+        # Nothing is raised
+        validate_configuration(self.configuration)
+
+    def test_error_on_invalid_volume_transfer_port(self):
+        """
+        A ``ValidationError`` is raised if the volume transfer port is not a
+        valid TCP port number.
+        """
+        self.configuration['volume-transfer-port'] = 65536
+        self.assertRaises(
+            ValidationError, validate_configuration, self.configuration)
+
+    def test_ssh_compression(self):
+        """
+        Volumes sent to other nodes over SSH may be compressed.
+        """
+        self.configuration['ssh-compression'] = True
+        # Nothing is raised
+        validate_configuration(self.configuration)
+
+    def test_error_on_invalid_ssh_compression(self):
+        """
+        A ``ValidationError`` is raised if SSH compression is not a boolean.
+        """
+        self.configuration['ssh-compression'] = u"yes"
+        self.assertRaises(
+            ValidationError, validate_configuration, self.configuration)
+
+    def test_replication(self):
+        """
+        Nodes to periodically push datasets to, and how often, may be given.
+        """
+        self.configuration['replication'] = {
+            u"hostnames": [u"10.0.0.2", u"10.0.0.3"],
+            u"interval": 30,
+        }
+        # Nothing is raised
+        validate_configuration(self.configuration)
+
+    def test_error_on_invalid_replication_interval(self):
+        """
+        A ``ValidationError`` is raised if the replication interval is not
+        positive.
+        """
+        self.configuration['replication'] = {
+            u"hostnames": [u"10.0.0.2"],
+            u"interval": 0,
+        }
+        self.assertRaises(
+            ValidationError, validate_configuration, self.configuration)
+
+    def test_error_on_replication_without_hostnames(self):
+        """
+        A ``ValidationError`` is raised if replication is configured without
+        any hostnames.
+        """
+        self.configuration['replication'] = {u"interval": 30}
+        self.assertRaises(
+            ValidationError, validate_configuration, self.configuration)
+
     def test_error_on_invalid_configuration_type(self):
         """
         A ``ValidationError`` is raised if the config file is not formatted
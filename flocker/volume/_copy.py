@@ -0,0 +1,115 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+# -*- test-case-name: flocker.volume.test.test_copy -*-
+
+"""
+Copy volume data between the processes which send and receive it.
+
+Volume data usually flows from one process's stdout pipe (``zfs send``) into
+another's stdin pipe (``ssh`` or ``zfs receive``).  Where the platform allows
+it, ``splice(2)`` moves that data between the pipes inside the kernel rather
+than reading it into Python strings only to write it out again.  Either way
+the copy is blocking, so it should happen outside the reactor thread; the
+blocking writes are also what stops a fast sender from outrunning a slow
+receiver.
+"""
+
+import os
+from ctypes import (
+    CDLL, c_int, c_size_t, c_ssize_t, c_uint, c_void_p, get_errno,
+)
+from ctypes.util import find_library
+from errno import EINTR
+from stat import S_ISFIFO
+
+from twisted.python.runtime import platform
+
+CHUNK_SIZE = 1024 * 1024
+
+_SPLICE_F_MOVE = 1
+_SPLICE_F_MORE = 4
+
+
+def _load_splice():
+    """
+    :return: ``splice(2)`` from the C library, or ``None`` if it is not
+        available.
+    """
+    if not platform.isLinux():
+        return None
+    try:
+        libc = CDLL(find_library("c"), use_errno=True)
+        splice = libc.splice
+    except (OSError, AttributeError):
+        return None
+    splice.argtypes = [
+        c_int, c_void_p, c_int, c_void_p, c_size_t, c_uint,
+    ]
+    splice.restype = c_ssize_t
+    return splice
+
+_splice = _load_splice()
+
+
+def _pipe_descriptor(stream):
+    """
+    :param stream: A file-like object.
+
+    :return: The file descriptor of ``stream`` if it is a pipe, otherwise
+        ``None``.
+    """
+    try:
+        fd = stream.fileno()
+    except (AttributeError, IOError, ValueError):
+        # No descriptor at all, e.g. ``BytesIO``.
+        return None
+    if S_ISFIFO(os.fstat(fd).st_mode):
+        return fd
+    return None
+
+
+def _splice_all(source, destination):
+    """
+    Move everything readable from one pipe into another with ``splice(2)``.
+
+    :param int source: The file descriptor to read from.
+    :param int destination: The file descriptor to write to.
+
+    :return: The number of bytes moved.
+    """
+    flags = _SPLICE_F_MOVE | _SPLICE_F_MORE
+    total = 0
+    while True:
+        moved = _splice(source, None, destination, None, CHUNK_SIZE, flags)
+        if moved == 0:
+            return total
+        if moved < 0:
+            errno = get_errno()
+            if errno == EINTR:
+                continue
+            raise OSError(errno, os.strerror(errno))
+        total += moved
+
+
+def copy_stream(source, destination):
+    """
+    Copy all of the data from one file-like object to another, blocking until
+    ``source`` reaches end of file.
+
+    :param source: A file-like object to read from.
+    :param destination: A file-like object to write to.
+
+    :return: The number of bytes copied.
+    """
+    if _splice is not None:
+        source_fd = _pipe_descriptor(source)
+        destination_fd = _pipe_descriptor(destination)
+        if source_fd is not None and destination_fd is not None:
+            # Anything already buffered by the file object has to go first
+            # or it would end up after the spliced data:
+            destination.flush()
+            return _splice_all(source_fd, destination_fd)
+    total = 0
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        destination.write(chunk)
+        total += len(chunk)
+    return total
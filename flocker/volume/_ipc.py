@@ -21,7 +21,7 @@ from twisted.internet.defer import succeed
 from twisted.python.filepath import FilePath
 
 from ..common._ipc import ProcessNode
-from .service import DEFAULT_CONFIG_PATH
+from .service import DEFAULT_CONFIG_PATH, Volume
 from .filesystems.zfs import Snapshot
 
 
@@ -32,7 +32,7 @@ from .filesystems.zfs import Snapshot
 SSH_PRIVATE_KEY_PATH = FilePath(b"/etc/flocker/id_rsa_flocker")
 
 
-def standard_node(hostname):
+def standard_node(hostname, compress=False):
     """
     Create the default production ``INode`` for the given hostname.
 
@@ -40,9 +40,13 @@ def standard_node(hostname):
     and authenticates using the cluster private key.
 
     :param bytes hostname: The host to connect to.
+    :param bool compress: Whether SSH should compress the data sent, which
+        helps on slow links but costs CPU time on fast ones.
     :return: A ``INode`` that can connect to the given hostname using SSH.
     """
-    return ProcessNode.using_ssh(hostname, 22, b"root", SSH_PRIVATE_KEY_PATH)
+    return ProcessNode.using_ssh(
+        hostname, 22, b"root", SSH_PRIVATE_KEY_PATH, compress=compress
+    )
 
 
 class IRemoteVolumeManager(Interface):
@@ -60,6 +64,29 @@ class IRemoteVolumeManager(Interface):
             ordered from oldest to newest.
         """
 
+    def resume_token(volume):
+        """
+        Find out whether an earlier push of the given volume was interrupted
+        part way through.
+
+        :param Volume volume: The volume which will be pushed to the remote
+            volume manager.
+
+        :return: A ``Deferred`` that fires with the ``bytes`` token for
+            resuming the interrupted push, or ``None``.
+        """
+
+    def abort_receive(volume):
+        """
+        Discard what the remote volume manager kept of an interrupted push of
+        the given volume, so that the next push starts afresh.
+
+        :param Volume volume: The volume which was being pushed to the
+            remote volume manager.
+
+        :return: A ``Deferred`` that fires when it has been discarded.
+        """
+
     def receive(volume):
         """
         Context manager that returns a file-like object to which a volume's
@@ -79,7 +106,8 @@ class IRemoteVolumeManager(Interface):
         :param Volume volume: The volume which will be acquired by the
             remote volume manager.
 
-        :return: The node ID of the remote volume manager (as ``unicode``).
+        :return: The node ID of the remote volume manager (as ``unicode``),
+            or a ``Deferred`` that fires with it.
         """
 
     def clone_to(parent, name):
@@ -128,6 +156,32 @@ class RemoteVolumeManager(object):
             in data.splitlines()
         ])
 
+    def resume_token(self, volume):
+        """
+        Run ``flocker-volume resume_token`` on the destination.
+        """
+        data = self._destination.get_output(
+            [b"flocker-volume",
+             b"--config", self._config_path.path,
+             b"resume_token",
+             volume.node_id.encode("ascii"),
+             volume.name.to_bytes()]
+        )
+        return succeed(data.strip() or None)
+
+    def abort_receive(self, volume):
+        """
+        Run ``flocker-volume abort_receive`` on the destination.
+        """
+        self._destination.get_output(
+            [b"flocker-volume",
+             b"--config", self._config_path.path,
+             b"abort_receive",
+             volume.node_id.encode("ascii"),
+             volume.name.to_bytes()]
+        )
+        return succeed(None)
+
     def receive(self, volume):
         return self._destination.run([b"flocker-volume",
                                       b"--config", self._config_path.path,
@@ -171,6 +225,25 @@ class LocalVolumeManager(object):
         """
         return volume.get_filesystem().snapshots()
 
+    def resume_token(self, volume):
+        """
+        Interrogate the service's copy of the volume's filesystem.
+        """
+        local = Volume(
+            node_id=volume.node_id, name=volume.name, service=self._service
+        )
+        return succeed(local.get_filesystem().resume_token())
+
+    def abort_receive(self, volume):
+        """
+        Discard the service's copy of the volume's interrupted receive.
+        """
+        local = Volume(
+            node_id=volume.node_id, name=volume.name, service=self._service
+        )
+        local.get_filesystem().abort_receive()
+        return succeed(None)
+
     @contextmanager
     def receive(self, volume):
         input_file = BytesIO()
@@ -0,0 +1,624 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+# -*- test-case-name: flocker.volume.test.test_transfer -*-
+
+"""
+A volume data transfer service which node agents run for each other.
+
+Rather than starting an SSH session for each step of a push (listing
+snapshots, receiving the data stream, acquiring the volume) the pushing agent
+keeps one AMP connection open to each peer and sends all of them over it.  In
+production the connection is TLS, with both ends authenticated by their
+cluster node certificates (see ``flocker.ca.node_transfer_context_factory``);
+the pushing agent also checks that the certificate is for the node it means to
+push to.
+
+Any number of data streams can be in progress at once over one connection;
+each is identified by a transfer number allocated by the receiver.
+"""
+
+import os
+from itertools import count
+from threading import Semaphore
+from contextlib import contextmanager
+
+from zope.interface import implementer
+
+from eliot import Logger, writeFailure
+
+from twisted.internet.abstract import FileDescriptor
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.endpoints import SSL4ClientEndpoint, connectProtocol
+from twisted.internet.error import ConnectionLost
+from twisted.internet.fdesc import setNonBlocking, writeToFD
+from twisted.internet.interfaces import IPullProducer
+from twisted.internet.protocol import ServerFactory
+from twisted.internet.threads import blockingCallFromThread, deferToThreadPool
+from twisted.python.failure import Failure
+from twisted.protocols.amp import (
+    AMP, Boolean, Command, CommandLocator, Integer, ListOf, String, Unicode,
+)
+
+from ._ipc import IRemoteVolumeManager
+from .filesystems.zfs import Snapshot
+from .service import Volume, VolumeName
+
+
+# AMP values are limited to 64KiB:
+_CHUNK_SIZE = 60 * 1024
+
+# How many chunks of one stream may be on their way to the receiver at once.
+_WINDOW = 16
+
+DEFAULT_VOLUME_TRANSFER_PORT = 4526
+
+
+class _VolumeCommand(Command):
+    """
+    A command about one volume, identified by its owner's node ID and its
+    name (as returned by ``VolumeName.to_bytes``).
+    """
+    arguments = [
+        (b"node_id", Unicode()),
+        (b"name", String()),
+    ]
+
+
+class SnapshotsCommand(_VolumeCommand):
+    """
+    List the snapshots of a volume, oldest first.
+    """
+    response = [(b"snapshots", ListOf(String()))]
+
+
+class ResumeTokenCommand(_VolumeCommand):
+    """
+    Get the token for resuming an interrupted receive of a volume.
+    """
+    response = [(b"token", String(optional=True))]
+
+
+class AbortReceiveCommand(_VolumeCommand):
+    """
+    Discard what was kept of an interrupted receive of a volume.
+    """
+    response = []
+
+
+class StartReceiveCommand(_VolumeCommand):
+    """
+    Start receiving a data stream for a volume.
+    """
+    response = [(b"transfer", Integer())]
+    errors = {ValueError: b"VALUE_ERROR"}
+
+
+class ReceiveDataCommand(Command):
+    """
+    The next part of a data stream.
+    """
+    arguments = [
+        (b"transfer", Integer()),
+        (b"data", String()),
+    ]
+    response = []
+
+
+class FinishReceiveCommand(Command):
+    """
+    The end of a data stream.  The response is sent once the data has been
+    written to the volume.
+    """
+    arguments = [
+        (b"transfer", Integer()),
+        # Whether the sender gave up part way through:
+        (b"abort", Boolean()),
+    ]
+    response = []
+
+
+class AcquireCommand(_VolumeCommand):
+    """
+    Take ownership of a volume.
+    """
+    response = [(b"node_id", Unicode())]
+
+
+class CloneToCommand(_VolumeCommand):
+    """
+    Clone a volume to a new one.
+    """
+    arguments = _VolumeCommand.arguments + [(b"child_name", String())]
+    response = []
+
+
+class _PipeWriter(FileDescriptor):
+    """
+    The write end of a pipe, written to from the reactor without blocking.
+    """
+    def __init__(self, reactor, fd):
+        FileDescriptor.__init__(self, reactor)
+        setNonBlocking(fd)
+        self._fd = fd
+        self.connected = True
+
+    def fileno(self):
+        return self._fd
+
+    def writeSomeData(self, data):
+        return writeToFD(self._fd, data)
+
+    def connectionLost(self, reason):
+        FileDescriptor.connectionLost(self, reason)
+        os.close(self._fd)
+
+
+@implementer(IPullProducer)
+class _Receive(object):
+    """
+    One data stream being received.
+
+    The stream is written to a pipe from the reactor, and
+    ``VolumeService.receive`` reads it from the other end in a thread.  Only
+    that one thread is needed per stream, so streams waiting for a thread
+    cannot hold up the ones that have one.
+
+    :ivar _PipeWriter _pipe: The pipe to write the stream to.  This is its
+        producer, so that it is told when everything written has been
+        written out.
+    :ivar list _drained: ``Deferred``\ s to fire once everything written so
+        far has been written out.
+    :ivar Deferred _receiving: Fires when ``VolumeService.receive`` returns.
+    """
+    def __init__(self, reactor, threadpool, service, node_id, name):
+        read_fd, write_fd = os.pipe()
+        self._drained = []
+        self._pipe = _PipeWriter(reactor, write_fd)
+        self._pipe.registerProducer(self, False)
+        self._receiving = deferToThreadPool(
+            reactor, threadpool,
+            self._receive, service, node_id, name, os.fdopen(read_fd, "rb", 0)
+        )
+
+    @staticmethod
+    def _receive(service, node_id, name, pipe):
+        with pipe:
+            return service.receive(node_id, name, pipe)
+
+    def resumeProducing(self):
+        """
+        Everything written so far has been written to the pipe.
+        """
+        drained, self._drained = self._drained, []
+        for waiting in drained:
+            waiting.callback(None)
+
+    def stopProducing(self):
+        """
+        The pipe was closed, e.g. because the receiving thread stopped
+        reading it.
+        """
+        drained, self._drained = self._drained, []
+        for waiting in drained:
+            waiting.errback(ConnectionLost())
+
+    def write(self, data):
+        """
+        Write the next part of the stream.
+
+        :return: ``Deferred`` that fires once it has been written to the pipe.
+        """
+        if not self._pipe.connected:
+            return fail(ConnectionLost())
+        writing = Deferred()
+        self._drained.append(writing)
+        self._pipe.write(data)
+        return writing
+
+    def finish(self):
+        """
+        End the stream.
+
+        :return: ``Deferred`` that fires once the stream has been received.
+        """
+        self._pipe.unregisterProducer()
+        # The pipe is closed once what was written has been written out:
+        self._pipe.loseConnection()
+        return self._receiving
+
+
+class VolumeTransferLocator(CommandLocator):
+    """
+    Responders for the volume transfer commands, on behalf of the local
+    ``VolumeService``.
+
+    :ivar dict _receives: ``_Receive`` instances for the streams in progress,
+        keyed by transfer number.
+    """
+    logger = Logger()
+
+    def __init__(self, reactor, threadpool, service):
+        """
+        :param reactor: The reactor to use.
+        :param threadpool: The ``ThreadPool`` to receive volume data in.
+        :param VolumeService service: The volume manager to act on.
+        """
+        CommandLocator.__init__(self)
+        self._reactor = reactor
+        self._threadpool = threadpool
+        self._service = service
+        self._receives = {}
+        self._counter = count()
+
+    def _volume(self, node_id, name):
+        return Volume(
+            node_id=node_id, name=VolumeName.from_bytes(name),
+            service=self._service,
+        )
+
+    @SnapshotsCommand.responder
+    def snapshots(self, node_id, name):
+        listing = self._volume(node_id, name).get_filesystem().snapshots()
+        listing.addCallback(
+            lambda snapshots: {
+                b"snapshots": [snapshot.name for snapshot in snapshots]
+            }
+        )
+        return listing
+
+    @ResumeTokenCommand.responder
+    def resume_token(self, node_id, name):
+        filesystem = self._volume(node_id, name).get_filesystem()
+        token = filesystem.resume_token()
+        if token is None:
+            return {}
+        return {b"token": token}
+
+    @AbortReceiveCommand.responder
+    def abort_receive(self, node_id, name):
+        self._volume(node_id, name).get_filesystem().abort_receive()
+        return {}
+
+    @StartReceiveCommand.responder
+    def start_receive(self, node_id, name):
+        if node_id == self._service.node_id:
+            # Don't even start; VolumeService.receive would refuse.
+            raise ValueError()
+        transfer = next(self._counter)
+        self._receives[transfer] = _Receive(
+            self._reactor, self._threadpool, self._service,
+            node_id, VolumeName.from_bytes(name),
+        )
+        return {b"transfer": transfer}
+
+    @ReceiveDataCommand.responder
+    def receive_data(self, transfer, data):
+        writing = self._receives[transfer].write(data)
+        return writing.addCallback(lambda _: {})
+
+    @FinishReceiveCommand.responder
+    def finish_receive(self, transfer, abort):
+        finishing = self._receives.pop(transfer).finish()
+        if abort:
+            # The sender already knows it failed; a partial stream is left
+            # for the filesystem to resume or discard.
+            finishing.addErrback(
+                writeFailure, self.logger,
+                u"flocker:volume:transfer:abort",
+            )
+        return finishing.addCallback(lambda _: {})
+
+    @AcquireCommand.responder
+    def acquire(self, node_id, name):
+        acquiring = self._service.acquire(node_id, VolumeName.from_bytes(name))
+        return acquiring.addCallback(
+            lambda _: {b"node_id": self._service.node_id}
+        )
+
+    @CloneToCommand.responder
+    def clone_to(self, node_id, name, child_name):
+        cloning = self._service.clone_to(
+            self._volume(node_id, name), VolumeName.from_bytes(child_name)
+        )
+        return cloning.addCallback(lambda _: {})
+
+    def abort_all(self):
+        """
+        End all the streams in progress, e.g. because the connection they
+        were being sent over was lost.
+        """
+        receives, self._receives = self._receives, {}
+        for receive in receives.values():
+            receive.finish().addErrback(
+                writeFailure, self.logger,
+                u"flocker:volume:transfer:abort",
+            )
+
+
+class _VolumeTransferServerProtocol(AMP):
+    """
+    The receiving side of a volume transfer connection.
+    """
+    def __init__(self, locator):
+        AMP.__init__(self, locator=locator)
+        self._transfer_locator = locator
+
+    def connectionLost(self, reason):
+        AMP.connectionLost(self, reason)
+        self._transfer_locator.abort_all()
+
+
+def volume_transfer_factory(reactor, threadpool, service):
+    """
+    Create a factory for the receiving side of volume transfer connections.
+
+    :param reactor: The reactor to use.
+    :param threadpool: The ``ThreadPool`` to receive volume data in.
+    :param VolumeService service: The volume manager to act on.
+
+    :return: A ``ServerFactory``.
+    """
+    return ServerFactory.forProtocol(
+        lambda: _VolumeTransferServerProtocol(
+            VolumeTransferLocator(reactor, threadpool, service)
+        )
+    )
+
+
+class _TransferWriter(object):
+    """
+    A file-like object, for use outside the reactor thread, which sends the
+    data written to it as part of one data stream.
+
+    Up to ``_WINDOW`` chunks may be awaiting acknowledgement by the receiver
+    at once; beyond that ``write`` blocks.
+    """
+    def __init__(self, reactor, protocol, transfer):
+        self._reactor = reactor
+        self._protocol = protocol
+        self._transfer = transfer
+        self._window = Semaphore(_WINDOW)
+        self._failure = None
+
+    def write(self, data):
+        for start in range(0, len(data), _CHUNK_SIZE):
+            self._window.acquire()
+            self._check()
+            self._reactor.callFromThread(
+                self._send, data[start:start + _CHUNK_SIZE]
+            )
+
+    def _send(self, chunk):
+        sending = self._protocol.callRemote(
+            ReceiveDataCommand, transfer=self._transfer, data=chunk
+        )
+        sending.addErrback(self._failed)
+        sending.addBoth(lambda _: self._window.release())
+
+    def _failed(self, failure):
+        if self._failure is None:
+            self._failure = failure
+
+    def _check(self):
+        """
+        :raise: The reason the receiver rejected a chunk, if it did.
+        """
+        if self._failure is not None:
+            self._failure.raiseException()
+
+    def flush(self):
+        """
+        Wait until the receiver has acknowledged everything written so far.
+        """
+        for _ in range(_WINDOW):
+            self._window.acquire()
+        for _ in range(_WINDOW):
+            self._window.release()
+        self._check()
+
+
+@implementer(IRemoteVolumeManager)
+class TransferRemoteVolumeManager(object):
+    """
+    Communicate with the volume manager of a node over a volume transfer
+    connection.
+
+    ``receive`` blocks on the reactor, so it must be used outside the
+    reactor thread; ``VolumeService`` does so when it has a threadpool.
+    """
+    def __init__(self, client, hostname, node_uuid):
+        """
+        :param TransferClient client: The client to connect with.
+        :param bytes hostname: The node to connect to.
+        :param UUID node_uuid: The UUID of that node.
+        """
+        self._client = client
+        self._hostname = hostname
+        self._node_uuid = node_uuid
+
+    def __eq__(self, other):
+        if not isinstance(other, TransferRemoteVolumeManager):
+            return NotImplemented
+        return (self._client, self._hostname, self._node_uuid) == (
+            other._client, other._hostname, other._node_uuid)
+
+    def __ne__(self, other):
+        if not isinstance(other, TransferRemoteVolumeManager):
+            return NotImplemented
+        return not self == other
+
+    def _call(self, command, volume, **kwargs):
+        return self._client.call(
+            self._hostname, self._node_uuid, command,
+            node_id=volume.node_id, name=volume.name.to_bytes(), **kwargs
+        )
+
+    def snapshots(self, volume):
+        listing = self._call(SnapshotsCommand, volume)
+        listing.addCallback(
+            lambda response: [
+                Snapshot(name=name) for name in response[b"snapshots"]
+            ]
+        )
+        return listing
+
+    def resume_token(self, volume):
+        getting = self._call(ResumeTokenCommand, volume)
+        return getting.addCallback(lambda response: response.get(b"token"))
+
+    def abort_receive(self, volume):
+        aborting = self._call(AbortReceiveCommand, volume)
+        return aborting.addCallback(lambda _: None)
+
+    @contextmanager
+    def receive(self, volume):
+        reactor = self._client.reactor
+        protocol = blockingCallFromThread(
+            reactor, self._client.connect, self._hostname, self._node_uuid
+        )
+        response = blockingCallFromThread(
+            reactor, protocol.callRemote, StartReceiveCommand,
+            node_id=volume.node_id, name=volume.name.to_bytes(),
+        )
+        transfer = response[b"transfer"]
+        writer = _TransferWriter(reactor, protocol, transfer)
+        try:
+            yield writer
+            writer.flush()
+        except:
+            blockingCallFromThread(
+                reactor, protocol.callRemote, FinishReceiveCommand,
+                transfer=transfer, abort=True,
+            )
+            raise
+        blockingCallFromThread(
+            reactor, protocol.callRemote, FinishReceiveCommand,
+            transfer=transfer, abort=False,
+        )
+
+    def acquire(self, volume):
+        acquiring = self._call(AcquireCommand, volume)
+        return acquiring.addCallback(lambda response: response[b"node_id"])
+
+    def clone_to(self, parent, name):
+        return self._call(CloneToCommand, parent, child_name=name.to_bytes())
+
+
+class TransferClient(object):
+    """
+    Keep one volume transfer connection open to each node data has been
+    pushed to.
+
+    :ivar reactor: The reactor to use.
+    :ivar _endpoint_factory: Called with the hostname and UUID of a node to
+        get the ``IStreamClientEndpoint`` to connect to it with.
+    :ivar dict _connections: The ``AMP`` connection to each node, keyed by
+        hostname and UUID.
+    :ivar dict _connecting: ``list``\ s of ``Deferred``\ s waiting for each
+        connection attempt in progress, keyed by hostname and UUID.
+    """
+    def __init__(self, reactor, endpoint_factory):
+        self.reactor = reactor
+        self._endpoint_factory = endpoint_factory
+        self._connections = {}
+        self._connecting = {}
+
+    @classmethod
+    def using_tls(cls, reactor, context_factory,
+                  port=DEFAULT_VOLUME_TRANSFER_PORT):
+        """
+        Create a client which connects with TLS.
+
+        :param reactor: The reactor to use.
+        :param context_factory: Called with the UUID of a node to get the TLS
+            context factory which only accepts that node, typically
+            ``flocker.ca.node_transfer_context_factory`` with its
+            ``peer_uuid``.
+        :param int port: The port nodes listen for transfers on.
+        """
+        return cls(
+            reactor,
+            lambda hostname, node_uuid: SSL4ClientEndpoint(
+                reactor, hostname, port, context_factory(node_uuid)
+            ),
+        )
+
+    def manager(self, hostname, node_uuid):
+        """
+        :param bytes hostname: A node.
+        :param UUID node_uuid: The UUID of that node.
+
+        :return: A ``TransferRemoteVolumeManager`` for that node.
+        """
+        return TransferRemoteVolumeManager(self, hostname, node_uuid)
+
+    def connect(self, hostname, node_uuid):
+        """
+        Get a connection to a node, making a new one if there isn't one
+        already.
+
+        :param bytes hostname: The node to connect to.
+        :param UUID node_uuid: The UUID of that node.
+
+        :return: ``Deferred`` that fires with the ``AMP`` protocol.
+        """
+        node = (hostname, node_uuid)
+        if node in self._connections:
+            return succeed(self._connections[node])
+        waiting = Deferred()
+        if node not in self._connecting:
+            self._connecting[node] = []
+            connecting = connectProtocol(
+                self._endpoint_factory(hostname, node_uuid),
+                _ClientProtocol(lambda: self._connections.pop(node, None)),
+            )
+
+            def connected(result):
+                if not isinstance(result, Failure):
+                    self._connections[node] = result
+                for waiter in self._connecting.pop(node):
+                    if isinstance(result, Failure):
+                        waiter.errback(result)
+                    else:
+                        waiter.callback(result)
+            connecting.addBoth(connected)
+        self._connecting[node].append(waiting)
+        return waiting
+
+    def call(self, hostname, node_uuid, command, **kwargs):
+        """
+        Run a command on a node.
+
+        :param bytes hostname: The node to run it on.
+        :param UUID node_uuid: The UUID of that node.
+        :param command: The ``Command`` to run.
+        :param kwargs: Its arguments.
+
+        :return: ``Deferred`` that fires with the response.
+        """
+        connecting = self.connect(hostname, node_uuid)
+        return connecting.addCallback(
+            lambda protocol: protocol.callRemote(command, **kwargs)
+        )
+
+    def disconnect(self):
+        """
+        Close all the connections.
+        """
+        for protocol in self._connections.values():
+            protocol.transport.loseConnection()
+
+
+class _ClientProtocol(AMP):
+    """
+    The pushing side of a volume transfer connection.
+    """
+    def __init__(self, lost):
+        """
+        :param lost: Called with no arguments when the connection is lost.
+        """
+        AMP.__init__(self)
+        self._lost = lost
+
+    def connectionLost(self, reason):
+        AMP.connectionLost(self, reason)
+        self._lost()
@@ -70,7 +70,36 @@ class IFilesystem(Interface):
             which exist of this filesystem.
         """
 
-    def reader(remote_snapshots=None):
+    def destroy_snapshots_before(snapshot):
+        """
+        Destroy the snapshots of this filesystem which are older than the
+        given one.
+
+        :param Snapshot snapshot: The oldest snapshot to keep.
+
+        :return: A ``Deferred`` that fires when the snapshots have been
+            destroyed.
+        """
+
+    def resume_token():
+        """
+        Find out whether a data stream written to this filesystem was
+        interrupted part way through.
+
+        :return: ``bytes`` which can be passed as the ``resume_token`` of
+            :meth:`IFilesystem.reader` on the reading side to generate the
+            rest of the interrupted stream, or ``None`` if there is nothing
+            to resume.
+        """
+
+    def abort_receive():
+        """
+        Discard what was kept of a data stream whose writing to this
+        filesystem was interrupted, so that a new stream can be written
+        instead of the rest of that one.
+        """
+
+    def reader(remote_snapshots=None, resume_token=None):
         """
         Context manager that allows reading the contents of the filesystem.
 
@@ -83,6 +112,9 @@ class IFilesystem(Interface):
             incremental data stream may be generated based on one of these if
             possible.  If no value is passed then a complete data stream will
             be generated.
+        :param bytes resume_token: The writer's
+            :meth:`IFilesystem.resume_token`.  If given, only the remainder
+            of the interrupted stream is generated.
 
         :return: A file-like object from whom the filesystem's data can be
             read as ``bytes``.
@@ -101,11 +101,38 @@ class DirectoryFilesystem(object):
                 snapshot.name for snapshot in self._snapshots()] + [name])
         )
 
+    def destroy_snapshots_before(self, snapshot):
+        """
+        Forget the pretend snapshots taken before the given one.
+        """
+        snapshots = self._snapshots()
+        if snapshot in snapshots:
+            self.get_path().child(b".snapshots").setContent(
+                b"\n".join(
+                    kept.name
+                    for kept in snapshots[snapshots.index(snapshot):]
+                )
+            )
+        return succeed(None)
+
+    def resume_token(self):
+        """
+        Writes are never partially applied, so there is nothing to resume.
+        """
+        return None
+
+    def abort_receive(self):
+        """
+        Writes are never partially applied, so there is nothing to discard.
+        """
+
     @contextmanager
-    def reader(self, remote_snapshots=None):
+    def reader(self, remote_snapshots=None, resume_token=None):
         """
         Package up filesystem contents as a tarball.
         """
+        if resume_token is not None:
+            raise ValueError("Unknown resume token", resume_token)
         result = BytesIO()
         tarball = TarFile(fileobj=result, mode="w")
         for child in self.path.children():
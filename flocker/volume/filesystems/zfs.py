@@ -8,12 +8,13 @@ from __future__ import absolute_import
 
 import os
 from contextlib import contextmanager
+from threading import Lock
 from uuid import uuid4
 from subprocess import (
     CalledProcessError, STDOUT, PIPE, Popen, check_call, check_output
 )
 
-from characteristic import attributes, with_cmp, with_repr
+from characteristic import Attribute, attributes, with_cmp, with_repr
 
 from zope.interface import implementer
 
@@ -127,6 +128,45 @@ def _sync_command_error_squashed(arguments, logger):
         message.write(logger)
 
 
+# The options supported by each ``zfs`` sub-command, as found by
+# ``_zfs_flags``.
+_flags_cache = {}
+
+
+def _zfs_flags(subcommand):
+    """
+    Find the single letter options a ``zfs`` sub-command supports.
+
+    ``zfs`` has no way to ask which features it has, but run without
+    arguments a sub-command prints a usage message listing its options.  The
+    result is cached for the life of the process.
+
+    :param bytes subcommand: The sub-command, e.g. ``b"send"``.
+
+    :return: A ``set`` of the option letters as ``bytes``.
+    """
+    if subcommand not in _flags_cache:
+        try:
+            process = Popen(
+                [b"zfs", subcommand], stdout=PIPE, stderr=STDOUT
+            )
+            output = process.communicate()[0]
+        except OSError:
+            output = b""
+        flags = set()
+        for line in output.splitlines():
+            words = line.split()
+            if words[:1] != [subcommand]:
+                continue
+            for word in words[1:]:
+                # e.g. ``[-DnPpRvLec]``, ``-t`` or ``[-o``:
+                word = word.strip(b"[]")
+                if word.startswith(b"-") and word[1:].isalpha():
+                    flags.update(word[1:])
+        _flags_cache[subcommand] = flags
+    return _flags_cache[subcommand]
+
+
 @attributes(["name"])
 class Snapshot(object):
     """
@@ -170,8 +210,10 @@ class Filesystem(object):
     filesystem.  This will likely grow into a more sophisticiated
     implementation over time.
     """
+    logger = Logger()
+
     def __init__(self, pool, dataset, mountpoint=None, size=None,
-                 reactor=None):
+                 reactor=None, index=None, compressed_send=False):
         """
         :param pool: The filesystem's pool name, e.g. ``b"hpool"``.
 
@@ -182,6 +224,14 @@ class Filesystem(object):
             filesystem is mounted.
 
         :param VolumeSize size: The capacity information for this filesystem.
+
+        :param _PoolIndex index: The index of the pool's filesystems to
+            consult instead of running ``zfs`` while it is current, or
+            ``None`` to always run ``zfs``.
+
+        :param bool compressed_send: Whether ``reader`` may send blocks
+            compressed as they are on disk.  Only enable this if every node
+            receiving the streams has a ``zfs`` which accepts them.
         """
         self.pool = pool
         self.dataset = dataset
@@ -190,6 +240,25 @@ class Filesystem(object):
         if reactor is None:
             from twisted.internet import reactor
         self._reactor = reactor
+        self._index = index
+        self._compressed_send = compressed_send
+
+    def _indexed(self):
+        """
+        :return: The current listing of the pool's filesystems from the
+            index, a ``dict`` mapping dataset names to ``_DatasetInfo``, or
+            ``None`` if there is none.
+        """
+        if self._index is None or self.dataset is None:
+            return None
+        return self._index.current()
+
+    def _invalidate_index(self):
+        """
+        Discard the index's listing because this filesystem is changing.
+        """
+        if self._index is not None:
+            self._index.invalidate()
 
     def _exists(self):
         """
@@ -198,6 +267,9 @@ class Filesystem(object):
         :return: ``True`` if there is a filesystem with this name, ``False``
             otherwise.
         """
+        datasets = self._indexed()
+        if datasets is not None:
+            return self.dataset in datasets
         try:
             check_output([b"zfs", b"list", self.name], stderr=STDOUT)
         except CalledProcessError:
@@ -205,6 +277,13 @@ class Filesystem(object):
         return True
 
     def snapshots(self):
+        datasets = self._indexed()
+        if datasets is not None:
+            info = datasets.get(self.dataset)
+            return succeed([
+                Snapshot(name=name)
+                for name in (info.snapshots if info is not None else ())
+            ])
         if self._exists():
             zfs_snapshots = ZFSSnapshots(self._reactor, self)
             d = zfs_snapshots.list()
@@ -224,33 +303,110 @@ class Filesystem(object):
     def get_path(self):
         return self._mountpoint
 
+    def destroy_snapshots_before(self, snapshot):
+        d = self.snapshots()
+
+        def got_snapshots(snapshots):
+            if snapshot not in snapshots:
+                return None
+            self._invalidate_index()
+            return gatherResults(list(zfs_command(
+                self._reactor,
+                [b"destroy", b"%s@%s" % (self.name, older.name)])
+                for older in snapshots[:snapshots.index(snapshot)]),
+                consumeErrors=True)
+        d.addCallback(got_snapshots)
+        return d
+
+    def resume_token(self):
+        """
+        Find the token ``zfs receive -s`` saved when a stream being received
+        into this filesystem was interrupted.
+
+        :return: The token as ``bytes``, or ``None`` if there is no
+            interrupted receive to resume (or ``zfs`` does not support
+            resuming).
+        """
+        try:
+            output = check_output(
+                [b"zfs", b"get", b"-H", b"-o", b"value",
+                 b"receive_resume_token", self.name],
+                stderr=STDOUT,
+            )
+        except CalledProcessError:
+            return None
+        token = output.strip()
+        if token in (b"", b"-"):
+            return None
+        return token
+
+    def abort_receive(self):
+        """
+        Discard the partially received stream ``zfs receive -s`` kept.
+        """
+        self._invalidate_index()
+        with open(os.devnull) as devnull:
+            check_call(
+                [b"zfs", b"receive", b"-A", self.name], stdin=devnull
+            )
+
     @contextmanager
-    def reader(self, remote_snapshots=None):
+    def reader(self, remote_snapshots=None, resume_token=None):
         """
         Send zfs stream of contents.
 
+        If compressed sends were enabled and ``zfs`` supports them, the
+        stream contains blocks exactly as they are compressed on disk (``zfs
+        send -c``) rather than decompressing them only for the receiver to
+        compress them again.
+
         :param list remote_snapshots: ``Snapshot`` instances, ordered from
             oldest to newest, which are available on the writer.  The reader
             may generate a partial stream which relies on one of these
             snapshots in order to minimize the data to be transferred.
+        :param bytes resume_token: A token from the writer's
+            ``resume_token``.  If given, the stream is the remainder of the
+            interrupted one and ``remote_snapshots`` is ignored.
+
+        :raise CalledProcessError: If ``zfs send`` could not generate the
+            remainder of an interrupted stream, for example because the
+            snapshot it was of has since been destroyed.
         """
+        if resume_token is not None:
+            command = [b"zfs", b"send", b"-t", resume_token]
+            process = Popen(command, stdout=PIPE)
+            try:
+                yield process.stdout
+            finally:
+                process.stdout.close()
+                status = process.wait()
+            if status:
+                raise CalledProcessError(status, command)
+            return
+
         # The existing snapshot code uses Twisted, so we're not using it
         # in this iteration.  What's worse, though, is that it's not clear
         # if the current snapshot naming scheme makes any sense, and
         # moreover it violates abstraction boundaries. So as first pass
         # I'm just using UUIDs, and hopefully requirements will become
         # clearer as we iterate.
-        snapshot = b"%s@%s" % (self.name, uuid4())
+        datasets = self._indexed()
+        self._invalidate_index()
+        snapshot_name = bytes(uuid4())
+        snapshot = b"%s@%s" % (self.name, snapshot_name)
         check_call([b"zfs", b"snapshot", snapshot])
 
         # Determine whether there is a shared snapshot which can be used as the
         # basis for an incremental send.
-        local_snapshots = list(
-            Snapshot(name=name) for name in
-            _parse_snapshots(
+        if datasets is not None and self.dataset in datasets:
+            # The snapshot just taken is the newest one:
+            names = list(datasets[self.dataset].snapshots) + [snapshot_name]
+        else:
+            names = _parse_snapshots(
                 check_output([b"zfs"] + _list_snapshots_command(self)),
                 self
-            ))
+            )
+        local_snapshots = list(Snapshot(name=name) for name in names)
 
         if remote_snapshots is None:
             remote_snapshots = []
@@ -268,7 +424,10 @@ class Filesystem(object):
                 snapshot,
             ]
 
-        process = Popen([b"zfs", b"send"] + identifier, stdout=PIPE)
+        options = []
+        if self._compressed_send and b"c" in _zfs_flags(b"send"):
+            options.append(b"-c")
+        process = Popen([b"zfs", b"send"] + options + identifier, stdout=PIPE)
         try:
             yield process.stdout
         finally:
@@ -280,7 +439,9 @@ class Filesystem(object):
         """
         Read in zfs stream.
         """
-        if self._exists():
+        exists = self._exists()
+        self._invalidate_index()
+        if exists:
             # If the filesystem already exists then this should be an
             # incremental data stream to up date it to a more recent snapshot.
             # If that's not the case then we're about to screw up - but that's
@@ -300,11 +461,17 @@ class Filesystem(object):
             # it in order to receive the stream.  To do that you have to
             # force.
             #
-            cmd = [b"zfs", b"receive", b"-F", self.name]
+            options = [b"-F"]
         else:
             # If the filesystem doesn't already exist then this is a complete
             # data stream.
-            cmd = [b"zfs", b"receive", self.name]
+            options = []
+        if b"s" in _zfs_flags(b"receive"):
+            # -s means keep what was received if the stream is interrupted,
+            # so the sender can resume from ``resume_token`` instead of
+            # starting again.
+            options.insert(0, b"-s")
+        cmd = [b"zfs", b"receive"] + options + [self.name]
         process = Popen(cmd, stdin=PIPE)
         succeeded = False
         try:
@@ -312,10 +479,23 @@ class Filesystem(object):
         finally:
             process.stdin.close()
             succeeded = not process.wait()
+            # A listing taken while the stream was being received is stale
+            # now too:
+            self._invalidate_index()
         if succeeded:
             check_call([b"zfs", b"set",
                         b"mountpoint=" + self._mountpoint.path,
                         self.name])
+            # Only the snapshot just received is needed as the basis of the
+            # next incremental stream; the sender keeps a copy of it too.
+            names = _parse_snapshots(
+                check_output([b"zfs"] + _list_snapshots_command(self)),
+                self
+            )
+            for name in names[:-1]:
+                _sync_command_error_squashed(
+                    [b"zfs", b"destroy", b"%s@%s" % (self.name, name)],
+                    self.logger)
 
 
 @implementer(IFilesystemSnapshots)
@@ -328,8 +508,9 @@ class ZFSSnapshots(object):
 
     def create(self, name):
         encoded_name = b"%s@%s" % (self._filesystem.name, name)
+        self._filesystem._invalidate_index()
         d = zfs_command(self._reactor, [b"snapshot", encoded_name])
-        d.addCallback(lambda _: None)
+        d.addCallback(lambda _: self._filesystem._invalidate_index())
         return d
 
     def list(self):
@@ -438,16 +619,35 @@ class StoragePool(Service):
     """
     logger = Logger()
 
-    def __init__(self, reactor, name, mount_root):
+    def __init__(self, reactor, name, mount_root, compressed_send=False):
         """
         :param reactor: A ``IReactorProcess`` provider.
         :param bytes name: The pool's name.
         :param FilePath mount_root: Directory where filesystems should be
             mounted.
+        :param bool compressed_send: See ``Filesystem``.
         """
         self._reactor = reactor
         self._name = name
         self._mount_root = mount_root
+        self._index = _PoolIndex()
+        self._compressed_send = compressed_send
+
+    def _changing(self, result):
+        """
+        Discard the pool's index because it is being changed, and again once
+        the change is finished.
+
+        :param Deferred result: Fires when the change is finished.
+
+        :return: ``result``.
+        """
+        self._index.invalidate()
+
+        def changed(passthrough):
+            self._index.invalidate()
+            return passthrough
+        return result.addBoth(changed)
 
     def startService(self):
         """
@@ -500,8 +700,8 @@ class StoragePool(Service):
                 b"-o", u"refquota={0}".format(
                     volume.size.maximum_size).encode("ascii")
             ])
-        d = zfs_command(self._reactor,
-                        [b"create"] + properties + [filesystem.name])
+        d = self._changing(zfs_command(
+            self._reactor, [b"create"] + properties + [filesystem.name]))
         d.addErrback(self._check_for_out_of_space)
         d.addCallback(lambda _: filesystem)
         return d
@@ -520,7 +720,7 @@ class StoragePool(Service):
         d.addCallback(got_snapshots)
         d.addCallback(lambda _: zfs_command(
             self._reactor, [b"destroy", filesystem.name]))
-        return d
+        return self._changing(d)
 
     def set_maximum_size(self, volume):
         filesystem = self.get(volume)
@@ -532,8 +732,8 @@ class StoragePool(Service):
             ])
         else:
             properties.extend([u"refquota=none"])
-        d = zfs_command(self._reactor,
-                        [b"set"] + properties + [filesystem.name])
+        d = self._changing(zfs_command(
+            self._reactor, [b"set"] + properties + [filesystem.name]))
         d.addErrback(self._check_for_out_of_space)
         d.addCallback(lambda _: filesystem)
         return d
@@ -553,13 +753,14 @@ class StoragePool(Service):
         d.addCallback(lambda _: zfs_command(self._reactor, clone_command))
         self._created(d, volume)
         d.addCallback(lambda _: new_filesystem)
-        return d
+        return self._changing(d)
 
     def change_owner(self, volume, new_volume):
         old_filesystem = self.get(volume)
         new_filesystem = self.get(new_volume)
-        d = zfs_command(self._reactor,
-                        [b"rename", old_filesystem.name, new_filesystem.name])
+        d = self._changing(zfs_command(
+            self._reactor,
+            [b"rename", old_filesystem.name, new_filesystem.name]))
         self._created(d, new_volume)
 
         def remounted(ignored):
@@ -614,24 +815,34 @@ class StoragePool(Service):
         dataset = volume_to_dataset(volume)
         mount_path = self._mount_root.child(dataset)
         return Filesystem(
-            self._name, dataset, mount_path, volume.size)
+            self._name, dataset, mount_path, volume.size,
+            reactor=self._reactor, index=self._index,
+            compressed_send=self._compressed_send)
 
     def enumerate(self):
+        generation = self._index.generation
         listing = _list_filesystems(self._reactor, self._name)
 
-        def listed(filesystems):
+        def listed(datasets):
+            # Filesystems of this pool asked about their snapshots before
+            # the pool is next changed can be answered from this listing:
+            self._index.update(generation, datasets)
             result = set()
-            for entry in filesystems:
+            for entry in datasets:
                 filesystem = Filesystem(
                     self._name, entry.dataset, FilePath(entry.mountpoint),
-                    VolumeSize(maximum_size=entry.refquota))
+                    VolumeSize(maximum_size=entry.refquota),
+                    reactor=self._reactor, index=self._index,
+                    compressed_send=self._compressed_send)
                 result.add(filesystem)
             return result
 
         return listing.addCallback(listed)
 
 
-@attributes(["dataset", "mountpoint", "refquota"], apply_immutable=True)
+@attributes(["dataset", "mountpoint", "refquota",
+             Attribute("snapshots", default_value=())],
+            apply_immutable=True)
 class _DatasetInfo(object):
     """
     :ivar bytes dataset: The name of the ZFS dataset to which this information
@@ -640,43 +851,113 @@ class _DatasetInfo(object):
         (where it will be auto-mounted by ZFS).
     :ivar int refquota: The value of the dataset's ``refquota`` property (the
         maximum number of bytes the dataset is allowed to have a reference to).
+    :ivar tuple snapshots: The names (``bytes``) of the dataset's snapshots,
+        oldest first.
+    """
+
+
+class _PoolIndex(object):
     """
+    The filesystems of a pool and their snapshots, as found by the most
+    recent listing of the whole pool.
+
+    The agent lists the pool once per convergence loop iteration; answering
+    questions about snapshots from that listing saves running ``zfs`` again
+    for each filesystem pushed or handed off in the same iteration.  Any
+    change made to the pool discards the listing, and a listing which was
+    already running when a change was made is never used.
+
+    Filesystems are read and written in threads, so access is locked.
+
+    :ivar int generation: Incremented whenever the listing is discarded.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.generation = 0
+        self._datasets = None
+
+    def current(self):
+        """
+        :return: A ``dict`` mapping the names of the pool's datasets to
+            their ``_DatasetInfo``, or ``None`` if the pool may have changed
+            since it was last listed.
+        """
+        return self._datasets
+
+    def update(self, generation, datasets):
+        """
+        Store a new listing of the pool.
+
+        :param int generation: The value of ``generation`` when the listing
+            was started.  If the listing was discarded since then, the new
+            listing may be stale already and is not stored.
+        :param datasets: An iterable of ``_DatasetInfo``.
+        """
+        with self._lock:
+            if generation == self.generation:
+                self._datasets = {info.dataset: info for info in datasets}
+
+    def invalidate(self):
+        """
+        Discard the listing because the pool is being changed.
+        """
+        with self._lock:
+            self.generation += 1
+            self._datasets = None
 
 
 def _list_filesystems(reactor, pool):
-    """Get a listing of all filesystems on a given pool.
+    """Get a listing of all filesystems on a given pool, with their
+    snapshots.
+
+    A single ``zfs`` process lists both the filesystems and their
+    snapshots.
 
     :param pool: A `flocker.volume.filesystems.interface.IStoragePool`
         provider.
-    :return: A ``Deferred`` that fires with an iterator, the elements
-        of which are ``tuples`` containing the name and mountpoint of each
-        filesystem.
+    :return: A ``Deferred`` that fires with a ``list`` of ``_DatasetInfo``,
+        one for each filesystem.
     """
     listing = zfs_command(
         reactor,
         [b"list",
-         # Descend the hierarchy to a depth of one (ie, list the direct
-         # children of the pool)
-         b"-d", b"1",
+         # Descend the hierarchy to a depth of two (ie, list the direct
+         # children of the pool and their snapshots)
+         b"-d", b"2",
          # Omit the output header
          b"-H",
          # Output exact, machine-parseable values (eg 65536 instead of 64K)
          b"-p",
+         # Output both filesystems and snapshots
+         b"-t", b"filesystem,snapshot",
          # Output each dataset's name, mountpoint and refquota
          b"-o", b"name,mountpoint,refquota",
+         # Sort by the creation property, so snapshots are in the order they
+         # were taken
+         b"-s", b"creation",
          # Look at this pool
          pool])
 
     def listed(output, pool):
+        filesystems = []
+        snapshots = {}
         for line in output.splitlines():
             name, mountpoint, refquota = line.split(b'\t')
+            name, _, snapshot = name.partition(b"@")
             name = name[len(pool) + 1:]
-            if name:
+            if snapshot:
+                snapshots.setdefault(name, []).append(snapshot)
+            elif name and b"/" not in name:
                 refquota = int(refquota.decode("ascii"))
                 if refquota == 0:
                     refquota = None
-                yield _DatasetInfo(
-                    dataset=name, mountpoint=mountpoint, refquota=refquota)
+                filesystems.append((name, mountpoint, refquota))
+        return [
+            _DatasetInfo(
+                dataset=dataset, mountpoint=path, refquota=quota,
+                snapshots=tuple(snapshots.get(dataset, ())))
+            for (dataset, path, quota) in filesystems
+        ]
 
     listing.addCallback(listed, pool)
     return listing
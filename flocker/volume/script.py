@@ -119,8 +119,82 @@ class _ReceiveSubcommandOptions(Options):
 
         :param VolumeService service: The volume manager service to utilize.
         """
-        service.receive(self["node_id"], VolumeName.from_bytes(self["name"]),
-                        sys.stdin)
+        statistics = service.receive(
+            self["node_id"], VolumeName.from_bytes(self["name"]), sys.stdin
+        )
+        # Standard out is not ours to write to but the pushing node passes
+        # standard error on to its own logs:
+        sys.stderr.write(
+            u"Received {}\n".format(statistics.describe()).encode("ascii")
+        )
+
+
+class _ResumeTokenSubcommandOptions(Options):
+    """
+    Command line options for ``flocker-volume resume_token``.
+    """
+
+    longdesc = """    Print the token for resuming an interrupted receive of a volume, or
+    nothing if there is none.
+
+    Parameters:
+
+    * owner-node-id: The node ID of the volume manager that owns the volume.
+
+    * name: The name of the volume.
+    """
+
+    synopsis = "<owner-node-id> <name>"
+
+    def parseArgs(self, node_id, name):
+        self["node_id"] = node_id.decode("ascii")
+        self["name"] = name
+
+    def run(self, service):
+        """
+        Run the action for this sub-command.
+
+        :param VolumeService service: The volume manager service to utilize.
+        """
+        volume = Volume(node_id=self["node_id"],
+                        name=VolumeName.from_bytes(self["name"]),
+                        service=service)
+        token = volume.get_filesystem().resume_token()
+        if token is not None:
+            sys.stdout.write(token + b"\n")
+
+
+class _AbortReceiveSubcommandOptions(Options):
+    """
+    Command line options for ``flocker-volume abort_receive``.
+    """
+
+    longdesc = """    Discard what was kept of an interrupted receive of a volume, so that
+    the next receive starts afresh instead of resuming it.
+
+    Parameters:
+
+    * owner-node-id: The node ID of the volume manager that owns the volume.
+
+    * name: The name of the volume.
+    """
+
+    synopsis = "<owner-node-id> <name>"
+
+    def parseArgs(self, node_id, name):
+        self["node_id"] = node_id.decode("ascii")
+        self["name"] = name
+
+    def run(self, service):
+        """
+        Run the action for this sub-command.
+
+        :param VolumeService service: The volume manager service to utilize.
+        """
+        volume = Volume(node_id=self["node_id"],
+                        name=VolumeName.from_bytes(self["name"]),
+                        service=service)
+        volume.get_filesystem().abort_receive()
 
 
 class _AcquireSubcommandOptions(Options):
@@ -217,6 +291,10 @@ class VolumeOptions(Options):
          "List snapshots for a volume."],
         ["receive", None, _ReceiveSubcommandOptions,
          "Receive a remotely pushed volume."],
+        ["resume_token", None, _ResumeTokenSubcommandOptions,
+         "Show how to resume an interrupted receive."],
+        ["abort_receive", None, _AbortReceiveSubcommandOptions,
+         "Discard an interrupted receive."],
         ["acquire", None, _AcquireSubcommandOptions,
          "Acquire a remotely owned volume."],
         ["clone_to", None, _CloneToSubcommandOptions,
@@ -10,13 +10,17 @@ from __future__ import absolute_import
 import sys
 import json
 import stat
+from time import time
 from uuid import UUID, uuid4
 
 from zope.interface import Interface, implementer
 
 from characteristic import attributes
 
+from eliot import Field, Logger, MessageType, preserve_context, write_failure
+
 from twisted.internet.defer import maybeDeferred
+from twisted.internet.threads import deferToThreadPool
 from twisted.python.filepath import FilePath
 from twisted.application.service import Service
 from twisted.internet.defer import fail
@@ -26,6 +30,7 @@ from twisted.internet.defer import fail
 # part of https://clusterhq.atlassian.net/browse/FLOC-64
 from .filesystems.zfs import StoragePool
 from ._model import VolumeSize
+from ._copy import copy_stream
 from ..common.script import ICommandLineScript
 
 DEFAULT_CONFIG_PATH = FilePath(b"/etc/flocker/volume.json")
@@ -34,11 +39,52 @@ FLOCKER_POOL = b"flocker"
 
 WAIT_FOR_VOLUME_INTERVAL = 0.1
 
+_logger = Logger()
+
+VOLUME_TRANSFERRED = MessageType(
+    u"flocker:volume:service:transferred",
+    [Field.for_types(u"direction", [unicode], u"push or receive"),
+     Field.for_types(u"volume", [bytes], u"The volume's name."),
+     Field.for_types(u"bytes", [int, long], u"The amount of data."),
+     Field.for_types(u"seconds", [float], u"How long it took.")],
+    u"A volume's data was pushed to or received from another node.",
+)
+
 
 class CreateConfigurationError(Exception):
     """Create the configuration file failed."""
 
 
+@attributes(["bytes", "seconds"])
+class TransferStatistics(object):
+    """
+    How much volume data was pushed or received and how long it took.
+
+    :ivar int bytes: The size of the data stream.
+    :ivar float seconds: The time taken to transfer it.
+    """
+    def describe(self):
+        """
+        :return: A ``unicode`` summary including the throughput.
+        """
+        rate = self.bytes / max(self.seconds, 0.001) / (1024 * 1024)
+        return u"{} bytes in {:.1f} seconds ({:.1f} MiB/s)".format(
+            self.bytes, self.seconds, rate
+        )
+
+    def log(self, direction, volume_name):
+        """
+        Write a ``VOLUME_TRANSFERRED`` message for these statistics.
+
+        :param unicode direction: ``u"push"`` or ``u"receive"``.
+        :param VolumeName volume_name: The volume transferred.
+        """
+        VOLUME_TRANSFERRED(
+            direction=direction, volume=volume_name.to_bytes(),
+            bytes=self.bytes, seconds=self.seconds,
+        ).write()
+
+
 @attributes(["namespace", "dataset_id"])
 class VolumeName(object):
     """
@@ -100,17 +146,22 @@ class VolumeService(Service):
         volume manager. Only available once the service has started.
     """
 
-    def __init__(self, config_path, pool, reactor):
+    def __init__(self, config_path, pool, reactor, threadpool=None):
         """
         :param FilePath config_path: Path to the volume manager config file.
         :param pool: An object that is both a
             ``flocker.volume.filesystems.interface.IStoragePool`` provider
             and a ``twisted.application.service.IService`` provider.
         :param reactor: A ``twisted.internet.interface.IReactorTime`` provider.
+        :param threadpool: A ``twisted.python.threadpool.ThreadPool`` in which
+            to transfer data when pushing volumes, or ``None`` to transfer it
+            in the calling thread.  ``reactor`` must also provide
+            ``IReactorFromThreads`` if this is given.
         """
         self._config_path = config_path
         self.pool = pool
         self._reactor = reactor
+        self._threadpool = threadpool
 
     def startService(self):
         Service.startService(self)
@@ -256,7 +307,14 @@ class VolumeService(Service):
         """
         Push the latest data in the volume to a remote destination.
 
-        This is a blocking API for now.
+        If this service has a threadpool the data is transferred in it,
+        otherwise this blocks until the transfer is done.
+
+        If an earlier push to the destination was interrupted, the rest of
+        that data stream is sent first instead of starting it again.  If that
+        fails the destination discards what it received of it.  If the
+        destination can't say whether there is such a stream, for example
+        because it runs an older release, a new stream is sent as usual.
 
         Only locally owned volumes (i.e. volumes whose ``uuid`` matches
         this service's) can be pushed.
@@ -268,20 +326,87 @@ class VolumeService(Service):
 
         :raises ValueError: If the uuid of the volume is different than
             our own; only locally-owned volumes can be pushed.
+
+        :return: ``Deferred`` that fires with ``TransferStatistics`` when the
+            data has been pushed.
         """
         if volume.node_id != self.node_id:
             raise ValueError()
+        transfers = []
+        pushing = maybeDeferred(destination.resume_token, volume)
+
+        def resume_token_failed(failure):
+            write_failure(
+                failure, _logger, u"flocker:volume:service:resume_token_failed"
+            )
+            return None
+        pushing.addErrback(resume_token_failed)
+
+        def got_resume_token(resume_token):
+            if resume_token is not None:
+                resuming = self._send(
+                    volume, destination, resume_token=resume_token
+                )
+                resuming.addCallback(transfers.append)
+                resuming.addErrback(resume_failed)
+                return resuming
+
+        def resume_failed(failure):
+            # The interrupted stream can't always be finished, for example
+            # if the snapshot it was of has been destroyed since.  Throw away
+            # what was received of it and send a new one instead.
+            write_failure(
+                failure, _logger, u"flocker:volume:service:resume_failed"
+            )
+            return destination.abort_receive(volume)
+        pushing.addCallback(got_resume_token)
+        pushing.addCallback(lambda _: destination.snapshots(volume))
+        pushing.addCallback(
+            lambda snapshots: self._send(
+                volume, destination, remote_snapshots=snapshots
+            )
+        )
+        pushing.addCallback(transfers.append)
+
+        def pushed(_):
+            statistics = TransferStatistics(
+                bytes=sum(transfer.bytes for transfer in transfers),
+                seconds=sum(transfer.seconds for transfer in transfers),
+            )
+            statistics.log(u"push", volume.name)
+            return statistics
+        pushing.addCallback(pushed)
+        return pushing
+
+    def _send(self, volume, destination, **reader_arguments):
+        """
+        Send one data stream for a volume to a remote destination.
+
+        :param Volume volume: The volume to send.
+        :param IRemoteVolumeManager destination: The remote volume manager
+            to send to.
+        :param reader_arguments: Keyword arguments for the volume's
+            ``IFilesystem.reader``.
+
+        :return: ``Deferred`` that fires with ``TransferStatistics`` when the
+            stream has been sent.
+        """
         fs = volume.get_filesystem()
-        getting_snapshots = destination.snapshots(volume)
 
-        def got_snapshots(snapshots):
+        def transfer():
+            start = time()
             with destination.receive(volume) as receiver:
-                with fs.reader(snapshots) as contents:
-                    for chunk in iter(lambda: contents.read(1024 * 1024), b""):
-                        receiver.write(chunk)
+                with fs.reader(**reader_arguments) as contents:
+                    transferred = copy_stream(contents, receiver)
+            return TransferStatistics(
+                bytes=transferred, seconds=time() - start
+            )
 
-        pushing = getting_snapshots.addCallback(got_snapshots)
-        return pushing
+        if self._threadpool is None:
+            return maybeDeferred(transfer)
+        return deferToThreadPool(
+            self._reactor, self._threadpool, preserve_context(transfer)
+        )
 
     def receive(self, volume_node_id, volume_name, input_file):
         """
@@ -299,13 +424,20 @@ class VolumeService(Service):
 
         :raises ValueError: If the uuid of the volume matches our own;
             remote nodes can't overwrite locally-owned volumes.
+
+        :return: ``TransferStatistics`` for the data received.
         """
         if volume_node_id == self.node_id:
             raise ValueError()
         volume = Volume(node_id=volume_node_id, name=volume_name, service=self)
+        start = time()
         with volume.get_filesystem().writer() as writer:
-            for chunk in iter(lambda: input_file.read(1024 * 1024), b""):
-                writer.write(chunk)
+            transferred = copy_stream(input_file, writer)
+        statistics = TransferStatistics(
+            bytes=transferred, seconds=time() - start
+        )
+        statistics.log(u"receive", volume_name)
+        return statistics
 
     def acquire(self, volume_node_id, volume_name):
         """
@@ -345,11 +477,10 @@ class VolumeService(Service):
             volume is not locally owned).
         """
         pushing = maybeDeferred(self.push, volume, destination)
-
-        def pushed(ignored):
-            remote_uuid = destination.acquire(volume)
-            return volume.change_owner(remote_uuid)
-        changing_owner = pushing.addCallback(pushed)
+        acquiring = pushing.addCallback(
+            lambda _: destination.acquire(volume)
+        )
+        changing_owner = acquiring.addCallback(volume.change_owner)
         return changing_owner
 
 
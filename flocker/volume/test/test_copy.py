@@ -0,0 +1,67 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+
+"""
+Tests for ``flocker.volume._copy``.
+"""
+
+import os
+from io import BytesIO
+from unittest import skipIf
+
+from ...testtools import TestCase
+from .._copy import copy_stream, _splice
+
+DATA = b"".join(b"%d\\n" % (i,) for i in range(4096))
+
+
+class CopyStreamTests(TestCase):
+    """
+    Tests for ``copy_stream``.
+    """
+    def pipe(self):
+        """
+        :return: A ``(reader, writer)`` tuple of file objects for a new pipe,
+            closed at the end of the test.
+        """
+        read_fd, write_fd = os.pipe()
+        reader = os.fdopen(read_fd, "rb", 0)
+        writer = os.fdopen(write_fd, "wb")
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        return reader, writer
+
+    def test_files(self):
+        """
+        All of the data is copied between file-like objects which are not
+        pipes.
+        """
+        destination = BytesIO()
+        copied = copy_stream(BytesIO(DATA), destination)
+        self.assertEqual((len(DATA), DATA), (copied, destination.getvalue()))
+
+    def test_pipe_to_file(self):
+        """
+        All of the data is copied from a pipe to a file-like object which is
+        not a pipe.
+        """
+        source, source_input = self.pipe()
+        source_input.write(DATA)
+        source_input.close()
+        destination = BytesIO()
+        copy_stream(source, destination)
+        self.assertEqual(DATA, destination.getvalue())
+
+    @skipIf(_splice is None, "splice(2) is not available.")
+    def test_pipes(self):
+        """
+        All of the data is copied between two pipes, after any data already
+        buffered for the destination.
+        """
+        source, source_input = self.pipe()
+        source_input.write(DATA)
+        source_input.close()
+        destination_output, destination = self.pipe()
+        destination.write(b"buffered\\n")
+        copy_stream(source, destination)
+        destination.close()
+        self.assertEqual(b"buffered\\n" + DATA, destination_output.read())
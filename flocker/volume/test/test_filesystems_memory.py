@@ -16,6 +16,7 @@ from ..filesystems.memory import (
     CannedFilesystemSnapshots, FilesystemStoragePool,
     DirectoryFilesystem,
 )
+from ..filesystems.zfs import Snapshot
 from ...testtools import (
     TestCase, assert_equal_comparison, assert_not_equal_comparison
 )
@@ -94,3 +95,20 @@ class DirectoryFilesystemTests(TestCase):
             repr(DirectoryFilesystem(
                 path=FilePath(b"/foo/bar"), size=123))
         )
+
+    def test_destroy_snapshots_before(self):
+        """
+        ``DirectoryFilesystem.destroy_snapshots_before`` forgets the pretend
+        snapshots older than the given one.
+        """
+        path = FilePath(self.mktemp())
+        path.makedirs()
+        filesystem = DirectoryFilesystem(path=path, size=123)
+        for name in [b"a", b"b", b"c"]:
+            filesystem.snapshot(name)
+        self.successResultOf(
+            filesystem.destroy_snapshots_before(Snapshot(name=b"b")))
+        self.assertEqual(
+            [Snapshot(name=b"b"), Snapshot(name=b"c")],
+            self.successResultOf(filesystem.snapshots()),
+        )
@@ -7,6 +7,8 @@ Further coverage is provided in
 """
 
 import os
+import sys
+from subprocess import CalledProcessError
 
 from twisted.internet.error import ProcessDone, ProcessTerminated
 from twisted.python.failure import Failure
@@ -22,12 +24,14 @@ from ...testtools import (
     TestCase, if_root
 )
 
+from ..filesystems import zfs
 from ..filesystems.zfs import (
-    _DatasetInfo,
+    _DatasetInfo, _zfs_flags, _PoolIndex,
     zfs_command, CommandFailed, BadArguments, Filesystem, ZFSSnapshots,
     _sync_command_error_squashed, _latest_common_snapshot, ZFS_ERROR,
-    Snapshot,
+    Snapshot, StoragePool,
 )
+from ..service import Volume, VolumeName
 
 
 class FilesystemTests(TestCase):
@@ -416,3 +420,558 @@ class DatasetInfoTests(TestCase):
         """
         self.assertRaises(
             AttributeError, setattr, self.info, "refquota", 321)
+
+    def test_default_snapshots(self):
+        """
+        :class:`_DatasetInfo.snapshots` is empty by default.
+        """
+        self.assertEqual((), self.info.snapshots)
+
+
+# Output of the batched listing of a pool, with snapshots of the pool's root
+# dataset and of a nested filesystem which are not of interest:
+POOL_LISTING = b"""\
+mypool\t/mypool\t0
+mypool@root\t-\t-
+mypool/a\t/flocker/a\t0
+mypool/a@first\t-\t-
+mypool/b\t/flocker/b\t1073741824
+mypool/a/nested\t/flocker/a/nested\t0
+mypool/a@second\t-\t-
+"""
+
+
+class StoragePoolEnumerateTests(TestCase):
+    """
+    Tests for ``StoragePool.enumerate`` and the index of the pool it keeps.
+    """
+    def setUp(self):
+        super(StoragePoolEnumerateTests, self).setUp()
+        self.reactor = FakeProcessReactor()
+        self.pool = StoragePool(
+            self.reactor, b"mypool", FilePath(b"/flocker")
+        )
+
+    def finish_listing(self, index=0, output=POOL_LISTING):
+        """
+        Make one of the ``zfs`` processes started so far output a listing and
+        exit.
+        """
+        process_protocol = self.reactor.processes[index].processProtocol
+        process_protocol.childDataReceived(1, output)
+        process_protocol.processEnded(Failure(ProcessDone(0)))
+
+    def enumerate(self):
+        """
+        Enumerate the pool's filesystems.
+
+        :return: A ``dict`` mapping dataset names to the ``Filesystem``
+            instances.
+        """
+        d = self.pool.enumerate()
+        self.finish_listing()
+        return {
+            filesystem.dataset: filesystem
+            for filesystem in self.successResultOf(d)
+        }
+
+    def test_command(self):
+        """
+        ``StoragePool.enumerate`` lists the pool's filesystems and their
+        snapshots with a single ``zfs`` command.
+        """
+        self.pool.enumerate()
+        self.assertEqual(
+            [[b"zfs", b"list", b"-d", b"2", b"-H", b"-p",
+              b"-t", b"filesystem,snapshot",
+              b"-o", b"name,mountpoint,refquota", b"-s", b"creation",
+              b"mypool"]],
+            [process.args for process in self.reactor.processes],
+        )
+
+    def test_filesystems(self):
+        """
+        ``StoragePool.enumerate`` returns the direct children of the pool.
+        """
+        filesystems = self.enumerate()
+        self.assertEqual(
+            {b"a": (FilePath(b"/flocker/a"), None),
+             b"b": (FilePath(b"/flocker/b"), 1073741824)},
+            {name: (filesystem.get_path(), filesystem.size.maximum_size)
+             for (name, filesystem) in filesystems.items()},
+        )
+
+    def test_snapshots_from_listing(self):
+        """
+        The snapshots of the filesystems ``StoragePool.enumerate`` returns
+        come from the listing, oldest first, without running ``zfs`` again.
+        """
+        filesystems = self.enumerate()
+        snapshots = self.successResultOf(filesystems[b"a"].snapshots())
+        self.assertEqual(
+            ([Snapshot(name=b"first"), Snapshot(name=b"second")], 1),
+            (snapshots, len(self.reactor.processes)),
+        )
+
+    def test_get_uses_listing(self):
+        """
+        ``Filesystem`` instances from ``StoragePool.get`` also answer from the
+        latest listing, including for filesystems which do not exist yet.
+        """
+        self.enumerate()
+        volume = Volume(
+            node_id=u"x", name=VolumeName(namespace=u"ns", dataset_id=u"id"),
+            service=None,
+        )
+        self.assertEqual(
+            ([], 1),
+            (self.successResultOf(self.pool.get(volume).snapshots()),
+             len(self.reactor.processes)),
+        )
+
+    def test_change_discards_listing(self):
+        """
+        Changing the pool discards the listing.
+        """
+        filesystems = self.enumerate()
+        ZFSSnapshots(self.reactor, filesystems[b"b"]).create(b"new")
+        self.assertIs(None, self.pool._index.current())
+
+    def test_stale_listing_discarded(self):
+        """
+        A listing which was started before the pool was changed is not used
+        for answering questions about snapshots.
+        """
+        d = self.pool.enumerate()
+        volume = Volume(
+            node_id=u"x", name=VolumeName(namespace=u"ns", dataset_id=u"id"),
+            service=None,
+        )
+        self.pool.set_maximum_size(volume)
+        self.finish_listing()
+        self.successResultOf(d)
+        self.assertIs(None, self.pool._index.current())
+
+    def test_destroy_snapshots_before(self):
+        """
+        ``Filesystem.destroy_snapshots_before`` destroys the snapshots older
+        than the given one and discards the listing.
+        """
+        filesystems = self.enumerate()
+        filesystems[b"a"].destroy_snapshots_before(Snapshot(name=b"second"))
+        self.assertEqual(
+            ([[b"zfs", b"destroy", b"mypool/a@first"]], None),
+            ([process.args for process in self.reactor.processes[1:]],
+             self.pool._index.current()),
+        )
+
+    def test_destroy_snapshots_before_unknown(self):
+        """
+        ``Filesystem.destroy_snapshots_before`` destroys nothing if the given
+        snapshot does not exist.
+        """
+        filesystems = self.enumerate()
+        d = filesystems[b"a"].destroy_snapshots_before(
+            Snapshot(name=b"other"))
+        self.assertEqual(
+            (None, 1),
+            (self.successResultOf(d), len(self.reactor.processes)),
+        )
+
+
+class PoolIndexTests(TestCase):
+    """
+    Tests for ``_PoolIndex``.
+    """
+    def test_update(self):
+        """
+        ``_PoolIndex.update`` stores the listing for ``current`` to return.
+        """
+        index = _PoolIndex()
+        info = _DatasetInfo(dataset=b"a", mountpoint=b"/a", refquota=None)
+        index.update(index.generation, [info])
+        self.assertEqual({b"a": info}, index.current())
+
+    def test_invalidated_update(self):
+        """
+        ``_PoolIndex.update`` ignores a listing started before the index was
+        invalidated.
+        """
+        index = _PoolIndex()
+        generation = index.generation
+        index.invalidate()
+        index.update(generation, [])
+        self.assertIs(None, index.current())
+
+
+# Usage messages printed by ``zfs send`` and ``zfs receive`` when run without
+# arguments, from a version which supports compressed sends and resumable
+# receives.
+RESUMABLE_USAGE = b"""\
+usage:
+\tsend [-DnPpRvLec] [-[i|I] snapshot] <snapshot>
+\tsend [-nvPLec] [-i snapshot|filesystem|bookmark] <filesystem|volume|snapshot>
+\tsend [-nvPe] -t <receive_resume_token>
+\treceive [-vnsFu] [-o <property>=<value>] <filesystem|volume|snapshot>
+\treceive [-vnsFu] [-d | -e] <filesystem>
+\treceive -A <filesystem|volume>
+"""
+
+# The same from a version which supports neither.
+OLD_USAGE = b"""\
+usage:
+\tsend [-DnPpRv] [-[iI] snapshot] <snapshot>
+\treceive [-vnFu] <filesystem|volume|snapshot>
+\treceive [-vnFu] [-d | -e] <filesystem>
+"""
+
+FAKE_ZFS = b"""\
+#!%(python)s
+# A stand-in for zfs which records its arguments in ``log`` and reads its
+# behaviour from other files in the directory it is in.
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(sys.argv[0]))
+
+
+def setting(name):
+    try:
+        with open(os.path.join(here, name)) as f:
+            return f.read()
+    except IOError:
+        return None
+
+arguments = sys.argv[1:]
+with open(os.path.join(here, "log"), "a") as log:
+    log.write(" ".join(arguments) + "\\n")
+
+if arguments in (["send"], ["receive"]):
+    sys.stderr.write(setting("usage"))
+    sys.exit(2)
+elif arguments[0] == "send":
+    sys.stdout.write("stream " + " ".join(arguments))
+    if "-t" in arguments and setting("resume-fails") is not None:
+        sys.exit(1)
+elif arguments[0] == "receive" and "-A" in arguments:
+    # Discarding an interrupted receive reads no stream.
+    pass
+elif arguments[0] == "receive":
+    with open(os.path.join(here, "received"), "a") as received:
+        received.write(sys.stdin.read())
+elif arguments[0] == "get":
+    token = setting("token")
+    if token is None:
+        sys.exit(1)
+    sys.stdout.write(token + "\\n")
+elif arguments[0] == "list" and "snapshot" not in arguments:
+    # Whether the filesystem exists:
+    sys.exit(setting("exists") is None)
+elif arguments[0] == "list":
+    sys.stdout.write(setting("snapshots") or "")
+"""
+
+
+class FakeZFS(object):
+    """
+    Install a fake ``zfs`` executable on ``PATH`` for the duration of a test.
+
+    :ivar FilePath directory: The directory containing it.
+    """
+    def __init__(self, test, usage=RESUMABLE_USAGE):
+        """
+        :param TestCase test: The test using it.
+        :param bytes usage: The usage message to print when a sub-command is
+            run without arguments.
+        """
+        self.directory = FilePath(test.mktemp())
+        self.directory.makedirs()
+        executable = self.directory.child(b"zfs")
+        executable.setContent(FAKE_ZFS % dict(python=sys.executable))
+        executable.chmod(0o755)
+        self.directory.child(b"usage").setContent(usage)
+        test.patch(os, "environ", dict(
+            os.environ,
+            PATH=self.directory.path + os.pathsep + os.environ["PATH"],
+        ))
+        test.patch(zfs, "_flags_cache", {})
+
+    def set(self, name, value):
+        """
+        Change the fake's behaviour.
+
+        :param bytes name: ``b"token"``, ``b"exists"``, ``b"snapshots"`` or
+            ``b"resume-fails"``.
+        :param bytes value: The setting.
+        """
+        self.directory.child(name).setContent(value)
+
+    def commands(self):
+        """
+        :return: A ``list`` of the ``zfs`` command lines run so far, each a
+            ``list`` of ``bytes``.
+        """
+        return [
+            line.split()
+            for line in self.directory.child(b"log").getContent().splitlines()
+        ]
+
+    def received(self):
+        """
+        :return: The ``bytes`` written to ``zfs receive``.
+        """
+        return self.directory.child(b"received").getContent()
+
+
+class ZFSFlagsTests(TestCase):
+    """
+    Tests for ``_zfs_flags``.
+    """
+    def test_flags(self):
+        """
+        ``_zfs_flags`` returns the single letter options the sub-command's
+        usage message lists.
+        """
+        FakeZFS(self)
+        self.assertEqual(set(b"DnPpRvLecit"), _zfs_flags(b"send"))
+
+    def test_cached(self):
+        """
+        ``_zfs_flags`` only runs ``zfs`` once for each sub-command.
+        """
+        fake = FakeZFS(self)
+        _zfs_flags(b"receive")
+        _zfs_flags(b"receive")
+        self.assertEqual([[b"receive"]], fake.commands())
+
+
+class FilesystemReplicationTests(TestCase):
+    """
+    Tests for ``Filesystem.reader``, ``Filesystem.writer`` and
+    ``Filesystem.resume_token``.
+    """
+    def setUp(self):
+        super(FilesystemReplicationTests, self).setUp()
+        self.filesystem = Filesystem(
+            b"pool", b"fs", FilePath(b"/flocker/fs"), reactor=object()
+        )
+
+    def test_reader_compressed(self):
+        """
+        If compressed sends are enabled, ``Filesystem.reader`` sends blocks
+        compressed as they are on disk if ``zfs send`` supports it.
+        """
+        FakeZFS(self)
+        filesystem = Filesystem(
+            b"pool", b"fs", FilePath(b"/flocker/fs"), reactor=object(),
+            compressed_send=True,
+        )
+        with filesystem.reader() as reader:
+            stream = reader.read().split()
+        self.assertEqual([b"stream", b"send", b"-c"], stream[:3])
+
+    def test_reader_compressed_pool(self):
+        """
+        ``Filesystem`` instances from a ``StoragePool`` with compressed sends
+        enabled send compressed streams.
+        """
+        FakeZFS(self)
+        pool = StoragePool(
+            object(), b"pool", FilePath(b"/flocker"), compressed_send=True,
+        )
+        volume = Volume(
+            node_id=u"x", name=VolumeName(namespace=u"ns", dataset_id=u"id"),
+            service=None,
+        )
+        with pool.get(volume).reader() as reader:
+            stream = reader.read().split()
+        self.assertEqual([b"stream", b"send", b"-c"], stream[:3])
+
+    def test_reader_compressed_disabled(self):
+        """
+        ``Filesystem.reader`` sends a plain stream unless compressed sends
+        are enabled, since the receiver's ``zfs`` may not accept them.
+        """
+        FakeZFS(self)
+        with self.filesystem.reader() as reader:
+            stream = reader.read().split()
+        self.assertEqual(
+            (3, [b"stream", b"send"]), (len(stream), stream[:2])
+        )
+
+    def test_reader_not_compressed(self):
+        """
+        ``Filesystem.reader`` sends a plain stream if ``zfs send`` does not
+        support compressed streams.
+        """
+        FakeZFS(self, usage=OLD_USAGE)
+        filesystem = Filesystem(
+            b"pool", b"fs", FilePath(b"/flocker/fs"), reactor=object(),
+            compressed_send=True,
+        )
+        with filesystem.reader() as reader:
+            stream = reader.read().split()
+        self.assertEqual(
+            (3, [b"stream", b"send"]), (len(stream), stream[:2])
+        )
+
+    def test_reader_indexed(self):
+        """
+        ``Filesystem.reader`` finds the latest common snapshot for an
+        incremental stream from the pool's index if it is current, rather
+        than by listing the filesystem's snapshots.
+        """
+        fake = FakeZFS(self)
+        index = _PoolIndex()
+        index.update(index.generation, [
+            _DatasetInfo(
+                dataset=b"fs", mountpoint=b"/flocker/fs", refquota=None,
+                snapshots=(b"a", b"b"),
+            ),
+        ])
+        filesystem = Filesystem(
+            b"pool", b"fs", FilePath(b"/flocker/fs"), reactor=object(),
+            index=index,
+        )
+        with filesystem.reader([Snapshot(name=b"a")]) as reader:
+            stream = reader.read().split()
+        self.assertEqual(
+            ([b"-i", b"pool/fs@a"], [], None),
+            (stream[2:4],
+             [command for command in fake.commands()
+              if command[0] == b"list"],
+             index.current()),
+        )
+
+    def test_reader_resume(self):
+        """
+        Given a resume token, ``Filesystem.reader`` sends the rest of the
+        interrupted stream without taking a new snapshot.
+        """
+        fake = FakeZFS(self)
+        with self.filesystem.reader(resume_token=b"1-abc") as reader:
+            stream = reader.read()
+        self.assertEqual(
+            (b"stream send -t 1-abc", [[b"send", b"-t", b"1-abc"]]),
+            (stream, fake.commands()),
+        )
+
+    def test_reader_resume_failed(self):
+        """
+        ``Filesystem.reader`` raises ``CalledProcessError`` if ``zfs send``
+        could not send the rest of the interrupted stream.
+        """
+        fake = FakeZFS(self)
+        fake.set(b"resume-fails", b"")
+
+        def read():
+            with self.filesystem.reader(resume_token=b"1-abc") as reader:
+                reader.read()
+        exception = self.assertRaises(CalledProcessError, read)
+        self.assertEqual(1, exception.returncode)
+
+    def test_abort_receive(self):
+        """
+        ``Filesystem.abort_receive`` discards the interrupted receive with
+        ``zfs receive -A``.
+        """
+        fake = FakeZFS(self)
+        self.filesystem.abort_receive()
+        self.assertEqual([[b"receive", b"-A", b"pool/fs"]], fake.commands())
+
+    def test_abort_receive_stdin(self):
+        """
+        ``Filesystem.abort_receive`` does not give ``zfs`` this process's
+        standard input.
+        """
+        fake = FakeZFS(self)
+        fake.directory.child(b"zfs").setContent(
+            b"#!/bin/sh\n"
+            b"readlink /proc/self/fd/0 > \"$(dirname \"$0\")/stdin\"\n"
+        )
+        self.filesystem.abort_receive()
+        self.assertEqual(
+            b"/dev/null\n", fake.directory.child(b"stdin").getContent()
+        )
+
+    def test_writer_resumable(self):
+        """
+        ``Filesystem.writer`` receives resumably if ``zfs receive`` supports
+        it.
+        """
+        fake = FakeZFS(self)
+        with self.filesystem.writer() as writer:
+            writer.write(b"data")
+        self.assertEqual(
+            (b"data", [b"receive", b"-s", b"pool/fs"]),
+            (fake.received(), fake.commands()[-3]),
+        )
+
+    def test_writer_resumable_existing(self):
+        """
+        ``Filesystem.writer`` receives resumably into an existing filesystem
+        if ``zfs receive`` supports it.
+        """
+        fake = FakeZFS(self)
+        fake.set(b"exists", b"")
+        with self.filesystem.writer() as writer:
+            writer.write(b"data")
+        self.assertEqual(
+            [b"receive", b"-s", b"-F", b"pool/fs"], fake.commands()[-3]
+        )
+
+    def test_writer_not_resumable(self):
+        """
+        ``Filesystem.writer`` receives as before if ``zfs receive`` does not
+        support resuming.
+        """
+        fake = FakeZFS(self, usage=OLD_USAGE)
+        with self.filesystem.writer() as writer:
+            writer.write(b"data")
+        self.assertEqual([b"receive", b"pool/fs"], fake.commands()[-3])
+
+    def test_writer_destroys_older_snapshots(self):
+        """
+        After receiving a stream ``Filesystem.writer`` destroys all but the
+        newest snapshot of the filesystem.
+        """
+        fake = FakeZFS(self)
+        fake.set(b"snapshots", b"pool/fs@a\npool/fs@b\npool/fs@c\n")
+        with self.filesystem.writer() as writer:
+            writer.write(b"data")
+        self.assertEqual(
+            [[b"destroy", b"pool/fs@a"], [b"destroy", b"pool/fs@b"]],
+            [command for command in fake.commands()
+             if command[0] == b"destroy"],
+        )
+
+    def test_resume_token(self):
+        """
+        ``Filesystem.resume_token`` returns the filesystem's
+        ``receive_resume_token`` property.
+        """
+        fake = FakeZFS(self)
+        fake.set(b"token", b"1-abc")
+        self.assertEqual(
+            (b"1-abc",
+             [[b"get", b"-H", b"-o", b"value", b"receive_resume_token",
+               b"pool/fs"]]),
+            (self.filesystem.resume_token(), fake.commands()),
+        )
+
+    def test_no_resume_token(self):
+        """
+        ``Filesystem.resume_token`` returns ``None`` if there is no
+        interrupted receive.
+        """
+        fake = FakeZFS(self)
+        fake.set(b"token", b"-")
+        self.assertIs(None, self.filesystem.resume_token())
+
+    def test_resume_token_unsupported(self):
+        """
+        ``Filesystem.resume_token`` returns ``None`` if ``zfs`` does not know
+        about ``receive_resume_token``.
+        """
+        FakeZFS(self)
+        self.assertIs(None, self.filesystem.resume_token())
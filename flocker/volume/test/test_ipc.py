@@ -64,6 +64,19 @@ def make_iremote_volume_manager(fixture):
             getting_snapshots.addCallback(got_snapshots)
             return getting_snapshots
 
+        def test_resume_token_none(self):
+            """
+            If no push to the remote manager was interrupted, there is no
+            resume token.
+            """
+            service_pair = fixture(self)
+            creating = service_pair.from_service.create(
+                service_pair.from_service.get(MY_VOLUME)
+            )
+            creating.addCallback(service_pair.remote.resume_token)
+            creating.addCallback(self.assertIs, None)
+            return creating
+
         def test_receive_exceptions_pass_through(self):
             """
             Exceptions raised in the ``receive()`` context manager are not
@@ -333,6 +346,49 @@ class RemoteVolumeManagerTests(TestCase):
         self.assertEqual(
             [Snapshot(name="abc"), Snapshot(name="def")], snapshots)
 
+    def test_resume_token_destination_run(self):
+        """
+        ``RemoteVolumeManager.resume_token`` calls ``flocker-volume``
+        remotely with the ``resume_token`` sub-command and returns its
+        output.
+        """
+        node = FakeNode([b"1-abc\n"])
+
+        remote = RemoteVolumeManager(node, FilePath(b"/path/to/json"))
+        token = self.successResultOf(remote.resume_token(self.volume))
+        self.assertEqual(
+            ([b"flocker-volume", b"--config", b"/path/to/json",
+              b"resume_token", self.volume.node_id.encode("ascii"),
+              b"myns.myvol"], b"1-abc"),
+            (node.remote_command, token),
+        )
+
+    def test_no_resume_token(self):
+        """
+        ``RemoteVolumeManager.resume_token`` returns ``None`` if the remote
+        ``flocker-volume`` prints nothing.
+        """
+        remote = RemoteVolumeManager(FakeNode([b""]))
+        self.assertIs(None, self.successResultOf(
+            remote.resume_token(self.volume)
+        ))
+
+    def test_abort_receive_destination_run(self):
+        """
+        ``RemoteVolumeManager.abort_receive`` calls ``flocker-volume``
+        remotely with the ``abort_receive`` sub-command.
+        """
+        node = FakeNode([b""])
+
+        remote = RemoteVolumeManager(node, FilePath(b"/path/to/json"))
+        self.successResultOf(remote.abort_receive(self.volume))
+        self.assertEqual(
+            [b"flocker-volume", b"--config", b"/path/to/json",
+             b"abort_receive", self.volume.node_id.encode("ascii"),
+             b"myns.myvol"],
+            node.remote_command,
+        )
+
     def test_receive_destination_run(self):
         """
         Receiving calls ``flocker-volume`` remotely with ``receive`` command.
@@ -391,3 +447,17 @@ class StandardNodeTests(TestCase):
         node = standard_node(b'example.com')
         self.assertEqual(node, ProcessNode.using_ssh(
             b'example.com', 22, b'root', SSH_PRIVATE_KEY_PATH))
+
+    def test_compress(self):
+        """
+        ``standard_node`` can return a node that will compress data sent
+        over SSH.
+        """
+        node = standard_node(b'example.com', compress=True)
+        self.assertEqual(
+            (node, True),
+            (ProcessNode.using_ssh(
+                b'example.com', 22, b'root', SSH_PRIVATE_KEY_PATH,
+                compress=True),
+             b"-C" in node.initial_command_arguments),
+        )
@@ -8,6 +8,7 @@ from io import BytesIO
 import sys
 import json
 from contextlib import contextmanager
+from subprocess import CalledProcessError
 
 from uuid import uuid4
 from StringIO import StringIO
@@ -15,22 +16,27 @@ from StringIO import StringIO
 from zope.interface import implementer
 from zope.interface.verify import verifyObject
 
+from eliot.testing import validate_logging
+
 from twisted.application.service import IService, Service
+from twisted.internet.defer import succeed
 from twisted.internet.task import Clock
 from twisted.python.filepath import FilePath, Permissions
 
 from ..service import (
     VolumeService, CreateConfigurationError, Volume, VolumeName,
     VolumeScript, ICommandLineVolumeScript,
-    VolumeSize,
+    VolumeSize, TransferStatistics,
     )
+from .. import service as service_module
 from ..script import VolumeOptions
 
-from ..filesystems.memory import FilesystemStoragePool
+from ..filesystems.memory import FilesystemStoragePool, DirectoryFilesystem
 from ..filesystems.zfs import StoragePool
 from .._ipc import RemoteVolumeManager, LocalVolumeManager
 from ..testtools import create_volume_service
 from ...common import FakeNode
+from ...common.test.test_thread import NonThreadPool, NonReactor
 from ...testtools import (
     skip_on_broken_permissions, attempt_effective_uid, make_with_init_tests,
     assert_equal_comparison, assert_not_equal_comparison, AsyncTestCase,
@@ -139,6 +145,21 @@ class VolumeSizeComparisonTests(TestCase):
         assert_not_equal_comparison(self, a, b)
 
 
+class TransferStatisticsTests(TestCase):
+    """
+    Tests for ``TransferStatistics``.
+    """
+    def test_describe(self):
+        """
+        ``TransferStatistics.describe`` includes the throughput.
+        """
+        statistics = TransferStatistics(bytes=3 * 1024 * 1024, seconds=2.0)
+        self.assertEqual(
+            u"3145728 bytes in 2.0 seconds (1.5 MiB/s)",
+            statistics.describe(),
+        )
+
+
 class VolumeServiceStartupTests(TestCase):
     """
     Tests for :class:`VolumeService` startup.
@@ -235,6 +256,44 @@ MY_VOLUME = VolumeName(namespace=u"myns", dataset_id=u"myvolume")
 MY_VOLUME2 = VolumeName(namespace=u"myns", dataset_id=u"myvolume2")
 
 
+class FakeVolumeManager(object):
+    """
+    A remote volume manager which shares the local volume's snapshots and
+    records the data streams written to it.
+
+    :ivar list written: ``BytesIO`` instances holding each stream received.
+    :ivar list aborted: The volumes whose interrupted receives have been
+        discarded.
+    """
+    def __init__(self, resume_token=None):
+        """
+        :param resume_token: The ``bytes`` token to report for resuming an
+            interrupted push, ``None``, or an exception to raise instead.
+        """
+        self.written = []
+        self.aborted = []
+        self._resume_token = resume_token
+
+    def resume_token(self, volume):
+        if isinstance(self._resume_token, Exception):
+            raise self._resume_token
+        return succeed(self._resume_token)
+
+    def abort_receive(self, volume):
+        self.aborted.append(volume)
+        self._resume_token = None
+        return succeed(None)
+
+    def snapshots(self, volume):
+        return volume.get_filesystem().snapshots()
+
+    @contextmanager
+    def receive(self, volume):
+        writer = BytesIO()
+        yield writer
+        self.written.append(writer)
+
+
 class VolumeServiceAPITests(AsyncTestCase):
     """Tests for the ``VolumeService`` API."""
 
@@ -437,9 +496,11 @@ class VolumeServiceAPITests(AsyncTestCase):
         with filesystem.reader() as reader:
             data = reader.read()
         node = FakeNode([
-            # Hard-code the knowledge that first `flocker-volume snapshots` is
-            # run.  It doesn't need to produce any particular output for this
-            # test, it just needs to not fail.
+            # Hard-code the knowledge that first `flocker-volume resume_token`
+            # and `flocker-volume snapshots` are run.  They don't need to
+            # produce any particular output for this test, they just need to
+            # not fail.
+            b"",
             b"",
         ])
 
@@ -447,6 +508,29 @@ class VolumeServiceAPITests(AsyncTestCase):
 
         self.assertEqual(node.stdin.read(), data)
 
+    def test_push_in_threadpool(self):
+        """
+        If the service has a threadpool, pushing a volume transfers its data
+        in that threadpool.
+        """
+        threadpool = NonThreadPool()
+        pool = FilesystemStoragePool(FilePath(self.mktemp()))
+        service = VolumeService(
+            FilePath(self.mktemp()), pool, reactor=NonReactor(),
+            threadpool=threadpool,
+        )
+        service.startService()
+        volume = self.successResultOf(service.create(service.get(MY_VOLUME)))
+        filesystem = volume.get_filesystem()
+        filesystem.get_path().child(b"foo").setContent(b"blah")
+        with filesystem.reader() as reader:
+            data = reader.read()
+        node = FakeNode([b"", b""])
+
+        self.successResultOf(service.push(volume, RemoteVolumeManager(node)))
+
+        self.assertEqual((1, data), (threadpool.calls, node.stdin.read()))
+
     def test_push_with_snapshots(self):
         """
         Pushing a locally-owned volume to a remote volume manager which has a
@@ -454,19 +538,6 @@ class VolumeServiceAPITests(AsyncTestCase):
         incremental data stream.
         """
 
-        class FakeVolumeManager(object):
-            def __init__(self):
-                self.written = []
-
-            def snapshots(self, volume):
-                return volume.get_filesystem().snapshots()
-
-            @contextmanager
-            def receive(self, volume):
-                writer = BytesIO()
-                yield writer
-                self.written.append(writer)
-
         pool = FilesystemStoragePool(FilePath(self.mktemp()))
         service = VolumeService(FilePath(self.mktemp()), pool, reactor=Clock())
         service.startService()
@@ -483,6 +554,84 @@ class VolumeServiceAPITests(AsyncTestCase):
             [b"incremental stream based on", b"stuff"],
             writer.getvalue().splitlines()[-2:])
 
+    def test_push_resumes(self):
+        """
+        If a previous push to the remote volume manager was interrupted, the
+        rest of that data stream is pushed before a new one.  The statistics
+        for the push cover both.
+        """
+        readers = []
+
+        @contextmanager
+        def reader(filesystem, remote_snapshots=None, resume_token=None):
+            readers.append((remote_snapshots, resume_token))
+            yield BytesIO(b"data")
+        self.patch(DirectoryFilesystem, "reader", reader)
+        pool = FilesystemStoragePool(FilePath(self.mktemp()))
+        service = VolumeService(FilePath(self.mktemp()), pool, reactor=Clock())
+        service.startService()
+        volume = self.successResultOf(service.create(service.get(MY_VOLUME)))
+        remote_manager = FakeVolumeManager(resume_token=b"token")
+
+        statistics = self.successResultOf(service.push(volume, remote_manager))
+
+        self.assertEqual(
+            ([(None, b"token"), ([], None)], 8),
+            (readers, statistics.bytes),
+        )
+
+    @validate_logging(None)
+    def test_push_resume_failed(self, logger):
+        """
+        If the rest of an interrupted data stream can't be sent, the remote
+        volume manager discards what it received of it and a new stream is
+        pushed instead.
+        """
+        self.patch(service_module, "_logger", logger)
+        readers = []
+
+        @contextmanager
+        def reader(filesystem, remote_snapshots=None, resume_token=None):
+            readers.append((remote_snapshots, resume_token))
+            if resume_token is not None:
+                raise CalledProcessError(1, [b"zfs", b"send"])
+            yield BytesIO(b"data")
+        self.patch(DirectoryFilesystem, "reader", reader)
+        pool = FilesystemStoragePool(FilePath(self.mktemp()))
+        service = VolumeService(FilePath(self.mktemp()), pool, reactor=Clock())
+        service.startService()
+        volume = self.successResultOf(service.create(service.get(MY_VOLUME)))
+        remote_manager = FakeVolumeManager(resume_token=b"token")
+
+        statistics = self.successResultOf(service.push(volume, remote_manager))
+
+        logger.flush_tracebacks(CalledProcessError)
+        self.assertEqual(
+            ([(None, b"token"), ([], None)], [volume], 4),
+            (readers, remote_manager.aborted, statistics.bytes),
+        )
+
+    @validate_logging(None)
+    def test_push_resume_token_failed(self, logger):
+        """
+        If the remote volume manager can't report whether there is an
+        interrupted data stream, for example because it runs a release
+        without ``flocker-volume resume_token``, a new stream is pushed.
+        """
+        self.patch(service_module, "_logger", logger)
+        pool = FilesystemStoragePool(FilePath(self.mktemp()))
+        service = VolumeService(FilePath(self.mktemp()), pool, reactor=Clock())
+        service.startService()
+        volume = self.successResultOf(service.create(service.get(MY_VOLUME)))
+        remote_manager = FakeVolumeManager(
+            resume_token=IOError("Bad exit", 2)
+        )
+
+        self.successResultOf(service.push(volume, remote_manager))
+
+        logger.flush_tracebacks(IOError)
+        self.assertEqual(1, len(remote_manager.written))
+
     def test_receive_local_node_id(self):
         """
         If a volume with the same node ID as the service is received,
@@ -540,6 +689,21 @@ class VolumeServiceAPITests(AsyncTestCase):
         root = new_volume.get_filesystem().get_path()
         self.assertTrue(root.child(b"afile").getContent(), b"lalala")
 
+    def test_receive_statistics(self):
+        """
+        ``receive`` returns ``TransferStatistics`` giving the amount of data
+        received.
+        """
+        pool = FilesystemStoragePool(FilePath(self.mktemp()))
+        service = VolumeService(FilePath(self.mktemp()), pool, reactor=Clock())
+        service.startService()
+        volume = self.successResultOf(service.create(service.get(MY_VOLUME)))
+        with volume.get_filesystem().reader() as reader:
+            data = reader.read()
+            reader.seek(0, 0)
+            statistics = service.receive(unicode(uuid4()), MY_VOLUME, reader)
+        self.assertEqual(len(data), statistics.bytes)
+
     def test_enumerate_no_volumes(self):
         """``enumerate()`` returns no volumes when there are no volumes."""
         pool = FilesystemStoragePool(FilePath(self.mktemp()))
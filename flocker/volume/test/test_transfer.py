@@ -0,0 +1,356 @@
+# Copyright ClusterHQ Inc.  See LICENSE file for details.
+
+"""
+Tests for ``flocker.volume._transfer``.
+"""
+
+from uuid import uuid4
+
+from zope.interface.verify import verifyObject
+
+from twisted.internet import reactor
+from twisted.internet.defer import gatherResults
+from twisted.internet.endpoints import TCP4ClientEndpoint
+from twisted.internet.threads import deferToThread
+from twisted.python.filepath import FilePath
+from twisted.python.threadpool import ThreadPool
+
+from ..service import VolumeService, Volume, VolumeName
+from ..filesystems.memory import FilesystemStoragePool, DirectoryFilesystem
+from .._ipc import IRemoteVolumeManager
+from .._transfer import (
+    TransferClient, TransferRemoteVolumeManager, volume_transfer_factory,
+    _CHUNK_SIZE,
+)
+from ...testtools import AsyncTestCase
+
+MY_VOLUME = VolumeName(namespace=u"myns", dataset_id=u"myvol")
+MY_VOLUME2 = VolumeName(namespace=u"myns", dataset_id=u"myvol2")
+NODE_UUID = uuid4()
+
+
+class TransferTests(AsyncTestCase):
+    """
+    Tests for ``TransferRemoteVolumeManager`` talking to a volume transfer
+    server over a real loopback connection.
+    """
+    def setUp(self):
+        super(TransferTests, self).setUp()
+        self.from_service = self.create_service()
+        self.to_service = self.create_service()
+        self.client, self.remote = self.listen(reactor.getThreadPool())
+
+    def listen(self, threadpool):
+        """
+        Start a volume transfer server for ``to_service``.
+
+        :param threadpool: The ``ThreadPool`` for the server to receive
+            volume data in.
+
+        :return: A ``TransferClient`` and a ``TransferRemoteVolumeManager``
+            which connect to the server.
+        """
+        port = reactor.listenTCP(
+            0, volume_transfer_factory(reactor, threadpool, self.to_service),
+            interface=b"127.0.0.1",
+        )
+        self.addCleanup(port.stopListening)
+        client = TransferClient(
+            reactor,
+            lambda hostname, node_uuid: TCP4ClientEndpoint(
+                reactor, hostname, port.getHost().port
+            ),
+        )
+        self.addCleanup(client.disconnect)
+        return client, client.manager(b"127.0.0.1", NODE_UUID)
+
+    def create_service(self):
+        """
+        :return: A started ``VolumeService`` with an in-memory pool, which
+            pushes in the reactor's threadpool.
+        """
+        path = FilePath(self.mktemp())
+        path.createDirectory()
+        service = VolumeService(
+            FilePath(self.mktemp()), FilesystemStoragePool(path), reactor,
+            threadpool=reactor.getThreadPool(),
+        )
+        service.startService()
+        self.addCleanup(service.stopService)
+        return service
+
+    def create_volume(self, name=MY_VOLUME, content=b"WORKS!"):
+        """
+        Create a volume in ``from_service`` with a file in it.
+
+        :return: The ``Volume``.
+        """
+        volume = self.successResultOf(
+            self.from_service.create(self.from_service.get(name))
+        )
+        volume.get_filesystem().get_path().child(b"afile").setContent(
+            content
+        )
+        return volume
+
+    def received_content(self, volume):
+        """
+        :return: The content of the file in ``to_service``'s copy of the
+            given volume.
+        """
+        copy = Volume(
+            node_id=volume.node_id, name=volume.name, service=self.to_service
+        )
+        return copy.get_filesystem().get_path().child(b"afile").getContent()
+
+    def test_interface(self):
+        """
+        ``TransferRemoteVolumeManager`` provides ``IRemoteVolumeManager``.
+        """
+        self.assertTrue(verifyObject(IRemoteVolumeManager, self.remote))
+
+    def test_equality(self):
+        """
+        ``TransferRemoteVolumeManager`` instances for the same client, host
+        and node UUID are equal.
+        """
+        self.assertEqual(
+            (True, False, False),
+            (self.remote == self.client.manager(b"127.0.0.1", NODE_UUID),
+             self.remote == self.client.manager(b"127.0.0.2", NODE_UUID),
+             self.remote == self.client.manager(b"127.0.0.1", uuid4())),
+        )
+
+    def test_connection_per_node(self):
+        """
+        ``TransferClient`` reuses its connection to a node, but makes a new
+        one if a different node is expected at the same address.
+        """
+        connecting = gatherResults([
+            self.client.connect(b"127.0.0.1", NODE_UUID),
+            self.client.connect(b"127.0.0.1", NODE_UUID),
+            self.client.connect(b"127.0.0.1", uuid4()),
+        ])
+
+        def connected(protocols):
+            first, again, other = protocols
+            self.assertEqual((True, False), (first is again, first is other))
+        return connecting.addCallback(connected)
+
+    def test_snapshots(self):
+        """
+        ``snapshots`` lists the destination's snapshots of the volume.
+        """
+        volume = self.create_volume()
+        filesystem = Volume(
+            node_id=volume.node_id, name=volume.name, service=self.to_service
+        ).get_filesystem()
+        filesystem.get_path().makedirs()
+        filesystem.snapshot(b"stuff")
+        d = self.remote.snapshots(volume)
+        d.addCallback(
+            lambda snapshots: self.assertEqual(
+                [b"stuff"], [snapshot.name for snapshot in snapshots]
+            )
+        )
+        return d
+
+    def test_resume_token(self):
+        """
+        ``resume_token`` fires with ``None`` if nothing needs resuming.
+        """
+        d = self.remote.resume_token(self.create_volume())
+        d.addCallback(self.assertIs, None)
+        return d
+
+    def test_abort_receive(self):
+        """
+        ``abort_receive`` discards the destination's interrupted receive of
+        the volume.
+        """
+        aborted = []
+        self.patch(
+            DirectoryFilesystem, "abort_receive",
+            lambda filesystem: aborted.append(filesystem)
+        )
+        volume = self.create_volume()
+        d = self.remote.abort_receive(volume)
+        d.addCallback(
+            lambda _: self.assertEqual(
+                [Volume(node_id=volume.node_id, name=volume.name,
+                        service=self.to_service).get_filesystem()],
+                aborted,
+            )
+        )
+        return d
+
+    def test_push(self):
+        """
+        ``VolumeService.push`` can send a volume's data over the transfer
+        connection, in chunks as large as AMP allows.
+        """
+        content = b"x" * (_CHUNK_SIZE * 3 + 1)
+        volume = self.create_volume(content=content)
+        d = self.from_service.push(volume, self.remote)
+        d.addCallback(
+            lambda _: self.assertEqual(content, self.received_content(volume))
+        )
+        return d
+
+    def test_concurrent_pushes(self):
+        """
+        Several volumes can be pushed over the same connection at once.
+        """
+        volumes = [
+            self.create_volume(MY_VOLUME, b"one"),
+            self.create_volume(MY_VOLUME2, b"two"),
+        ]
+        d = gatherResults([
+            self.from_service.push(volume, self.remote) for volume in volumes
+        ])
+        d.addCallback(
+            lambda _: self.assertEqual(
+                ([b"one", b"two"], 1),
+                ([self.received_content(volume) for volume in volumes],
+                 len(self.client._connections)),
+            )
+        )
+        return d
+
+    def test_more_pushes_than_threads(self):
+        """
+        More volumes than the receiving threadpool has threads can be pushed
+        over the same connection at once.
+        """
+        threadpool = ThreadPool(minthreads=0, maxthreads=2)
+        threadpool.start()
+        self.addCleanup(threadpool.stop)
+        client, remote = self.listen(threadpool)
+        contents = [
+            bytes(i) * (_CHUNK_SIZE * 3) for i in range(threadpool.max * 2)
+        ]
+        volumes = [
+            self.create_volume(
+                VolumeName(namespace=u"myns", dataset_id=u"vol%d" % (i,)),
+                content,
+            )
+            for i, content in enumerate(contents)
+        ]
+        d = gatherResults([
+            self.from_service.push(volume, remote) for volume in volumes
+        ])
+        d.addCallback(
+            lambda _: self.assertEqual(
+                contents,
+                [self.received_content(volume) for volume in volumes],
+            )
+        )
+        return d
+
+    def test_receive_rejected(self):
+        """
+        If the destination refuses to receive the volume, ``ValueError`` is
+        raised in the thread writing to it.
+        """
+        volume = self.create_volume()
+        owned = Volume(
+            node_id=self.to_service.node_id, name=volume.name,
+            service=self.from_service,
+        )
+
+        def push():
+            with self.remote.receive(owned):
+                pass
+        return self.assertFailure(deferToThread(push), ValueError)
+
+    def test_handoff(self):
+        """
+        ``VolumeService.handoff`` pushes the volume and makes the destination
+        its owner.
+        """
+        volume = self.create_volume()
+        d = self.from_service.handoff(volume, self.remote)
+
+        def handed_off(_):
+            return self.to_service.enumerate()
+        d.addCallback(handed_off)
+        d.addCallback(
+            lambda volumes: self.assertEqual(
+                [(self.to_service.node_id, MY_VOLUME)],
+                [(v.node_id, v.name) for v in volumes],
+            )
+        )
+        return d
+
+    def test_clone_to(self):
+        """
+        ``clone_to`` clones a volume on the destination.
+        """
+        volume = self.create_volume()
+        d = self.from_service.handoff(volume, self.remote)
+        parent = Volume(
+            node_id=self.to_service.node_id, name=MY_VOLUME,
+            service=self.to_service,
+        )
+        d.addCallback(lambda _: self.remote.clone_to(parent, MY_VOLUME2))
+        d.addCallback(lambda _: self.to_service.enumerate())
+        d.addCallback(
+            lambda volumes: self.assertIn(
+                MY_VOLUME2, [v.name for v in volumes]
+            )
+        )
+        return d
+
+
+class TransferClientTests(AsyncTestCase):
+    """
+    Tests for ``TransferClient``.
+    """
+    def test_connection_failed(self):
+        """
+        If connecting fails, the commands waiting for the connection fail and
+        the next command tries to connect again.
+        """
+        attempts = []
+
+        def endpoint(hostname, node_uuid):
+            attempts.append((hostname, node_uuid))
+            # Nothing listens on port 1:
+            return TCP4ClientEndpoint(reactor, hostname, 1)
+        client = TransferClient(reactor, endpoint)
+        remote = client.manager(b"127.0.0.1", NODE_UUID)
+        volume = Volume(node_id=u"a", name=MY_VOLUME, service=None)
+        first = self.assertFailure(remote.snapshots(volume), Exception)
+        first.addCallback(
+            lambda _: self.assertFailure(remote.snapshots(volume), Exception)
+        )
+        first.addCallback(
+            lambda _: self.assertEqual([(b"127.0.0.1", NODE_UUID)] * 2,
+                                       attempts)
+        )
+        return first
+
+    def test_manager(self):
+        """
+        ``TransferClient.manager`` returns a ``TransferRemoteVolumeManager``
+        for the given host and node UUID.
+        """
+        client = TransferClient(reactor, None)
+        self.assertEqual(
+            TransferRemoteVolumeManager(client, b"192.0.2.1", NODE_UUID),
+            client.manager(b"192.0.2.1", NODE_UUID),
+        )
+
+    def test_using_tls(self):
+        """
+        ``TransferClient.using_tls`` connects to nodes with TLS, using the
+        context factory for the node UUID the client expects.
+        """
+        client = TransferClient.using_tls(
+            reactor, lambda node_uuid: (u"context", node_uuid), 4527,
+        )
+        endpoint = client._endpoint_factory(b"192.0.2.1", NODE_UUID)
+        self.assertEqual(
+            (b"192.0.2.1", 4527, (u"context", NODE_UUID)),
+            (endpoint._host, endpoint._port, endpoint._sslContextFactory),
+        )